@@ -75,7 +75,10 @@ class DbAuthInfo(Base):
 
         params = dict(Computer(dbcomputer=self.dbcomputer).get_transport_params().items() +
                       self.get_auth_params().items())
-        return ThisTransport(machine=self.dbcomputer.hostname, **params)
+        transport = ThisTransport(machine=self.dbcomputer.hostname, **params)
+        # The transport tracer records the operations by computer
+        transport._computer_pk = self.dbcomputer.pk
+        return transport
 
     def __str__(self):
         if self.enabled:
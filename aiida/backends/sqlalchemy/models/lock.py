@@ -29,4 +29,4 @@ class DbLock(Base):
         if 'owner' not in kwargs or not kwargs["owner"]:
             raise ValidationError("The field owner can't be empty")
 
-        self.__init__(**kwargs)
+        super(DbLock, self).__init__(**kwargs)
@@ -162,3 +162,133 @@ class TestCalcNode(AiidaTestCase):
         # updatable attributes are not copied
         with self.assertRaises(AttributeError):
             b.get_attr('state')
+
+    def test_set_states_and_attrs(self):
+        """
+        Checks the bulk update of states and attributes of calculations.
+        """
+        from aiida.orm import JobCalculation
+        from aiida.common.datastructures import calc_states
+
+        calcs = [JobCalculation(computer=self.computer,
+                                resources={'num_machines': 1,
+                                           'num_mpiprocs_per_machine': 1}
+                                ).store() for _ in range(3)]
+        calcs[0]._set_state(calc_states.TOSUBMIT)
+        calcs[1]._set_state(calc_states.WITHSCHEDULER)
+        calcs[2]._set_state(calc_states.COMPUTED)
+
+        skipped = JobCalculation._set_states_and_attrs([
+            (calcs[0], calc_states.WITHSCHEDULER, {'job_id': '12'}),
+            (calcs[1], None, {'scheduler_state': 'running'}),
+            # Going backwards is not allowed
+            (calcs[2], calc_states.WITHSCHEDULER, {'scheduler_state': 'done'}),
+        ])
+        self.assertEquals([c.pk for c in skipped], [calcs[2].pk])
+
+        self.assertEquals(calcs[0].get_state(), calc_states.WITHSCHEDULER)
+        self.assertEquals(calcs[0].get_attr('state'),
+                          calc_states.WITHSCHEDULER)
+        self.assertEquals(calcs[0].get_job_id(), '12')
+        self.assertEquals(calcs[1].get_state(), calc_states.WITHSCHEDULER)
+        self.assertEquals(calcs[1].get_scheduler_state(), 'running')
+        self.assertEquals(calcs[2].get_state(), calc_states.COMPUTED)
+        self.assertEquals(calcs[2].get_scheduler_state(), 'done')
+
+        # The same transition cannot be done twice
+        skipped = JobCalculation._set_states_and_attrs([
+            (calcs[0], calc_states.WITHSCHEDULER, {})])
+        self.assertEquals([c.pk for c in skipped], [calcs[0].pk])
+
+        with self.assertRaises(ValueError):
+            JobCalculation._set_states_and_attrs([
+                (calcs[0], 'NOT_A_STATE', {})])
+
+    def test_changed_jobinfo_attrs(self):
+        """
+        Checks that the jobinfo is stored only when it changed, with the
+        history of its changes.
+        """
+        from aiida.orm import JobCalculation
+        from aiida.scheduler.datastructures import JobInfo, job_states
+
+        calc = JobCalculation(computer=self.computer,
+                              resources={'num_machines': 1,
+                                         'num_mpiprocs_per_machine': 1}
+                              ).store()
+
+        jobinfo = JobInfo()
+        jobinfo.job_id = '12'
+        jobinfo.job_state = job_states.QUEUED
+        JobCalculation._set_states_and_attrs([
+            (calc, None, calc._get_changed_jobinfo_attrs(jobinfo))])
+
+        # Only the time used changed
+        jobinfo.wallclock_time_seconds = 20
+        self.assertEquals(calc._get_changed_jobinfo_attrs(jobinfo), {})
+
+        jobinfo.job_state = job_states.RUNNING
+        JobCalculation._set_states_and_attrs([
+            (calc, None, calc._get_changed_jobinfo_attrs(jobinfo))])
+        self.assertEquals(calc._get_last_jobinfo().wallclock_time_seconds, 20)
+
+        history = calc._get_jobinfo_history()
+        self.assertEquals([h['changes'] for h in history], [
+            {'job_id': '12', 'job_state': job_states.QUEUED},
+            {'job_state': job_states.RUNNING}])
+
+    def test_kill_calculations(self):
+        """
+        Checks the kill of several calculations that are not with the
+        scheduler.
+        """
+        from aiida.orm import JobCalculation
+        from aiida.common.datastructures import calc_states
+        from aiida.common.exceptions import InvalidOperation
+
+        calcs = [JobCalculation(computer=self.computer,
+                                resources={'num_machines': 1,
+                                           'num_mpiprocs_per_machine': 1}
+                                ).store() for _ in range(2)]
+        calcs[1]._set_state(calc_states.FINISHED)
+
+        errors = JobCalculation.kill_calculations(calcs)
+        self.assertIsNone(errors[calcs[0].pk])
+        self.assertEquals(calcs[0].get_state(), calc_states.FAILED)
+        self.assertIsInstance(errors[calcs[1].pk], InvalidOperation)
+        self.assertEquals(calcs[1].get_state(), calc_states.FINISHED)
+
+        with self.assertRaises(InvalidOperation):
+            calcs[1].kill()
+
+    def test_kill_calculations_errors(self):
+        """
+        Checks that the errors on some calculations do not prevent the kill
+        of the others.
+        """
+        import mock
+        from aiida.orm import JobCalculation
+        from aiida.common.datastructures import calc_states
+        from aiida.common.exceptions import (
+            InvalidOperation, ModificationNotAllowed, NotExistent,
+            RemoteOperationError)
+
+        calcs = [JobCalculation(computer=self.computer,
+                                resources={'num_machines': 1,
+                                           'num_mpiprocs_per_machine': 1}
+                                ).store() for _ in range(3)]
+        calcs[2]._set_state(calc_states.WITHSCHEDULER)
+
+        # The state of the first calculation is changed concurrently, and
+        # the computer of the last one is not configured for the user
+        with mock.patch.object(calcs[0], '_set_state',
+                               side_effect=ModificationNotAllowed), \
+                mock.patch.object(JobCalculation, '_get_authinfo',
+                                  side_effect=NotExistent):
+            errors = JobCalculation.kill_calculations(calcs)
+
+        self.assertIsInstance(errors[calcs[0].pk], InvalidOperation)
+        self.assertIsNone(errors[calcs[1].pk])
+        self.assertEquals(calcs[1].get_state(), calc_states.FAILED)
+        self.assertIsInstance(errors[calcs[2].pk], RemoteOperationError)
+        self.assertEquals(calcs[2].get_state(), calc_states.WITHSCHEDULER)
@@ -82,3 +82,912 @@ class TestDaemonBasic(AiidaTestCase):
         self.assertEquals(running_no, 0,
                           "At this point there should be "
                           "no running workflows.")
+
+
+class TestDaemonRunner(AiidaTestCase):
+    """
+    Test the scheduling logic of the event-driven daemon runner, without
+    listening to the database.
+    """
+
+    def _get_runner(self, tasks):
+        import time
+        from aiida.daemon.runner import DaemonRunner
+
+        class PollingRunner(DaemonRunner):
+            def _connect(self):
+                self._next_connection_attempt = time.time() + 3600
+
+        return PollingRunner(tasks)
+
+    def test_trigger_and_fallback(self):
+        from aiida.common.datastructures import calc_states
+        from aiida.daemon.runner import DaemonTask
+
+        calls = []
+        submitter = DaemonTask('submitter', lambda: calls.append('submitter'),
+                               [calc_states.TOSUBMIT], 3600)
+        retriever = DaemonTask('retriever', lambda: calls.append('retriever'),
+                               [calc_states.COMPUTED], 3600)
+        runner = self._get_runner([submitter, retriever])
+
+        def stop():
+            calls.append('stop')
+            runner.request_stop()
+
+        # All tasks run at startup
+        runner._tasks.append(DaemonTask('stop', stop, [], 3600))
+        runner.run()
+        self.assertEquals(calls, ['submitter', 'retriever', 'stop'])
+
+        # Only the tasks interested in the notified state run again
+        del calls[:]
+        runner._stop_requested = False
+        runner._trigger("{}:{}".format(1, calc_states.COMPUTED))
+        runner._trigger("{}:{}".format(2, calc_states.FINISHED))
+        runner._tasks[-1].triggered = True
+        runner.run()
+        self.assertEquals(calls, ['retriever', 'stop'])
+
+
+class TestSchedulerPoller(AiidaTestCase):
+    """
+    Test the adaptive intervals and the job-list cache used to poll the
+    schedulers.
+    """
+
+    def tearDown(self):
+        from aiida.backends.utils import del_global_setting
+        from aiida.daemon.polling import SchedulerPoller
+
+        # The computer is shared with the other tests
+        for key in ('minimum_job_poll_interval',
+                    'maximum_job_poll_interval'):
+            self.computer._del_property(key, raise_exception=False)
+        try:
+            del_global_setting(SchedulerPoller._setting_key.format(
+                self.computer.pk))
+        except KeyError:
+            pass
+
+    def test_backoff(self):
+        from aiida.backends.utils import del_global_setting
+        from aiida.daemon.polling import SchedulerPoller
+
+        try:
+            del_global_setting(SchedulerPoller._setting_key.format(
+                self.computer.pk))
+        except KeyError:
+            pass
+        self.computer.set_minimum_job_poll_interval(10)
+        self.computer.set_maximum_job_poll_interval(35)
+        poller = SchedulerPoller()
+
+        self.assertTrue(poller.is_due(self.computer))
+        self.assertEquals(poller.report_poll(self.computer), 10)
+        self.assertFalse(poller.is_due(self.computer))
+        self.assertEquals(poller.report_poll(self.computer), 20)
+        self.assertEquals(poller.report_poll(self.computer), 35)
+        self.assertEquals(poller.report_poll(self.computer), 35)
+        poller.mark_changed(self.computer)
+        self.assertEquals(poller.report_poll(self.computer), 10)
+
+    def test_reset_on_submission(self):
+        from aiida.daemon.polling import SchedulerPoller
+
+        self.computer.set_minimum_job_poll_interval(10)
+        self.computer.set_maximum_job_poll_interval(80)
+        poller = SchedulerPoller()
+        for _ in range(4):
+            poller.report_poll(self.computer)
+        self.assertEquals(poller.get_interval(self.computer), 80)
+
+        # The jobs are submitted by another daemon process
+        SchedulerPoller().report_submission(self.computer)
+        self.assertEquals(poller.get_interval(self.computer), 10)
+        self.assertFalse(poller.is_due(self.computer))
+        # The backoff starts again from the minimum interval
+        self.assertEquals(poller.report_poll(self.computer), 20)
+
+    def test_shared_job_list(self):
+        from aiida.daemon.polling import SchedulerPoller
+
+        class FakeScheduler(object):
+            def __init__(self):
+                self.queries = []
+
+            def get_feature(self, feature_name):
+                return False
+
+            def getJobs(self, jobs=None, user=None, as_dict=False):
+                self.queries.append(jobs)
+                return {}
+
+        self.computer.set_minimum_job_poll_interval(3600)
+        scheduler = FakeScheduler()
+        poller = SchedulerPoller()
+        poller.set_expected_jobids(self.computer, ['1', '2', '3'])
+
+        poller.get_jobs(self.computer, scheduler, self.user, ['1'])
+        poller.get_jobs(self.computer, scheduler, self.user, ['2', '3'])
+        self.assertEquals(scheduler.queries, [['1', '2', '3']])
+
+        # A job that was not in the last query is not taken from the cache
+        poller.get_jobs(self.computer, scheduler, self.user, ['4'])
+        self.assertEquals(len(scheduler.queries), 2)
+
+    def test_job_list_of_other_users(self):
+        from aiida.daemon.polling import SchedulerPoller
+        from aiida.orm import User
+        from aiida.scheduler.datastructures import JobInfo
+
+        class FakeScheduler(object):
+            def __init__(self, by_user):
+                self.by_user = by_user
+                self.queries = []
+
+            def get_feature(self, feature_name):
+                return feature_name == 'can_query_by_user' and self.by_user
+
+            def getJobs(self, jobs=None, user=None, as_dict=False):
+                self.queries.append(jobs)
+                # The jobs of the other users are hidden
+                jobinfo = JobInfo()
+                jobinfo.job_id = '1'
+                return {'1': jobinfo}
+
+        other_user = User(email='poller-other@aiida.net')
+        other_user.store()
+        self.computer.set_minimum_job_poll_interval(3600)
+
+        # Different remote accounts do not share the job lists
+        scheduler = FakeScheduler(by_user=False)
+        poller = SchedulerPoller()
+        poller.set_expected_jobids(self.computer, ['1'], username='alice')
+        poller.set_expected_jobids(self.computer, ['2'], username='bob')
+        poller.get_jobs(self.computer, scheduler, self.user, ['1'],
+                        username='alice')
+        poller.get_jobs(self.computer, scheduler, other_user, ['2'],
+                        username='bob')
+        self.assertEquals(scheduler.queries, [['1'], ['2']])
+
+        # A job missing from the job list of another user is queried again
+        scheduler = FakeScheduler(by_user=False)
+        poller = SchedulerPoller()
+        poller.set_expected_jobids(self.computer, ['1', '2'])
+        poller.get_jobs(self.computer, scheduler, self.user, ['1'])
+        poller.get_jobs(self.computer, scheduler, other_user, ['2'])
+        poller.get_jobs(self.computer, scheduler, other_user, ['1'])
+        self.assertEquals(scheduler.queries, [['1', '2'], ['2']])
+
+        # A job missing from a list of all the jobs of the user (e.g.
+        # submitted after the query) is queried again
+        scheduler = FakeScheduler(by_user=True)
+        poller = SchedulerPoller()
+        poller.get_jobs(self.computer, scheduler, self.user, ['1'])
+        poller.get_jobs(self.computer, scheduler, self.user, ['1'])
+        poller.get_jobs(self.computer, scheduler, self.user, ['1', '2'])
+        self.assertEquals(scheduler.queries, [None, None])
+
+    def test_job_history(self):
+        from aiida.daemon.polling import SchedulerPoller
+        from aiida.scheduler.datastructures import JobInfo
+
+        class FakeScheduler(object):
+            def __init__(self):
+                self.queries = []
+
+            def get_feature(self, feature_name):
+                return feature_name == 'can_query_job_history'
+
+            def get_job_history(self, jobs=None, user=None, since=None,
+                                as_dict=False):
+                self.queries.append(('history', jobs, since is not None))
+                # Job 1 finished; job 2 is not in the accounting yet
+                jobinfo = JobInfo()
+                jobinfo.job_id = '1'
+                jobinfo.exit_status = 0
+                return {'1': jobinfo}
+
+            def getJobs(self, jobs=None, user=None, as_dict=False):
+                self.queries.append(('queue', jobs, False))
+                return {}
+
+        self.computer.set_minimum_job_poll_interval(0)
+        scheduler = FakeScheduler()
+        poller = SchedulerPoller()
+        poller.set_expected_jobids(self.computer, [])
+
+        jobs = poller.get_jobs(self.computer, scheduler, self.user, ['1', '2'])
+        self.assertEquals(sorted(jobs), ['1'])
+        self.assertEquals(scheduler.queries, [('history', ['1', '2'], False),
+                                              ('queue', ['2'], False)])
+
+        # The next query is incremental; the missing job is looked for in
+        # the full history, and then in the queue
+        scheduler.queries = []
+        poller.get_jobs(self.computer, scheduler, self.user, ['1', '2'])
+        self.assertEquals(scheduler.queries, [('history', ['1', '2'], True),
+                                              ('history', ['2'], False),
+                                              ('queue', ['2'], False)])
+
+
+class TestDaemonMetrics(AiidaTestCase):
+    """
+    Test the metrics recorded by the daemon tasks.
+    """
+
+    def test_cycle(self):
+        from aiida.daemon.metrics import (
+            DaemonMetrics, get_task_metrics, reset_task_metrics,
+            format_prometheus)
+
+        reset_task_metrics()
+        metrics = DaemonMetrics(flush_interval=3600)
+        # Outside of a cycle, nothing is recorded
+        metrics.add_processed(5)
+
+        for _ in range(2):
+            with metrics.cycle('submitter'):
+                metrics.add_processed(2)
+                metrics.add_time('transport', 1.5)
+                with metrics.timer('db'):
+                    pass
+
+        # The metrics are stored only after the flush interval
+        self.assertEquals(get_task_metrics(), {})
+        metrics.flush_interval = 0
+        with metrics.cycle('submitter'):
+            metrics.add_processed(2)
+            metrics.add_time('transport', 1.5)
+            with metrics.timer('db'):
+                pass
+        with metrics.cycle('submitter'):
+            pass
+
+        task_metrics = get_task_metrics()
+        self.assertEquals(task_metrics.keys(), ['submitter'])
+        submitter = task_metrics['submitter']
+        self.assertEquals(submitter['cycles'], 4)
+        self.assertEquals(submitter['last_processed'], 0)
+        self.assertEquals(submitter['total_processed'], 6)
+        self.assertEquals(submitter['last_times'], {})
+        self.assertAlmostEquals(submitter['total_times']['transport'], 4.5)
+        self.assertIn('db', submitter['total_times'])
+
+        with self.assertRaises(ValueError):
+            metrics.add_time('unknown', 1.)
+
+        text = format_prometheus(
+            task_metrics, {('TOSUBMIT', 'my "computer"'): 3})
+        self.assertIn('aiida_daemon_task_processed_total{task="submitter"} '
+                      '6.0', text)
+        self.assertIn('aiida_daemon_task_category_seconds_total'
+                      '{task="submitter",category="transport"} 4.5', text)
+        self.assertIn('aiida_daemon_queue_depth'
+                      '{state="TOSUBMIT",computer="my \\"computer\\""} 3.0',
+                      text)
+        reset_task_metrics()
+
+
+class TestSubmissionThrottle(AiidaTestCase):
+    """
+    Test the limits on the submission of calculations to a computer.
+    """
+
+    def test_fair_share(self):
+        from aiida.daemon.throttling import SubmissionThrottle
+
+        class FakeThrottle(SubmissionThrottle):
+            queued = {}
+            recent = []
+
+            def get_queued_jobs(self, computer):
+                return self.queued
+
+            def get_recent_submissions(self, computer):
+                return self.recent
+
+        throttle = FakeThrottle()
+        calc_pks_by_user = {1: [13, 11, 12], 2: [21, 22, 23]}
+
+        self.computer.set_max_queued_jobs(None)
+        self.computer.set_max_submissions_per_minute(None)
+        self.assertEquals(throttle.select(self.computer, calc_pks_by_user),
+                          {1: [11, 12, 13], 2: [21, 22, 23]})
+
+        # User 1 already has two queued jobs: the free slots go to user 2
+        # first, then they are shared
+        self.computer.set_max_queued_jobs(6)
+        throttle.queued = {1: 2}
+        self.assertEquals(throttle.select(self.computer, calc_pks_by_user),
+                          {1: [11], 2: [21, 22, 23]})
+
+        # The rate limit also applies
+        self.computer.set_max_submissions_per_minute(3)
+        throttle.recent = [0.]
+        self.assertEquals(throttle.select(self.computer, calc_pks_by_user),
+                          {1: [], 2: [21, 22]})
+
+        throttle.queued = {1: 6}
+        self.assertEquals(throttle.select(self.computer, calc_pks_by_user),
+                          {1: [], 2: []})
+
+        self.computer.set_max_queued_jobs(None)
+        self.computer.set_max_submissions_per_minute(None)
+
+
+class TestJobArrays(AiidaTestCase):
+    """
+    Test the bundling of calculations in job arrays.
+    """
+
+    def test_group_for_job_arrays(self):
+        from aiida.orm import JobCalculation
+        from aiida.daemon.execmanager import _group_for_job_arrays
+
+        def get_calc(num_machines):
+            return JobCalculation(
+                computer=self.computer,
+                resources={'num_machines': num_machines,
+                           'num_mpiprocs_per_machine': 1},
+                max_wallclock_seconds=3600)
+
+        calcs = [get_calc(1), get_calc(2), get_calc(1), get_calc(1)]
+        scheduler = self.computer.get_scheduler()
+
+        self.computer.set_job_array_max_size(None)
+        self.assertEquals(
+            _group_for_job_arrays(self.computer, scheduler, calcs),
+            [[calcs[0]], [calcs[1]], [calcs[2]], [calcs[3]]])
+
+        # Only the calculations with the same options are bundled
+        self.computer.set_job_array_max_size(2)
+        self.assertEquals(
+            _group_for_job_arrays(self.computer, scheduler, calcs),
+            [[calcs[0], calcs[2]], [calcs[1]], [calcs[3]]])
+
+        with self.assertRaises(TypeError):
+            self.computer.set_job_array_max_size(1)
+
+        self.computer.set_job_array_max_size(None)
+
+
+class TestWorkClaims(AiidaTestCase):
+    """
+    Test the claims that split the work between several daemon workers.
+    """
+
+    def test_claims(self):
+        from aiida.daemon.claims import WorkClaims
+
+        class FakeWorker(WorkClaims):
+            worker_id = 'host1:1'
+            timeout = 300
+
+            def _start_heartbeat(self):
+                pass
+
+        worker1 = FakeWorker()
+        worker2 = FakeWorker()
+        worker2.worker_id = 'host2:2'
+
+        self.assertEquals(worker1.claim('test', [1, 2, 3], limit=2), [1, 2])
+        # The items claimed by another worker are skipped
+        self.assertEquals(worker2.claim('test', [1, 2, 3, 4]), [3, 4])
+        self.assertEquals(worker2.claim('test', [1, 2, 5, 6], limit=1), [5])
+
+        # Only the owner can release its claims
+        worker1.release('test', [1])
+        worker2.release('test', [2])
+        self.assertEquals(worker2.claim('test', [1, 2]), [1])
+        self.assertEquals(worker1.heartbeat(), 1)
+
+        # The claims of a dead worker expire
+        worker3 = FakeWorker()
+        worker3.worker_id = 'host3:3'
+        worker3.timeout = -1
+        self.assertEquals(worker3.claim('test', [7]), [7])
+        self.assertEquals(worker1.claim('test', [7]), [7])
+
+        with worker2.claimed('test', [7, 8]) as claimed:
+            self.assertEquals(claimed, [8])
+        self.assertEquals(worker1.claim('test', [8]), [8])
+
+        worker1.release('test', [2, 7, 8])
+        worker2.release('test', [1, 3, 4, 5])
+
+    def test_clear_stale(self):
+        from aiida.daemon.claims import WorkClaims
+        from aiida.orm.lock import LockManager
+
+        class FakeWorker(WorkClaims):
+            timeout = 300
+
+            def _start_heartbeat(self):
+                pass
+
+        workers = [FakeWorker() for _ in range(3)]
+        for worker, worker_id in zip(workers,
+                                     ['host1:1', 'host2:2', 'host2:3']):
+            worker.worker_id = worker_id
+        workers[2].timeout = -1
+        for idx, worker in enumerate(workers):
+            self.assertEquals(worker.claim('stale', [idx]), [idx])
+
+        # Only the claims of host1 and the expired ones are removed
+        LockManager().clear_stale(owner_prefix='host1:')
+        other = FakeWorker()
+        other.worker_id = 'host4:4'
+        self.assertEquals(other.claim('stale', [0, 1, 2]), [0, 2])
+
+        other.release('stale', [0, 2])
+        workers[1].release('stale', [1])
+
+
+class TestRetrieval(AiidaTestCase):
+    """
+    Test the retrieval of the computed calculations.
+    """
+
+    def test_retrieve_connection_error(self):
+        import mock
+        from aiida.common.datastructures import calc_states
+        from aiida.orm import JobCalculation
+        from aiida.daemon.execmanager import retrieve_computed_for_authinfo
+
+        calc = JobCalculation(computer=self.computer,
+                              resources={'num_machines': 1,
+                                         'num_mpiprocs_per_machine': 1})
+        calc.store()
+        calc._set_state(calc_states.COMPUTED)
+
+        authinfo = mock.Mock(enabled=True,
+                             dbcomputer=self.computer.dbcomputer,
+                             aiidauser=calc.dbnode.user)
+        with mock.patch('aiida.transport.pool.transport_pool') as pool:
+            pool.get_transport.side_effect = IOError("connection refused")
+            with self.assertRaises(IOError):
+                retrieve_computed_for_authinfo(authinfo)
+            self.assertFalse(pool.release_transport.called)
+
+        # The calculation is retrieved again at the next run
+        self.assertEquals(calc.get_state(), calc_states.COMPUTED)
+
+
+class TestParserPool(AiidaTestCase):
+    """
+    Test the pool of processes parsing the calculations.
+    """
+    # Parses calculation 1, fails parsing calculation 4, dies while
+    # parsing calculation 2 and never ends with calculation 3
+    _worker_script = """
+import sys, time
+for line in iter(sys.stdin.readline, ''):
+    calc_pk = int(line)
+    if calc_pk == 2:
+        sys.exit(3)
+    if calc_pk == 3:
+        time.sleep(60)
+    sys.stdout.write('{} {}\\n'.format(calc_pk, 1 if calc_pk == 1 else 0))
+    sys.stdout.flush()
+"""
+
+    def get_pool(self, num_workers, worker_script=None):
+        import sys
+        from aiida.daemon.parsing import ParserPool
+
+        if worker_script is None:
+            worker_script = self._worker_script
+        pool = ParserPool(num_workers=num_workers)
+        pool._get_worker_command = lambda: [sys.executable, '-c',
+                                            worker_script]
+        return pool
+
+    @staticmethod
+    def collect(pool, num_calcs):
+        import time
+
+        results = {}
+        deadline = time.time() + 30
+        while len(results) < num_calcs and time.time() < deadline:
+            pool.wait(timeout=1)
+            for calc_pk, outcome, _, status in pool.collect():
+                results[calc_pk] = (outcome, status)
+        return results
+
+    def test_parser_pool(self):
+        from aiida.daemon import parsing
+
+        pool = self.get_pool(num_workers=2)
+        try:
+            pool.start(1, 60)
+            pool.start(2, 60)
+            self.assertEquals(pool.get_free_slots(), 0)
+            self.assertEquals(sorted(pool.get_running()), [1, 2])
+            self.assertEquals(self.collect(pool, 2),
+                              {1: (parsing.PARSED, None),
+                               2: (parsing.DIED, 3)})
+
+            # The worker that is still alive parses the next calculation
+            self.assertEquals(len(pool._idle), 1)
+            pool.start(4, 60)
+            self.assertEquals(len(pool._idle), 0)
+            self.assertEquals(self.collect(pool, 1),
+                              {4: (parsing.PARSE_ERROR, None)})
+
+            # The worker is stopped after the timeout
+            pool.start(3, 0.5)
+            self.assertEquals(self.collect(pool, 1),
+                              {3: (parsing.TIMEOUT, None)})
+            self.assertEquals(pool.get_running(), [])
+        finally:
+            pool.close()
+
+    def test_parse_jobs_abnormal_exit(self):
+        import mock
+        from aiida.common.datastructures import calc_states
+        from aiida.orm import JobCalculation
+        from aiida.daemon.execmanager import parse_jobs
+
+        calc = JobCalculation(computer=self.computer,
+                              resources={'num_machines': 1,
+                                         'num_mpiprocs_per_machine': 1})
+        calc.store()
+        calc._set_state(calc_states.PARSING)
+
+        pool = self.get_pool(num_workers=1,
+                             worker_script="import sys; sys.exit(3)")
+        try:
+            with mock.patch('aiida.daemon.parsing.parser_pool', pool):
+                self.assertEquals(parse_jobs(wait=True), [])
+        finally:
+            pool.close()
+
+        self.assertEquals(calc.get_state(), calc_states.PARSINGFAILED)
+
+
+class TestUploadCache(AiidaTestCase):
+    """
+    Test the upload of files through the remote upload cache.
+    """
+
+    def test_upload_to_cache(self):
+        import os
+        import shutil
+        import tempfile
+        from aiida.daemon.execmanager import _upload_to_cache
+        from aiida.transport.plugins.local import LocalTransport
+
+        local_folder = tempfile.mkdtemp()
+        remote_folder = tempfile.mkdtemp()
+        cache_dir = os.path.join(remote_folder, 'cache')
+        try:
+            for name, content in [('a', 'shared'), ('b', 'other'),
+                                  ('c', 'shared')]:
+                with open(os.path.join(local_folder, name), 'w') as f:
+                    f.write(content)
+            upload_list = [(os.path.join(local_folder, src), dest)
+                           for src, dest in [('a', 'a'), ('b', 'sub/b'),
+                                             ('c', 'c'), ('a', 'sub/b')]]
+
+            with LocalTransport() as t:
+                for calc_folder in ['calc1', 'calc2']:
+                    t.chdir(remote_folder)
+                    t.mkdir(calc_folder)
+                    t.chdir(calc_folder)
+                    self.assertEquals(
+                        _upload_to_cache(t, upload_list, cache_dir, 1, {}),
+                        [])
+
+            # The identical files are stored only once, read-only
+            self.assertEquals(len(os.listdir(cache_dir)), 1)
+            cached_file = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            self.assertFalse(os.stat(cached_file).st_mode & 0222)
+            for calc_folder in ['calc1', 'calc2']:
+                for dest in ['a', 'c', 'sub/b']:
+                    with open(os.path.join(remote_folder, calc_folder,
+                                           dest)) as f:
+                        self.assertEquals(f.read(), 'shared')
+
+            # The copies can be modified without changing the cache
+            with open(os.path.join(remote_folder, 'calc1', 'a'), 'w') as f:
+                f.write('modified')
+            with open(cached_file) as f:
+                self.assertEquals(f.read(), 'shared')
+        finally:
+            shutil.rmtree(local_folder)
+            shutil.rmtree(remote_folder)
+
+    def test_upload_to_cache_batch_error(self):
+        import os
+        import shutil
+        import tempfile
+        import mock
+        from aiida.daemon.execmanager import _upload_to_cache
+        from aiida.transport.plugins.local import LocalTransport
+
+        local_folder = tempfile.mkdtemp()
+        remote_folder = tempfile.mkdtemp()
+        try:
+            upload_list = []
+            for name in ['a', 'b', 'c']:
+                with open(os.path.join(local_folder, name), 'w') as f:
+                    f.write(name)
+                upload_list.append((os.path.join(local_folder, name), name))
+
+            with LocalTransport() as t:
+                t.chdir(remote_folder)
+                exec_command_batch = t.exec_command_batch
+                calls = []
+
+                def failing_batch(commands):
+                    calls.append(commands)
+                    # The checks take two batches, the three new entries
+                    # and the three copies take three: the last one fails
+                    if len(calls) == 5:
+                        raise IOError("connection lost")
+                    return exec_command_batch(commands)
+
+                t.exec_command_batch = failing_batch
+                with mock.patch(
+                        'aiida.daemon.execmanager._UPLOAD_CACHE_BATCH_SIZE',
+                        2):
+                    not_copied = _upload_to_cache(
+                        t, upload_list, os.path.join(remote_folder, 'cache'),
+                        1, {})
+
+            self.assertEquals(len(calls), 5)
+            self.assertEquals(not_copied, upload_list[1:])
+            with open(os.path.join(remote_folder, 'a')) as f:
+                self.assertEquals(f.read(), 'a')
+        finally:
+            shutil.rmtree(local_folder)
+            shutil.rmtree(remote_folder)
+
+    def test_split_cached_uploads(self):
+        import os
+        import shutil
+        import tempfile
+        from aiida.daemon.execmanager import _split_cached_uploads
+
+        local_folder = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(local_folder, 'dir'))
+            for name in ['a', 'b', 'c']:
+                with open(os.path.join(local_folder, name), 'w') as f:
+                    f.write(name)
+            upload_list = [(os.path.join(local_folder, src), dest)
+                           for src, dest in [('a', 'sub/a'), ('b', 'b'),
+                                             ('dir', 'sub'), ('c', 'c')]]
+
+            # The file overwritten by the later folder keeps its place
+            self.assertEquals(_split_cached_uploads(upload_list),
+                              ([upload_list[0], upload_list[2]],
+                               [upload_list[1], upload_list[3]]))
+        finally:
+            shutil.rmtree(local_folder)
+
+
+class TestBulkStaging(AiidaTestCase):
+    """
+    Test the upload of the input files as a single tar stream.
+    """
+
+    def _create_files(self, local_folder):
+        import os
+
+        os.mkdir(os.path.join(local_folder, 'folder'))
+        for name in ['a', 'b', 'folder/b']:
+            with open(os.path.join(local_folder, name), 'w') as f:
+                f.write(os.path.basename(name))
+        # The later entries overwrite the earlier ones
+        return [(os.path.join(local_folder, src), dest)
+                for src, dest in [('a', 'a'), ('folder', 'sub'), ('b', 'a')]]
+
+    def _check_files(self, remote_folder):
+        import os
+
+        for name, content in [('a', 'b'), ('sub/b', 'b')]:
+            with open(os.path.join(remote_folder, name)) as f:
+                self.assertEquals(f.read(), content)
+
+    def test_upload_as_tar(self):
+        import shutil
+        import tempfile
+        from aiida.daemon.execmanager import _upload_files
+        from aiida.transport.plugins.local import LocalTransport
+
+        local_folder = tempfile.mkdtemp()
+        remote_folder = tempfile.mkdtemp()
+        try:
+            upload_list = self._create_files(local_folder)
+            with LocalTransport() as t:
+                t.chdir(remote_folder)
+
+                def put(*args, **kwargs):
+                    raise AssertionError("The files must be sent as a "
+                                         "single tar stream")
+
+                t.put = put
+                _upload_files(t, upload_list, True, 1, {})
+
+            self._check_files(remote_folder)
+        finally:
+            shutil.rmtree(local_folder)
+            shutil.rmtree(remote_folder)
+
+    def test_upload_as_tar_fallback(self):
+        import shutil
+        import tempfile
+        from aiida.daemon.execmanager import _upload_files
+        from aiida.transport.plugins.local import LocalTransport
+
+        local_folder = tempfile.mkdtemp()
+        try:
+            upload_list = self._create_files(local_folder)
+            # The remote tar fails, or the transport does not support it
+            for put_archive_result in [False, NotImplementedError]:
+                remote_folder = tempfile.mkdtemp()
+                try:
+                    with LocalTransport() as t:
+                        t.chdir(remote_folder)
+                        put = t.put
+                        calls = []
+
+                        def put_archive(upload_list):
+                            if put_archive_result is NotImplementedError:
+                                raise NotImplementedError
+                            return put_archive_result
+
+                        def counting_put(*args, **kwargs):
+                            calls.append(args)
+                            return put(*args, **kwargs)
+
+                        t.put_archive = put_archive
+                        t.put = counting_put
+                        _upload_files(t, upload_list, True, 1, {})
+
+                    self.assertEquals(len(calls), len(upload_list))
+                    self._check_files(remote_folder)
+                finally:
+                    shutil.rmtree(remote_folder)
+        finally:
+            shutil.rmtree(local_folder)
+
+
+class TestSubmission(AiidaTestCase):
+    """
+    Test the submission of the calculations in a pool of threads.
+    """
+
+    class FakeCalc(object):
+        def __init__(self, pk, state):
+            self.pk = pk
+            self.state = state
+
+        def get_state(self):
+            return self.state
+
+    def test_submit_chunks(self):
+        import mock
+        from aiida.daemon import execmanager
+
+        computer1 = mock.Mock()
+        computer1.name = 'computer1'
+        computer2 = mock.Mock()
+        computer2.name = 'computer2'
+        computers = {1: computer1, 2: computer2}
+        chunks = [(1, 10, [1, 3, 5]), (1, 10, [2, 4]), (2, 10, [6])]
+
+        def submit_calcs_in_thread(computer_pk, aiidauser_pk, calc_pks):
+            # The first calculation of each chunk fails
+            return (computers[computer_pk].name, 0., 1., len(calc_pks) - 1,
+                    1)
+
+        with mock.patch('aiida.common.setup.get_property',
+                        return_value=2), \
+             mock.patch('aiida.daemon.throttling.submission_throttle') as \
+                throttle, \
+             mock.patch('aiida.daemon.polling.scheduler_poller') as poller, \
+             mock.patch.object(execmanager, '_submit_calcs_in_thread',
+                               side_effect=submit_calcs_in_thread) as \
+                submit:
+            throughput = execmanager._submit_chunks(chunks, computers)
+
+        # Each chunk is submitted separately
+        self.assertEquals(sorted(call[0] for call in submit.call_args_list),
+                          sorted(chunks))
+        self.assertEquals(throughput, {
+            'computer1': {'submitted': 3, 'failed': 2, 'seconds': 1.},
+            'computer2': {'submitted': 0, 'failed': 1, 'seconds': 1.}})
+        self.assertEquals(
+            sorted(throttle.report_submissions.call_args_list),
+            sorted([mock.call(computer1, 3), mock.call(computer2, 0)]))
+        # Only the computer with new jobs is polled again soon
+        poller.report_submission.assert_called_once_with(computer1)
+
+    def test_submit_calcs_in_thread(self):
+        import mock
+        from aiida.common.datastructures import calc_states
+        from aiida.daemon import execmanager
+
+        calcs = dict((pk, self.FakeCalc(pk, calc_states.TOSUBMIT))
+                     for pk in [1, 2, 3])
+
+        def submit_calc_list(authinfo, calcs, failed_calcs):
+            # The first is submitted, the second fails, the third is
+            # skipped (e.g. it was submitted by someone else)
+            calcs[1].state = calc_states.SUBMISSIONFAILED
+            failed_calcs.append(calcs[1])
+            return [calcs[0]]
+
+        def failing_submit_calc_list(authinfo, calcs, failed_calcs):
+            # The transport could not be opened
+            failed_calcs.extend(calcs)
+            raise IOError("connection refused")
+
+        computer = mock.Mock()
+        computer.name = 'computer'
+        with mock.patch('aiida.orm.Computer.get', return_value=computer), \
+             mock.patch('aiida.orm.User.search_for_users',
+                        return_value=[mock.Mock()]), \
+             mock.patch('aiida.backends.utils.get_authinfo'), \
+             mock.patch('aiida.backends.utils.close_thread_db_connection'), \
+             mock.patch.object(execmanager, 'load_node',
+                               side_effect=calcs.get):
+            for side_effect, expected in [
+                    (submit_calc_list, (1, 1)),
+                    (failing_submit_calc_list, (0, 3))]:
+                with mock.patch.object(execmanager, '_submit_calc_list',
+                                       side_effect=side_effect):
+                    result = execmanager._submit_calcs_in_thread(
+                        1, 10, [1, 2, 3])
+                self.assertEquals(result[0], 'computer')
+                self.assertEquals(result[3:], expected)
+
+            # Errors before the submission are not failed submissions
+            with mock.patch('aiida.orm.Computer.get',
+                            side_effect=IOError("no database")):
+                result = execmanager._submit_calcs_in_thread(1, 10, [1, 2, 3])
+            self.assertEquals(result[0], '1')
+            self.assertEquals(result[3:], (0, 0))
+
+    def test_submit_calc_list_failures(self):
+        import contextlib
+        import mock
+        from aiida.common.datastructures import calc_states
+        from aiida.daemon import execmanager
+
+        calcs = [self.FakeCalc(pk, calc_states.TOSUBMIT) for pk in [1, 2, 3]]
+
+        def submit_calc(calc, authinfo, transport):
+            if calc.pk == 2:
+                calc.state = calc_states.SUBMISSIONFAILED
+                raise IOError("upload failed")
+            if calc.pk == 3:
+                # Submitted by someone else in the meantime
+                calc.state = calc_states.WITHSCHEDULER
+                raise ValueError("Can only submit calculations with "
+                                 "state=TOSUBMIT!")
+
+        @contextlib.contextmanager
+        def request_transport(authinfo):
+            yield mock.Mock()
+
+        failed_calcs = []
+        with mock.patch('aiida.transport.pool.transport_pool.'
+                        'request_transport', request_transport), \
+             mock.patch('aiida.orm.Computer'), \
+             mock.patch('aiida.utils.logger.get_dblogger_extra',
+                        return_value={}), \
+             mock.patch.object(execmanager, '_group_for_job_arrays',
+                               lambda computer, scheduler, calcs: [
+                                   [calc] for calc in calcs]), \
+             mock.patch.object(execmanager, 'submit_calc',
+                               side_effect=submit_calc):
+            submitted = execmanager._submit_calc_list(
+                mock.Mock(), calcs, failed_calcs=failed_calcs)
+
+        self.assertEquals(submitted, calcs[:1])
+        self.assertEquals(failed_calcs, calcs[1:2])
@@ -810,6 +810,26 @@ class TestNodeBasic(AiidaTestCase):
         with self.assertRaises(KeyError):
             get_global_setting('aaa')
 
+    def test_update_setting(self):
+        from aiida.backends.utils import (
+            get_global_setting, update_global_setting, del_global_setting)
+        from aiida.orm.lock import LockManager
+
+        def increment(value):
+            return (value or 0) + 1
+
+        update_global_setting('counter', increment, description="counter")
+        update_global_setting('counter', increment)
+        self.assertEqual(get_global_setting('counter'), 2)
+
+        # The lock is released after each update
+        lockmanager = LockManager()
+        self.assertEqual(
+            lockmanager.aquire_many(['setting|update|counter'], owner='t'),
+            ['setting|update|counter'])
+        lockmanager.release_many(['setting|update|counter'], owner='t')
+        del_global_setting('counter')
+
     def test_attr_listing(self):
         """
         Checks that the list of attributes and extras is ok.
@@ -121,6 +121,79 @@ def get_log_messages(*args, **kwargs):
         raise ValueError("This method doesn't exist for this backend")
 
 
+def close_thread_db_connection():
+    """
+    Release the database connection (Django) or the scoped session
+    (SQLAlchemy) used by the current thread.
+
+    To be called at the end of each thread (other than the main one)
+    that accessed the database, so that connections are not leaked.
+    """
+    if settings.BACKEND == BACKEND_DJANGO:
+        from django.db import connection
+        connection.close()
+    elif settings.BACKEND == BACKEND_SQLA:
+        import aiida.backends.sqlalchemy
+        if aiida.backends.sqlalchemy.scopedsessionclass is not None:
+            aiida.backends.sqlalchemy.scopedsessionclass.remove()
+    else:
+        raise Exception("unknown backend {}".format(settings.BACKEND))
+
+
+# Name of the PostgreSQL channel on which the changes of the state of
+# calculations are notified (see notify_calc_state_change)
+CALC_STATE_CHANNEL = 'aiida_calc_state'
+
+
+def notify_calc_state_change(calc_pk, state):
+    """
+    Notify listeners (e.g. the event-driven daemon runner in
+    aiida.daemon.runner) that the state of a calculation has changed,
+    using the PostgreSQL NOTIFY command on the CALC_STATE_CHANNEL channel.
+    The payload has the format 'pk:state'.
+
+    Nothing is done for other databases. Errors are only logged, since a
+    lost notification only delays the daemon until its next polling.
+    """
+    notify_calc_state_changes([(calc_pk, state)])
+
+
+def notify_calc_state_changes(changes):
+    """
+    Same as notify_calc_state_change, for a list of (calc_pk, state)
+    tuples, sending all the notifications with a single query.
+    """
+    from aiida.common import aiidalogger
+
+    payloads = ["{}:{}".format(calc_pk, state) for calc_pk, state in changes]
+    if not payloads:
+        return
+    query = "SELECT pg_notify({}, payload) FROM unnest({}) AS payload"
+    try:
+        if settings.BACKEND == BACKEND_DJANGO:
+            from django.db import connection
+            if connection.vendor == 'postgresql':
+                cursor = connection.cursor()
+                cursor.execute(query.format("%s", "%s"),
+                               [CALC_STATE_CHANNEL, payloads])
+        elif settings.BACKEND == BACKEND_SQLA:
+            from sqlalchemy import text
+            from aiida.backends.sqlalchemy import get_scoped_session
+            engine = get_scoped_session().bind
+            if engine.dialect.name == 'postgresql':
+                # A separate connection, so that the work pending in the
+                # session of the caller is neither committed nor rolled back
+                with engine.connect() as connection:
+                    with connection.begin():
+                        connection.execute(
+                            text(query.format(":channel", ":payloads")),
+                            channel=CALC_STATE_CHANNEL, payloads=payloads)
+    except Exception as e:
+        aiidalogger.warning("Unable to notify the state changes {} ({}): "
+                            "{}".format(", ".join(payloads),
+                                        e.__class__.__name__, e))
+
+
 def get_authinfo(computer, aiidauser):
 
     if settings.BACKEND == BACKEND_DJANGO:
@@ -243,6 +316,44 @@ def set_global_setting(key, value, description=None):
     set_global_setting(key, value, description)
 
 
+def update_global_setting(key, update, description=None, timeout=60):
+    """
+    Change the value of a global setting from its current value, so that
+    concurrent updates (from other threads, or other daemon processes on
+    any machine) are not lost: the updates of a setting through this
+    function are serialized by a DbLock.
+
+    :param key: the key of the setting
+    :param update: a function receiving the current value (None if the
+        setting does not exist) and returning the new value
+    :param description: the description of the setting
+    :param timeout: the time (in seconds) after which the lock is taken
+        over, if its owner died without releasing it
+    """
+    import os
+    import socket
+    import time
+    import uuid
+    from aiida.orm.lock import LockManager
+
+    lock_key = 'setting|update|{}'.format(key)
+    # Unique to this call, so that threads never release each other's lock
+    owner = "{}:{}:{}".format(socket.gethostname(), os.getpid(),
+                              uuid.uuid4().hex)
+    lockmanager = LockManager()
+    while not lockmanager.aquire_many([lock_key], timeout=timeout,
+                                      owner=owner):
+        time.sleep(0.05)
+    try:
+        try:
+            value = get_global_setting(key)
+        except KeyError:
+            value = None
+        set_global_setting(key, update(value), description)
+    finally:
+        lockmanager.release_many([lock_key], owner=owner)
+
+
 def del_global_setting(key):
     if settings.BACKEND == BACKEND_DJANGO:
         from aiida.backends.djsite.globalsettings import del_global_setting
@@ -38,6 +38,7 @@ class Calculation(VerdiCommandWithSubcommands):
             'list': (self.calculation_list, self.complete_none),
             'logshow': (self.calculation_logshow, self.complete_none),
             'kill': (self.calculation_kill, self.complete_none),
+            'jobinfo': (self.calculation_jobinfo, self.complete_none),
             'inputls': (self.calculation_inputls, self.complete_none),
             'outputls': (self.calculation_outputls, self.complete_none),
             'inputcat': (self.calculation_inputcat, self.complete_none),
@@ -617,8 +618,7 @@ class Calculation(VerdiCommandWithSubcommands):
 
         from aiida.cmdline import wait_for_confirmation
         from aiida.orm.calculation.job import JobCalculation as Calc
-        from aiida.common.exceptions import NotExistent, InvalidOperation, \
-            RemoteOperationError
+        from aiida.common.exceptions import NotExistent
 
         import argparse
 
@@ -641,21 +641,67 @@ class Calculation(VerdiCommandWithSubcommands):
             if not wait_for_confirmation():
                 sys.exit(0)
 
-        counter = 0
+        calcs = []
         for calc_pk in parsed_args.calcs:
             try:
-                c = load_node(calc_pk, parent_class=Calc)
-
-                c.kill()  # Calc.kill(calc_pk)
-                counter += 1
+                calcs.append(load_node(calc_pk, parent_class=Calc))
             except NotExistent:
                 print >> sys.stderr, ("WARNING: calculation {} "
                                       "does not exist.".format(calc_pk))
-            except (InvalidOperation, RemoteOperationError) as e:
-                print >> sys.stderr, (e.message)
+
+        # A single kill command is sent to each computer
+        counter = 0
+        errors = Calc.kill_calculations(calcs)
+        for c in calcs:
+            if errors[c.pk] is None:
+                counter += 1
+            else:
+                print >> sys.stderr, (errors[c.pk].message)
         print >> sys.stderr, "{} calculation{} killed.".format(counter,
                                                                "" if counter == 1 else "s")
 
+    def calculation_jobinfo(self, *args):
+        """
+        Show the detailed information given by the scheduler on the jobs of
+        calculations.
+
+        Pass a list of calculation PKs; a single command is sent to the
+        scheduler of each computer.
+        """
+        if not is_dbenv_loaded():
+            load_dbenv()
+
+        from aiida.orm.calculation.job import JobCalculation as Calc
+        from aiida.common.exceptions import NotExistent
+
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            prog=self.get_full_command_name(),
+            description='Show the detailed jobinfo of AiiDA calculations.')
+        parser.add_argument('calcs', metavar='PK', type=int, nargs='+',
+                            help='The principal key (PK) of the calculations')
+        parsed_args = parser.parse_args(list(args))
+
+        calcs = []
+        for calc_pk in parsed_args.calcs:
+            try:
+                calcs.append(load_node(calc_pk, parent_class=Calc))
+            except NotExistent:
+                print >> sys.stderr, ("WARNING: calculation {} "
+                                      "does not exist.".format(calc_pk))
+
+        try:
+            jobinfos = Calc.get_detailed_jobinfos(calcs)
+        except NotImplementedError:
+            print >> sys.stderr, ("The scheduler does not implement the "
+                                  "detailed jobinfo.")
+            sys.exit(1)
+
+        for c in calcs:
+            print "*** {} (jobid {}):".format(c.pk, c.get_job_id())
+            print jobinfos.get(c.pk, "No detailed jobinfo for this calculation")
+
     def calculation_cleanworkdir(self, *args):
         """
         Clean all the content of all the output remote folders of calculations,
@@ -146,6 +146,7 @@ class Computer(VerdiCommandWithSubcommands):
             'configure': (self.computer_configure, self.complete_computers),
             'test': (self.computer_test, self.complete_computers),
             'delete': (self.computer_delete, self.complete_computers),
+            'latency': (self.computer_latency, self.complete_computers),
         }
 
     def complete_computers(self, subargs_idx, subargs):
@@ -1044,6 +1045,65 @@ class Computer(VerdiCommandWithSubcommands):
                                       "for computer '{}' yet.".format(
                     user_email, computername))
 
+    def computer_latency(self, *args):
+        """
+        Show the latency histograms of the transport operations on a
+        computer, as recorded by the daemon.
+        """
+        if not is_dbenv_loaded():
+            load_dbenv()
+
+        import argparse
+
+        from aiida.common.exceptions import NotExistent
+        from aiida.transport.tracing import (
+            LATENCY_BUCKETS, get_latency_histograms, reset_latency_histograms)
+
+        parser = argparse.ArgumentParser(
+            prog=self.get_full_command_name(),
+            description='Show the latency histograms of the transport '
+                        'operations on a computer')
+        parser.add_argument('--reset', action='store_true',
+                            help="Delete the recorded histograms")
+        parser.add_argument('computer', type=str,
+                            help="The name of the computer")
+
+        parsed_args = parser.parse_args(args)
+
+        try:
+            computer = self.get_computer(name=parsed_args.computer)
+        except NotExistent:
+            print >> sys.stderr, "No computer exists with name '{}'".format(
+                parsed_args.computer)
+            sys.exit(1)
+
+        if parsed_args.reset:
+            reset_latency_histograms(computer.pk)
+            print "Latency histograms of computer '{}' deleted.".format(
+                computer.name)
+            return
+
+        histograms = get_latency_histograms(computer.pk)
+        if not histograms:
+            print "# No transport operations recorded on '{}' yet.".format(
+                computer.name)
+            return
+
+        bucket_names = ["<={:g}s".format(b) for b in LATENCY_BUCKETS] + [
+            ">{:g}s".format(LATENCY_BUCKETS[-1])]
+        print "# Transport operations on {} ({}):".format(
+            computer.name, computer.hostname)
+        print "{:<32} {:>8} {:>6} {:>10} {:>12}  {}".format(
+            "Operation", "Count", "Errors", "Mean (s)", "MB",
+            " ".join("{:>7}".format(name) for name in bucket_names))
+        for operation, histogram in sorted(histograms.iteritems()):
+            print "{:<32} {:>8} {:>6} {:>10.3f} {:>12.1f}  {}".format(
+                operation, histogram['count'], histogram['errors'],
+                histogram['seconds'] / max(histogram['count'], 1),
+                histogram['bytes'] / 1048576.,
+                " ".join("{:>7}".format(num)
+                         for num in histogram['buckets']))
+
     def get_computer_names(self):
         """
         Retrieve the list of computers in the DB.
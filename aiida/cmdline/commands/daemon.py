@@ -100,6 +100,18 @@ class Daemon(VerdiCommandWithSubcommands):
             os.path.join(setup.AIIDA_CONFIG_FOLDER,
                          setup.DAEMON_SUBDIR, "supervisord.sock")))
 
+    def _install_daemon_files(self):
+        """
+        (Re)write the supervisord configuration file of the daemon.
+        """
+        import getpass
+        from aiida.common import setup
+
+        aiida_dir = os.path.expanduser(setup.AIIDA_CONFIG_FOLDER)
+        setup.install_daemon_files(
+            aiida_dir, os.path.join(aiida_dir, setup.DAEMON_SUBDIR),
+            os.path.join(aiida_dir, setup.LOG_SUBDIR), getpass.getuser())
+
     def get_daemon_pid(self):
         """
         Return the daemon pid, as read from the supervisord.pid file.
@@ -153,10 +165,16 @@ class Daemon(VerdiCommandWithSubcommands):
             print "Daemon already running, try asking for its status"
             return
 
-        print "Clearing all locks ..."
-        from aiida.orm.lock import LockManager
+        # Rewrite the supervisord configuration, that depends on the
+        # 'daemon.runner' property
+        self._install_daemon_files()
+
+        # The workers on other machines may be running: only their
+        # expired claims are cleared
+        print "Clearing the stale daemon claims ..."
+        from aiida.daemon.claims import work_claims
 
-        LockManager().clear_all()
+        work_claims.clear_stale()
 
         print "Starting AiiDA Daemon ..."
         currenv = _get_env_with_venv_bin()
@@ -166,8 +184,8 @@ class Daemon(VerdiCommandWithSubcommands):
         process.wait()
 
         # The following lines are needed for the workflow_stepper
-        # (re-initialize the timestamps used to lock the task, in case
-        # it crashed for some reason).
+        # (re-initialize its timestamps, in case it crashed for some
+        # reason).
         # TODO: remove them when the old workflow system will be
         # taken away.
         try:
@@ -258,8 +276,8 @@ class Daemon(VerdiCommandWithSubcommands):
                     dead = True
                     print "AiiDA Daemon shut down correctly."
                     # The following lines are needed for the workflow_stepper
-                    # (re-initialize the timestamps used to lock the task, in case
-                    # it crashed for some reason).
+                    # (re-initialize its timestamps, in case it crashed for
+                    # some reason).
                     # TODO: remove them when the old workflow system will be
                     # taken away.
                     try:
@@ -323,6 +341,8 @@ class Daemon(VerdiCommandWithSubcommands):
         else:
             print ("# Most recent daemon timestamp: [Never]")
 
+        self.print_metrics()
+
         pid = self.get_daemon_pid()
         if pid is None:
             print "Daemon not running (cannot find the PID for it)"
@@ -361,6 +381,41 @@ class Daemon(VerdiCommandWithSubcommands):
         else:
             print "I was able to connect to the daemon, but I did not find any process..."
 
+    def print_metrics(self):
+        """
+        Print the metrics of the daemon tasks, and the number of
+        calculations waiting in each stage of the daemon.
+        """
+        import time
+        from aiida.common.utils import str_timedelta
+        from aiida.daemon.metrics import (
+            CATEGORIES, get_task_metrics, get_queue_depths)
+
+        task_metrics = get_task_metrics()
+        if task_metrics:
+            print "## Daemon tasks (last run; totals):"
+            for task_name, metrics in sorted(task_metrics.iteritems()):
+                times = ", ".join(
+                    "{} {:.1f}s".format(category,
+                                        metrics['last_times'].get(category, 0.))
+                    for category in CATEGORIES)
+                print "   * {:<10} {} calcs in {:.1f}s ({}), {}; {} runs, " \
+                      "{} calcs in {:.1f}s".format(
+                    task_name, metrics['last_processed'],
+                    metrics['last_duration'], times,
+                    str_timedelta(timedelta(
+                        seconds=time.time() - metrics['last_start']),
+                        short=True, negative_to_zero=True),
+                    metrics['cycles'], metrics['total_processed'],
+                    metrics['total_duration'])
+
+        queue_depths = get_queue_depths()
+        if queue_depths:
+            print "## Calculations waiting in the daemon:"
+            for (state, computer_name), num in sorted(
+                    queue_depths.iteritems()):
+                print "   * {:<14} {:<20} {}".format(state, computer_name, num)
+
     def daemon_logshow(self, *args):
         """
         Show the log of the daemon, press CTRL+C to quit.
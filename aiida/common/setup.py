@@ -150,7 +150,7 @@ serverurl=unix:///{daemon_dir}/supervisord.sock
 ; Main AiiDA Daemon
 ;=======================================
 [program:aiida-daemon]
-command=celery worker -A tasks --loglevel=INFO --beat --schedule={daemon_dir}/celerybeat-schedule
+command={daemon_command}
 directory={aiida_code_home}/daemon/
 user={local_user}
 numprocs=1
@@ -173,14 +173,54 @@ killasgroup=true
 ; so, if rabbitmq is supervised, it will start first.
 priority=1000
 """
+    # The further workers, if more than one is requested; they share the
+    # work with the main one (see aiida.daemon.claims)
+    local_workers_conf = """
+;=======================================
+; Further AiiDA Daemon workers
+;=======================================
+[program:aiida-daemon-workers]
+command={workers_command}
+process_name=%(program_name)s_%(process_num)02d
+directory={aiida_code_home}/daemon/
+user={local_user}
+numprocs={num_workers}
+stdout_logfile={log_dir}/aiida_daemon_worker_%(process_num)02d.log
+stderr_logfile={log_dir}/aiida_daemon_worker_%(process_num)02d.log
+autostart=true
+autorestart=true
+startsecs=10
+stopwaitsecs = 600
+killasgroup=true
+priority=1001
+"""
+    num_workers = max(1, get_property("daemon.workers"))
     if daemon_conf is None:
         daemon_conf = local_daemon_conf
+        if num_workers > 1:
+            daemon_conf += local_workers_conf
+
+    # The command depends on how the daemon tasks have to be run
+    if get_property("daemon.runner") == "events":
+        daemon_command = "python -m aiida.daemon.runner"
+        workers_command = daemon_command
+    else:
+        daemon_command = ("celery worker -A tasks --loglevel=INFO --beat "
+                          "--schedule={}/celerybeat-schedule".format(daemon_dir))
+        # Only the main worker runs the scheduler of the periodic tasks
+        # (--beat); Celery replaces '%h' (escaped for supervisord) with the
+        # host name
+        workers_command = ("celery worker -A tasks --loglevel=INFO "
+                           "-n worker%(process_num)02d@%%h")
 
     old_umask = os.umask(DEFAULT_UMASK)
     try:
         with open(os.path.join(aiida_dir, daemon_dir, DAEMON_CONF_FILE), "w") as f:
             f.write(daemon_conf.format(daemon_dir=daemon_dir, log_dir=log_dir,
                                        local_user=local_user,
+                                       daemon_command=daemon_command,
+                                       workers_command=workers_command,
+                                       num_workers=num_workers - 1,
                                        aiida_code_home=os.path.split(
                                            os.path.abspath(
                                                aiida.__file__))[0]))
@@ -942,7 +982,95 @@ _property_table = {
         "bool",
         "Boolean whether to print deprecation warnings",
         False,
-        None)
+        None),
+    "daemon.submission_threads": (
+        "daemon_submission_threads",
+        "int",
+        "Number of threads used by the daemon to submit calculations; "
+        "different computers (and different connections to the same "
+        "computer, see Computer.set_max_concurrent_submissions) are "
+        "processed concurrently",
+        4,
+        None),
+    "daemon.runner": (
+        "daemon_runner",
+        "string",
+        "How the daemon tasks are run: 'celery' runs them as Celery periodic "
+        "tasks, at fixed intervals; 'events' runs them as soon as the state "
+        "of a calculation changes (using PostgreSQL LISTEN/NOTIFY), polling "
+        "only as a fallback. Restart the daemon after changing it",
+        "celery",
+        ["celery", "events"]),
+    "daemon.fallback_poll_interval": (
+        "daemon_fallback_poll_interval",
+        "int",
+        "With the 'events' daemon runner, maximum interval (in seconds) "
+        "between two runs of the tasks that are otherwise triggered by "
+        "state changes (submitter, retriever, legacy workflow stepper)",
+        300,
+        None),
+    "daemon.parser_workers": (
+        "daemon_parser_workers",
+        "int",
+        "Maximum number of processes used by the daemon to parse "
+        "calculations at the same time",
+        2,
+        None),
+    "daemon.parser_timeout": (
+        "daemon_parser_timeout",
+        "int",
+        "Time (in seconds) after which the daemon stops the parsing of a "
+        "calculation, and sets it to PARSINGFAILED, for the parsers that do "
+        "not define their own timeout",
+        3600,
+        None),
+    "daemon.transport_keepalive_interval": (
+        "daemon_transport_keepalive_interval",
+        "int",
+        "Interval (in seconds) between the keep-alive packets sent on the "
+        "connections kept open by the daemon (0 to disable)",
+        60,
+        None),
+    "daemon.transport_idle_timeout": (
+        "daemon_transport_idle_timeout",
+        "int",
+        "Time (in seconds) after which the daemon closes a connection to a "
+        "computer that has not been used",
+        300,
+        None),
+    "daemon.metrics_port": (
+        "daemon_metrics_port",
+        "int",
+        "Local port on which the daemon serves its metrics in the "
+        "Prometheus text format (0 to disable). Restart the daemon after "
+        "changing it",
+        0,
+        None),
+    "daemon.workers": (
+        "daemon_workers",
+        "int",
+        "Number of daemon worker processes run on this machine; the workers "
+        "(also those started on other machines for the same profile) share "
+        "the calculations by claiming them. Restart the daemon after "
+        "changing it",
+        1,
+        None),
+    "daemon.claim_timeout": (
+        "daemon_claim_timeout",
+        "int",
+        "Time (in seconds) after which the claims of a daemon worker on "
+        "calculations expire if the worker stops refreshing them (e.g. "
+        "because it died), so that other workers can take over the work",
+        300,
+        None),
+    "daemon.claim_batch_size": (
+        "daemon_claim_batch_size",
+        "int",
+        "Maximum number of calculations claimed at once by a daemon worker "
+        "in each step of the pipeline (submission, retrieval, parsing); the "
+        "other ones are left to the other workers, or to the next run",
+        100,
+        None),
 }
 
 
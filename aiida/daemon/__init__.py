@@ -8,4 +8,11 @@
 # For further information please visit http://www.aiida.net               #
 ###########################################################################
 
-
+# Default intervals (in seconds) between two runs of each daemon task; they
+# can be changed with the corresponding keys in the profile configuration
+DAEMON_INTERVALS_SUBMIT = 10
+DAEMON_INTERVALS_RETRIEVE = 10
+DAEMON_INTERVALS_UPDATE = 30
+DAEMON_INTERVALS_PARSE = 10
+DAEMON_INTERVALS_WFSTEP = 30
+DAEMON_INTERVALS_TICK_WORKFLOWS = 5
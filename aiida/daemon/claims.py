@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Claims on the work of the daemon, so that several daemon workers (on the
+same machine or on different ones, see the ``daemon.workers`` property) can
+share the work without doing it twice.
+
+Before acting on a calculation (or on a computer, for the tasks that work on
+all its calculations at once), a worker claims it; the claims are records
+of the DbLock table with a unique key, so that each item is claimed by one
+worker only, and the items already claimed by another worker are skipped
+without waiting. The claims of each worker are kept alive by a heartbeat
+thread; the claims of a worker that died expire after the
+``daemon.claim_timeout``, and the items can then be claimed by the other
+workers.
+"""
+import os
+import socket
+import threading
+from contextlib import contextmanager
+
+from aiida.common import aiidalogger
+
+claimslogger = aiidalogger.getChild('daemonclaims')
+
+_KEY_PREFIX = 'daemon|claim|{}|'
+
+
+class WorkClaims(object):
+    """
+    Claim items of work for the current daemon worker, and keep the claims
+    alive.
+
+    The items are identified by a kind (e.g. 'calc' for the calculations,
+    that are claimed by one daemon task at a time) and an id (e.g. the pk).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heartbeat_pid = None
+        self._stop = None
+
+    @property
+    def worker_id(self):
+        """
+        The name of the current daemon worker, used as owner of its claims:
+        each process is a separate worker.
+        """
+        return "{}:{}".format(socket.gethostname(), os.getpid())
+
+    @property
+    def timeout(self):
+        """
+        The time (in seconds) after which a claim expires, unless it is
+        refreshed by the heartbeat.
+        """
+        from aiida.common.setup import get_property
+
+        return max(1, get_property("daemon.claim_timeout"))
+
+    @staticmethod
+    def _get_key(kind, item_id):
+        return (_KEY_PREFIX + '{}').format(kind, item_id)
+
+    def claim(self, kind, item_ids, limit=None):
+        """
+        Claim the given items for the current worker; the items already
+        claimed by another worker are skipped.
+
+        :param kind: the kind of the items
+        :param item_ids: the ids of the items
+        :param limit: the maximum number of items to claim (the first ones
+            that are not claimed by another worker), or None for no limit
+        :return: the list of the claimed ids, in the given order
+        """
+        from aiida.orm.lock import LockManager
+
+        item_ids = list(item_ids)
+        if limit is not None:
+            limit = max(0, limit)
+        if not item_ids or limit == 0:
+            return []
+
+        self._start_heartbeat()
+        lockmanager = LockManager()
+        claimed = []
+        # If some items are claimed by other workers, claim the next ones
+        # until the limit is reached
+        while item_ids and (limit is None or len(claimed) < limit):
+            batch_size = (len(item_ids) if limit is None
+                          else limit - len(claimed))
+            batch, item_ids = item_ids[:batch_size], item_ids[batch_size:]
+            keys = lockmanager.aquire_many(
+                [self._get_key(kind, item_id) for item_id in batch],
+                timeout=self.timeout, owner=self.worker_id)
+            keys = set(keys)
+            claimed.extend(item_id for item_id in batch
+                           if self._get_key(kind, item_id) in keys)
+        return claimed
+
+    def release(self, kind, item_ids):
+        """
+        Release the claims of the current worker on the given items.
+        """
+        from aiida.orm.lock import LockManager
+
+        item_ids = list(item_ids)
+        if not item_ids:
+            return
+        try:
+            LockManager().release_many(
+                [self._get_key(kind, item_id) for item_id in item_ids],
+                owner=self.worker_id)
+        except Exception as e:
+            # The claims expire anyway after the timeout
+            claimslogger.warning("Unable to release the claims on {} {}: "
+                                 "{}".format(kind, item_ids, e))
+
+    @contextmanager
+    def claimed(self, kind, item_ids, limit=None):
+        """
+        Context manager claiming the given items (see :py:meth:`claim`) and
+        releasing them at the end; it gives the list of the claimed ids.
+        """
+        claimed = self.claim(kind, item_ids, limit=limit)
+        try:
+            yield claimed
+        finally:
+            self.release(kind, claimed)
+
+    def heartbeat(self):
+        """
+        Restart the timeout of all the claims of the current worker.
+        """
+        from aiida.orm.lock import LockManager
+
+        return LockManager().refresh(owner=self.worker_id)
+
+    def _start_heartbeat(self):
+        """
+        Start the heartbeat thread of the current process, if not running
+        yet (threads do not survive a fork: each process has its own).
+        """
+        with self._lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            self._heartbeat_pid = os.getpid()
+            self._stop = threading.Event()
+            thread = threading.Thread(target=self._heartbeat_loop,
+                                      args=(self._stop,),
+                                      name='daemon-claims-heartbeat')
+            thread.daemon = True
+            thread.start()
+
+    def _heartbeat_loop(self, stop):
+        from aiida.backends.utils import close_thread_db_connection
+
+        while not stop.wait(self.timeout / 3.):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                claimslogger.warning("Unable to refresh the claims of the "
+                                     "daemon worker {}: {}".format(
+                    self.worker_id, e))
+            finally:
+                close_thread_db_connection()
+
+    def clear_stale(self):
+        """
+        Remove the claims of the workers of this machine, that must not be
+        running (e.g. when the daemon starts), and the expired claims of
+        the workers of all machines. The claims of the workers running on
+        other machines are left untouched.
+        """
+        from aiida.orm.lock import LockManager
+
+        LockManager().clear_stale(
+            owner_prefix="{}:".format(socket.gethostname()))
+
+    def stop_heartbeat(self):
+        """
+        Stop the heartbeat thread of the current process, if running.
+        """
+        with self._lock:
+            if self._heartbeat_pid == os.getpid():
+                self._stop.set()
+                self._heartbeat_pid = None
+
+
+# The claims of the daemon worker of this process
+work_claims = WorkClaims()
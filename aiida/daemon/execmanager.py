@@ -22,23 +22,47 @@ from aiida.common.exceptions import (
 )
 from aiida.common import aiidalogger
 from aiida.common.links import LinkType
+from aiida.daemon.metrics import daemon_metrics
 from aiida.orm import load_node
 
 
 
 execlogger = aiidalogger.getChild('execmanager')
 
+# The name of the submit script of job arrays (see _submit_calc_array)
+_ARRAY_SCRIPT_FILENAME = '_aiidaarray.sh'
+# Maximum number of commands run at once for the upload cache (see
+# _upload_to_cache)
+_UPLOAD_CACHE_BATCH_SIZE = 200
 
-def update_running_calcs_status(authinfo):
+
+def update_running_calcs_status(authinfo, calcs_to_inquire=None):
     """
     Update the states of calculations in WITHSCHEDULER status belonging
     to user and machine as defined in the 'dbauthinfo' table.
+
+    The scheduler is queried through the
+    :py:data:`aiida.daemon.polling.scheduler_poller`, so that a recent job
+    list may be reused instead of querying the scheduler again. For the
+    schedulers with the 'can_query_job_history' feature, the exit status and
+    the resources used by the finished jobs are kept in their last jobinfo,
+    and the jobs that vanished from the scheduler are reported as warnings.
+    The jobinfo of a calculation is stored again only when it changed (see
+    ``JobCalculation._get_changed_jobinfo_attrs``). The detailed jobinfo of
+    all the jobs that finished is asked to the scheduler with a single
+    command (see ``Scheduler.get_detailed_jobinfos``).
+
+    :param authinfo: the DbAuthInfo of the user and the computer
+    :param calcs_to_inquire: the calculations to update; if None, all the
+        calculations of the user on the computer in the WITHSCHEDULER state
     """
     from aiida.orm import JobCalculation, Computer
     from aiida.scheduler.datastructures import JobInfo
     from aiida.utils.logger import get_dblogger_extra
     from aiida.backends.utils import QueryFactory
-    
+    from aiida.daemon.polling import scheduler_poller, get_remote_username
+    from aiida.transport.pool import transport_pool
+
     if not authinfo.enabled:
         return
 
@@ -46,12 +70,15 @@ def update_running_calcs_status(authinfo):
                      "and machine {}".format(
         authinfo.aiidauser.email, authinfo.dbcomputer.name))
 
-    qmanager = QueryFactory()()
-    calcs_to_inquire = qmanager.query_jobcalculations_by_computer_user_state(
-        state=calc_states.WITHSCHEDULER,
-        computer=authinfo.dbcomputer,
-        user=authinfo.aiidauser
-    )
+    if calcs_to_inquire is None:
+        qmanager = QueryFactory()()
+        with daemon_metrics.timer('db'):
+            calcs_to_inquire = list(
+                qmanager.query_jobcalculations_by_computer_user_state(
+                    state=calc_states.WITHSCHEDULER,
+                    computer=authinfo.dbcomputer,
+                    user=authinfo.aiidauser
+                ))
 
     #~ calcs_to_inquire = list(JobCalculation._get_all_with_state(
         #~ state=calc_states.WITHSCHEDULER,
@@ -61,8 +88,8 @@ def update_running_calcs_status(authinfo):
 
     # NOTE: no further check is done that machine and
     # aiidauser are correct for each calc in calcs
-    s = Computer(dbcomputer=authinfo.dbcomputer).get_scheduler()
-    t = authinfo.get_transport()
+    computer = Computer(dbcomputer=authinfo.dbcomputer)
+    s = computer.get_scheduler()
 
     computed = []
 
@@ -72,7 +99,7 @@ def update_running_calcs_status(authinfo):
         jobids_to_inquire = [str(c.get_job_id()) for c in calcs_to_inquire]
 
         # Open connection
-        with t:
+        with transport_pool.request_transport(authinfo) as t:
             s.set_transport(t)
             # TODO: Check if we are ok with filtering by job (to make this work,
             # I had to remove the check on the retval for getJobs,
@@ -83,13 +110,20 @@ def update_running_calcs_status(authinfo):
             # sensible (at least, skip this computer but continue with
             # following ones, and set a counter; set calculations to
             # UNKNOWN after a while?
-            if s.get_feature('can_query_by_user'):
-                found_jobs = s.getJobs(user="$USER", as_dict=True)
-            else:
-                found_jobs = s.getJobs(jobs=jobids_to_inquire, as_dict=True)
+            found_jobs = scheduler_poller.get_jobs(
+                computer, s, authinfo.aiidauser, jobids_to_inquire,
+                username=get_remote_username(authinfo))
+            # With the job history, the finished jobs are in found_jobs
+            # with their exit status
+            try:
+                with_history = s.get_feature('can_query_job_history')
+            except NotImplementedError:
+                with_history = False
 
-            # I update the status of jobs
+            # I update the status of jobs; the changes are collected, and
+            # then written to the database in a single transaction
 
+            updates = []
             for c in calcs_to_inquire:
                 try:
                     logger_extra = get_dblogger_extra(c)
@@ -111,23 +145,38 @@ def update_running_calcs_status(authinfo):
                         execlogger.debug("Inquirying calculation {} (jobid "
                                          "{}): it has job_state={}".format(
                             c.pk, jobid, jobinfo.job_state), extra=logger_extra)
+                        if c.get_scheduler_state() != unicode(
+                                jobinfo.job_state):
+                            scheduler_poller.mark_changed(computer)
                         # For the moment, FAILED is not defined
                         if jobinfo.job_state in [job_states.DONE]:  # , job_states.FAILED]:
                             computed.append(c)
-                            try:
-                                c._set_state(calc_states.COMPUTED)
-                            except ModificationNotAllowed:
-                                # Someone already set it, just skip
-                                pass
 
                         ## Do not set the WITHSCHEDULER state multiple times,
                         ## this would raise a ModificationNotAllowed
                         # else:
                         # c._set_state(calc_states.WITHSCHEDULER)
 
-                        c._set_scheduler_state(jobinfo.job_state)
+                        attrs = c._get_scheduler_state_attrs(jobinfo.job_state)
+                        attrs.update(c._get_changed_jobinfo_attrs(jobinfo))
+                    elif with_history:
+                        # Neither the accounting nor the queue know the
+                        # job: it did not finish normally
+                        execlogger.warning("Inquirying calculation {} (jobid "
+                                           "{}): the job vanished from the "
+                                           "scheduler, assuming "
+                                           "job_state={}".format(
+                            c.pk, jobid, job_states.DONE), extra=logger_extra)
 
-                        c._set_last_jobinfo(jobinfo)
+                        computed.append(c)
+                        scheduler_poller.mark_changed(computer)
+                        jobinfo = JobInfo()
+                        jobinfo.job_id = jobid
+                        jobinfo.job_state = job_states.DONE
+                        jobinfo.annotation = ("Job not found in the "
+                                              "accounting of the scheduler")
+                        attrs = c._get_scheduler_state_attrs(job_states.DONE)
+                        attrs.update(c._get_changed_jobinfo_attrs(jobinfo))
                     else:
                         execlogger.debug("Inquirying calculation {} (jobid "
                                          "{}): not found, assuming "
@@ -136,7 +185,9 @@ def update_running_calcs_status(authinfo):
 
                         # calculation c is not found in the output of qstat
                         computed.append(c)
-                        c._set_scheduler_state(job_states.DONE)
+                        scheduler_poller.mark_changed(computer)
+                        attrs = c._get_scheduler_state_attrs(job_states.DONE)
+                    updates.append((c, None, attrs))
                 except Exception as e:
                     # TODO: implement a counter, after N retrials
                     # set it to a status that
@@ -148,25 +199,52 @@ def update_running_calcs_status(authinfo):
                         ), extra=logger_extra)
                     continue
 
+            with daemon_metrics.timer('db'):
+                JobCalculation._set_states_and_attrs(updates)
+            daemon_metrics.add_processed(len(updates))
+
+            # The detailed jobinfo of all the finished jobs is asked with
+            # a single command
+            detailed_jobinfos = {}
+            if computed:
+                try:
+                    with daemon_metrics.timer('scheduler'):
+                        detailed_jobinfos = s.get_detailed_jobinfos(
+                            [c.get_job_id() for c in computed])
+                except NotImplementedError:
+                    detailed_jobinfos = None
+                except Exception as e:
+                    execlogger.warning("There was an exception while "
+                                       "retrieving the detailed jobinfo of "
+                                       "{} jobs on computer {} ({}): "
+                                       "{}".format(
+                        len(computed), computer.name, e.__class__.__name__,
+                        e.message))
+
+            updates = []
             for c in computed:
+                attrs = {}
                 try:
                     logger_extra = get_dblogger_extra(c)
-                    try:
-                        detailed_jobinfo = s.get_detailed_jobinfo(
-                            jobid=c.get_job_id())
-                    except NotImplementedError:
+                    if detailed_jobinfos is None:
                         detailed_jobinfo = (
                             u"AiiDA MESSAGE: This scheduler does not implement "
                             u"the routine get_detailed_jobinfo to retrieve "
                             u"the information on "
                             u"a job after it has finished.")
+                    else:
+                        detailed_jobinfo = detailed_jobinfos.get(
+                            str(c.get_job_id()))
+                        if detailed_jobinfo is None:
+                            # Already reported above
+                            continue
                     last_jobinfo = c._get_last_jobinfo()
                     if last_jobinfo is None:
                         last_jobinfo = JobInfo()
                         last_jobinfo.job_id = c.get_job_id()
                         last_jobinfo.job_state = job_states.DONE
                     last_jobinfo.detailedJobinfo = detailed_jobinfo
-                    c._set_last_jobinfo(last_jobinfo)
+                    attrs = c._get_changed_jobinfo_attrs(last_jobinfo)
                 except Exception as e:
                     execlogger.warning("There was an exception while "
                                        "retrieving the detailed jobinfo "
@@ -179,11 +257,11 @@ def update_running_calcs_status(authinfo):
                     # of this routine; no further change should be done after
                     # this, so that in general the retriever can just
                     # poll for this state, if we want to.
-                    try:
-                        c._set_state(calc_states.COMPUTED)
-                    except ModificationNotAllowed:
-                        # Someone already set it, just skip
-                        pass
+                    # (If someone already set it, it is just skipped)
+                    updates.append((c, calc_states.COMPUTED, attrs))
+
+            with daemon_metrics.timer('db'):
+                JobCalculation._set_states_and_attrs(updates)
 
     return computed
 
@@ -191,14 +269,19 @@ def update_running_calcs_status(authinfo):
 def retrieve_jobs():
     from aiida.orm import JobCalculation, Computer
     from aiida.backends.utils import get_authinfo, QueryFactory
+    from aiida.transport.pool import transport_pool
+
+    transport_pool.close_expired()
 
     qmanager = QueryFactory()()
     # I create a unique set of pairs (computer, aiidauser)
-    computers_users_to_check = qmanager.query_jobcalculations_by_computer_user_state(
-            state=calc_states.COMPUTED,
-            only_computer_user_pairs=True,
-            only_enabled=True
-        )
+    with daemon_metrics.timer('db'):
+        computers_users_to_check = list(
+            qmanager.query_jobcalculations_by_computer_user_state(
+                state=calc_states.COMPUTED,
+                only_computer_user_pairs=True,
+                only_enabled=True
+            ))
 
     # I create a unique set of pairs (computer, aiidauser)
     #~ computers_users_to_check = list(
@@ -226,59 +309,331 @@ def retrieve_jobs():
             continue
 
 
+def parse_jobs(wait=False):
+    """
+    Parse the calculations in the PARSING state, i.e. those whose files
+    have been retrieved.
+
+    The calculations are parsed by a pool of Python processes (see
+    :py:mod:`aiida.daemon.parsing`), at most ``daemon.parser_workers`` of
+    them, each parsing one calculation after the other. The calculations
+    are handed over to the free processes, and the results are collected at
+    the next call, so that slow parsers do not block the other daemon
+    tasks. A parser running for more than its timeout (``Parser._timeout``,
+    or the ``daemon.parser_timeout`` property) is stopped, and the
+    calculation is set in the PARSINGFAILED state. Each daemon worker parses
+    only the calculations it has claimed (see :py:mod:`aiida.daemon.claims`),
+    so that a calculation is never parsed by two workers at the same time.
+
+    :param wait: if True, return only when the parsing of all the
+        calculations has ended
+    :return: the list of the pks of the calculations whose parsing ended
+        since the previous call
+    """
+    from aiida.daemon.parsing import parser_pool
+
+    parsed = []
+    while True:
+        parsed.extend(_collect_parsed())
+        _start_parsing()
+        if not wait or not parser_pool.get_running():
+            return parsed
+        parser_pool.wait()
+
+
+def _start_parsing():
+    """
+    Hand the calculations in the PARSING state over to the free processes
+    of the parser pool (see :py:func:`parse_jobs`).
+    """
+    from aiida.common.setup import get_property
+    from aiida.daemon.claims import work_claims
+    from aiida.daemon.parsing import parser_pool
+    from aiida.backends.utils import QueryFactory
+
+    free_slots = parser_pool.get_free_slots()
+    if not free_slots:
+        return
+
+    qmanager = QueryFactory()()
+    # Parsing does not need the computer, also parse the calculations of
+    # disabled computers
+    with daemon_metrics.timer('db'):
+        pending = [calc.pk for calc in
+                   qmanager.query_jobcalculations_by_computer_user_state(
+                       state=calc_states.PARSING,
+                       only_enabled=False
+                   )]
+    running = set(parser_pool.get_running())
+    pending = [calc_pk for calc_pk in pending if calc_pk not in running]
+    # The calculations claimed by other workers are left to them
+    pending = work_claims.claim(
+        'calc', pending,
+        limit=min(free_slots, max(1, get_property("daemon.claim_batch_size"))))
+
+    default_timeout = get_property("daemon.parser_timeout")
+    try:
+        while pending:
+            calc = load_node(pending[0])
+            if calc.get_state() != calc_states.PARSING:
+                # Parsed by another worker after the query
+                work_claims.release('calc', [pending.pop(0)])
+                continue
+            try:
+                timeout = calc.get_parserclass()._timeout
+            except Exception:
+                # No parser, or the parser cannot be loaded: the error
+                # is reported by the parser process
+                timeout = None
+            if timeout is None:
+                timeout = default_timeout
+            parser_pool.start(calc.pk, timeout)
+            pending.pop(0)
+    finally:
+        # Only on unexpected errors
+        work_claims.release('calc', pending)
+
+
+def _collect_parsed():
+    """
+    Collect the calculations whose parsing has ended in the parser pool
+    (see :py:func:`parse_jobs`), and set in the PARSINGFAILED state those
+    whose parser was stopped or terminated abnormally.
+
+    :return: the list of the pks of the calculations that were parsed
+        (successfully or not)
+    """
+    import traceback
+    from aiida.daemon.claims import work_claims
+    from aiida.daemon import parsing
+    from aiida.utils.logger import get_dblogger_extra
+
+    parsed = []
+    for calc_pk, outcome, elapsed, status in parsing.parser_pool.collect():
+        try:
+            if outcome == parsing.PARSED:
+                parsed.append(calc_pk)
+                daemon_metrics.add_processed()
+                continue
+            calc = load_node(calc_pk)
+            if outcome == parsing.TIMEOUT:
+                execlogger.error("[parsing of calc {}] The parser was "
+                                 "stopped after {} seconds".format(
+                    calc_pk, int(elapsed)), extra=get_dblogger_extra(calc))
+            elif calc.get_state() != calc_states.PARSING:
+                # The error was reported by the parser process
+                continue
+            elif outcome == parsing.DIED:
+                execlogger.error("[parsing of calc {}] The parser process "
+                                 "terminated abnormally (status {})".format(
+                    calc_pk, status), extra=get_dblogger_extra(calc))
+            try:
+                calc._set_state(calc_states.PARSINGFAILED)
+            except ModificationNotAllowed:
+                pass
+        except Exception:
+            execlogger.error("Error collecting the parsing of calc {}. "
+                             "Traceback: {}".format(calc_pk,
+                                                    traceback.format_exc()))
+        finally:
+            daemon_metrics.add_time('parsing', elapsed)
+            work_claims.release('calc', [calc_pk])
+
+    return parsed
+
+
+def stop_parsing():
+    """
+    Wait for the end of the parsing of the calculations handed over to the
+    parser pool (see :py:func:`parse_jobs`), and stop the parser processes.
+    """
+    from aiida.daemon.parsing import parser_pool
+
+    try:
+        while parser_pool.get_running():
+            parser_pool.wait()
+            _collect_parsed()
+    finally:
+        parser_pool.close()
+
+
+def _parse_in_worker(calc_pk):
+    """
+    Parse the calculation with the given pk, in a process of the parser
+    pool (see :py:mod:`aiida.daemon.parsing`).
+
+    :return: True if the calculation was parsed (successfully or not),
+        False on errors.
+    """
+    import traceback
+    from aiida.utils.logger import get_dblogger_extra
+    from aiida.backends.utils import close_thread_db_connection
+
+    try:
+        calc = load_node(calc_pk)
+        return _parse_retrieved(calc, get_dblogger_extra(calc))
+    except Exception:
+        execlogger.error("Error parsing calc {}. Traceback: {}".format(
+            calc_pk, traceback.format_exc()))
+        return False
+    finally:
+        close_thread_db_connection()
+
+
 # in daemon
 def update_jobs():
     """
     calls an update for each set of pairs (machine, aiidauser)
+
+    Computers are polled at the adaptive intervals decided by
+    :py:data:`aiida.daemon.polling.scheduler_poller`; the calculations of
+    all users of a computer are collected first, so that a single scheduler
+    query can be used for all the users with the same remote account. With
+    several daemon workers, each computer is polled by one of them at a
+    time (see :py:mod:`aiida.daemon.claims`).
     """
     from aiida.orm import JobCalculation, Computer, User
     from aiida.backends.utils import get_authinfo, QueryFactory
+    from aiida.daemon.claims import work_claims
+    from aiida.daemon.polling import scheduler_poller, get_remote_username
+    from aiida.transport.pool import transport_pool
+
+    transport_pool.close_expired()
 
     qmanager = QueryFactory()()
     # I create a unique set of pairs (computer, aiidauser)
-    computers_users_to_check = qmanager.query_jobcalculations_by_computer_user_state(
-            state=calc_states.WITHSCHEDULER,
-            only_computer_user_pairs=True,
-            only_enabled=True
-        )
-
+    with daemon_metrics.timer('db'):
+        computers_users_to_check = list(
+            qmanager.query_jobcalculations_by_computer_user_state(
+                state=calc_states.WITHSCHEDULER,
+                only_computer_user_pairs=True,
+                only_enabled=True
+            ))
+
+    users_by_computer = {}
+    computers = {}
     for computer, aiidauser in computers_users_to_check:
+        computers[computer.pk] = computer
+        users_by_computer.setdefault(computer.pk, []).append(aiidauser)
+
+    for computer_pk, aiidausers in users_by_computer.iteritems():
+        computer = computers[computer_pk]
+        if not scheduler_poller.is_due(computer):
+            execlogger.debug("Skipping computer {}, polled less than {}s "
+                             "ago".format(computer.name,
+                                          scheduler_poller.get_interval(
+                                              computer)))
+            continue
 
-        execlogger.debug("({},{}) pair to check".format(
-            aiidauser.email, computer.name))
-
-        try:
-            authinfo = get_authinfo(computer.dbcomputer, aiidauser._dbuser)
-            computed_calcs = update_running_calcs_status(authinfo)
-        except Exception as e:
-            msg = ("Error while updating calculation status "
-                   "for aiidauser={} on computer={}, "
-                   "error type is {}, error message: {}".format(
-                aiidauser.email,
-                computer.name,
-                e.__class__.__name__, e.message))
-            execlogger.error(msg)
-            # Continue with next computer
+        # Only one daemon worker at a time polls a computer
+        if not work_claims.claim('poll', [computer_pk]):
+            execlogger.debug("Skipping computer {}, polled by another daemon "
+                             "worker".format(computer.name))
             continue
+        try:
+            calcs_by_user = []
+            # The job ids are shared only between the users of the same
+            # remote account
+            jobids_by_username = {}
+            for aiidauser in aiidausers:
+                execlogger.debug("({},{}) pair to check".format(
+                    aiidauser.email, computer.name))
+                try:
+                    authinfo = get_authinfo(computer.dbcomputer,
+                                            aiidauser._dbuser)
+                    with daemon_metrics.timer('db'):
+                        calcs = list(qmanager.
+                            query_jobcalculations_by_computer_user_state(
+                                state=calc_states.WITHSCHEDULER,
+                                computer=authinfo.dbcomputer,
+                                user=authinfo.aiidauser
+                            ))
+                    username = get_remote_username(authinfo)
+                except Exception as e:
+                    msg = ("Error while updating calculation status "
+                           "for aiidauser={} on computer={}, "
+                           "error type is {}, error message: {}".format(
+                        aiidauser.email,
+                        computer.name,
+                        e.__class__.__name__, e.message))
+                    execlogger.error(msg)
+                    continue
+                calcs_by_user.append((aiidauser, authinfo, calcs))
+                jobids_by_username.setdefault(username, []).extend(
+                    str(c.get_job_id()) for c in calcs
+                    if c.get_job_id() is not None)
+
+            for username, jobids in jobids_by_username.iteritems():
+                scheduler_poller.set_expected_jobids(computer, jobids,
+                                                     username=username)
+
+            for aiidauser, authinfo, calcs in calcs_by_user:
+                try:
+                    computed_calcs = update_running_calcs_status(authinfo,
+                                                                 calcs)
+                except Exception as e:
+                    msg = ("Error while updating calculation status "
+                           "for aiidauser={} on computer={}, "
+                           "error type is {}, error message: {}".format(
+                        aiidauser.email,
+                        computer.name,
+                        e.__class__.__name__, e.message))
+                    execlogger.error(msg)
+                    # Continue with next user
+                    continue
+
+            interval = scheduler_poller.report_poll(computer)
+            execlogger.debug("Next poll of computer {} in {}s".format(
+                computer.name, interval))
+        finally:
+            work_claims.release('poll', [computer_pk])
 
 
 def submit_jobs():
     """
     Submit all jobs in the TOSUBMIT state.
+
+    Different (computer, aiidauser) pairs are processed concurrently by a
+    pool of threads (its size is set by the ``daemon.submission_threads``
+    property), so that a slow computer does not delay the submission to
+    the other ones. The calculations of each pair are further split among
+    up to ``computer.get_max_concurrent_submissions()`` connections.
+
+    The limits of each computer on the number of queued jobs and on the
+    submission rate are respected, sharing the free slots between the AiiDA
+    users (see :py:mod:`aiida.daemon.throttling`); the calculations that
+    cannot be submitted yet stay in the TOSUBMIT state.
+
+    With several daemon workers, each of them submits the calculations it
+    has claimed (at most ``daemon.claim_batch_size`` for each computer and
+    user, see :py:mod:`aiida.daemon.claims`).
+
+    :return: a dictionary with the computer names as keys, and as values
+        a dictionary with the number of ``submitted`` and ``failed``
+        calculations, and the ``seconds`` spent submitting to that computer.
     """
-    from aiida.orm import JobCalculation, Computer, User
+    from aiida.common.setup import get_property
     from aiida.utils.logger import get_dblogger_extra
     from aiida.backends.utils import get_authinfo, QueryFactory
+    from aiida.daemon.claims import work_claims
+    from aiida.daemon.throttling import submission_throttle
+    from aiida.transport.pool import transport_pool
 
+    transport_pool.close_expired()
 
     qmanager = QueryFactory()()
     # I create a unique set of pairs (computer, aiidauser)
-    computers_users_to_check = qmanager.query_jobcalculations_by_computer_user_state(
-            state=calc_states.TOSUBMIT,
-            only_computer_user_pairs=True,
-            only_enabled=True
-        )
-
+    with daemon_metrics.timer('db'):
+        computers_users_to_check = list(
+            qmanager.query_jobcalculations_by_computer_user_state(
+                state=calc_states.TOSUBMIT,
+                only_computer_user_pairs=True,
+                only_enabled=True
+            ))
+
+    computers = {}
+    # computer pk -> {aiidauser pk: calc pks}
+    calc_pks_by_computer = {}
     for computer, aiidauser in computers_users_to_check:
 
         execlogger.debug("({},{}) pair to submit".format(
@@ -314,7 +669,19 @@ def submit_jobs():
                 # Go to the next (dbcomputer,aiidauser) pair
                 continue
 
-            submitted_calcs = submit_jobs_with_authinfo(authinfo)
+            if not authinfo.enabled:
+                continue
+
+            with daemon_metrics.timer('db'):
+                calc_pks = [
+                    c.pk for c in
+                    qmanager.query_jobcalculations_by_computer_user_state(
+                        state=calc_states.TOSUBMIT,
+                        computer=authinfo.dbcomputer,
+                        user=authinfo.aiidauser)]
+            computers[computer.pk] = computer
+            calc_pks_by_computer.setdefault(
+                computer.pk, {})[aiidauser.pk] = calc_pks
         except Exception as e:
             import traceback
 
@@ -329,25 +696,192 @@ def submit_jobs():
             # Continue with next computer
             continue
 
+    # List of (computer_pk, aiidauser_pk, calc_pks) tuples; each of them is
+    # submitted in a separate thread, with its own transport
+    submission_chunks = []
+    # The claims of this daemon worker (see aiida.daemon.claims)
+    claimed_computer_pks = []
+    claimed_calc_pks = []
+    batch_size = max(1, get_property("daemon.claim_batch_size"))
+    try:
+        for computer_pk, calc_pks_by_user in calc_pks_by_computer.iteritems():
+            computer = computers[computer_pk]
+            # Only one daemon worker at a time submits to a computer with
+            # submission limits, so that the limits are respected
+            if (computer.get_max_queued_jobs() is not None or
+                    computer.get_max_submissions_per_minute() is not None):
+                if not work_claims.claim('submission', [computer_pk]):
+                    execlogger.debug("Skipping computer {}, another daemon "
+                                     "worker is submitting to it".format(
+                        computer.name))
+                    continue
+                claimed_computer_pks.append(computer_pk)
+            try:
+                with daemon_metrics.timer('db'):
+                    selected = submission_throttle.select(computer,
+                                                          calc_pks_by_user)
+            except Exception as e:
+                execlogger.error("Error while selecting the calculations to "
+                                 "submit to computer={}, error type is {}, "
+                                 "error message: {}".format(
+                    computer.name, e.__class__.__name__, e.message))
+                continue
+
+            num_held = (
+                sum(len(pks) for pks in calc_pks_by_user.itervalues()) -
+                sum(len(pks) for pks in selected.itervalues()))
+            if num_held:
+                execlogger.debug("Holding {} calculations in the TOSUBMIT "
+                                 "state for computer {}, because of its "
+                                 "submission limits".format(num_held,
+                                                            computer.name))
+
+            width = max(1, computer.get_max_concurrent_submissions())
+            for aiidauser_pk, calc_pks in selected.iteritems():
+                # The calculations claimed by other workers are left to them
+                calc_pks = work_claims.claim('calc', calc_pks,
+                                             limit=batch_size)
+                claimed_calc_pks.extend(calc_pks)
+                for idx in range(width):
+                    chunk = calc_pks[idx::width]
+                    if chunk:
+                        submission_chunks.append(
+                            (computer_pk, aiidauser_pk, chunk))
+
+        return _submit_chunks(submission_chunks, computers)
+    finally:
+        work_claims.release('calc', claimed_calc_pks)
+        work_claims.release('submission', claimed_computer_pks)
+
+
+def _submit_chunks(submission_chunks, computers):
+    """
+    Submit the calculations of the given chunks, each in a thread of a pool,
+    and record the submissions (see :py:func:`submit_jobs`).
+
+    :param submission_chunks: a list of (computer pk, aiidauser pk,
+        calculation pks) tuples
+    :param computers: a dictionary with the computers, by pk
+    :return: the throughput, as returned by :py:func:`submit_jobs`
+    """
+    from multiprocessing.pool import ThreadPool
+    from aiida.common.setup import get_property
+    from aiida.daemon.polling import scheduler_poller
+    from aiida.daemon.throttling import submission_throttle
+
+    throughput = {}
+    if not submission_chunks:
+        return throughput
+
+    pool = ThreadPool(
+        min(max(1, get_property("daemon.submission_threads")),
+            len(submission_chunks)))
+    submitted_by_computer = {}
+    try:
+        results = [pool.apply_async(_submit_calcs_in_thread, chunk)
+                   for chunk in submission_chunks]
+        pool.close()
+        for chunk, result in zip(submission_chunks, results):
+            computer_name, start, end, num_submitted, num_failed = result.get()
+            submitted_by_computer[chunk[0]] = (
+                submitted_by_computer.get(chunk[0], 0) + num_submitted)
+            stats = throughput.setdefault(
+                computer_name, {'submitted': 0, 'failed': 0,
+                                'start': start, 'end': end})
+            stats['submitted'] += num_submitted
+            stats['failed'] += num_failed
+            daemon_metrics.add_processed(num_submitted)
+            stats['start'] = min(stats['start'], start)
+            stats['end'] = max(stats['end'], end)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for computer_pk, num_submitted in submitted_by_computer.iteritems():
+        try:
+            submission_throttle.report_submissions(computers[computer_pk],
+                                                   num_submitted)
+            if num_submitted:
+                # The new jobs are polled soon, even if the computer was
+                # polled at a long interval until now
+                scheduler_poller.report_submission(computers[computer_pk])
+        except Exception as e:
+            execlogger.warning("Unable to record the submissions to computer "
+                               "{}: {}".format(computers[computer_pk].name, e))
+
+    for computer_name, stats in throughput.iteritems():
+        stats['seconds'] = stats.pop('end') - stats.pop('start')
+        if stats['submitted'] or stats['failed']:
+            execlogger.info(
+                "Submitted {} calculations ({} failed) to computer {} in "
+                "{:.1f}s ({:.2f} calculations/s)".format(
+                    stats['submitted'], stats['failed'], computer_name,
+                    stats['seconds'],
+                    stats['submitted'] / max(stats['seconds'], 1.e-3)))
+
+    return throughput
+
+
+def _submit_calcs_in_thread(computer_pk, aiidauser_pk, calc_pks):
+    """
+    Submit the given calculations of a (computer, aiidauser) pair, over a
+    single transport. Meant to be run in a thread of the pool created by
+    :py:func:`submit_jobs`: the ORM objects are loaded again from their pks
+    so that they are bound to the database connection of this thread, which
+    is released at the end.
+
+    :return: a tuple (computer name, start time, end time, number of
+        submitted calculations, number of failed submissions). The
+        calculations that were skipped (e.g. because they were submitted by
+        someone else in the meantime) are neither submitted nor failed.
+        Errors are logged and never raised, so that the other threads are
+        not affected.
+    """
+    import time
+    from aiida.orm import Computer, User
+    from aiida.backends.utils import get_authinfo, close_thread_db_connection
+
+    start = time.time()
+    computer_name = str(computer_pk)
+    num_submitted = 0
+    # Filled by _submit_calc_list, also if it raises
+    failed_calcs = []
+    try:
+        computer = Computer.get(computer_pk)
+        computer_name = computer.name
+        aiidauser = User.search_for_users(id=aiidauser_pk)[0]
+        calcs = [load_node(pk) for pk in calc_pks]
+        authinfo = get_authinfo(computer.dbcomputer, aiidauser._dbuser)
+        num_submitted = len(_submit_calc_list(authinfo, calcs,
+                                              failed_calcs=failed_calcs))
+    except Exception as e:
+        import traceback
+
+        msg = ("Error while submitting jobs "
+               "for aiidauser pk={} on computer={}, "
+               "error type is {}, traceback: {}".format(
+            aiidauser_pk,
+            computer_name,
+            e.__class__.__name__, traceback.format_exc()))
+        execlogger.error(msg)
+    finally:
+        close_thread_db_connection()
+
+    return (computer_name, start, time.time(), num_submitted,
+            len(failed_calcs))
+
 
 def submit_jobs_with_authinfo(authinfo):
     """
     Submit jobs in TOSUBMIT status belonging
     to user and machine as defined in the 'dbauthinfo' table.
-    """
-    from aiida.orm import JobCalculation
-    from aiida.utils.logger import get_dblogger_extra
 
+    :return: the list of calculations that were successfully submitted
+    """
     from aiida.backends.utils import QueryFactory
 
-
-
     if not authinfo.enabled:
-        return
-
-    execlogger.debug("Submitting jobs for user {} "
-                     "and machine {}".format(
-        authinfo.aiidauser.email, authinfo.dbcomputer.name))
+        return []
 
     qmanager = QueryFactory()()
     # I create a unique set of pairs (computer, aiidauser)
@@ -356,6 +890,36 @@ def submit_jobs_with_authinfo(authinfo):
         computer=authinfo.dbcomputer,
         user=authinfo.aiidauser)
 
+    return _submit_calc_list(authinfo, calcs_to_inquire)
+
+
+def _submit_calc_list(authinfo, calcs_to_inquire, failed_calcs=None):
+    """
+    Submit the given calculations, all belonging to the user and machine
+    defined by the authinfo, opening a single transport.
+
+    :param failed_calcs: if given, a list to which the calculations whose
+        submission failed (i.e. that were set in the SUBMISSIONFAILED
+        state) are appended; the calculations that were skipped, e.g.
+        because they were submitted by someone else in the meantime, are
+        not
+    :return: the list of calculations that were successfully submitted
+    """
+    if failed_calcs is None:
+        failed_calcs = []
+
+    from aiida.orm import Computer
+    from aiida.utils.logger import get_dblogger_extra
+    from aiida.transport.pool import transport_pool
+
+    if not authinfo.enabled:
+        return []
+
+    execlogger.debug("Submitting jobs for user {} "
+                     "and machine {}".format(
+        authinfo.aiidauser.email, authinfo.dbcomputer.name))
+
+    submitted_calcs = []
 
     # I avoid to open an ssh connection if there are
     # no calcs with state WITHSCHEDULER
@@ -363,13 +927,24 @@ def submit_jobs_with_authinfo(authinfo):
         # Open connection
         try:
             # I do it here so that the transport is opened only once per computer
-            with authinfo.get_transport() as t:
-                for c in calcs_to_inquire:
+            with transport_pool.request_transport(authinfo) as t:
+                computer = Computer(dbcomputer=authinfo.dbcomputer)
+                s = computer.get_scheduler()
+                s.set_transport(t)
+                for calc_group in _group_for_job_arrays(computer, s,
+                                                        calcs_to_inquire):
+                    if len(calc_group) > 1:
+                        submitted_calcs.extend(_submit_calc_array(
+                            calc_group, authinfo, t, s, failed_calcs))
+                        continue
+
+                    c = calc_group[0]
                     logger_extra = get_dblogger_extra(c)
                     t._set_logger_extra(logger_extra)
 
                     try:
                         submit_calc(calc=c, authinfo=authinfo, transport=t)
+                        submitted_calcs.append(c)
                     except Exception as e:
                         # TODO: implement a counter, after N retrials
                         # set it to a status that
@@ -377,6 +952,8 @@ def submit_jobs_with_authinfo(authinfo):
                         execlogger.warning("There was an exception for "
                                            "calculation {} ({}): {}".format(
                             c.pk, e.__class__.__name__, e.message))
+                        if _submission_failed(c):
+                            failed_calcs.append(c)
                         # I just proceed to the next calculation
                         continue
         # Catch exceptions also at this level (this happens only if there is
@@ -390,6 +967,8 @@ def submit_jobs_with_authinfo(authinfo):
                 logger_extra = get_dblogger_extra(calc)
                 try:
                     calc._set_state(calc_states.SUBMISSIONFAILED)
+                    if calc not in failed_calcs:
+                        failed_calcs.append(calc)
                 except ModificationNotAllowed:
                     # Someone already set it, just skip
                     pass
@@ -400,13 +979,16 @@ def submit_jobs_with_authinfo(authinfo):
                                  extra=logger_extra)
             raise
 
+    return submitted_calcs
+
 
-def submit_calc(calc, authinfo, transport=None):
+def submit_calc(calc, authinfo, transport=None, submit_job=True):
     """
     Submit a calculation
 
-    :note: if no transport is passed, a new transport is opened and then
-        closed within this function. If you want to use an already opened
+    :note: if no transport is passed, a transport is taken from the
+        :py:data:`aiida.transport.pool.transport_pool` and given back
+        within this function. If you want to use an already opened
         transport, pass it as further parameter. In this case, the transport
         has to be already open, and must coincide with the transport of the
         the computer defined by the authinfo.
@@ -417,13 +999,22 @@ def submit_calc(calc, authinfo, transport=None):
     :param transport: if passed, must be an already opened transport. No checks
         are done on the consistency of the given transport with the transport
         of the computer defined in the authinfo.
+    :param submit_job: if False, the files of the calculation are uploaded,
+        but the job is not submitted to the scheduler, and the calculation
+        is left in the SUBMITTING state (used to submit job arrays).
+    :return: if submit_job is False, a tuple with the remote working
+        directory and the name of the submit script of the calculation
     """
+    import os
+    import time
     from aiida.orm import Code, Computer
     from aiida.common.folders import SandboxFolder
     from aiida.common.exceptions import (
         InputValidationError)
     from aiida.orm.data.remote import RemoteData
     from aiida.utils.logger import get_dblogger_extra
+    from aiida.common.utils import escape_for_bash
+    from aiida.transport.pool import transport_pool, is_connection_error
 
     if not authinfo.enabled:
         return
@@ -431,13 +1022,12 @@ def submit_calc(calc, authinfo, transport=None):
     logger_extra = get_dblogger_extra(calc)
 
     if transport is None:
-        t = authinfo.get_transport()
+        t = None
         must_open_t = True
     else:
         t = transport
         must_open_t = False
-
-    t._set_logger_extra(logger_extra)
+        t._set_logger_extra(logger_extra)
 
     if calc._has_cached_links():
         raise ValueError("Cannot submit calculation {} because it has "
@@ -461,9 +1051,11 @@ def submit_calc(calc, authinfo, transport=None):
         raise ValueError("The calculation has already been submitted by "
                          "someone else!")
 
+    discard_t = False
     try:
         if must_open_t:
-            t.open()
+            t = transport_pool.get_transport(authinfo)
+            t._set_logger_extra(logger_extra)
 
         s = Computer(dbcomputer=authinfo.dbcomputer).get_scheduler()
         s.set_transport(t)
@@ -526,35 +1118,25 @@ def submit_calc(calc, authinfo, transport=None):
             # in the calculation properties using _set_remote_dir
             # and I do not have to know the logic, but I just need to
             # read the absolute path from the calculation properties.
-            t.mkdir(calcinfo.uuid[:2], ignore_existing=True)
-            t.chdir(calcinfo.uuid[:2])
-            t.mkdir(calcinfo.uuid[2:4], ignore_existing=True)
-            t.chdir(calcinfo.uuid[2:4])
-            t.mkdir(calcinfo.uuid[4:])
-            t.chdir(calcinfo.uuid[4:])
+            # The sharded folders are created with a single batch of
+            # commands (a single round-trip for remote transports); the
+            # last mkdir fails if the folder of the calculation exists
+            shard_folder = '{}/{}'.format(calcinfo.uuid[:2], calcinfo.uuid[2:4])
+            calc_folder = '{}/{}'.format(shard_folder, calcinfo.uuid[4:])
+            results = t.exec_command_batch(
+                ['mkdir -p {}'.format(escape_for_bash(shard_folder)),
+                 'mkdir {}'.format(escape_for_bash(calc_folder))],
+                stop_on_error=True)
+            retval, _, stderr = results[-1]
+            if len(results) != 2 or retval != 0:
+                raise OSError("Unable to create the remote folder {}: "
+                              "{}".format(calc_folder, stderr.strip()))
+            t.chdir(calc_folder)
             workdir = t.getcwd()
             # I store the workdir of the calculation for later file
             # retrieval
             calc._set_remote_workdir(workdir)
 
-            # I first create the code files, so that the code can put
-            # default files to be overwritten by the plugin itself.
-            # Still, beware! The code file itself could be overwritten...
-            # But I checked for this earlier.
-            for code in input_codes:
-                if code.is_local():
-                    # Note: this will possibly overwrite files
-                    for f in code.get_folder_list():
-                        t.put(code.get_abs_path(f), f)
-                    t.chmod(code.get_local_executable(), 0755)  # rwxr-xr-x
-
-            # copy all files, recursively with folders
-            for f in folder.get_content_list():
-                execlogger.debug("[submission of calc {}] "
-                                 "copying file/folder {}...".format(calc.pk, f),
-                                 extra=logger_extra)
-                t.put(folder.get_abs_path(f), f)
-
             # local_copy_list is a list of tuples,
             # each with (src_abs_path, dest_rel_path)
             # NOTE: validation of these lists are done
@@ -563,14 +1145,46 @@ def submit_calc(calc, authinfo, transport=None):
             remote_copy_list = calcinfo.remote_copy_list
             remote_symlink_list = calcinfo.remote_symlink_list
 
+            # I first create the code files, so that the code can put
+            # default files to be overwritten by the plugin itself.
+            # Still, beware! The code file itself could be overwritten...
+            # But I checked for this earlier.
+            upload_list = []
+            for code in input_codes:
+                if code.is_local():
+                    for f in code.get_folder_list():
+                        upload_list.append((code.get_abs_path(f), f))
+            # then all files of the folder, recursively with folders
+            for f in folder.get_content_list():
+                upload_list.append((folder.get_abs_path(f), f))
+            # and finally the files of the local_copy_list
             if local_copy_list is not None:
-                for src_abs_path, dest_rel_path in local_copy_list:
-                    execlogger.debug("[submission of calc {}] "
-                                     "copying local file/folder to {}".format(
-                        calc.pk, dest_rel_path),
-                                     extra=logger_extra)
+                upload_list.extend(local_copy_list)
+
+            upload_start = time.time()
+            upload_cache_dir = computer.get_upload_cache_dir()
+            cached_list = []
+            if upload_cache_dir is not None:
+                # The files go through the cache, after the other entries
+                upload_list, cached_list = _split_cached_uploads(
+                    upload_list)
+
+            # Note: this will possibly overwrite files, as code files
+            # come first in the list
+            _upload_files(t, upload_list, computer.get_bulk_staging(),
+                          calc.pk, logger_extra)
+
+            if cached_list:
+                for src_abs_path, dest_rel_path in _upload_to_cache(
+                        t, cached_list,
+                        upload_cache_dir.format(username=remote_user),
+                        calc.pk, logger_extra):
                     t.put(src_abs_path, dest_rel_path)
 
+            for code in input_codes:
+                if code.is_local():
+                    t.chmod(code.get_local_executable(), 0755)  # rwxr-xr-x
+
             if remote_copy_list is not None:
                 for (remote_computer_uuid, remote_abs_path,
                      dest_rel_path) in remote_copy_list:
@@ -615,6 +1229,7 @@ def submit_calc(calc, authinfo, transport=None):
                         raise IOError("It is not possible to create a symlink "
                                       "between two different machines for "
                                       "calculation {}".format(calc.pk))
+            daemon_metrics.add_time('transport', time.time() - upload_start)
 
             remotedata = RemoteData(computer=computer,
                                     remote_path=workdir)
@@ -622,27 +1237,19 @@ def submit_calc(calc, authinfo, transport=None):
                                      link_type=LinkType.CREATE)
             remotedata.store()
 
-            job_id = s.submit_from_script(t.getcwd(), script_filename)
-            calc._set_job_id(job_id)
-            # This should always be possible, because we should be
-            # the only ones submitting this calculations,
-            # so I do not check the ModificationNotAllowed
-            calc._set_state(calc_states.WITHSCHEDULER)
-            ## I do not set the state to queued; in this way, if the
-            ## daemon is down, the user sees '(unknown)' as last state
-            ## and understands that the daemon is not running.
-            # if job_tmpl.submit_as_hold:
-            #    calc._set_scheduler_state(job_states.QUEUED_HELD)
-            #else:
-            #    calc._set_scheduler_state(job_states.QUEUED)
-
-            execlogger.debug("submitted calculation {} on {} with "
-                             "jobid {}".format(calc.pk, computer.name, job_id),
-                             extra=logger_extra)
+            if not submit_job:
+                execlogger.debug("uploaded calculation {} on {}, to be "
+                                 "submitted in a job array".format(
+                    calc.pk, computer.name), extra=logger_extra)
+                return workdir, script_filename
+
+            _submit_uploaded_calc(calc, s, workdir, script_filename)
 
     except Exception as e:
         import traceback
 
+        # The transport is not reused after a transport error
+        discard_t = is_connection_error(t, e)
         try:
             calc._set_state(calc_states.SUBMISSIONFAILED)
         except ModificationNotAllowed:
@@ -655,226 +1262,1049 @@ def submit_calc(calc, authinfo, transport=None):
                          extra=logger_extra)
         raise
     finally:
-        # close the transport, but only if it was opened within this function
-        if must_open_t:
-            t.close()
+        # give back the transport, but only if it was taken within this
+        # function
+        if must_open_t and t is not None:
+            transport_pool.release_transport(t, discard=discard_t)
 
 
-def retrieve_computed_for_authinfo(authinfo):
-    from aiida.orm import JobCalculation
-    from aiida.common.folders import SandboxFolder
-    from aiida.orm.data.folder import FolderData
+def _submit_uploaded_calc(calc, scheduler, workdir, script_filename):
+    """
+    Submit to the scheduler the job of a calculation in the SUBMITTING
+    state, whose files were already uploaded, and set the calculation to
+    the WITHSCHEDULER state.
+
+    :param calc: the calculation
+    :param scheduler: the scheduler, with an open transport set
+    :param workdir: the remote working directory of the calculation
+    :param script_filename: the name of the submit script in workdir
+    """
     from aiida.utils.logger import get_dblogger_extra
-    from aiida.orm import DataFactory
 
-    from aiida.backends.utils import QueryFactory
+    with daemon_metrics.timer('scheduler'):
+        job_id = scheduler.submit_from_script(workdir, script_filename)
+    calc._set_job_id(job_id)
+    # This should always be possible, because we should be
+    # the only ones submitting this calculations,
+    # so I do not check the ModificationNotAllowed
+    calc._set_state(calc_states.WITHSCHEDULER)
+    ## I do not set the state to queued; in this way, if the
+    ## daemon is down, the user sees '(unknown)' as last state
+    ## and understands that the daemon is not running.
+    # if job_tmpl.submit_as_hold:
+    #    calc._set_scheduler_state(job_states.QUEUED_HELD)
+    #else:
+    #    calc._set_scheduler_state(job_states.QUEUED)
+
+    execlogger.debug("submitted calculation {} with jobid {}".format(
+        calc.pk, job_id), extra=get_dblogger_extra(calc))
+
+
+def _get_job_array_key(calc):
+    """
+    Return a key identifying the scheduler options of a calculation: only
+    calculations with the same key can be submitted in the same job array.
+    """
+    import json
+
+    return json.dumps([
+        calc.get_resources(full=True),
+        calc.get_max_wallclock_seconds(),
+        calc.get_queue_name(),
+        calc.get_priority(),
+        calc.get_max_memory_kb(),
+        calc.get_custom_scheduler_commands(),
+        calc.get_import_sys_environment(),
+    ], sort_keys=True)
+
+
+def _group_for_job_arrays(computer, scheduler, calcs):
+    """
+    Group the calculations to submit to a computer in job arrays, according
+    to ``computer.get_job_array_max_size()``.
+
+    :return: a list of lists of calculations, in the order of submission;
+        the lists with more than one calculation are to be submitted as a
+        job array
+    """
+    max_size = computer.get_job_array_max_size()
+    try:
+        can_submit_job_arrays = scheduler.get_feature('can_submit_job_arrays')
+    except NotImplementedError:
+        can_submit_job_arrays = False
+    if max_size is None or not can_submit_job_arrays:
+        return [[c] for c in calcs]
+
+    groups = []
+    open_groups = {}
+    for c in calcs:
+        try:
+            key = _get_job_array_key(c)
+        except Exception:
+            # The options are checked again in the submission
+            groups.append([c])
+            continue
+        group = open_groups.get(key)
+        if group is None or len(group) >= max_size:
+            group = []
+            groups.append(group)
+            open_groups[key] = group
+        group.append(c)
+    return groups
+
+
+def _get_job_array_template(calc, scheduler):
+    """
+    Return the JobTemplate of the header of a job array, with the scheduler
+    options of the given calculation.
+    """
+    from aiida.scheduler.datastructures import JobTemplate
+
+    job_tmpl = JobTemplate()
+    job_tmpl.submit_as_hold = False
+    job_tmpl.rerunnable = False
+    job_tmpl.job_name = 'aiida-array-{}'.format(calc.pk)
+    job_tmpl.job_resource = scheduler.create_job_resource(
+        **calc.get_resources(full=True))
+    custom_sched_commands = calc.get_custom_scheduler_commands()
+    if custom_sched_commands:
+        job_tmpl.custom_scheduler_commands = custom_sched_commands
+    job_tmpl.import_sys_environment = calc.get_import_sys_environment()
+
+    queue_name = calc.get_queue_name()
+    if queue_name is not None:
+        job_tmpl.queue_name = queue_name
+    priority = calc.get_priority()
+    if priority is not None:
+        job_tmpl.priority = priority
+    max_memory_kb = calc.get_max_memory_kb()
+    if max_memory_kb is not None:
+        job_tmpl.max_memory_kb = max_memory_kb
+    max_wallclock_seconds = calc.get_max_wallclock_seconds()
+    if max_wallclock_seconds is not None:
+        job_tmpl.max_wallclock_seconds = max_wallclock_seconds
+    return job_tmpl
+
+
+def _submit_calc_array(calcs, authinfo, transport, scheduler,
+                       failed_calcs):
+    """
+    Submit the given calculations, with the same scheduler options (see
+    :py:func:`_get_job_array_key`), as a single job array. Each task of
+    the array runs the submit script of one calculation, in its working
+    directory. If the submission of the array fails, the calculations are
+    submitted as separate jobs.
+
+    :param calcs: the calculations, in the TOSUBMIT state
+    :param authinfo: the authinfo of the calculations
+    :param transport: the open transport
+    :param scheduler: the scheduler, with the transport set
+    :param failed_calcs: a list to which the calculations whose submission
+        failed are appended (see :py:func:`_submit_calc_list`)
+    :return: the list of calculations that were successfully submitted
+    """
+    import os
+    import tempfile
+    import traceback
+    from aiida.utils.logger import get_dblogger_extra
+
+    uploaded = []
+    for c in calcs:
+        transport._set_logger_extra(get_dblogger_extra(c))
+        try:
+            workdir, script_filename = submit_calc(
+                calc=c, authinfo=authinfo, transport=transport,
+                submit_job=False)
+        except Exception as e:
+            execlogger.warning("There was an exception for "
+                               "calculation {} ({}): {}".format(
+                c.pk, e.__class__.__name__, e.message))
+            if _submission_failed(c):
+                failed_calcs.append(c)
+            continue
+        uploaded.append((c, workdir, script_filename))
+
+    if len(uploaded) > 1:
+        # The script of the array is put in the working directory of the
+        # first calculation, where also the scheduler output of the array
+        # itself goes; the output of each task is redirected to the
+        # scheduler output files of its calculation
+        first_calc, array_workdir, _ = uploaded[0]
+        task_scripts = []
+        for c, workdir, script_filename in uploaded:
+            sched_error_file = (None
+                                if c._SCHED_ERROR_FILE == c._SCHED_OUTPUT_FILE
+                                else c._SCHED_ERROR_FILE)
+            task_scripts.append((workdir, script_filename,
+                                 c._SCHED_OUTPUT_FILE, sched_error_file))
+        try:
+            script_content = scheduler.get_array_submit_script(
+                _get_job_array_template(first_calc, scheduler), task_scripts)
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(script_content)
+                f.flush()
+                transport.putfile(f.name, os.path.join(array_workdir,
+                                                       _ARRAY_SCRIPT_FILENAME))
+            with daemon_metrics.timer('scheduler'):
+                array_job_id, job_ids = scheduler.submit_array_from_script(
+                    array_workdir, _ARRAY_SCRIPT_FILENAME, len(uploaded))
+        except Exception:
+            execlogger.warning("Submission of the job array of calculations "
+                               "{} failed, submitting them as separate jobs. "
+                               "Traceback: {}".format(
+                [c.pk for c, _, _ in uploaded], traceback.format_exc()))
+        else:
+            for (c, _, _), job_id in zip(uploaded, job_ids):
+                c._set_job_id(job_id)
+                c._set_array_job_id(array_job_id)
+                c._set_state(calc_states.WITHSCHEDULER)
+            execlogger.debug("submitted calculations {} in the job array "
+                             "{}".format([c.pk for c, _, _ in uploaded],
+                                         array_job_id))
+            return [c for c, _, _ in uploaded]
+
+    submitted_calcs = []
+    for c, workdir, script_filename in uploaded:
+        logger_extra = get_dblogger_extra(c)
+        transport._set_logger_extra(logger_extra)
+        try:
+            _submit_uploaded_calc(c, scheduler, workdir, script_filename)
+        except Exception:
+            try:
+                c._set_state(calc_states.SUBMISSIONFAILED)
+            except ModificationNotAllowed:
+                # Someone already set it, just skip
+                pass
+            failed_calcs.append(c)
+
+            execlogger.error("Submission of calc {} failed, check also the "
+                             "log file! Traceback: {}".format(
+                c.pk, traceback.format_exc()), extra=logger_extra)
+            continue
+        submitted_calcs.append(c)
+    return submitted_calcs
+
+
+def _submission_failed(calc):
+    """
+    Return True if the submission of a calculation, which raised an
+    exception, failed; False if the calculation was skipped instead (e.g.
+    because it was no longer in the TOSUBMIT state, see
+    :py:func:`submit_calc`), in which case it is not set in the
+    SUBMISSIONFAILED state.
+    """
+    try:
+        return calc.get_state() == calc_states.SUBMISSIONFAILED
+    except Exception:
+        return False
+
+
+def _split_cached_uploads(upload_list):
+    """
+    Split a list of uploads between the entries to upload as usual and the
+    files to upload through the upload cache afterwards, so that the result
+    is the same as uploading the entries in order: a file whose destination
+    is written by a later entry that is uploaded as usual (a file with the
+    same destination, or a folder containing it) stays in the first list.
+
+    :param upload_list: a list of (local absolute path, remote relative
+        path) tuples
+    :return: a tuple with the two lists, in the original order
+    """
+    import os
 
+    upload_entries = []
+    cached_entries = []
+    # The destinations written by the later entries uploaded as usual
+    later_dests = []
+    for src_abs_path, dest_rel_path in reversed(upload_list):
+        dest = os.path.normpath(dest_rel_path)
+        if os.path.isfile(src_abs_path) and not any(
+                dest == other or dest.startswith(other + os.sep) or
+                other == os.curdir for other in later_dests):
+            cached_entries.append((src_abs_path, dest_rel_path))
+        else:
+            upload_entries.append((src_abs_path, dest_rel_path))
+            later_dests.append(dest)
+    return upload_entries[::-1], cached_entries[::-1]
+
+
+def _upload_to_cache(transport, upload_list, cache_dir, calc_pk,
+                     logger_extra):
+    """
+    Upload files to the current directory of an open transport through a
+    remote cache folder, where each file is stored once, read-only and
+    named after the md5 of its content: only the files not yet in the cache
+    are transferred, and all of them are then copied from the cache on the
+    remote machine (as copy-on-write clones where the filesystem supports
+    them). The copies are separate, writable files, so that calculations
+    that modify their inputs never change the cache. The checks and the
+    copies are done with a few batches of commands (see
+    :py:func:`_exec_command_chunks`).
+
+    :param transport: an open transport, whose current directory is the
+        destination folder
+    :param upload_list: a list of (local absolute path, remote relative path)
+        tuples, where the local paths are files; later entries overwrite
+        earlier ones, as it would happen with separate ``put`` calls.
+    :param cache_dir: the absolute path of the remote cache folder
+    :param calc_pk: the pk of the calculation, used only in log messages
+    :param logger_extra: the extra dictionary to pass to the logger
+    :return: the entries of upload_list that could not be copied from the
+        cache, in the same order; the caller should upload them as usual.
+    """
     import os
+    import uuid
+    from aiida.common.utils import escape_for_bash, md5_file
+
+    # Only the last entry for each destination matters
+    last_index = dict((dest_rel_path, idx) for idx, (_, dest_rel_path)
+                      in enumerate(upload_list))
+    upload_list = [entry for idx, entry in enumerate(upload_list)
+                   if last_index[entry[1]] == idx]
+    if not upload_list:
+        return []
+
+    hashes = {}
+    for src_abs_path, _ in upload_list:
+        if src_abs_path not in hashes:
+            hashes[src_abs_path] = md5_file(src_abs_path)
+    sources = dict((md5, src_abs_path)
+                   for src_abs_path, md5 in hashes.iteritems())
+    md5_list = sorted(sources)
+
+    # Entries with the write permission may have been modified (e.g. if
+    # they were hard-linked into working directories): they are uploaded
+    # again
+    results = _exec_command_chunks(
+        transport,
+        ['mkdir -p {}'.format(escape_for_bash(cache_dir))] +
+        ['test -f {0} && test -z "$(find {0} -perm -200)"'.format(
+            escape_for_bash(os.path.join(cache_dir, md5)))
+         for md5 in md5_list], calc_pk, logger_extra)
+    if results[0] is None:
+        # The error was logged
+        return upload_list
+    if results[0][0] != 0:
+        execlogger.warning("[submission of calc {}] "
+                           "Unable to create the upload cache folder {} "
+                           "(stderr={}), uploading each file "
+                           "separately".format(calc_pk, cache_dir,
+                                               results[0][2].strip()),
+                           extra=logger_extra)
+        return upload_list
+    # If a check could not be run, the file is uploaded again
+    missing = [md5 for md5, result in zip(md5_list, results[1:])
+               if result is None or result[0] != 0]
+
+    # The missing files are uploaded with a temporary name, made read-only
+    # and then moved, so that other daemon workers never copy a partially
+    # uploaded file
+    commands = []
+    for md5 in missing:
+        cached_file = os.path.join(cache_dir, md5)
+        tmp_file = '{}.{}.tmp'.format(cached_file, uuid.uuid4().hex)
+        execlogger.debug("[submission of calc {}] "
+                         "uploading {} to the upload cache".format(
+            calc_pk, sources[md5]), extra=logger_extra)
+        transport.putfile(sources[md5], tmp_file)
+        commands.append('chmod a-w {0} && mv -f {0} {1}'.format(
+            escape_for_bash(tmp_file), escape_for_bash(cached_file)))
+    for src_abs_path, dest_rel_path in upload_list:
+        cached_file = escape_for_bash(
+            os.path.join(cache_dir, hashes[src_abs_path]))
+        command = ('rm -f {1} && {{ cp --reflink=auto {0} {1} 2>/dev/null '
+                   '|| cp {0} {1} ; }} && chmod u+w {1}'.format(
+            cached_file, escape_for_bash(dest_rel_path)))
+        dest_dir = os.path.dirname(dest_rel_path)
+        if dest_dir:
+            command = 'mkdir -p {} && {}'.format(escape_for_bash(dest_dir),
+                                                 command)
+        commands.append(command)
+
+    # If an entry could not be added to the cache, the copies fail
+    results = _exec_command_chunks(transport, commands, calc_pk,
+                                   logger_extra)[len(missing):]
+    not_copied = [entry for entry, result in zip(upload_list, results)
+                  if result is None or result[0] != 0]
+    if not_copied:
+        execlogger.warning("[submission of calc {}] "
+                           "Unable to copy {} files from the upload cache "
+                           "{}, uploading them separately".format(
+            calc_pk, len(not_copied), cache_dir), extra=logger_extra)
+
+    execlogger.debug("[submission of calc {}] "
+                     "{} files copied from the upload cache, {} of them "
+                     "uploaded".format(calc_pk,
+                                       len(upload_list) - len(not_copied),
+                                       len(missing)), extra=logger_extra)
+
+    return not_copied
+
+
+def _exec_command_chunks(transport, commands, calc_pk, logger_extra):
+    """
+    Execute the given commands with
+    :py:meth:`~aiida.transport.Transport.exec_command_batch`, in batches of
+    at most ``_UPLOAD_CACHE_BATCH_SIZE`` commands.
+
+    :return: a list with a tuple (retcode, stdout, stderr) for each
+        command, in the same order, or None for the commands of a batch
+        that failed (the error is logged).
+    """
+    results = []
+    for start in range(0, len(commands), _UPLOAD_CACHE_BATCH_SIZE):
+        chunk = commands[start:start + _UPLOAD_CACHE_BATCH_SIZE]
+        try:
+            chunk_results = transport.exec_command_batch(chunk)
+        except Exception as e:
+            execlogger.warning("[submission of calc {}] "
+                               "Unable to run a batch of {} commands for the "
+                               "upload cache ({}), uploading the files "
+                               "separately".format(calc_pk, len(chunk), e),
+                               extra=logger_extra)
+            chunk_results = [None] * len(chunk)
+        results.extend(chunk_results)
+    return results
+
+
+def _upload_files(transport, upload_list, bulk_staging, calc_pk,
+                  logger_extra):
+    """
+    Upload files and folders to the current directory of an open transport,
+    in the given order.
+
+    :param transport: an open transport, whose current directory is the
+        destination folder
+    :param upload_list: a list of (local absolute path, remote relative path)
+        tuples
+    :param bulk_staging: if True, upload them as a single tar stream (see
+        :py:func:`_upload_as_tar`), falling back to one upload per entry if
+        it fails
+    :param calc_pk: the pk of the calculation, used only in log messages
+    :param logger_extra: the extra dictionary to pass to the logger
+    """
+    if bulk_staging and _upload_as_tar(transport, upload_list, calc_pk,
+                                       logger_extra):
+        return
+
+    for src_abs_path, dest_rel_path in upload_list:
+        execlogger.debug("[submission of calc {}] "
+                         "copying file/folder {}...".format(
+            calc_pk, dest_rel_path),
+                         extra=logger_extra)
+        transport.put(src_abs_path, dest_rel_path)
+
+
+def _upload_as_tar(transport, upload_list, calc_pk, logger_extra):
+    """
+    Upload files and folders to the current directory of an open transport
+    as a single tar stream, unpacked remotely while it is transferred (see
+    :py:meth:`~aiida.transport.Transport.put_archive`). This replaces one
+    transfer per file with a single transfer and a single remote command.
+
+    :param transport: an open transport, whose current directory is the
+        destination folder
+    :param upload_list: a list of (local absolute path, remote relative path)
+        tuples. Entries are unpacked in the given order, so later entries
+        overwrite earlier ones, as it would happen with separate ``put`` calls.
+    :param calc_pk: the pk of the calculation, used only in log messages
+    :param logger_extra: the extra dictionary to pass to the logger
+    :return: True if the files were uploaded, False if the archive could not
+        be unpacked remotely (e.g. because ``tar`` is not available, or the
+        transport does not support it); in this case, the caller should
+        upload the files one by one.
+    """
+    if not upload_list:
+        return True
+
+    execlogger.debug("[submission of calc {}] "
+                     "uploading {} files/folders as a single tar "
+                     "stream".format(calc_pk, len(upload_list)),
+                     extra=logger_extra)
+    try:
+        staged = transport.put_archive(upload_list)
+    except NotImplementedError:
+        staged = False
+    if not staged:
+        execlogger.warning("[submission of calc {}] "
+                           "Unable to upload the input files as a tar "
+                           "stream, falling back to uploading each file "
+                           "separately".format(calc_pk),
+                           extra=logger_extra)
+    return staged
+
+
+def retrieve_computed_for_authinfo(authinfo):
+    """
+    Retrieve the files of all calculations in the COMPUTED state belonging
+    to the user and machine defined by the authinfo, store them in the
+    database and hand the calculations over to the parsers (they are set in
+    the PARSING state, and parsed by :py:func:`parse_jobs`).
+
+    The retrieval is pipelined: the files are transferred by a pool of
+    threads, each with its own transport from the transport pool (up to
+    ``computer.get_max_concurrent_transfers()`` of them), while the main
+    thread stores in the repository the files of the calculations that
+    have already been transferred. If ``computer.get_retrieve_as_archive()``
+    is True, the whole retrieve list of each calculation is fetched as a
+    single compressed archive.
+
+    :return: the list of retrieved calculations
+    """
+    from aiida.orm import Computer
+    from aiida.backends.utils import QueryFactory
+    from aiida.transport.pool import transport_pool
 
     if not authinfo.enabled:
         return
 
     qmanager = QueryFactory()()
     # I create a unique set of pairs (computer, aiidauser)
-    calcs_to_retrieve = qmanager.query_jobcalculations_by_computer_user_state(
-            state=calc_states.COMPUTED,
-        computer=authinfo.dbcomputer,
-        user=authinfo.aiidauser)
+    with daemon_metrics.timer('db'):
+        calcs_to_retrieve = list(
+            qmanager.query_jobcalculations_by_computer_user_state(
+                state=calc_states.COMPUTED,
+                computer=authinfo.dbcomputer,
+                user=authinfo.aiidauser))
 
 
     retrieved = []
 
     # I avoid to open an ssh connection if there are no
     # calcs with state not COMPUTED
-    if len(calcs_to_retrieve):
+    if not len(calcs_to_retrieve):
+        return retrieved
+
+    computer = Computer(dbcomputer=authinfo.dbcomputer)
+
+    # The transports are taken from the pool in this thread (the authinfo
+    # cannot be used by the transfer threads), before the calculations are
+    # moved to the RETRIEVING state: if the connection fails, they are
+    # still COMPUTED and are retrieved at the next run. Only the first
+    # request waits if the limit of sessions of the computer is reached;
+    # then, use as many transports as are available.
+    num_transports = max(1, min(computer.get_max_concurrent_transfers(),
+                                len(calcs_to_retrieve)))
+    all_transports = [transport_pool.get_transport(authinfo)]
+    try:
+        for _ in range(num_transports - 1):
+            t = transport_pool.get_transport(authinfo, block=False)
+            if t is None:
+                break
+            all_transports.append(t)
+        _retrieve_with_transports(computer, calcs_to_retrieve,
+                                  all_transports, retrieved)
+    finally:
+        for t in all_transports:
+            transport_pool.release_transport(t)
 
-        # Open connection
-        with authinfo.get_transport() as t:
-            for calc in calcs_to_retrieve:
-                logger_extra = get_dblogger_extra(calc)
-                t._set_logger_extra(logger_extra)
+    return retrieved
 
-                try:
-                    calc._set_state(calc_states.RETRIEVING)
-                except ModificationNotAllowed:
-                    # Someone else has already started to retrieve it,
-                    # just log and continue
-                    execlogger.debug("Attempting to retrieve more than once "
-                                     "calculation {}: skipping!".format(calc.pk),
-                                     extra=logger_extra)
-                    continue  # with the next calculation to retrieve
-                try:
-                    execlogger.debug("Retrieving calc {}".format(calc.pk),
-                                     extra=logger_extra)
-                    workdir = calc._get_remote_workdir()
-                    retrieve_list = calc._get_retrieve_list()
-                    retrieve_singlefile_list = calc._get_retrieve_singlefile_list()
-                    execlogger.debug("[retrieval of calc {}] "
-                                     "chdir {}".format(calc.pk, workdir),
-                                     extra=logger_extra)
-                    t.chdir(workdir)
-
-                    retrieved_files = FolderData()
-                    retrieved_files.add_link_from(
-                        calc, label=calc._get_linkname_retrieved(),
-                        link_type=LinkType.CREATE)
-
-                    # First, retrieve the files of folderdata
-                    with SandboxFolder() as folder:
-                        for item in retrieve_list:
-                            # I have two possibilities:
-                            # * item is a string
-                            # * or is a list
-                            # then I have other two possibilities:
-                            # * there are file patterns
-                            # * or not
-                            # First decide the name of the files
-                            if isinstance(item, list):
-                                tmp_rname, tmp_lname, depth = item
-                                # if there are more than one file I do something differently
-                                if t.has_magic(tmp_rname):
-                                    remote_names = t.glob(tmp_rname)
-                                    local_names = []
-                                    for rem in remote_names:
-                                        to_append = rem.split(os.path.sep)[-depth:] if depth > 0 else []
-                                        local_names.append(os.path.sep.join([tmp_lname] + to_append))
-                                else:
-                                    remote_names = [tmp_rname]
-                                    to_append = remote_names.split(os.path.sep)[-depth:] if depth > 0 else []
-                                    local_names = [os.path.sep.join([tmp_lname] + to_append)]
-                                if depth > 1:  # create directories in the folder, if needed
-                                    for this_local_file in local_names:
-                                        new_folder = os.path.join(
-                                            folder.abspath,
-                                            os.path.split(this_local_file)[0])
-                                        if not os.path.exists(new_folder):
-                                            os.makedirs(new_folder)
-                            else:  # it is a string
-                                if t.has_magic(item):
-                                    remote_names = t.glob(item)
-                                    local_names = [os.path.split(rem)[1] for rem in remote_names]
-                                else:
-                                    remote_names = [item]
-                                    local_names = [os.path.split(item)[1]]
-
-                            for rem, loc in zip(remote_names, local_names):
-                                execlogger.debug("[retrieval of calc {}] "
-                                                 "Trying to retrieve remote item '{}'".format(
-                                    calc.pk, rem),
-                                                 extra=logger_extra)
-                                t.get(rem,
-                                      os.path.join(folder.abspath, loc),
-                                      ignore_nonexisting=True)
-
-                        # Here I retrieved everything;
-                        # now I store them inside the calculation
-                        retrieved_files.replace_with_folder(folder.abspath,
-                                                            overwrite=True)
-
-                    # Second, retrieve the singlefiles
-                    with SandboxFolder() as folder:
-                        singlefile_list = []
-                        for (linkname, subclassname, filename) in retrieve_singlefile_list:
-                            execlogger.debug("[retrieval of calc {}] Trying "
-                                             "to retrieve remote singlefile '{}'".format(
-                                calc.pk, filename),
-                                             extra=logger_extra)
-                            localfilename = os.path.join(
-                                folder.abspath, os.path.split(filename)[1])
-                            t.get(filename, localfilename,
-                                  ignore_nonexisting=True)
-                            singlefile_list.append((linkname, subclassname,
-                                                    localfilename))
-
-                        # ignore files that have not been retrieved
-                        singlefile_list = [i for i in singlefile_list if
-                                           os.path.exists(i[2])]
-
-                        # after retrieving from the cluster, I create the objects
-                        singlefiles = []
-                        for (linkname, subclassname, filename) in singlefile_list:
-                            SinglefileSubclass = DataFactory(subclassname)
-                            singlefile = SinglefileSubclass()
-                            singlefile.set_file(filename)
-                            singlefile.add_link_from(calc, label=linkname,
-                                                     link_type=LinkType.CREATE)
-                            singlefiles.append(singlefile)
-
-                    # Finally, store
-                    execlogger.debug("[retrieval of calc {}] "
-                                     "Storing retrieved_files={}".format(
-                        calc.pk, retrieved_files.dbnode.pk),
-                                     extra=logger_extra)
-                    retrieved_files.store()
-                    for fil in singlefiles:
-                        execlogger.debug("[retrieval of calc {}] "
-                                         "Storing retrieved_singlefile={}".format(
-                            calc.pk, fil.dbnode.pk),
-                                         extra=logger_extra)
-                        fil.store()
-
-                    # If I was the one retrieving, I should also be the only
-                    # one parsing! I do not check
-                    calc._set_state(calc_states.PARSING)
-
-                    Parser = calc.get_parserclass()
-                    # If no parser is set, the calculation is successful
-                    successful = True
-                    if Parser is not None:
-                        # TODO: parse here
-                        parser = Parser(calc)
-                        successful, new_nodes_tuple = parser.parse_from_calc()
-
-                        for label, n in new_nodes_tuple:
-                            n.add_link_from(calc, label=label,
-                                            link_type=LinkType.CREATE)
-                            n.store()
-
-                    if successful:
-                        try:
-                            calc._set_state(calc_states.FINISHED)
-                        except ModificationNotAllowed:
-                            # I should have been the only one to set it, but
-                            # in order to avoid unuseful error messages, I
-                            # just ignore
-                            pass
-                    else:
-                        try:
-                            calc._set_state(calc_states.FAILED)
-                        except ModificationNotAllowed:
-                            # I should have been the only one to set it, but
-                            # in order to avoid unuseful error messages, I
-                            # just ignore
-                            pass
-                        execlogger.error("[parsing of calc {}] "
-                                         "The parser returned an error, but it should have "
-                                         "created an output node with some partial results "
-                                         "and warnings. Check there for more information on "
-                                         "the problem".format(calc.pk), extra=logger_extra)
-                    retrieved.append(calc)
-                except Exception:
-                    import traceback
-
-                    tb = traceback.format_exc()
-                    newextradict = logger_extra.copy()
-                    newextradict['full_traceback'] = tb
-                    if calc.get_state() == calc_states.PARSING:
-                        execlogger.error("Error parsing calc {}. "
-                                         "Traceback: {}".format(calc.pk, tb),
-                                         extra=newextradict)
-                        # TODO: add a 'comment' to the calculation
-                        try:
-                            calc._set_state(calc_states.PARSINGFAILED)
-                        except ModificationNotAllowed:
-                            pass
-                    else:
-                        execlogger.error("Error retrieving calc {}. "
-                                         "Traceback: {}".format(calc.pk, tb),
-                                         extra=newextradict)
-                        try:
-                            calc._set_state(calc_states.RETRIEVALFAILED)
-                        except ModificationNotAllowed:
-                            pass
-                        raise
 
-    return retrieved
+def _retrieve_with_transports(computer, calcs_to_retrieve, all_transports,
+                              retrieved):
+    """
+    Retrieve the given calculations using the given transports (see
+    :py:func:`retrieve_computed_for_authinfo`), and append to ``retrieved``
+    the calculations that were retrieved. Surplus transports are given back
+    to the pool and removed from ``all_transports``.
+    """
+    import Queue
+    from multiprocessing.pool import ThreadPool
+    from aiida.orm import JobCalculation
+    from aiida.common.setup import get_property
+    from aiida.daemon.claims import work_claims
+    from aiida.utils.logger import get_dblogger_extra
+
+    from aiida.backends.utils import close_thread_db_connection
+    from aiida.transport.pool import transport_pool
+
+    # I collect, in the main thread, everything the transfer threads need
+    # to know, so that they never have to access the database
+    calcs_by_pk = {}
+    retrieval_jobs = []
+    # All calculations are moved to the RETRIEVING state at once. With
+    # several daemon workers, each one moves only the calculations it has
+    # claimed; the claims are not needed any more after that
+    with work_claims.claimed(
+            'calc', [calc.pk for calc in calcs_to_retrieve],
+            limit=max(1, get_property("daemon.claim_batch_size"))
+    ) as claimed_pks:
+        claimed_pks = set(claimed_pks)
+        calcs_to_retrieve = [calc for calc in calcs_to_retrieve
+                             if calc.pk in claimed_pks]
+        with daemon_metrics.timer('db'):
+            skipped = set(c.pk for c in JobCalculation._set_states_and_attrs(
+                [(calc, calc_states.RETRIEVING, {})
+                 for calc in calcs_to_retrieve]))
+    for calc in calcs_to_retrieve:
+        logger_extra = get_dblogger_extra(calc)
+
+        if calc.pk in skipped:
+            # Someone else has already started to retrieve it,
+            # just log and continue
+            execlogger.debug("Attempting to retrieve more than once "
+                             "calculation {}: skipping!".format(calc.pk),
+                             extra=logger_extra)
+            continue  # with the next calculation to retrieve
+        try:
+            retrieval_jobs.append({
+                'pk': calc.pk,
+                'workdir': calc._get_remote_workdir(),
+                'retrieve_list': calc._get_retrieve_list(),
+                'retrieve_singlefile_list':
+                    calc._get_retrieve_singlefile_list(),
+                'logger_extra': logger_extra,
+            })
+            calcs_by_pk[calc.pk] = calc
+        except Exception:
+            import traceback
+
+            newextradict = logger_extra.copy()
+            newextradict['full_traceback'] = traceback.format_exc()
+            execlogger.error("Error retrieving calc {}. "
+                             "Traceback: {}".format(
+                calc.pk, newextradict['full_traceback']),
+                             extra=newextradict)
+            try:
+                calc._set_state(calc_states.RETRIEVALFAILED)
+            except ModificationNotAllowed:
+                pass
+
+    if not retrieval_jobs:
+        return
+
+    use_archive = computer.get_retrieve_as_archive()
+    # Give back the transports that are not needed
+    while len(all_transports) > len(retrieval_jobs):
+        transport_pool.release_transport(all_transports.pop())
+    num_transports = len(all_transports)
+    # Each transfer thread takes a transport from this queue and puts it
+    # back when done
+    transports = Queue.Queue()
+    for t in all_transports:
+        transports.put(t)
+
+    def transfer(job):
+        t = transports.get()
+        try:
+            with daemon_metrics.timer('transport'):
+                return _retrieve_files_for_job(t, job, use_archive)
+        finally:
+            transports.put(t)
+            # Log messages with a calculation in the extras are also
+            # stored in the database, using a connection of this thread
+            close_thread_db_connection()
+
+    pool = ThreadPool(num_transports)
+    try:
+        for (job, folder, singlefolder, singlefile_list,
+             exception_tb) in pool.imap_unordered(transfer, retrieval_jobs):
+            calc = calcs_by_pk[job['pk']]
+            try:
+                if exception_tb is None:
+                    with daemon_metrics.timer('db'):
+                        stored = _store_retrieved(calc, folder,
+                                                  singlefile_list,
+                                                  job['logger_extra'])
+                    if stored:
+                        retrieved.append(calc)
+                        daemon_metrics.add_processed()
+                else:
+                    newextradict = job['logger_extra'].copy()
+                    newextradict['full_traceback'] = exception_tb
+                    execlogger.error("Error retrieving calc {}. "
+                                     "Traceback: {}".format(calc.pk,
+                                                            exception_tb),
+                                     extra=newextradict)
+                    try:
+                        calc._set_state(calc_states.RETRIEVALFAILED)
+                    except ModificationNotAllowed:
+                        pass
+            finally:
+                if folder is not None:
+                    folder.erase()
+                    singlefolder.erase()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _get_retrieve_names(item, transport):
+    """
+    Expand an item of the retrieve list of a calculation into the list of
+    remote files to retrieve and of the names they get in the local folder.
+
+    :param item: an item of the retrieve list, i.e. either a string (a
+        remote path, possibly with shell-style wildcards, that is stored
+        with its basename) or a list [remote path, local path, depth],
+        where the last ``depth`` components of each remote path are
+        appended to the local path.
+    :param transport: an open transport, whose current directory is the
+        working directory of the calculation
+    :return: a tuple (remote_names, local_names) of two lists with the same
+        length
+    """
+    import os
+
+    # I have two possibilities:
+    # * item is a string
+    # * or is a list
+    # then I have other two possibilities:
+    # * there are file patterns
+    # * or not
+    # First decide the name of the files
+    if isinstance(item, list):
+        tmp_rname, tmp_lname, depth = item
+        # if there are more than one file I do something differently
+        if transport.has_magic(tmp_rname):
+            remote_names = transport.glob(tmp_rname)
+        else:
+            remote_names = [tmp_rname]
+        local_names = []
+        for rem in remote_names:
+            to_append = rem.split(os.path.sep)[-depth:] if depth > 0 else []
+            local_names.append(os.path.sep.join([tmp_lname] + to_append))
+    else:  # it is a string
+        if transport.has_magic(item):
+            remote_names = transport.glob(item)
+            local_names = [os.path.split(rem)[1] for rem in remote_names]
+        else:
+            remote_names = [item]
+            local_names = [os.path.split(item)[1]]
+
+    return remote_names, local_names
+
+
+def _retrieve_files_with_transport(transport, job, folder, singlefolder):
+    """
+    Retrieve the files of the retrieve list, and of the retrieve singlefile
+    list, of a calculation.
+
+    :param transport: an open transport, whose current directory is the
+        working directory of the calculation
+    :param job: a dictionary describing the calculation to retrieve (see
+        :py:func:`retrieve_computed_for_authinfo`)
+    :param folder: the local folder where to put the files of the
+        retrieve list
+    :param singlefolder: the local folder where to put the singlefiles
+    :return: a list of (linkname, subclassname, local absolute path)
+        tuples, one for each singlefile that was actually retrieved
+    """
+    import os
+
+    pk = job['pk']
+    logger_extra = job['logger_extra']
+
+    for item in job['retrieve_list']:
+        remote_names, local_names = _get_retrieve_names(item, transport)
+        if isinstance(item, list) and item[2] > 1:
+            # create directories in the folder, if needed
+            for this_local_file in local_names:
+                new_folder = os.path.join(
+                    folder.abspath,
+                    os.path.split(this_local_file)[0])
+                if not os.path.exists(new_folder):
+                    os.makedirs(new_folder)
+
+        for rem, loc in zip(remote_names, local_names):
+            execlogger.debug("[retrieval of calc {}] "
+                             "Trying to retrieve remote item '{}'".format(
+                pk, rem),
+                             extra=logger_extra)
+            transport.get(rem,
+                          os.path.join(folder.abspath, loc),
+                          ignore_nonexisting=True)
+
+    singlefile_list = []
+    for (linkname, subclassname, filename) in job['retrieve_singlefile_list']:
+        execlogger.debug("[retrieval of calc {}] Trying "
+                         "to retrieve remote singlefile '{}'".format(
+            pk, filename),
+                         extra=logger_extra)
+        localfilename = os.path.join(
+            singlefolder.abspath, os.path.split(filename)[1])
+        transport.get(filename, localfilename,
+                      ignore_nonexisting=True)
+        singlefile_list.append((linkname, subclassname,
+                                localfilename))
+
+    # ignore files that have not been retrieved
+    return [i for i in singlefile_list if os.path.exists(i[2])]
+
+
+def _quote_glob_pattern(pattern):
+    """
+    Quote a path for bash, leaving the shell-style wildcards unquoted so
+    that they are still expanded by the shell.
+    """
+    import re
+
+    return re.sub(r'([^\w*?\[\]/.\-])', r'\\\1', pattern)
+
+
+def _retrieve_files_as_archive(transport, job, folder, singlefolder):
+    """
+    Retrieve the files of a calculation as :py:func:`_retrieve_files_with_transport`
+    does, but packing all of them remotely in a single compressed archive,
+    so that only one file is transferred.
+
+    :return: the list of retrieved singlefiles as in
+        :py:func:`_retrieve_files_with_transport`, or None if the archive
+        could not be created or extracted (e.g. ``tar`` is not available,
+        or some items are not inside the working directory); in this case
+        the files should be retrieved one by one.
+    """
+    import os
+    import tarfile
+    from aiida.common.folders import SandboxFolder
+    from aiida.transport.plugins.local import LocalTransport
+    from aiida.transport.plugins.ssh import _is_safe_tar_member
+
+    remote_paths = []
+    for item in job['retrieve_list']:
+        remote_paths.append(item[0] if isinstance(item, list) else item)
+    remote_paths.extend(
+        filename for _, _, filename in job['retrieve_singlefile_list'])
+
+    if any(os.path.isabs(path) or '..' in path.split(os.path.sep)
+           for path in remote_paths):
+        return None
+    if not remote_paths:
+        return []
+
+    # The symlinks are archived as the files they point to, as they are
+    # retrieved one by one
+    remote_archive = '.aiida_retrieved.tar.gz'
+    retval, stdout, stderr = transport.exec_command_wait(
+        "tar -czf {} --dereference --ignore-failed-read -- {}".format(
+            remote_archive,
+            " ".join(_quote_glob_pattern(path) for path in remote_paths)))
+    if retval != 0:
+        execlogger.warning("[retrieval of calc {}] "
+                           "Unable to create the archive of the retrieved "
+                           "files (retval={}, stderr={}), falling back to "
+                           "retrieving each file separately".format(
+            job['pk'], retval, stderr.strip()),
+                           extra=job['logger_extra'])
+        if transport.isfile(remote_archive):
+            transport.remove(remote_archive)
+        return None
+
+    with SandboxFolder() as archive_folder:
+        local_archive = archive_folder.get_abs_path(remote_archive)
+        try:
+            transport.getfile(remote_archive, local_archive)
+        finally:
+            transport.remove(remote_archive)
+
+        extracted = archive_folder.get_abs_path('extracted')
+        os.mkdir(extracted)
+        archive = tarfile.open(local_archive, 'r:gz')
+        try:
+            members = archive.getmembers()
+            unsafe = [member.name for member in members
+                      if not _is_safe_tar_member(member)]
+            if unsafe:
+                execlogger.warning("[retrieval of calc {}] "
+                                   "Refusing to extract {} from the archive "
+                                   "of the retrieved files, falling back to "
+                                   "retrieving each file separately".format(
+                    job['pk'], ", ".join(unsafe)), extra=job['logger_extra'])
+                return None
+            archive.extractall(extracted, members)
+        finally:
+            archive.close()
+
+        # The same logic as for the remote retrieval is now applied to
+        # the local copy of the working directory
+        with LocalTransport() as local_transport:
+            local_transport.chdir(extracted)
+            return _retrieve_files_with_transport(
+                local_transport, job, folder, singlefolder)
+
+
+def _retrieve_files_for_job(transport, job, use_archive=False):
+    """
+    Transfer the files of a calculation into two new sandbox folders.
+    Meant to be run in a thread: it does not access the database, and
+    never raises.
+
+    :param transport: an open transport
+    :param job: a dictionary describing the calculation to retrieve (see
+        :py:func:`retrieve_computed_for_authinfo`)
+    :param use_archive: if True, try first to retrieve all files as a
+        single archive
+    :return: a tuple (job, folder, singlefolder, singlefile_list,
+        exception_traceback). On success, the last element is None and the
+        caller must erase the two folders; otherwise, the first four
+        elements are (job, None, None, None) and the last one is the
+        formatted traceback of the error.
+    """
+    from aiida.common.folders import SandboxFolder
+
+    folder = SandboxFolder()
+    singlefolder = SandboxFolder()
+    try:
+        transport._set_logger_extra(job['logger_extra'])
+        execlogger.debug("Retrieving calc {}".format(job['pk']),
+                         extra=job['logger_extra'])
+        execlogger.debug("[retrieval of calc {}] "
+                         "chdir {}".format(job['pk'], job['workdir']),
+                         extra=job['logger_extra'])
+        transport.chdir(job['workdir'])
+
+        singlefile_list = None
+        if use_archive:
+            singlefile_list = _retrieve_files_as_archive(
+                transport, job, folder, singlefolder)
+        if singlefile_list is None:
+            singlefile_list = _retrieve_files_with_transport(
+                transport, job, folder, singlefolder)
+    except Exception:
+        import traceback
+
+        folder.erase()
+        singlefolder.erase()
+        return job, None, None, None, traceback.format_exc()
+
+    return job, folder, singlefolder, singlefile_list, None
+
+
+def _store_retrieved(calc, folder, singlefile_list, logger_extra):
+    """
+    Store the files retrieved for a calculation (in the RETRIEVING state)
+    as its output nodes, and hand the calculation over to the parsers by
+    setting it in the PARSING state (see :py:func:`parse_jobs`).
+
+    :param calc: the calculation
+    :param folder: the local folder with the files of the retrieve list
+    :param singlefile_list: a list of (linkname, subclassname, local
+        absolute path) tuples, one for each retrieved singlefile
+    :param logger_extra: the extra dictionary to pass to the logger
+    :return: True if the retrieved files were stored, False if an error
+        occurred (it is logged, and the calculation is set in the
+        RETRIEVALFAILED state).
+    """
+    from aiida.orm.data.folder import FolderData
+    from aiida.orm import DataFactory
+
+    try:
+        retrieved_files = FolderData()
+        retrieved_files.add_link_from(
+            calc, label=calc._get_linkname_retrieved(),
+            link_type=LinkType.CREATE)
+
+        # Here I retrieved everything;
+        # now I store them inside the calculation
+        retrieved_files.replace_with_folder(folder.abspath,
+                                            overwrite=True)
+
+        # after retrieving from the cluster, I create the objects
+        singlefiles = []
+        for (linkname, subclassname, filename) in singlefile_list:
+            SinglefileSubclass = DataFactory(subclassname)
+            singlefile = SinglefileSubclass()
+            singlefile.set_file(filename)
+            singlefile.add_link_from(calc, label=linkname,
+                                     link_type=LinkType.CREATE)
+            singlefiles.append(singlefile)
+
+        # Finally, store
+        execlogger.debug("[retrieval of calc {}] "
+                         "Storing retrieved_files={}".format(
+            calc.pk, retrieved_files.dbnode.pk),
+                         extra=logger_extra)
+        retrieved_files.store()
+        for fil in singlefiles:
+            execlogger.debug("[retrieval of calc {}] "
+                             "Storing retrieved_singlefile={}".format(
+                calc.pk, fil.dbnode.pk),
+                             extra=logger_extra)
+            fil.store()
+
+        # If I was the one retrieving, I should also be the only
+        # one handing it over to the parsers! I do not check
+        calc._set_state(calc_states.PARSING)
+    except Exception:
+        import traceback
+
+        tb = traceback.format_exc()
+        newextradict = logger_extra.copy()
+        newextradict['full_traceback'] = tb
+        execlogger.error("Error retrieving calc {}. "
+                         "Traceback: {}".format(calc.pk, tb),
+                         extra=newextradict)
+        try:
+            calc._set_state(calc_states.RETRIEVALFAILED)
+        except ModificationNotAllowed:
+            pass
+        return False
+
+    return True
+
+
+def _parse_retrieved(calc, logger_extra):
+    """
+    Parse the retrieved files of a calculation in the PARSING state, store
+    the output nodes of the parser, and set the final state of the
+    calculation.
+
+    :param calc: the calculation
+    :param logger_extra: the extra dictionary to pass to the logger
+    :return: True if the calculation was parsed (successfully or not),
+        False if an error occurred (it is logged, and the calculation is set
+        in the PARSINGFAILED state).
+    """
+    try:
+        Parser = calc.get_parserclass()
+        # If no parser is set, the calculation is successful
+        successful = True
+        if Parser is not None:
+            parser = Parser(calc)
+            successful, new_nodes_tuple = parser.parse_from_calc()
+
+            for label, n in new_nodes_tuple:
+                n.add_link_from(calc, label=label,
+                                link_type=LinkType.CREATE)
+                n.store()
+
+        if successful:
+            try:
+                calc._set_state(calc_states.FINISHED)
+            except ModificationNotAllowed:
+                # I should have been the only one to set it, but
+                # in order to avoid unuseful error messages, I
+                # just ignore
+                pass
+        else:
+            try:
+                calc._set_state(calc_states.FAILED)
+            except ModificationNotAllowed:
+                # I should have been the only one to set it, but
+                # in order to avoid unuseful error messages, I
+                # just ignore
+                pass
+            execlogger.error("[parsing of calc {}] "
+                             "The parser returned an error, but it should have "
+                             "created an output node with some partial results "
+                             "and warnings. Check there for more information on "
+                             "the problem".format(calc.pk), extra=logger_extra)
+    except Exception:
+        import traceback
+
+        tb = traceback.format_exc()
+        newextradict = logger_extra.copy()
+        newextradict['full_traceback'] = tb
+        execlogger.error("Error parsing calc {}. "
+                         "Traceback: {}".format(calc.pk, tb),
+                         extra=newextradict)
+        # TODO: add a 'comment' to the calculation
+        try:
+            calc._set_state(calc_states.PARSINGFAILED)
+        except ModificationNotAllowed:
+            pass
+        return False
+
+    return True
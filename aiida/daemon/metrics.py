@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Throughput and latency metrics of the daemon tasks.
+
+Each run (cycle) of a daemon task records the number of calculations it
+processed, its duration, and the time spent in each category of work
+(see :py:data:`CATEGORIES`). The metrics of the last cycle and the totals
+since the metrics were last reset are stored in the DbSetting table, so
+that they are shared by all daemon processes, and shown by
+``verdi daemon status``. They are collected in memory and stored at most
+once per ``flush_interval`` (one minute by default) rather than after each
+cycle, since most cycles of an idle daemon do nothing. At the same time,
+the latency histograms of the transport operations (see
+:py:mod:`aiida.transport.tracing`) are stored.
+
+The metrics, together with the number of calculations in each state of the
+pipeline for each computer, can also be served in the Prometheus text
+format on ``http://127.0.0.1:<port>/metrics``, by setting the
+``daemon.metrics_port`` property and restarting the daemon.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from aiida.common import aiidalogger
+from aiida.common.datastructures import calc_states
+from aiida.transport.tracing import transport_tracer
+
+metricslogger = aiidalogger.getChild('daemonmetrics')
+
+# The categories of the time spent by the daemon tasks. The time of work
+# done in parallel threads is summed, and the scheduler time includes the
+# commands run through the transport
+CATEGORIES = ('transport', 'scheduler', 'db', 'parsing')
+
+# The states of the calculations handled by the daemon, whose number is
+# reported as the depth of the queue of each stage
+QUEUE_STATES = (
+    calc_states.TOSUBMIT,
+    calc_states.SUBMITTING,
+    calc_states.WITHSCHEDULER,
+    calc_states.COMPUTED,
+    calc_states.RETRIEVING,
+    calc_states.PARSING,
+)
+
+_SETTING_PREFIX = 'daemon|metrics|'
+
+
+class DaemonMetrics(object):
+    """
+    Collect the metrics of the daemon tasks run by the current process.
+
+    A cycle of a task is wrapped in :py:meth:`cycle`; during it, the code of
+    the task (in any thread) reports the processed calculations with
+    :py:meth:`add_processed`, and measures its work with :py:meth:`timer`.
+    Outside of a cycle, nothing is recorded. The metrics are stored in the
+    database by :py:meth:`flush`, called by :py:meth:`cycle` at most once
+    per ``flush_interval`` seconds.
+    """
+
+    def __init__(self, flush_interval=60.):
+        """
+        :param flush_interval: the minimum interval (in seconds) between
+            two writes of the metrics to the database
+        """
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._task_name = None
+        self._processed = 0
+        self._times = defaultdict(float)
+        # task name -> metrics of the cycles not stored yet
+        self._unstored = {}
+        self._last_flush = time.time()
+
+    @contextmanager
+    def cycle(self, task_name):
+        """
+        Context manager recording a run of the given daemon task; the
+        metrics are stored in the database at the end, if the last
+        flush is older than ``flush_interval``.
+        """
+        with self._lock:
+            self._task_name = task_name
+            self._processed = 0
+            self._times = defaultdict(float)
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            with self._lock:
+                processed = self._processed
+                times = dict(self._times)
+                self._task_name = None
+
+                unstored = self._unstored.setdefault(task_name, {
+                    'cycles': 0, 'duration': 0., 'processed': 0, 'times': {}})
+                unstored['cycles'] += 1
+                unstored['duration'] += duration
+                unstored['processed'] += processed
+                for category, seconds in times.iteritems():
+                    unstored['times'][category] = (
+                        unstored['times'].get(category, 0.) + seconds)
+                unstored['last'] = (start, duration, processed, times)
+
+                flush = time.time() >= self._last_flush + self.flush_interval
+            if flush:
+                self.flush()
+
+    def flush(self):
+        """
+        Store in the database the metrics of the cycles run since the last
+        flush, and the latency histograms of the transport operations.
+        """
+        with self._lock:
+            unstored = self._unstored
+            self._unstored = {}
+            self._last_flush = time.time()
+        try:
+            for task_name, task_unstored in unstored.iteritems():
+                self._store(task_name, task_unstored)
+            transport_tracer.store()
+        except Exception as e:
+            # Metrics must never stop the daemon
+            metricslogger.warning("Unable to store the metrics of the "
+                                  "daemon tasks: {}".format(e))
+
+    def add_processed(self, num=1):
+        """
+        Add ``num`` to the number of calculations processed in the current
+        cycle.
+        """
+        with self._lock:
+            if self._task_name is not None:
+                self._processed += num
+
+    def add_time(self, category, seconds):
+        """
+        Add the given time to a category of the current cycle.
+        """
+        if category not in CATEGORIES:
+            raise ValueError("Unknown metrics category '{}'".format(category))
+        with self._lock:
+            if self._task_name is not None:
+                self._times[category] += seconds
+
+    @contextmanager
+    def timer(self, category):
+        """
+        Context manager adding the time spent in its body to the given
+        category (one of :py:data:`CATEGORIES`) of the current cycle.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(category, time.time() - start)
+
+    @staticmethod
+    def _store(task_name, unstored):
+        from aiida.backends.utils import update_global_setting
+
+        start, duration, processed, times = unstored['last']
+
+        def update(metrics):
+            metrics = metrics or {}
+            total_times = metrics.get('total_times', {})
+            for category, seconds in unstored['times'].iteritems():
+                total_times[category] = (total_times.get(category, 0.) +
+                                         seconds)
+            return {
+                'cycles': metrics.get('cycles', 0) + unstored['cycles'],
+                'last_start': start,
+                'last_duration': duration,
+                'last_processed': processed,
+                'last_times': times,
+                'total_duration': (metrics.get('total_duration', 0.) +
+                                   unstored['duration']),
+                'total_processed': (metrics.get('total_processed', 0) +
+                                    unstored['processed']),
+                'total_times': total_times,
+            }
+
+        # Several workers may run the same task at the same time
+        update_global_setting(
+            _SETTING_PREFIX + task_name, update,
+            description="Metrics of the daemon task {}".format(task_name))
+
+
+def get_task_metrics():
+    """
+    Return the metrics stored by the daemon tasks.
+
+    :return: a dictionary with the task names as keys, and as values the
+        dictionaries of metrics (keys 'cycles', 'last_start',
+        'last_duration', 'last_processed', 'last_times', 'total_duration',
+        'total_processed', 'total_times'; the times are dictionaries with
+        the categories as keys)
+    """
+    from aiida.daemon.timestamps import celery_tasks
+    from aiida.backends.utils import get_global_setting
+
+    metrics = {}
+    for task_name in sorted(celery_tasks):
+        try:
+            metrics[task_name] = get_global_setting(
+                _SETTING_PREFIX + task_name)
+        except KeyError:
+            pass
+    return metrics
+
+
+def reset_task_metrics():
+    """
+    Delete the stored metrics of all daemon tasks.
+    """
+    from aiida.daemon.timestamps import celery_tasks
+    from aiida.backends.utils import del_global_setting
+
+    for task_name in celery_tasks:
+        try:
+            del_global_setting(_SETTING_PREFIX + task_name)
+        except KeyError:
+            pass
+
+
+def get_queue_depths():
+    """
+    Return the number of calculations in each of the :py:data:`QUEUE_STATES`
+    on each computer.
+
+    :return: a dictionary with (state, computer name) tuples as keys
+    """
+    from aiida.orm import JobCalculation, Computer
+    from aiida.orm.querybuilder import QueryBuilder
+
+    qb = QueryBuilder()
+    qb.append(JobCalculation, tag='calc',
+              filters={'attributes.state': {'in': list(QUEUE_STATES)}},
+              project=['attributes.state'])
+    qb.append(Computer, computer_of='calc', project=['name'])
+
+    depths = defaultdict(int)
+    for state, computer_name in qb.iterall():
+        depths[(state, computer_name)] += 1
+    return dict(depths)
+
+
+def _escape_label(value):
+    return unicode(value).replace(
+        '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(task_metrics, queue_depths):
+    """
+    Format the metrics in the Prometheus text exposition format.
+
+    :param task_metrics: the metrics of the tasks, as returned by
+        :py:func:`get_task_metrics`
+    :param queue_depths: the queue depths, as returned by
+        :py:func:`get_queue_depths`
+    :return: the text, as a unicode string
+    """
+    lines = []
+
+    def add_metric(name, metric_type, description, samples):
+        lines.append(u"# HELP {} {}".format(name, description))
+        lines.append(u"# TYPE {} {}".format(name, metric_type))
+        for labels, value in samples:
+            labels_string = u",".join(
+                u'{}="{}"'.format(k, _escape_label(v)) for k, v in labels)
+            lines.append(u"{}{{{}}} {}".format(name, labels_string,
+                                               repr(float(value))))
+
+    def task_samples(key):
+        return [([('task', task_name)], metrics.get(key, 0))
+                for task_name, metrics in sorted(task_metrics.iteritems())]
+
+    def category_samples(key):
+        return [([('task', task_name), ('category', category)],
+                 metrics.get(key, {}).get(category, 0.))
+                for task_name, metrics in sorted(task_metrics.iteritems())
+                for category in CATEGORIES]
+
+    add_metric('aiida_daemon_task_cycles_total', 'counter',
+               'Number of runs of the daemon task',
+               task_samples('cycles'))
+    add_metric('aiida_daemon_task_processed_total', 'counter',
+               'Number of calculations processed by the daemon task',
+               task_samples('total_processed'))
+    add_metric('aiida_daemon_task_duration_seconds_total', 'counter',
+               'Time spent running the daemon task',
+               task_samples('total_duration'))
+    add_metric('aiida_daemon_task_category_seconds_total', 'counter',
+               'Time spent by the daemon task in each category of work',
+               category_samples('total_times'))
+    add_metric('aiida_daemon_task_last_processed', 'gauge',
+               'Number of calculations processed by the last run of the '
+               'daemon task',
+               task_samples('last_processed'))
+    add_metric('aiida_daemon_task_last_duration_seconds', 'gauge',
+               'Duration of the last run of the daemon task',
+               task_samples('last_duration'))
+    add_metric('aiida_daemon_task_last_category_seconds', 'gauge',
+               'Time spent by the last run of the daemon task in each '
+               'category of work',
+               category_samples('last_times'))
+    add_metric('aiida_daemon_task_last_start_timestamp_seconds', 'gauge',
+               'Start time of the last run of the daemon task',
+               task_samples('last_start'))
+    add_metric('aiida_daemon_queue_depth', 'gauge',
+               'Number of calculations in each state of the daemon pipeline',
+               [([('state', state), ('computer', computer_name)], num)
+                for (state, computer_name), num
+                in sorted(queue_depths.iteritems())])
+
+    return u"\n".join(lines) + u"\n"
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """
+    Serve the metrics in the Prometheus text format on
+    ``http://<host>:<port>/metrics``, in a background thread.
+
+    :param port: the port; if None, use the ``daemon.metrics_port``
+        property. Nothing is done if it is 0.
+    :param host: the address to listen on; by default, only local
+        connections are accepted
+    :return: the server (a ``BaseHTTPServer.HTTPServer``), or None if it was
+        not started
+    """
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from aiida.common.setup import get_property
+
+    if port is None:
+        port = get_property("daemon.metrics_port")
+    if not port:
+        return None
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            from aiida.backends.utils import close_thread_db_connection
+
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = format_prometheus(get_task_metrics(),
+                                         get_queue_depths()).encode('utf-8')
+            except Exception as e:
+                metricslogger.warning("Unable to collect the daemon "
+                                      "metrics: {}".format(e))
+                self.send_error(500)
+                return
+            finally:
+                close_thread_db_connection()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            metricslogger.debug(format % args)
+
+    try:
+        server = HTTPServer((host, port), MetricsRequestHandler)
+    except Exception as e:
+        metricslogger.warning("Unable to serve the daemon metrics on port "
+                              "{}: {}".format(port, e))
+        return None
+
+    thread = threading.Thread(target=server.serve_forever,
+                              name='daemon-metrics')
+    thread.daemon = True
+    thread.start()
+    metricslogger.info("Serving the daemon metrics on http://{}:{}/metrics"
+                       "".format(host, port))
+    return server
+
+
+# The metrics of the daemon tasks run by this process
+daemon_metrics = DaemonMetrics()
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+The processes in which the daemon parses the calculations (see
+:py:func:`aiida.daemon.execmanager.parse_jobs`).
+
+The calculations are parsed in new Python interpreters, rather than in
+forked copies of the daemon: the daemon runs other threads (the heartbeat of
+the claims, the transports, the metrics server), and a forked process
+could inherit a lock held by one of them and never finish. The interpreters
+are kept running, and each parses one calculation after the other, so that
+the profile is loaded only once.
+
+Usage: python -m aiida.daemon.parsing PROFILE
+
+The worker reads the pks of the calculations to parse from the standard
+input, one per line, and writes a line ``PK STATUS`` on the standard output
+after each of them (``STATUS`` is 1 if the calculation was parsed,
+successfully or not, 0 on errors).
+"""
+import os
+import select
+import subprocess
+import sys
+import time
+
+from aiida.common import aiidalogger
+
+parsinglogger = aiidalogger.getChild('daemonparsing')
+
+# The outcomes of the parsing of a calculation (see ParserPool.collect)
+PARSED = 'parsed'
+PARSE_ERROR = 'error'
+TIMEOUT = 'timeout'
+DIED = 'died'
+
+
+class ParserPool(object):
+    """
+    A pool of worker processes parsing calculations, at most one calculation
+    at a time for each worker.
+
+    The calculations are handed over with :py:meth:`start`, which does not
+    wait for the parsing to end; the calculations whose parsing has ended
+    are returned by :py:meth:`collect`. A worker parsing a calculation for
+    more than its timeout is stopped.
+
+    The pool is not thread-safe, nor shared between processes.
+    """
+
+    def __init__(self, num_workers=None):
+        """
+        :param num_workers: maximum number of worker processes; if None,
+            use the ``daemon.parser_workers`` property
+        """
+        self._num_workers = num_workers
+        # The workers waiting for a calculation
+        self._idle = []
+        # process -> (calc pk, start time, timeout)
+        self._busy = {}
+        # process -> output read so far
+        self._output = {}
+
+    @property
+    def num_workers(self):
+        if self._num_workers is None:
+            from aiida.common.setup import get_property
+            return max(1, get_property("daemon.parser_workers"))
+        return self._num_workers
+
+    def _get_worker_command(self):
+        from aiida.backends import settings
+
+        return [sys.executable, '-m', 'aiida.daemon.parsing',
+                settings.AIIDADB_PROFILE]
+
+    def get_free_slots(self):
+        """
+        Return the number of calculations that can be started now.
+        """
+        return max(0, self.num_workers - len(self._busy))
+
+    def get_running(self):
+        """
+        Return the list of the pks of the calculations being parsed.
+        """
+        return [calc_pk for calc_pk, _, _ in self._busy.itervalues()]
+
+    def start(self, calc_pk, timeout):
+        """
+        Hand the given calculation over to an idle worker, starting a new
+        one if needed, and return immediately.
+
+        :param calc_pk: the pk of the calculation
+        :param timeout: the time (in seconds) after which the parsing is
+            stopped
+        """
+        process = None
+        while self._idle:
+            process = self._idle.pop()
+            if process.poll() is None:
+                break
+            self._discard(process)
+            process = None
+        if process is None:
+            process = subprocess.Popen(self._get_worker_command(),
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       close_fds=True)
+            self._output[process] = ''
+
+        self._busy[process] = (calc_pk, time.time(), timeout)
+        try:
+            process.stdin.write('{}\n'.format(calc_pk))
+            process.stdin.flush()
+        except IOError:
+            # The worker died: this is reported by collect()
+            pass
+
+    def _read_result(self, process):
+        """
+        Read the available output of a busy worker.
+
+        :return: True or False if the worker reported the end of the
+            parsing, None if it did not yet
+        :raise EOFError: if the output of the worker is closed
+        """
+        data = os.read(process.stdout.fileno(), 4096)
+        if not data:
+            raise EOFError
+        self._output[process] += data
+        if '\n' not in self._output[process]:
+            return None
+        line, self._output[process] = self._output[process].split('\n', 1)
+        calc_pk, status = line.split()
+        if int(calc_pk) != self._busy[process][0]:
+            raise ValueError("Unexpected output of the parser process: "
+                             "{}".format(line))
+        return status == '1'
+
+    def _discard(self, process):
+        """
+        Stop a worker and forget about it.
+        """
+        try:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        except OSError:
+            pass
+        for stream in [process.stdin, process.stdout]:
+            try:
+                stream.close()
+            except IOError:
+                pass
+        self._output.pop(process, None)
+
+    def collect(self):
+        """
+        Return the calculations whose parsing has ended since the previous
+        call, without waiting.
+
+        :return: a list of tuples ``(calc_pk, outcome, elapsed, status)``:
+            ``outcome`` is :py:data:`PARSED` if the calculation was parsed
+            (successfully or not), :py:data:`PARSE_ERROR` if the parsing
+            failed, :py:data:`TIMEOUT` if the worker was stopped after the
+            timeout, :py:data:`DIED` if the worker terminated abnormally;
+            ``elapsed`` is the time spent parsing, in seconds; ``status``
+            is the exit status of the worker if it died, None otherwise.
+        """
+        if not self._busy:
+            return []
+
+        readable = select.select([p.stdout for p in self._busy], [], [],
+                                 0)[0]
+        now = time.time()
+        ended = []
+        for process, (calc_pk, start, timeout) in self._busy.items():
+            result = None
+            died = False
+            if process.stdout in readable:
+                try:
+                    result = self._read_result(process)
+                except (EOFError, ValueError, OSError) as e:
+                    if not isinstance(e, EOFError):
+                        parsinglogger.error("Error reading the output of "
+                                            "the parser process: {}".format(e))
+                    died = True
+
+            if result is not None:
+                ended.append((calc_pk, PARSED if result else PARSE_ERROR,
+                              now - start, None))
+                self._idle.append(process)
+            elif died or process.poll() is not None:
+                self._discard(process)
+                ended.append((calc_pk, DIED, now - start, process.returncode))
+            elif now >= start + timeout:
+                self._discard(process)
+                ended.append((calc_pk, TIMEOUT, now - start, None))
+            else:
+                continue
+            del self._busy[process]
+
+        return ended
+
+    def wait(self, timeout=None):
+        """
+        Wait until a worker has something to report, or until the timeout
+        of a calculation expires, but at most ``timeout`` seconds (if not
+        None). Return immediately if no calculation is being parsed.
+        """
+        if not self._busy:
+            return
+        delay = max(0., min(start + calc_timeout for _, start, calc_timeout
+                            in self._busy.itervalues()) - time.time())
+        if timeout is not None:
+            delay = min(delay, timeout)
+        select.select([p.stdout for p in self._busy], [], [], delay)
+
+    def close(self):
+        """
+        Stop all the workers; the calculations being parsed are forgotten.
+        """
+        for process in self._idle:
+            # The worker exits at the end of its input
+            try:
+                process.stdin.close()
+                process.wait()
+            except (IOError, OSError):
+                pass
+            self._discard(process)
+        for process in self._busy:
+            self._discard(process)
+        self._idle = []
+        self._busy = {}
+
+
+# The pool used by the daemon
+parser_pool = ParserPool()
+
+
+def main(profile):
+    """
+    Load the given profile and parse the calculations whose pks are read
+    from the standard input, until the end of the input.
+    """
+    from aiida.backends.utils import load_dbenv
+
+    load_dbenv(process='daemon', profile=profile)
+
+    from aiida.daemon.execmanager import _parse_in_worker
+
+    # The results are written on the original standard output, the output
+    # of the parsers goes to the standard error
+    results = os.fdopen(os.dup(sys.stdout.fileno()), 'w', 0)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in iter(sys.stdin.readline, ''):
+        calc_pk = int(line)
+        parsed = _parse_in_worker(calc_pk)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        results.write('{} {}\n'.format(calc_pk, 1 if parsed else 0))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
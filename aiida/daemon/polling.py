@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Adaptive polling of the schedulers, used by the daemon to update the state
+of the calculations in the WITHSCHEDULER state.
+
+Each computer is queried at most every
+``computer.get_minimum_job_poll_interval()`` seconds. If a query does not
+show any change in the state of the jobs, the interval until the next one
+is multiplied by :py:attr:`SchedulerPoller.backoff_factor`, up to
+``computer.get_maximum_job_poll_interval()`` seconds; it goes back to the
+minimum as soon as a change is seen, or a job is submitted to the computer.
+The intervals are stored in the DbSetting table, so that they are shared by
+all daemon processes.
+
+The job lists returned by the schedulers are also cached, and shared
+between the AiiDA users of the same computer that use the same remote
+account: when the scheduler is queried by job id, a single query asks for
+the jobs of all of them (the schedulers may hide the jobs of the other
+accounts). A job missing from a cached list is never taken as finished: the
+scheduler is queried again, with the transport of the owner of the job,
+unless the list comes from a query of that same user that asked for the job.
+
+The schedulers with the 'can_query_job_history' feature are queried through
+their accounting (e.g. sacct for SLURM) instead of their queue: the result
+also has the finished jobs, with their exit status and resources used.
+After the first query of a process, only the jobs that were not finished
+at the time of the previous query are asked for (with a margin of
+:py:attr:`SchedulerPoller.history_margin` seconds). The jobs missing from
+the accounting are looked for in the queue, so that a job not in the
+result has really vanished from the scheduler.
+"""
+import threading
+import time
+
+from aiida.daemon.metrics import daemon_metrics
+
+
+class SchedulerPoller(object):
+    """
+    Decide when the scheduler of each computer has to be queried, and
+    cache the job lists it returns.
+    """
+    # Factor by which the polling interval of a computer is increased
+    # after each query that did not show any change
+    backoff_factor = 2.
+
+    # Seconds subtracted from the time of the previous query of the job
+    # history, to cope with the clock skew and the accounting lag
+    history_margin = 300
+
+    _setting_key = 'daemon|jobpolling|{}'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (computer pk, user pk or None, remote username) -> (time, pk of
+        # the user who queried, queried jobids or None, dictionary of
+        # JobInfo objects)
+        self._job_lists = {}
+        # (computer pk, remote username) -> set of the job ids to query
+        self._expected_jobids = {}
+        # computer pks for which a change was seen since the last poll
+        self._changed = set()
+        # (computer pk, user pk or None, remote username) -> time of the
+        # previous query of the job history
+        self._history_times = {}
+
+    def _get_poll_state(self, computer):
+        from aiida.backends.utils import get_global_setting
+
+        try:
+            return get_global_setting(self._setting_key.format(computer.pk))
+        except KeyError:
+            return None
+
+    def is_due(self, computer):
+        """
+        Return True if enough time has passed since the last query of the
+        scheduler of the given computer.
+        """
+        state = self._get_poll_state(computer)
+        if not state:
+            return True
+        return time.time() - state['last'] >= state['interval']
+
+    def get_interval(self, computer):
+        """
+        Return the current interval (in seconds) between two queries of the
+        scheduler of the given computer.
+        """
+        state = self._get_poll_state(computer)
+        if not state:
+            return computer.get_minimum_job_poll_interval()
+        return state['interval']
+
+    def mark_changed(self, computer):
+        """
+        Record that the state of a job of the given computer has changed,
+        so that the computer is polled again at the minimum interval.
+        """
+        with self._lock:
+            self._changed.add(computer.pk)
+
+    def report_submission(self, computer):
+        """
+        Record that jobs were submitted to the given computer, so that its
+        scheduler is polled again at the minimum interval, by any daemon
+        process: the stored interval is reset, with the time of the last
+        query left unchanged.
+        """
+        from aiida.backends.utils import update_global_setting
+
+        self.mark_changed(computer)
+
+        min_interval = computer.get_minimum_job_poll_interval()
+        state = self._get_poll_state(computer)
+        if not state or state['interval'] <= min_interval:
+            # Already polled at the minimum interval
+            return
+
+        def update(state):
+            # Without a state, the computer is polled at once
+            return dict(state or {'last': 0.}, interval=min_interval)
+
+        update_global_setting(
+            self._setting_key.format(computer.pk), update,
+            description="Interval and time of the last query of the "
+                        "scheduler of computer {}".format(computer.name))
+
+    def report_poll(self, computer):
+        """
+        Record that the scheduler of the given computer has been polled,
+        and compute the interval until the next poll.
+
+        :return: the new interval, in seconds
+        """
+        from aiida.backends.utils import set_global_setting
+
+        with self._lock:
+            changed = computer.pk in self._changed
+            self._changed.discard(computer.pk)
+
+        min_interval = computer.get_minimum_job_poll_interval()
+        state = self._get_poll_state(computer)
+        if changed or not state:
+            interval = min_interval
+        else:
+            # The minimum interval wins if the maximum is set lower
+            interval = max(min_interval,
+                           min(computer.get_maximum_job_poll_interval(),
+                               state['interval'] * self.backoff_factor))
+
+        set_global_setting(
+            self._setting_key.format(computer.pk),
+            {'interval': interval, 'last': time.time()},
+            description="Interval and time of the last query of the "
+                        "scheduler of computer {}".format(computer.name))
+        return interval
+
+    def set_expected_jobids(self, computer, jobids, username=None):
+        """
+        Set the job ids of all users of the given remote account that are
+        expected to be queried on the given computer, so that a single query
+        can serve all of them.
+
+        :param username: the remote username, as returned by
+            :py:func:`get_remote_username`
+        """
+        with self._lock:
+            self._expected_jobids[(computer.pk, username)] = set(jobids)
+
+    def get_jobs(self, computer, scheduler, aiidauser, jobids, username=None):
+        """
+        Return the jobs of the given user on the given computer, as a
+        dictionary of JobInfo objects as returned by
+        ``scheduler.getJobs(as_dict=True)`` (or by
+        ``scheduler.get_job_history(as_dict=True)``, see the module
+        docstring); if a recent enough job list is in the cache, it is
+        returned without querying the scheduler.
+
+        :param computer: the computer
+        :param scheduler: the scheduler of the computer, with an open
+            transport (used only if the scheduler has to be queried)
+        :param aiidauser: the AiiDA user owning the jobs
+        :param jobids: the job ids (strings) that have to be in the result,
+            if they are still known to the scheduler
+        :param username: the remote username of the user, as returned by
+            :py:func:`get_remote_username`
+        """
+        jobids = set(jobids)
+        min_interval = computer.get_minimum_job_poll_interval()
+        by_user = scheduler.get_feature('can_query_by_user')
+
+        with self._lock:
+            if by_user:
+                key = (computer.pk, aiidauser.pk, username)
+                query_jobids = None
+            else:
+                key = (computer.pk, None, username)
+                query_jobids = jobids | self._expected_jobids.get(
+                    (computer.pk, username), set())
+
+            cached = self._job_lists.get(key)
+            if (cached is not None and
+                    time.time() - cached[0] < min_interval):
+                _, owner, cached_jobids, cached_jobs = cached
+                if jobids.issubset(cached_jobs):
+                    return cached_jobs
+                if cached_jobids is not None and jobids <= cached_jobids:
+                    # The missing jobs are finished only if this user asked
+                    # for them; otherwise, the jobs of this user are queried
+                    # again with its transport, without caching the result
+                    if owner == aiidauser.pk:
+                        return cached_jobs
+                    query_jobids = jobids
+                    key = None
+
+        try:
+            with_history = scheduler.get_feature('can_query_job_history')
+        except NotImplementedError:
+            with_history = False
+
+        with daemon_metrics.timer('scheduler'):
+            if with_history:
+                jobs = self._get_job_history(key, scheduler, by_user,
+                                             query_jobids, jobids)
+            else:
+                jobs = self._query(scheduler.getJobs, by_user, query_jobids)
+
+        if key is not None:
+            with self._lock:
+                self._job_lists[key] = (time.time(), aiidauser.pk,
+                                        query_jobids, jobs)
+        return jobs
+
+    @staticmethod
+    def _query(method, by_user, jobids, **kwargs):
+        """
+        Call a query method of the scheduler (getJobs or get_job_history)
+        by user or by job ids, and return the dictionary of JobInfo objects.
+        """
+        if by_user:
+            return method(user="$USER", as_dict=True, **kwargs)
+        return method(jobs=sorted(jobids), as_dict=True, **kwargs)
+
+    def _get_job_history(self, key, scheduler, by_user, query_jobids,
+                         jobids):
+        """
+        Query the job history of the scheduler, incrementally after the
+        first query for the given key, and look for the jobs that are
+        missing from it in the full history and in the queue.
+
+        :param key: the key of the history times, or None to query the
+            full history
+        :return: a dictionary of JobInfo objects, as returned by
+            ``scheduler.get_job_history(as_dict=True)``
+        """
+        with self._lock:
+            since = self._history_times.get(key)
+        query_time = time.time()
+        if since is not None:
+            since -= self.history_margin
+
+        jobs = self._query(scheduler.get_job_history, by_user, query_jobids,
+                           since=since)
+
+        # Jobs that finished before the window (e.g. if their update failed)
+        missing = jobids.difference(jobs)
+        if missing and since is not None:
+            found = self._query(scheduler.get_job_history, by_user, missing)
+            jobs.update((jobid, found[jobid])
+                        for jobid in missing if jobid in found)
+            missing.difference_update(found)
+
+        # Jobs not recorded yet by the accounting
+        if missing:
+            found = self._query(scheduler.getJobs, by_user, missing)
+            jobs.update((jobid, found[jobid])
+                        for jobid in missing if jobid in found)
+
+        if key is not None:
+            with self._lock:
+                self._history_times[key] = query_time
+        return jobs
+
+
+def get_remote_username(authinfo):
+    """
+    Return the username used to connect to the computer with the given
+    DbAuthInfo, or None if it is not set (the default account of the
+    daemon, e.g. for the local transport).
+    """
+    return authinfo.get_auth_params().get('username')
+
+
+# The poller used by the daemon
+scheduler_poller = SchedulerPoller()
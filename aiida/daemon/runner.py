@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+An event-driven alternative to the Celery periodic tasks defined in
+``aiida/daemon/tasks.py``.
+
+The runner listens (with the PostgreSQL LISTEN command) to the notifications
+sent by ``JobCalculation._set_state`` on every state change, and runs the
+daemon tasks that have work to do as soon as a notification arrives: e.g.,
+the submitter when a calculation goes in the TOSUBMIT state, or the
+retriever right after the updater has found a COMPUTED calculation.
+Each task is also run at regular intervals, as a safety net for lost
+notifications and for the work that is not triggered by state changes
+(e.g., polling the schedulers).
+
+To use it, set the ``daemon.runner`` property to ``events`` and restart the
+daemon, or run it directly with ``python -m aiida.daemon.runner``.
+"""
+import errno
+import select
+import signal
+import time
+
+from aiida.backends.utils import load_dbenv, is_dbenv_loaded
+from aiida.common import aiidalogger
+from aiida.common.datastructures import calc_states
+
+runnerlogger = aiidalogger.getChild('daemonrunner')
+
+# States that mean that a calculation is done, and that workflows waiting
+# for it may proceed
+_FINAL_STATES = (
+    calc_states.FINISHED,
+    calc_states.FAILED,
+    calc_states.SUBMISSIONFAILED,
+    calc_states.RETRIEVALFAILED,
+    calc_states.PARSINGFAILED,
+)
+
+
+def _run_submitter():
+    from aiida.daemon.execmanager import submit_jobs
+    from aiida.daemon.timestamps import set_daemon_timestamp
+    from aiida.daemon.metrics import daemon_metrics
+
+    set_daemon_timestamp(task_name='submitter', when='start')
+    with daemon_metrics.cycle('submitter'):
+        submit_jobs()
+    set_daemon_timestamp(task_name='submitter', when='stop')
+
+
+def _run_updater():
+    from aiida.daemon.execmanager import update_jobs
+    from aiida.daemon.timestamps import set_daemon_timestamp
+    from aiida.daemon.metrics import daemon_metrics
+
+    set_daemon_timestamp(task_name='updater', when='start')
+    with daemon_metrics.cycle('updater'):
+        update_jobs()
+    set_daemon_timestamp(task_name='updater', when='stop')
+
+
+def _run_retriever():
+    from aiida.daemon.execmanager import retrieve_jobs
+    from aiida.daemon.timestamps import set_daemon_timestamp
+    from aiida.daemon.metrics import daemon_metrics
+
+    set_daemon_timestamp(task_name='retriever', when='start')
+    with daemon_metrics.cycle('retriever'):
+        retrieve_jobs()
+    set_daemon_timestamp(task_name='retriever', when='stop')
+
+
+def _run_parser():
+    from aiida.daemon.execmanager import parse_jobs
+    from aiida.daemon.timestamps import set_daemon_timestamp
+    from aiida.daemon.metrics import daemon_metrics
+
+    set_daemon_timestamp(task_name='parser', when='start')
+    with daemon_metrics.cycle('parser'):
+        parse_jobs()
+    set_daemon_timestamp(task_name='parser', when='stop')
+
+
+def _run_tick_work():
+    from aiida.work.daemon import tick_workflow_engine
+
+    tick_workflow_engine()
+
+
+def _run_workflow_stepper():
+    from aiida.daemon.workflowmanager import execute_steps
+    from aiida.daemon.timestamps import set_daemon_timestamp
+    from aiida.daemon.metrics import daemon_metrics
+    from aiida.daemon.claims import work_claims
+
+    # The tasks of a runner are never run concurrently, but there may be
+    # several runners (see the daemon.workers property)
+    with work_claims.claimed('task', ['workflow']) as claimed:
+        if not claimed:
+            return
+        set_daemon_timestamp(task_name='workflow', when='start')
+        with daemon_metrics.cycle('workflow'):
+            execute_steps()
+        set_daemon_timestamp(task_name='workflow', when='stop')
+
+
+class DaemonTask(object):
+    """
+    A task run by the :py:class:`DaemonRunner`.
+    """
+
+    def __init__(self, name, function, trigger_states, interval,
+                 event_interval=None):
+        """
+        :param name: the name of the task
+        :param function: the function to call, without parameters
+        :param trigger_states: the calculation states whose notification
+            triggers an immediate run of this task
+        :param interval: the interval (in seconds) between two runs when no
+            notifications can be received
+        :param event_interval: the interval (in seconds) between two runs
+            when notifications are received; if None, use ``interval``
+        """
+        self.name = name
+        self.function = function
+        self.trigger_states = frozenset(trigger_states)
+        self.interval = interval
+        self.event_interval = (interval if event_interval is None
+                               else max(interval, event_interval))
+        # Run all tasks as soon as the runner starts
+        self.next_run = 0.
+        self.triggered = True
+
+    def is_due(self, now):
+        return self.triggered or now >= self.next_run
+
+    def run(self, listening):
+        """
+        Run the task, and schedule its next run.
+
+        :param listening: True if notifications are being received, used to
+            choose the interval until the next run
+        """
+        self.triggered = False
+        start = time.time()
+        try:
+            self.function()
+        except Exception as e:
+            import traceback
+
+            runnerlogger.error("Error in the daemon task {} ({}): {}".format(
+                self.name, e.__class__.__name__, traceback.format_exc()))
+        now = time.time()
+        runnerlogger.debug("Daemon task {} run in {:.2f}s".format(
+            self.name, now - start))
+        self.next_run = now + (
+            self.event_interval if listening else self.interval)
+
+
+class DaemonRunner(object):
+    """
+    Run the daemon tasks in a single process, as soon as the state of
+    calculations changes, and at regular intervals otherwise.
+    """
+    # Seconds to wait before trying again to open the connection used to
+    # listen to notifications, after a failure
+    _reconnect_interval = 60
+
+    def __init__(self, tasks=None):
+        """
+        :param tasks: a list of :py:class:`DaemonTask` instances; if None,
+            use the same tasks as the Celery daemon
+        """
+        self._tasks = tasks if tasks is not None else self._get_default_tasks()
+        self._connection = None
+        self._next_connection_attempt = 0.
+        self._stop_requested = False
+
+    @staticmethod
+    def _get_default_tasks():
+        from aiida.backends import settings
+        from aiida.common.setup import get_profile_config, get_property
+        from aiida.daemon import (
+            DAEMON_INTERVALS_SUBMIT, DAEMON_INTERVALS_RETRIEVE,
+            DAEMON_INTERVALS_UPDATE, DAEMON_INTERVALS_WFSTEP,
+            DAEMON_INTERVALS_TICK_WORKFLOWS, DAEMON_INTERVALS_PARSE)
+
+        config = get_profile_config(settings.AIIDADB_PROFILE)
+        fallback = get_property("daemon.fallback_poll_interval")
+
+        return [
+            # Calculations held back by the submission limits of a computer
+            # may be submitted when other ones leave the scheduler
+            DaemonTask('submitter', _run_submitter,
+                       [calc_states.TOSUBMIT, calc_states.COMPUTED],
+                       config.get("DAEMON_INTERVALS_SUBMIT",
+                                  DAEMON_INTERVALS_SUBMIT),
+                       fallback),
+            # The updater has to poll the schedulers anyway
+            DaemonTask('updater', _run_updater,
+                       [],
+                       config.get("DAEMON_INTERVALS_UPDATE",
+                                  DAEMON_INTERVALS_UPDATE)),
+            DaemonTask('retriever', _run_retriever,
+                       [calc_states.COMPUTED],
+                       config.get("DAEMON_INTERVALS_RETRIEVE",
+                                  DAEMON_INTERVALS_RETRIEVE),
+                       fallback),
+            DaemonTask('parser', _run_parser,
+                       [calc_states.PARSING],
+                       config.get("DAEMON_INTERVALS_PARSE",
+                                  DAEMON_INTERVALS_PARSE),
+                       fallback),
+            # Processes of the workflow engine are stored on disk, and not
+            # (yet) notified
+            DaemonTask('tick_work', _run_tick_work,
+                       _FINAL_STATES,
+                       config.get("DAEMON_INTERVALS_TICK_WORKFLOWS",
+                                  DAEMON_INTERVALS_TICK_WORKFLOWS)),
+            DaemonTask('workflow_stepper', _run_workflow_stepper,
+                       _FINAL_STATES,
+                       config.get("DAEMON_INTERVALS_WFSTEP",
+                                  DAEMON_INTERVALS_WFSTEP),
+                       fallback),
+        ]
+
+    @property
+    def listening(self):
+        """
+        True if notifications of state changes are currently received.
+        """
+        return self._connection is not None
+
+    def _connect(self):
+        """
+        Open a dedicated connection to the database, and start listening to
+        the state changes of calculations. On failure, log and go on polling.
+        """
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+        from aiida.backends import settings
+        from aiida.backends.utils import CALC_STATE_CHANNEL
+        from aiida.common.setup import get_profile_config
+
+        self._next_connection_attempt = time.time() + self._reconnect_interval
+        config = get_profile_config(settings.AIIDADB_PROFILE)
+        if not config["AIIDADB_ENGINE"].startswith("postgre"):
+            return
+
+        try:
+            connection = psycopg2.connect(
+                host=config["AIIDADB_HOST"] or None,
+                port=config["AIIDADB_PORT"] or None,
+                user=config["AIIDADB_USER"],
+                password=config["AIIDADB_PASS"],
+                dbname=config["AIIDADB_NAME"])
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            connection.cursor().execute("LISTEN {};".format(CALC_STATE_CHANNEL))
+        except psycopg2.Error as e:
+            runnerlogger.warning("Unable to listen to state changes, the "
+                                 "daemon tasks will only run at regular "
+                                 "intervals: {}".format(e))
+            return
+
+        self._connection = connection
+        runnerlogger.info("Listening to state changes of calculations")
+        # Notifications may have been lost while not listening
+        for task in self._tasks:
+            task.triggered = True
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _trigger(self, payload):
+        """
+        Mark as triggered the tasks interested in the state change described
+        by the payload of a notification ('pk:state').
+        """
+        try:
+            _, state = payload.rsplit(':', 1)
+        except ValueError:
+            runnerlogger.warning("Invalid notification payload '{}'".format(
+                payload))
+            return
+        for task in self._tasks:
+            if state in task.trigger_states:
+                task.triggered = True
+
+    def _wait(self, timeout):
+        """
+        Wait for at most ``timeout`` seconds, returning earlier if
+        notifications of state changes are received.
+        """
+        if self._connection is None:
+            if time.time() >= self._next_connection_attempt:
+                self._connect()
+            if self._connection is None:
+                # Sleep in short steps, to react quickly to signals
+                time.sleep(min(timeout, 1.))
+                return
+
+        import psycopg2
+
+        try:
+            if timeout > 0:
+                try:
+                    select.select([self._connection], [], [], timeout)
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+            self._connection.poll()
+            while self._connection.notifies:
+                self._trigger(self._connection.notifies.pop(0).payload)
+        except (psycopg2.Error, select.error) as e:
+            runnerlogger.warning("Lost the connection used to listen to "
+                                 "state changes: {}".format(e))
+            self._disconnect()
+
+    def request_stop(self, *args):
+        """
+        Ask the runner to stop after the task currently running (if any).
+        Can be used as a signal handler.
+        """
+        self._stop_requested = True
+
+    def run(self):
+        """
+        Run the daemon tasks until :py:meth:`request_stop` is called.
+        """
+        self._connect()
+        try:
+            while not self._stop_requested:
+                for task in self._tasks:
+                    if self._stop_requested:
+                        break
+                    if task.is_due(time.time()):
+                        task.run(self.listening)
+                        # Check right away for the notifications sent by the
+                        # task itself, for an immediate follow-up
+                        self._wait(0)
+
+                if (self._stop_requested or
+                        any(task.triggered for task in self._tasks)):
+                    continue
+                next_run = min(task.next_run for task in self._tasks)
+                self._wait(max(0., next_run - time.time()))
+        finally:
+            from aiida.daemon.execmanager import stop_parsing
+            from aiida.daemon.metrics import daemon_metrics
+            from aiida.transport.pool import transport_pool
+
+            self._disconnect()
+            stop_parsing()
+            transport_pool.close_idle()
+            daemon_metrics.flush()
+
+
+if __name__ == "__main__":
+    if not is_dbenv_loaded():
+        load_dbenv(process="daemon")
+
+    from aiida.daemon.metrics import start_metrics_server
+
+    runner = DaemonRunner()
+    start_metrics_server()
+    signal.signal(signal.SIGTERM, runner.request_stop)
+    signal.signal(signal.SIGINT, runner.request_stop)
+    runner.run()
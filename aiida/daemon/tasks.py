@@ -12,6 +12,7 @@ from datetime import timedelta
 from aiida.backends.utils import load_dbenv, is_dbenv_loaded
 from celery import Celery
 from celery.task import periodic_task
+from celery.signals import worker_ready
 
 from aiida.backends import settings
 from aiida.backends.profile import BACKEND_SQLA, BACKEND_DJANGO
@@ -22,13 +23,13 @@ if not is_dbenv_loaded():
 
 from aiida.common.setup import get_profile_config
 from aiida.common.exceptions import ConfigurationError
-from aiida.daemon.timestamps import set_daemon_timestamp,get_last_daemon_timestamp
+from aiida.daemon.timestamps import set_daemon_timestamp
+from aiida.daemon.metrics import daemon_metrics
 
-DAEMON_INTERVALS_SUBMIT = 10
-DAEMON_INTERVALS_RETRIEVE = 10
-DAEMON_INTERVALS_UPDATE = 30
-DAEMON_INTERVALS_WFSTEP = 30
-DAEMON_INTERVALS_TICK_WORKFLOWS = 5
+from aiida.daemon import (
+    DAEMON_INTERVALS_SUBMIT, DAEMON_INTERVALS_RETRIEVE,
+    DAEMON_INTERVALS_UPDATE, DAEMON_INTERVALS_WFSTEP,
+    DAEMON_INTERVALS_TICK_WORKFLOWS, DAEMON_INTERVALS_PARSE)
 
 config = get_profile_config(settings.AIIDADB_PROFILE)
 
@@ -50,6 +51,13 @@ broker = (
 app = Celery('tasks', broker=broker)
 
 
+@worker_ready.connect
+def serve_metrics(**kwargs):
+    # In the main worker process; the metrics are read from the database
+    from aiida.daemon.metrics import start_metrics_server
+    start_metrics_server()
+
+
 # the tasks as taken from the djsite.db.tasks, same tasks and same functionalities
 # will now of course fail because set_daemon_timestep has not be implementd for SA
 
@@ -62,7 +70,8 @@ def submitter():
     from aiida.daemon.execmanager import submit_jobs
     print "aiida.daemon.tasks.submitter:  Checking for calculations to submit"
     set_daemon_timestamp(task_name='submitter', when='start')
-    submit_jobs()
+    with daemon_metrics.cycle('submitter'):
+        submit_jobs()
     set_daemon_timestamp(task_name='submitter', when='stop')
 
 
@@ -75,7 +84,8 @@ def updater():
     from aiida.daemon.execmanager import update_jobs
     print "aiida.daemon.tasks.update:  Checking for calculations to update"
     set_daemon_timestamp(task_name='updater', when='start')
-    update_jobs()
+    with daemon_metrics.cycle('updater'):
+        update_jobs()
     set_daemon_timestamp(task_name='updater', when='stop')
 
 
@@ -89,10 +99,25 @@ def retriever():
     from aiida.daemon.execmanager import retrieve_jobs
     print "aiida.daemon.tasks.retrieve:  Checking for calculations to retrieve"
     set_daemon_timestamp(task_name='retriever', when='start')
-    retrieve_jobs()
+    with daemon_metrics.cycle('retriever'):
+        retrieve_jobs()
     set_daemon_timestamp(task_name='retriever', when='stop')
 
 
+@periodic_task(
+    run_every=timedelta(
+        seconds=config.get("DAEMON_INTERVALS_PARSE", DAEMON_INTERVALS_PARSE)
+    )
+)
+def parser():
+    from aiida.daemon.execmanager import parse_jobs
+    print "aiida.daemon.tasks.parser:  Checking for calculations to parse"
+    set_daemon_timestamp(task_name='parser', when='start')
+    with daemon_metrics.cycle('parser'):
+        parse_jobs()
+    set_daemon_timestamp(task_name='parser', when='stop')
+
+
 @periodic_task(
     run_every=timedelta(
         seconds=config.get("DAEMON_INTERVALS_TICK_WORKFLOWS",
@@ -111,33 +136,30 @@ def tick_work():
                )
 def workflow_stepper(): # daemon for legacy workflow 
     from aiida.daemon.workflowmanager import execute_steps
+    from aiida.daemon.claims import work_claims
     print "aiida.daemon.tasks.workflowmanager:  Checking for workflows to manage"
-    # RUDIMENTARY way to check if this task is already running (to avoid acting
-    # again and again on the same workflow steps)
-    try:
-        stepper_is_running = (get_last_daemon_timestamp('workflow',when='stop')
-            -get_last_daemon_timestamp('workflow',when='start'))<=timedelta(0)
-    except TypeError:
-        # when some timestamps are None (undefined)
-        stepper_is_running = (get_last_daemon_timestamp('workflow',when='stop')
-            is None and get_last_daemon_timestamp('workflow',when='start') is not None)
-        
-    if not stepper_is_running:
-        set_daemon_timestamp(task_name='workflow', when='start')
-        # the previous wf manager stopped already -> we can run a new one
-        print "aiida.daemon.tasks.workflowmanager: running execute_steps"
-        execute_steps()
-        set_daemon_timestamp(task_name='workflow', when='stop')
-    else:
-        print "aiida.daemon.tasks.workflowmanager: execute_steps already running"
+    # Only one daemon worker at a time runs this task (to avoid acting
+    # again and again on the same workflow steps); the claim expires if
+    # the worker dies while running it
+    with work_claims.claimed('task', ['workflow']) as claimed:
+        if claimed:
+            set_daemon_timestamp(task_name='workflow', when='start')
+            print "aiida.daemon.tasks.workflowmanager: running execute_steps"
+            with daemon_metrics.cycle('workflow'):
+                execute_steps()
+            set_daemon_timestamp(task_name='workflow', when='stop')
+        else:
+            print "aiida.daemon.tasks.workflowmanager: execute_steps already running"
        
 
 def manual_tick_all():
-    from aiida.daemon.execmanager import submit_jobs, update_jobs, retrieve_jobs
+    from aiida.daemon.execmanager import (
+        submit_jobs, update_jobs, retrieve_jobs, parse_jobs)
     from aiida.work.daemon import tick_workflow_engine
     from aiida.daemon.workflowmanager import execute_steps
     submit_jobs()
     update_jobs()
     retrieve_jobs()
+    parse_jobs(wait=True)
     execute_steps() # legacy workflows
     tick_workflow_engine()
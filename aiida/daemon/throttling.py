@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Limits on the submission of calculations, used by the daemon to decide
+which calculations in the TOSUBMIT state can be submitted now.
+
+For each computer, the daemon respects:
+
+* ``computer.get_max_queued_jobs()``: the maximum number of calculations in
+  the SUBMITTING or WITHSCHEDULER state at the same time;
+* ``computer.get_max_submissions_per_minute()``: the maximum number of
+  submissions in any 60 seconds.
+
+When the limits allow only part of the calculations to be submitted, the
+free slots are shared between the AiiDA users: each slot goes to the user
+with the fewest calculations already queued on the computer. The other
+calculations stay in the TOSUBMIT state, and are submitted by a later run
+of the daemon, when there is capacity again.
+"""
+import time
+
+from aiida.common.datastructures import calc_states
+
+# The states of the calculations counted as queued on a computer
+QUEUED_STATES = (calc_states.SUBMITTING, calc_states.WITHSCHEDULER)
+
+
+class SubmissionThrottle(object):
+    """
+    Select the calculations that can be submitted to each computer, and
+    keep track of the recent submissions.
+    """
+    # Width (in seconds) of the window of the submission rate limit
+    rate_window = 60.
+
+    _setting_key = 'daemon|submissions|{}'
+
+    def get_queued_jobs(self, computer):
+        """
+        Return the number of calculations of each AiiDA user that are
+        queued (see :py:data:`QUEUED_STATES`) on the given computer.
+
+        :return: a dictionary with the user pks as keys
+        """
+        from aiida.orm import JobCalculation, Computer, User
+        from aiida.orm.querybuilder import QueryBuilder
+
+        qb = QueryBuilder()
+        qb.append(JobCalculation, tag='calc',
+                  filters={'attributes.state': {'in': list(QUEUED_STATES)}})
+        qb.append(Computer, computer_of='calc',
+                  filters={'id': {'==': computer.pk}})
+        qb.append(User, creator_of='calc', project=['id'])
+
+        queued = {}
+        for user_pk, in qb.iterall():
+            queued[user_pk] = queued.get(user_pk, 0) + 1
+        return queued
+
+    def get_recent_submissions(self, computer):
+        """
+        Return the times of the submissions to the given computer in the
+        last :py:attr:`rate_window` seconds.
+        """
+        from aiida.backends.utils import get_global_setting
+
+        try:
+            times = get_global_setting(self._setting_key.format(computer.pk))
+        except KeyError:
+            return []
+        now = time.time()
+        return [t for t in times if now - t < self.rate_window]
+
+    def report_submissions(self, computer, num):
+        """
+        Record that ``num`` calculations have just been submitted to the
+        given computer. Only needed if the computer has a rate limit.
+        """
+        from aiida.backends.utils import update_global_setting
+
+        if not num or computer.get_max_submissions_per_minute() is None:
+            return
+
+        def update(times):
+            now = time.time()
+            recent = [t for t in times or [] if now - t < self.rate_window]
+            return recent + [now] * num
+
+        # The submissions of the other workers are recorded concurrently
+        update_global_setting(
+            self._setting_key.format(computer.pk), update,
+            description="Times of the recent submissions to computer "
+                        "{}".format(computer.name))
+
+    def get_capacity(self, computer):
+        """
+        Return the number of calculations that can be submitted to the given
+        computer now, or None if there is no limit.
+        """
+        capacity = None
+
+        max_queued = computer.get_max_queued_jobs()
+        if max_queued is not None:
+            capacity = max_queued - sum(
+                self.get_queued_jobs(computer).itervalues())
+
+        max_rate = computer.get_max_submissions_per_minute()
+        if max_rate is not None:
+            rate_capacity = max_rate - len(
+                self.get_recent_submissions(computer))
+            capacity = (rate_capacity if capacity is None
+                        else min(capacity, rate_capacity))
+
+        if capacity is None:
+            return None
+        return max(0, capacity)
+
+    def select(self, computer, calc_pks_by_user):
+        """
+        Select the calculations that can be submitted now to the given
+        computer.
+
+        :param computer: the computer
+        :param calc_pks_by_user: a dictionary with the AiiDA user pks as
+            keys, and as values the lists of the pks of their calculations
+            in the TOSUBMIT state on the computer
+        :return: a dictionary with the same keys, and as values the lists of
+            the pks of the calculations to submit (the oldest first)
+        """
+        pending = {user_pk: sorted(pks)
+                   for user_pk, pks in calc_pks_by_user.iteritems()}
+        capacity = self.get_capacity(computer)
+        if capacity is None:
+            return pending
+
+        selected = {user_pk: [] for user_pk in pending}
+        if capacity == 0:
+            return selected
+
+        queued = self.get_queued_jobs(computer)
+        while capacity > 0:
+            candidates = [(queued.get(user_pk, 0) + len(selected[user_pk]),
+                           user_pk)
+                          for user_pk, pks in pending.iteritems() if pks]
+            if not candidates:
+                break
+            _, user_pk = min(candidates)
+            selected[user_pk].append(pending[user_pk].pop(0))
+            capacity -= 1
+        return selected
+
+
+# The throttle used by the daemon
+submission_throttle = SubmissionThrottle()
@@ -25,6 +25,7 @@ celery_tasks = {
         'submitter': 'submitter',
         'updater': 'updater',
         'retriever': 'retriever',
+        'parser': 'parser',
         'workflow': 'workflow_stepper',
 }
 
@@ -15,6 +15,7 @@ from aiida.common.utils import str_timedelta
 from aiida.common.datastructures import sort_states, calc_states
 from aiida.common.exceptions import ModificationNotAllowed, DbContentError
 from aiida.backends.djsite.utils import get_automatic_user
+from aiida.backends.utils import notify_calc_state_change
 from aiida.orm.group import Group
 from aiida.orm.implementation.django.calculation import Calculation
 from aiida.orm.implementation.general.calculation.job import (
@@ -76,6 +77,59 @@ class JobCalculation(AbstractJobCalculation, Calculation):
         if state != calc_states.IMPORTED:
             self._set_attr('state', state)
 
+        # Wake up the daemon, if it is listening for state changes
+        notify_calc_state_change(self.pk, state)
+
+    @classmethod
+    def _bulk_set_states_and_attrs(cls, updates):
+        """
+        Apply the given state transitions and attribute updates in a single
+        transaction. See
+        :py:meth:`AbstractJobCalculation._set_states_and_attrs`.
+        """
+        from django.db.models import F
+        from aiida.backends.djsite.db.models import (
+            DbAttribute, DbCalcState, DbNode)
+
+        pks = [calc.pk for calc, _, _ in updates]
+        old_states = {pk: [] for pk in pks}
+        for pk, state in DbCalcState.objects.filter(
+                dbnode_id__in=pks).values_list('dbnode_id', 'state'):
+            old_states[pk].append(state)
+
+        skipped = []
+        transited = []
+        try:
+            with transaction.atomic():
+                new_states = []
+                for calc, state, attrs in updates:
+                    if state is not None:
+                        if cls._is_valid_transition(state, old_states[calc.pk]):
+                            new_states.append(
+                                DbCalcState(dbnode_id=calc.pk, state=state))
+                            transited.append((calc, state))
+                            if state != calc_states.IMPORTED:
+                                attrs = dict(attrs, state=state)
+                        else:
+                            skipped.append(calc)
+                    for key, value in attrs.iteritems():
+                        DbAttribute.set_value_for_node(
+                            calc.dbnode, key, value, with_transaction=False)
+                DbCalcState.objects.bulk_create(new_states)
+                DbNode.objects.filter(pk__in=pks).update(
+                    nodeversion=F('nodeversion') + 1)
+        except IntegrityError:
+            raise ModificationNotAllowed(
+                "A state of one of the calculations {} was set "
+                "concurrently".format(pks))
+
+        # Reload the nodes, to have the new version numbers in memory
+        dbnodes = DbNode.objects.in_bulk(pks)
+        for calc, _, _ in updates:
+            calc._dbnode = dbnodes[calc.pk]
+
+        return skipped, transited
+
     def get_state(self, from_attribute=False):
         """
         Get the state of the calculation.
@@ -9,6 +9,7 @@
 ###########################################################################
 
 import time
+from datetime import timedelta
 
 from django.db import IntegrityError, transaction
 
@@ -43,6 +44,40 @@ class LockManager(AbstractLockManager):
         except:
             raise InternalError("Something went wrong, try to keep on.")
 
+    def aquire_many(self, keys, timeout=3600, owner="None"):
+        from aiida.backends.djsite.db.models import DbLock
+
+        now = timezone.now()
+        for old_lock in DbLock.objects.filter(key__in=keys):
+            if old_lock.creation + timedelta(seconds=old_lock.timeout) < now:
+                # The creation is checked again, in case the lock has been
+                # refreshed in the meantime
+                DbLock.objects.filter(key=old_lock.key,
+                                      creation=old_lock.creation).delete()
+
+        acquired = []
+        for key in keys:
+            sid = transaction.savepoint()
+            try:
+                DbLock.objects.create(key=key, timeout=timeout, owner=owner)
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                continue
+            acquired.append(key)
+        return acquired
+
+    def refresh(self, owner="None"):
+        from aiida.backends.djsite.db.models import DbLock
+
+        return DbLock.objects.filter(owner=owner).update(
+            creation=timezone.now())
+
+    def release_many(self, keys, owner="None"):
+        from aiida.backends.djsite.db.models import DbLock
+
+        DbLock.objects.filter(key__in=keys, owner=owner).delete()
+
     def clear_all(self):
         from aiida.backends.djsite.db.models import DbLock
         try:
@@ -51,6 +86,19 @@ class LockManager(AbstractLockManager):
         except IntegrityError:
             transaction.savepoint_rollback(sid)
 
+    def clear_stale(self, owner_prefix):
+        from aiida.backends.djsite.db.models import DbLock
+
+        now = timezone.now()
+        for old_lock in DbLock.objects.all():
+            if (old_lock.owner.startswith(owner_prefix) or
+                    old_lock.creation + timedelta(seconds=old_lock.timeout)
+                    < now):
+                # The creation is checked again, in case the lock has been
+                # refreshed in the meantime
+                DbLock.objects.filter(key=old_lock.key,
+                                      creation=old_lock.creation).delete()
+
 
 class Lock(AbstractLock):
 
@@ -58,12 +58,16 @@ class AbstractJobCalculation(object):
         self._linkname_retrieved = 'retrieved'
 
         self._updatable_attributes = (
-            'state', 'job_id', 'scheduler_state',
+            'state', 'job_id', 'array_job_id', 'scheduler_state',
             'scheduler_lastchecktime',
-            'last_jobinfo', 'remote_workdir', 'retrieve_list',
-            'retrieve_singlefile_list'
+            'last_jobinfo', 'jobinfo_history', 'remote_workdir',
+            'retrieve_list', 'retrieve_singlefile_list'
         )
 
+        # The number of changes of the jobinfo kept in the 'jobinfo_history'
+        # attribute
+        self._jobinfo_history_length = 20
+
         # Files in which the scheduler output and error will be stored.
         # If they are identical, outputs will be joined.
         self._SCHED_OUTPUT_FILE = '_scheduler-stdout.txt'
@@ -550,6 +554,117 @@ class AbstractJobCalculation(object):
         """
         pass
 
+    @classmethod
+    def _set_states_and_attrs(cls, updates):
+        """
+        Apply a batch of state transitions and attribute updates to stored
+        calculations in a single database transaction, rather than one
+        transaction for each call to ``_set_state`` and ``_set_attr``.
+
+        As with ``_set_state``, a calculation cannot transit twice through
+        the same state, nor go back to a previous state: such transitions
+        are skipped and reported in the return value. If the uniqueness
+        check fails because another process set a state concurrently, the
+        whole batch is applied again one calculation at a time.
+
+        :param updates: a list of ``(calc, state, attributes)`` tuples, with
+          at most one tuple per calculation. ``state`` is the new state
+          (or None to leave the state unchanged), and ``attributes`` a
+          dictionary of attributes to set (possibly empty).
+        :return: the list of the calculations whose state transition was
+          skipped; their attributes are set anyway.
+        :raise ValueError: if a state is not valid.
+        :raise ModificationNotAllowed: if a calculation is not stored, or if
+          an attribute cannot be changed because the calculation is sealed.
+        """
+        from aiida.orm.implementation.general.node import clean_value
+        from aiida.backends.utils import (
+            validate_attribute_key, notify_calc_state_changes)
+
+        cleaned = []
+        for calc, state, attributes in updates:
+            if not calc.is_stored:
+                raise ModificationNotAllowed("Cannot set the calculation state "
+                                             "before storing")
+            if state is not None and state not in calc_states:
+                raise ValueError(
+                    "'{}' is not a valid calculation status".format(state))
+            attrs = {}
+            for key, value in attributes.iteritems():
+                if (key not in calc._updatable_attributes and
+                        calc.is_sealed):
+                    raise ModificationNotAllowed(
+                        "Cannot change the attributes of a sealed "
+                        "calculation.")
+                validate_attribute_key(key)
+                attrs[key] = clean_value(value)
+            cleaned.append((calc, state, attrs))
+
+        if not cleaned:
+            return []
+
+        try:
+            skipped, transited = cls._bulk_set_states_and_attrs(cleaned)
+        except ModificationNotAllowed:
+            # A state was set concurrently: the transaction was rolled back,
+            # fall back to the checks of _set_state
+            skipped = []
+            for calc, state, attrs in cleaned:
+                if state is not None:
+                    try:
+                        calc._set_state(state)
+                    except ModificationNotAllowed:
+                        skipped.append(calc)
+                for key, value in attrs.iteritems():
+                    calc._set_attr(key, value)
+            return skipped
+
+        # Wake up the daemon, if it is listening for state changes
+        notify_calc_state_changes([(calc.pk, state)
+                                   for calc, state in transited])
+        return skipped
+
+    @classmethod
+    def _bulk_set_states_and_attrs(cls, updates):
+        """
+        Backend-specific part of :py:meth:`_set_states_and_attrs`: apply the
+        given updates in a single transaction. Transitions that are not
+        allowed according to the states stored in the DbCalcState table
+        are skipped; the 'state' attribute is set together with the other
+        attributes for the transitions that are applied (except for the
+        IMPORTED state).
+
+        :param updates: a list of ``(calc, state, attributes)`` tuples, with
+          valid states and cleaned attributes.
+        :return: a tuple ``(skipped, transited)``, with the list of the
+          calculations whose transition was skipped, and the list of
+          ``(calc, state)`` tuples for the transitions that were applied.
+        :raise ModificationNotAllowed: if the uniqueness constraint of the
+          DbCalcState table was violated (the transaction is rolled back).
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _is_valid_transition(state, old_states):
+        """
+        Return True if a calculation that went through the given old states
+        can transit to the given new state.
+
+        :param state: the new state
+        :param old_states: the states of the calculation found in the
+          DbCalcState table
+        """
+        from aiida.common.datastructures import sort_states
+
+        if state in old_states:
+            return False
+        if not old_states:
+            return True
+        state_sequence = [state, sort_states(old_states)[0]]
+        # sort from new to old: if they are equal, then it is a valid
+        # advance in state (otherwise, we are going backwards...)
+        return sort_states(state_sequence) == state_sequence
+
     @abstractmethod
     def get_state(self, from_attribute=False):
         """
@@ -754,13 +869,46 @@ class AbstractJobCalculation(object):
         """
         return self.get_attr('job_id', None)
 
+    def _set_array_job_id(self, array_job_id):
+        """
+        Set the scheduler job id of the job array in which the calculation
+        was submitted (always set as a string).
+        """
+        if self.get_state() != calc_states.SUBMITTING:
+            raise ModificationNotAllowed(
+                "Cannot set the job array id if you are not "
+                "submitting the calculation (current state is "
+                "{})".format(self.get_state())
+            )
+
+        return self._set_attr('array_job_id', unicode(array_job_id))
+
+    def get_array_job_id(self):
+        """
+        Get the scheduler job id of the job array in which the calculation
+        was submitted, if any.
+
+        :return: a string, or None if the calculation was submitted as a
+            separate job
+        """
+        return self.get_attr('array_job_id', None)
+
     def _set_scheduler_state(self, state):
+        for key, value in self._get_scheduler_state_attrs(state).iteritems():
+            self._set_attr(key, value)
+
+    @staticmethod
+    def _get_scheduler_state_attrs(state):
+        """
+        Return the attributes set by ``_set_scheduler_state``, to be used
+        with ``_set_states_and_attrs``.
+        """
         # I don't do any test here on the possible valid values,
         # I just convert it to a string
         from aiida.utils import timezone
 
-        self._set_attr('scheduler_state', unicode(state))
-        self._set_attr('scheduler_lastchecktime', timezone.now())
+        return {'scheduler_state': unicode(state),
+                'scheduler_lastchecktime': timezone.now()}
 
     def get_scheduler_state(self):
         """
@@ -780,9 +928,58 @@ class AbstractJobCalculation(object):
         return self.get_attr('scheduler_lastchecktime', None)
 
     def _set_last_jobinfo(self, last_jobinfo):
-        import pickle
+        for key, value in self._get_last_jobinfo_attrs(
+                last_jobinfo).iteritems():
+            self._set_attr(key, value)
 
-        self._set_attr('last_jobinfo', last_jobinfo.serialize())
+    @staticmethod
+    def _get_last_jobinfo_attrs(last_jobinfo):
+        """
+        Return the attributes set by ``_set_last_jobinfo``, to be used with
+        ``_set_states_and_attrs``.
+        """
+        return {'last_jobinfo': last_jobinfo.serialize()}
+
+    def _get_changed_jobinfo_attrs(self, last_jobinfo):
+        """
+        Return the attributes to set with ``_set_states_and_attrs`` to store
+        a new jobinfo, only if it changed since the stored one (see
+        ``JobInfo.get_changed_fields``): 'last_jobinfo', and
+        'jobinfo_history' with the new change appended (see
+        ``_get_jobinfo_history``). If nothing changed, nothing is stored.
+        """
+        import json
+        from aiida.utils import timezone
+
+        previous = self._get_last_jobinfo()
+        changed = last_jobinfo.get_changed_fields(previous)
+        if previous is not None and not changed:
+            return {}
+
+        attrs = self._get_last_jobinfo_attrs(last_jobinfo)
+        serialized = json.loads(attrs['last_jobinfo'])
+        history = self._get_jobinfo_history()
+        history.append({
+            'time': timezone.now().isoformat(),
+            'changes': {k: serialized.get(k) for k in changed
+                        if k in last_jobinfo.get_default_fields()},
+        })
+        attrs['jobinfo_history'] = json.dumps(
+            history[-self._jobinfo_history_length:], separators=(',', ':'))
+        return attrs
+
+    def _get_jobinfo_history(self):
+        """
+        Return the most recent changes of the jobinfo of the calculation,
+        oldest first.
+
+        :return: a list of dictionaries, with keys 'time' (an ISO 8601
+            string) and 'changes' (a dictionary with the serialized new
+            values of the default fields of the JobInfo that changed)
+        """
+        import json
+
+        return json.loads(self.get_attr('jobinfo_history', '[]'))
 
     def _get_last_jobinfo(self):
         """
@@ -1308,51 +1505,138 @@ class AbstractJobCalculation(object):
         No changes of calculation status are done (they will be done later by
         the calculation manager).
 
+        To kill many calculations, use :py:meth:`kill_calculations`, which
+        sends a single kill command for each computer.
+
         .. todo: if the status is TOSUBMIT, check with some lock that it is not
             actually being submitted at the same time in another thread.
         """
+        error = self.kill_calculations([self])[self.pk]
+        if error is not None:
+            raise error
+
+    @classmethod
+    def kill_calculations(cls, calcs):
+        """
+        Kill several calculations (see :py:meth:`kill`), with a single kill
+        command of the scheduler for the calculations of each computer and
+        user.
+
+        :param calcs: a list of stored calculations
+        :return: a dictionary with the pks of the calculations as keys, and as
+            values None if the calculation was killed, or the exception
+            (InvalidOperation or RemoteOperationError) explaining why it
+            could not be killed.
+        """
         # TODO: Check if we want to add a status "KILLED" or something similar.
         from aiida.common.exceptions import (InvalidOperation,
                                              RemoteOperationError)
 
-        old_state = self.get_state()
+        errors = {}
+        to_kill = []
+        for calc in calcs:
+            old_state = calc.get_state()
+
+            if (old_state == calc_states.NEW or
+                        old_state == calc_states.TOSUBMIT):
+                try:
+                    calc._set_state(calc_states.FAILED)
+                except ModificationNotAllowed:
+                    # The daemon moved it to another state in the meantime
+                    errors[calc.pk] = InvalidOperation(
+                        "Cannot kill calculation {}, its state changed "
+                        "while killing it (it was in {} state)".format(
+                            calc.pk, old_state))
+                    continue
+                calc.logger.warning(
+                    "Calculation {} killed by the user "
+                    "(it was in {} state)".format(calc.pk, old_state))
+                errors[calc.pk] = None
+            elif old_state != calc_states.WITHSCHEDULER:
+                errors[calc.pk] = InvalidOperation(
+                    "Cannot kill a calculation in {} state".format(old_state))
+            else:
+                to_kill.append(calc)
 
-        if (old_state == calc_states.NEW or old_state == calc_states.TOSUBMIT):
-            self._set_state(calc_states.FAILED)
-            self.logger.warning(
-                "Calculation {} killed by the user "
-                "(it was in {} state)".format(self.pk, old_state))
-            return
+        for computer, group in cls._group_by_computer_and_user(to_kill):
+            # I get the scheduler plugin class and initialize it with the
+            # correct transport, and kill all the jobs of the group at once
+            try:
+                t = group[0]._get_transport()
+                s = computer.get_scheduler()
+                s.set_transport(t)
+                with t:
+                    killed = s.kill_jobs([c.get_job_id() for c in group])
+            except Exception as e:
+                for calc in group:
+                    errors[calc.pk] = RemoteOperationError(
+                        "An error occurred while trying to kill calculation "
+                        "{} on computer {} ({}): {}".format(
+                            calc.pk, computer.name, e.__class__.__name__, e))
+                continue
 
-        if old_state != calc_states.WITHSCHEDULER:
-            raise InvalidOperation("Cannot kill a calculation in {} state"
-                                   .format(old_state))
+            for calc in group:
+                if killed.get(str(calc.get_job_id())):
+                    # Do not set the state, but let the parser do its job
+                    calc._logger.warning(
+                        "Calculation {} killed by the user "
+                        "(it was {})".format(calc.pk,
+                                             calc_states.WITHSCHEDULER))
+                    errors[calc.pk] = None
+                else:
+                    errors[calc.pk] = RemoteOperationError(
+                        "An error occurred while trying to kill "
+                        "calculation {} (jobid {}), see log "
+                        "(maybe the calculation already finished?)"
+                            .format(calc.pk, calc.get_job_id()))
 
-        # I get the scheduler plugin class and initialize it with the correct
-        # transport
-        computer = self.get_computer()
-        t = self._get_transport()
-        s = computer.get_scheduler()
-        s.set_transport(t)
+        return errors
 
-        # And I call the proper kill method for the job ID of this calculation
-        with t:
-            retval = s.kill(self.get_job_id())
-
-        # Raise error is something went wrong
-        if not retval:
-            raise RemoteOperationError(
-                "An error occurred while trying to kill "
-                "calculation {} (jobid {}), see log "
-                "(maybe the calculation already finished?)"
-                    .format(self.pk, self.get_job_id()))
-        else:
-            # Do not set the state, but let the parser do its job
-            # self._set_state(calc_states.FAILED)
-            self._logger.warning(
-                "Calculation {} killed by the user "
-                "(it was {})".format(self.pk,
-                                     calc_states.WITHSCHEDULER))
+    @classmethod
+    def get_detailed_jobinfos(cls, calcs):
+        """
+        Ask the scheduler for the detailed information on the jobs of several
+        calculations (see ``Scheduler.get_detailed_jobinfo``), with a single
+        command for the calculations of each computer and user.
+
+        :param calcs: a list of stored calculations; those without a job id
+            are skipped
+        :return: a dictionary with the pks of the calculations as keys, and
+            the detailed jobinfo strings as values (the calculations whose
+            job is not in the output of the scheduler are missing)
+        :raise NotImplementedError: if the scheduler of a computer does not
+            implement the detailed jobinfo
+        """
+        jobinfos = {}
+        calcs = [c for c in calcs if c.get_job_id() is not None]
+        for computer, group in cls._group_by_computer_and_user(calcs):
+            t = group[0]._get_transport()
+            s = computer.get_scheduler()
+            s.set_transport(t)
+            with t:
+                by_jobid = s.get_detailed_jobinfos(
+                    [c.get_job_id() for c in group])
+            for calc in group:
+                jobinfo = by_jobid.get(str(calc.get_job_id()))
+                if jobinfo is not None:
+                    jobinfos[calc.pk] = jobinfo
+        return jobinfos
+
+    @staticmethod
+    def _group_by_computer_and_user(calcs):
+        """
+        Group calculations by computer and user, i.e. by authinfo.
+
+        :return: a list of (computer, list of calculations) tuples
+        """
+        groups = {}
+        for calc in calcs:
+            computer = calc.get_computer()
+            key = (computer.pk, calc.dbnode.user_id)
+            if key not in groups:
+                groups[key] = (computer, [])
+            groups[key][1].append(calc)
+        return groups.values()
 
     def _presubmit(self, folder, use_unstored_links=False):
         """
@@ -670,6 +670,260 @@ class AbstractComputer(object):
                 raise TypeError("def_cpus_per_machine must be an integer (or None)")
         self._set_property("default_mpiprocs_per_machine", def_cpus_per_machine)
 
+    def get_max_concurrent_submissions(self):
+        """
+        Return the maximum number of connections that the daemon opens at
+        the same time, for each AiiDA user, to submit calculations to this
+        computer (default: 1, i.e. calculations are submitted one after the
+        other).
+        """
+        return self._get_property("max_concurrent_submissions", 1)
+
+    def set_max_concurrent_submissions(self, val):
+        """
+        Set the maximum number of connections that the daemon opens at the
+        same time, for each AiiDA user, to submit calculations to this
+        computer.
+
+        :param val: a positive integer
+        """
+        if not isinstance(val, (int, long)) or val < 1:
+            raise TypeError("max_concurrent_submissions must be a positive "
+                            "integer")
+        self._set_property("max_concurrent_submissions", val)
+
+    def get_bulk_staging(self):
+        """
+        Return True if the input files of calculations are uploaded to this
+        computer as a single tar stream, unpacked remotely while it is
+        transferred (default: False, i.e. each file is uploaded separately).
+        """
+        return self._get_property("bulk_staging", False)
+
+    def set_bulk_staging(self, val):
+        """
+        Set whether the input files of calculations should be uploaded to
+        this computer as a single tar archive. This requires the ``tar``
+        command on the computer; if it fails, the daemon falls back to
+        uploading each file separately.
+
+        :param val: a boolean
+        """
+        self._set_property("bulk_staging", bool(val))
+
+    def get_upload_cache_dir(self):
+        """
+        Return the absolute path of the remote folder where the daemon keeps
+        a single copy of each file uploaded to this computer, named after
+        the md5 of its content, or None if each file is uploaded to the
+        working directory of each calculation (default).
+        """
+        return self._get_property("upload_cache_dir", None)
+
+    def set_upload_cache_dir(self, val):
+        """
+        Set the remote folder where the daemon keeps a single copy of each
+        file uploaded to this computer. The input files of calculations are
+        then uploaded only if they are not already in this folder, and are
+        copied from it into the working directory of each calculation (as
+        copy-on-write clones where the remote filesystem supports them).
+        The files in the folder are read-only. As for the working directory,
+        the ``{username}`` field is replaced by the remote username.
+        Accepts None to upload each file to each calculation.
+
+        :param val: an absolute path, or None
+        """
+        if val is None:
+            self._del_property("upload_cache_dir", raise_exception=False)
+            return
+        if not isinstance(val, basestring) or not val.startswith('/'):
+            raise TypeError("upload_cache_dir must be an absolute path "
+                            "(or None)")
+        self._set_property("upload_cache_dir", val)
+
+    def get_max_concurrent_transfers(self):
+        """
+        Return the maximum number of connections that the daemon opens at
+        the same time, for each AiiDA user, to retrieve the files of
+        calculations from this computer (default: 1).
+        """
+        return self._get_property("max_concurrent_transfers", 1)
+
+    def set_max_concurrent_transfers(self, val):
+        """
+        Set the maximum number of connections that the daemon opens at the
+        same time, for each AiiDA user, to retrieve the files of
+        calculations from this computer.
+
+        :param val: a positive integer
+        """
+        if not isinstance(val, (int, long)) or val < 1:
+            raise TypeError("max_concurrent_transfers must be a positive "
+                            "integer")
+        self._set_property("max_concurrent_transfers", val)
+
+    def get_retrieve_as_archive(self):
+        """
+        Return True if the files of each calculation are retrieved from this
+        computer as a single compressed tar archive (default: False, i.e.
+        each file is retrieved separately).
+        """
+        return self._get_property("retrieve_as_archive", False)
+
+    def set_retrieve_as_archive(self, val):
+        """
+        Set whether the files of each calculation should be retrieved from
+        this computer as a single compressed tar archive. This requires GNU
+        ``tar`` on the computer; if it fails, the daemon falls back to
+        retrieving each file separately.
+
+        :param val: a boolean
+        """
+        self._set_property("retrieve_as_archive", bool(val))
+
+    def get_minimum_job_poll_interval(self):
+        """
+        Return the minimum interval (in seconds) between two queries of the
+        scheduler of this computer by the daemon (default: 10).
+        """
+        return self._get_property("minimum_job_poll_interval", 10)
+
+    def set_minimum_job_poll_interval(self, val):
+        """
+        Set the minimum interval (in seconds) between two queries of the
+        scheduler of this computer by the daemon. The daemon always polls
+        at this interval right after a change in the state of the jobs.
+
+        :param val: a non-negative number
+        """
+        if not isinstance(val, (int, long, float)) or val < 0:
+            raise TypeError("minimum_job_poll_interval must be a "
+                            "non-negative number")
+        self._set_property("minimum_job_poll_interval", val)
+
+    def get_maximum_job_poll_interval(self):
+        """
+        Return the maximum interval (in seconds) between two queries of the
+        scheduler of this computer by the daemon, reached when the state of
+        the jobs does not change for a long time (default: 600).
+        """
+        return self._get_property("maximum_job_poll_interval", 600)
+
+    def set_maximum_job_poll_interval(self, val):
+        """
+        Set the maximum interval (in seconds) between two queries of the
+        scheduler of this computer by the daemon. Set it equal to the
+        minimum interval to disable the adaptive polling.
+
+        :param val: a non-negative number
+        """
+        if not isinstance(val, (int, long, float)) or val < 0:
+            raise TypeError("maximum_job_poll_interval must be a "
+                            "non-negative number")
+        self._set_property("maximum_job_poll_interval", val)
+
+    def get_max_transport_sessions(self):
+        """
+        Return the maximum number of connections to this computer that each
+        daemon process keeps open at the same time, for all AiiDA users
+        together, or None if there is no limit (default).
+        """
+        return self._get_property("max_transport_sessions", None)
+
+    def set_max_transport_sessions(self, val):
+        """
+        Set the maximum number of connections to this computer that each
+        daemon process keeps open at the same time, for all AiiDA users
+        together. Accepts None to remove the limit.
+
+        :param val: a positive integer, or None
+        """
+        if val is None:
+            self._del_property("max_transport_sessions",
+                               raise_exception=False)
+            return
+        if not isinstance(val, (int, long)) or val < 1:
+            raise TypeError("max_transport_sessions must be a positive "
+                            "integer (or None)")
+        self._set_property("max_transport_sessions", val)
+
+    def get_max_queued_jobs(self):
+        """
+        Return the maximum number of calculations that the daemon keeps
+        submitted to the scheduler of this computer at the same time, for
+        all AiiDA users together, or None if there is no limit (default).
+        Further calculations are held in the TOSUBMIT state.
+        """
+        return self._get_property("max_queued_jobs", None)
+
+    def set_max_queued_jobs(self, val):
+        """
+        Set the maximum number of calculations that the daemon keeps
+        submitted to the scheduler of this computer at the same time, for
+        all AiiDA users together. Accepts None to remove the limit.
+
+        :param val: a positive integer, or None
+        """
+        if val is None:
+            self._del_property("max_queued_jobs", raise_exception=False)
+            return
+        if not isinstance(val, (int, long)) or val < 1:
+            raise TypeError("max_queued_jobs must be a positive integer "
+                            "(or None)")
+        self._set_property("max_queued_jobs", val)
+
+    def get_max_submissions_per_minute(self):
+        """
+        Return the maximum number of calculations that the daemon submits to
+        this computer in any 60 seconds, for all AiiDA users together, or
+        None if there is no limit (default).
+        """
+        return self._get_property("max_submissions_per_minute", None)
+
+    def set_max_submissions_per_minute(self, val):
+        """
+        Set the maximum number of calculations that the daemon submits to
+        this computer in any 60 seconds, for all AiiDA users together.
+        Accepts None to remove the limit.
+
+        :param val: a positive integer, or None
+        """
+        if val is None:
+            self._del_property("max_submissions_per_minute",
+                               raise_exception=False)
+            return
+        if not isinstance(val, (int, long)) or val < 1:
+            raise TypeError("max_submissions_per_minute must be a positive "
+                            "integer (or None)")
+        self._set_property("max_submissions_per_minute", val)
+
+    def get_job_array_max_size(self):
+        """
+        Return the maximum number of calculations that the daemon bundles in
+        a single job array of the scheduler of this computer, or None if
+        calculations are always submitted as separate jobs (default).
+        Only calculations with the same scheduler options (resources,
+        walltime, queue, ...) are bundled together.
+        """
+        return self._get_property("job_array_max_size", None)
+
+    def set_job_array_max_size(self, val):
+        """
+        Set the maximum number of calculations that the daemon bundles in a
+        single job array of the scheduler of this computer. Accepts None to
+        submit each calculation as a separate job. It has no effect if the
+        scheduler plugin does not support job arrays.
+
+        :param val: an integer larger than 1, or None
+        """
+        if val is None:
+            self._del_property("job_array_max_size", raise_exception=False)
+            return
+        if not isinstance(val, (int, long)) or val < 2:
+            raise TypeError("job_array_max_size must be an integer larger "
+                            "than 1 (or None)")
+        self._set_property("job_array_max_size", val)
+
     @abstractmethod
     def get_transport_params(self):
         pass
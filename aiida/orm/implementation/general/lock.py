@@ -32,12 +32,50 @@ class AbstractLockManager(object):
 
         raise NotImplementedError
 
+    def aquire_many(self, keys, timeout=3600, owner="None"):
+        """
+        Try to generate a DbLock for each of the given keys. The keys that
+        are already locked are skipped, without waiting; the expired locks
+        are taken over.
+        :param keys: a list of unique lock keys (strings)
+        :param timeout: how long (in seconds) the locks are valid, unless
+            refreshed (see :py:meth:`refresh`)
+        :param owner: a string with the owner name of the new locks
+        :return: the list of the keys that were locked, in the given order
+        """
+        raise NotImplementedError
+
+    def refresh(self, owner="None"):
+        """
+        Restart the timeout of all the locks of the given owner.
+        :param owner: a string with the owner name
+        :return: the number of refreshed locks
+        """
+        raise NotImplementedError
+
+    def release_many(self, keys, owner="None"):
+        """
+        Release the locks with the given keys, if they belong to the given
+        owner (the other ones are left untouched).
+        :param keys: a list of lock keys
+        :param owner: a string with the owner name
+        """
+        raise NotImplementedError
+
     def clear_all(self):
         """
         Clears all the Locks, no matter if expired or not, useful for the bootstrap
         """
         raise NotImplementedError
 
+    def clear_stale(self, owner_prefix):
+        """
+        Clears the expired Locks, and the Locks whose owner name starts with
+        the given prefix (e.g. the owners known not to be running anymore).
+        :param owner_prefix: a string, the beginning of the owner names
+        """
+        raise NotImplementedError
+
 
 class AbstractLock(object):
     """
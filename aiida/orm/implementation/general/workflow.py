@@ -16,7 +16,7 @@ import logging
 from abc import abstractmethod, abstractproperty
 
 from aiida.common.exceptions import (InternalError, AiidaException,
-                                     InvalidOperation, RemoteOperationError)
+                                     InvalidOperation)
 from aiida.common.datastructures import (wf_states, wf_exit_call,
                                          wf_default_call, calc_states)
 from aiida.common.utils import str_timedelta
@@ -744,17 +744,21 @@ class AbstractWorkflow(object):
 
     def kill_step_calculations(self, step):
         """
-        Calls the ``kill`` method for each Calculation linked to the step method passed as argument.
+        Kills each Calculation linked to the step method passed as argument,
+        with a single kill command for each computer (see
+        ``JobCalculation.kill_calculations``).
         :param step: a Workflow step (decorated) method
         """
+        from aiida.orm.calculation.job import JobCalculation
+
         counter = 0
-        for c in step.get_calculations():
-            if c._is_new() or c._is_running():
-                try:
-                    c.kill()
-                except (InvalidOperation, RemoteOperationError) as e:
-                    counter += 1
-                    self.logger.error(e.message)
+        errors = JobCalculation.kill_calculations(
+            [c for c in step.get_calculations()
+             if c._is_new() or c._is_running()])
+        for error in errors.itervalues():
+            if error is not None:
+                counter += 1
+                self.logger.error(error.message)
 
         if counter:
             raise InvalidOperation("{} step calculation{} could not be killed"
@@ -21,6 +21,7 @@ from aiida.common.utils import str_timedelta
 
 from aiida.backends import sqlalchemy as sa
 from aiida.backends.sqlalchemy.utils import get_automatic_user
+from aiida.backends.utils import notify_calc_state_change
 from aiida.backends.sqlalchemy.models.node import DbNode, DbCalcState
 from aiida.backends.sqlalchemy.models.group import DbGroup
 
@@ -82,6 +83,54 @@ class JobCalculation(AbstractJobCalculation, Calculation):
         if state != calc_states.IMPORTED:
             self._set_attr('state', state)
 
+        # Wake up the daemon, if it is listening for state changes
+        notify_calc_state_change(self.pk, state)
+
+    @classmethod
+    def _bulk_set_states_and_attrs(cls, updates):
+        """
+        Apply the given state transitions and attribute updates in a single
+        transaction. See
+        :py:meth:`AbstractJobCalculation._set_states_and_attrs`.
+        """
+        from sqlalchemy.orm.attributes import flag_modified
+
+        session = sa.get_scoped_session()
+
+        pks = [calc.pk for calc, _, _ in updates]
+        old_states = {pk: [] for pk in pks}
+        for pk, state in session.query(
+                DbCalcState.dbnode_id, DbCalcState.state).filter(
+                    DbCalcState.dbnode_id.in_(pks)):
+            old_states[pk].append(state.value)
+
+        skipped = []
+        transited = []
+        try:
+            for calc, state, attrs in updates:
+                dbnode = calc.dbnode
+                if state is not None:
+                    if cls._is_valid_transition(state, old_states[calc.pk]):
+                        session.add(DbCalcState(dbnode=dbnode, state=state))
+                        transited.append((calc, state))
+                        if state != calc_states.IMPORTED:
+                            attrs = dict(attrs, state=state)
+                    else:
+                        skipped.append(calc)
+                for key, value in attrs.iteritems():
+                    DbNode._set_attr(dbnode.attributes, key, value)
+                flag_modified(dbnode, "attributes")
+                dbnode.nodeversion = DbNode.nodeversion + 1
+                session.add(dbnode)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise ModificationNotAllowed(
+                "A state of one of the calculations {} was set "
+                "concurrently".format(pks))
+
+        return skipped, transited
+
     def get_state(self, from_attribute=False):
         """
         Get the state of the calculation.
@@ -9,9 +9,12 @@
 ###########################################################################
 
 import time
+from contextlib import contextmanager
+from datetime import timedelta
 from aiida.utils import timezone
 
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
 from aiida.backends.sqlalchemy import get_scoped_session
 from aiida.backends.sqlalchemy.models.lock import DbLock
@@ -21,6 +24,25 @@ from aiida.orm.implementation.general.lock import AbstractLockManager, AbstractL
 
 
 
+@contextmanager
+def _lock_session():
+    """
+    A session with its own connection, committed at the end of the block,
+    for the locks shared between processes: they must be committed at
+    once, without committing (or rolling back) the objects pending in the
+    scoped session of the caller.
+    """
+    session = Session(bind=get_scoped_session().bind)
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 class LockManager(AbstractLockManager):
     def aquire(self, key, timeout=3600, owner="None"):
         session = get_scoped_session()
@@ -46,11 +68,60 @@ class LockManager(AbstractLockManager):
         except:
             raise InternalError("Something went wrong, try to keep on.")
 
+    def aquire_many(self, keys, timeout=3600, owner="None"):
+        with _lock_session() as session:
+            now = timezone.now()
+            for old_lock in session.query(DbLock).filter(
+                    DbLock.key.in_(keys)).all():
+                if (old_lock.creation + timedelta(seconds=old_lock.timeout)
+                        < now):
+                    # The creation is checked again, in case the lock has
+                    # been refreshed in the meantime
+                    session.query(DbLock).filter_by(
+                        key=old_lock.key, creation=old_lock.creation).delete(
+                        synchronize_session=False)
+
+            acquired = []
+            for key in keys:
+                try:
+                    with session.begin_nested():
+                        session.add(DbLock(key=key, timeout=timeout,
+                                           owner=owner))
+                except SQLAlchemyError:
+                    continue
+                acquired.append(key)
+        return acquired
+
+    def refresh(self, owner="None"):
+        with _lock_session() as session:
+            return session.query(DbLock).filter_by(owner=owner).update(
+                {'creation': timezone.now()}, synchronize_session=False)
+
+    def release_many(self, keys, owner="None"):
+        with _lock_session() as session:
+            session.query(DbLock).filter(DbLock.key.in_(keys),
+                                         DbLock.owner == owner).delete(
+                synchronize_session=False)
+
     def clear_all(self):
         session = get_scoped_session()
         with session.begin(subtransactions=True):
             DbLock.query.delete()
 
+    def clear_stale(self, owner_prefix):
+        with _lock_session() as session:
+            now = timezone.now()
+            for old_lock in session.query(DbLock).all():
+                if (old_lock.owner.startswith(owner_prefix) or
+                        old_lock.creation + timedelta(seconds=old_lock.timeout)
+                        < now):
+                    # The creation is checked again, in case the lock has
+                    # been refreshed in the meantime
+                    session.query(DbLock).filter_by(
+                        key=old_lock.key, creation=old_lock.creation).delete(
+                        synchronize_session=False)
+
+
 class Lock(AbstractLock):
 
     def release(self, owner="None"):
@@ -24,6 +24,9 @@ class Parser(object):
     Get the child Folderdata, parse it and store the parsed data.
     """
     _linkname_outparams = 'output_parameters'
+    # Maximum time (in seconds) that the daemon lets the parser run; if
+    # None, the ``daemon.parser_timeout`` property is used
+    _timeout = None
 
     def __init__(self, calc):
         """
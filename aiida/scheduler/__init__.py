@@ -28,6 +28,37 @@ def SchedulerFactory(module):
     return BaseFactory(module, Scheduler, "aiida.scheduler.plugins")
 
 
+def cached_conversion(method):
+    """
+    Decorate a conversion method of the schedulers (e.g. the parsing of a
+    time string), caching its results by arguments: the same strings are
+    found many times in a long job list. Exceptions are not cached.
+    """
+    from functools import wraps
+
+    cache = {}
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.iteritems()))) if kwargs else args
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        result = method(self, *args, **kwargs)
+        # Bound the size of the cache
+        if len(cache) >= _CONVERSION_CACHE_SIZE:
+            cache.clear()
+        cache[key] = result
+        return result
+
+    return wrapper
+
+
+# The maximum number of results cached by each conversion method
+_CONVERSION_CACHE_SIZE = 100000
+
+
 class SchedulerError(AiidaException):
     pass
 
@@ -48,11 +79,24 @@ class Scheduler(object):
     # 'can_query_by_user': True if I can pass the 'user' argument to
     # get_joblist_command (and in this case, no 'jobs' should be given).
     # Otherwise, if False, a list of jobs is passed, and no 'user' is given.
+    # 'can_submit_job_arrays': True if the plugin implements the methods
+    # to submit job arrays (see get_array_submit_script).
+    # 'can_query_job_history': True if the plugin can ask the accounting of
+    # the scheduler for the jobs that changed state since a given time,
+    # including the finished ones (see get_job_history).
     _features = {}
 
     # The class to be used for the job resource.
     _job_resource_class = None
 
+    # The environment variable with the index (starting from 1) of the
+    # task of a job array, for the plugins that support job arrays
+    _array_task_index_variable = None
+
+    # The maximum number of job ids sent in a single command by the batched
+    # operations (kill_jobs, get_detailed_jobinfos)
+    _max_jobs_per_command = 500
+
     def __init__(self):
         self._transport = None
 
@@ -307,6 +351,10 @@ class Scheduler(object):
         retval, stdout, stderr = self.transport.exec_command_wait(
             command)
 
+        return self._format_detailed_jobinfo(command, retval, stdout, stderr)
+
+    @staticmethod
+    def _format_detailed_jobinfo(command, retval, stdout, stderr):
         return u"""Detailed jobinfo obtained with command '{}'
 Return Code: {}
 -------------------------------------------------------------
@@ -316,6 +364,63 @@ stderr:
 {}
 """.format(command, retval, stdout, stderr)
 
+    def _get_detailed_jobinfos_command(self, jobids):
+        """
+        Return the command to run to get the detailed information on
+        several jobs, or None if the plugin has no such command.
+
+        By default, the commands of _get_detailed_jobinfo_command are run
+        with a single batch of the transport (see
+        ``Transport.exec_command_batch``); the plugins whose command
+        accepts several job ids should override this method and
+        _parse_detailed_jobinfos_output.
+
+        :param jobids: a list of job ids
+        """
+        return None
+
+    def _parse_detailed_jobinfos_output(self, jobids, retval, stdout, stderr):
+        """
+        Split the output of the command returned by
+        _get_detailed_jobinfos_command among the jobs.
+
+        :return: a dictionary with the job ids as keys, and (retval, stdout,
+            stderr) tuples as values
+        """
+        raise NotImplementedError
+
+    def get_detailed_jobinfos(self, jobids):
+        """
+        Return the output of the detailed_jobinfo command for several jobs,
+        with a single remote command (or a single batch of commands) for up
+        to _max_jobs_per_command jobs.
+
+        :param jobids: a list of job ids
+        :return: a dictionary with the job ids as keys, and as values the
+            strings returned by get_detailed_jobinfo
+        :raise NotImplementedError: if the plugin does not implement the
+            detailed_jobinfo command
+        """
+        jobinfos = {}
+        jobids = [str(jobid) for jobid in jobids]
+        for start in range(0, len(jobids), self._max_jobs_per_command):
+            chunk = jobids[start:start + self._max_jobs_per_command]
+            commands = [self._get_detailed_jobinfo_command(jobid=jobid)
+                        for jobid in chunk]
+            command = self._get_detailed_jobinfos_command(chunk)
+            if command is None:
+                outputs = dict(zip(chunk, self.transport.exec_command_batch(
+                    commands)))
+            else:
+                retval, stdout, stderr = self.transport.exec_command_wait(
+                    command)
+                outputs = self._parse_detailed_jobinfos_output(
+                    chunk, retval, stdout, stderr)
+            for jobid, jobid_command in zip(chunk, commands):
+                jobinfos[jobid] = self._format_detailed_jobinfo(
+                    jobid_command, *outputs[jobid])
+        return jobinfos
+
     @abstractmethod
     def _parse_joblist_output(self, retval, stdout, stderr):
         """
@@ -356,6 +461,73 @@ stderr:
         else:
             return joblist
 
+    def _get_job_history_command(self, jobs=None, user=None, since=None):
+        """
+        Return the command to run to get, from the accounting of the
+        scheduler, the jobs that were queued, running or finished since a
+        given time, in the format parsed by _parse_job_history_output.
+
+        To be implemented by the plugins that support the
+        'can_query_job_history' feature.
+
+        :param jobs: either None, or a list of jobs
+        :param user: either None, or a string with the username
+        :param since: either None to get the jobs whatever their age, or
+            a POSIX timestamp (of the local clock)
+        """
+        raise NotImplementedError
+
+    def _parse_job_history_output(self, retval, stdout, stderr):
+        """
+        Parse the output of the command returned by
+        _get_job_history_command.
+
+        To be implemented by the plugins that support the
+        'can_query_job_history' feature.
+
+        Return a list of JobInfo objects, one of each job; for the finished
+        jobs, the exit status and the resources used should be set when
+        available.
+        """
+        raise NotImplementedError
+
+    def get_job_history(self, jobs=None, user=None, since=None,
+                        as_dict=False):
+        """
+        Get from the accounting of the scheduler the list of the jobs that
+        were queued, running or finished since a given time, and return it.
+
+        Differently from getJobs, the finished jobs are returned (with the
+        DONE state) until the accounting of the scheduler forgets them: a
+        job that is not in the result of a query without ``since`` is
+        unknown to the scheduler.
+
+        :param list jobs: a list of jobs to check; only these are checked
+        :param str user: a string with a user: only jobs of this user are
+            checked
+        :param since: if not None, a POSIX timestamp: only the jobs that
+            were not finished at that time are returned. The plugins may
+            return older jobs as well.
+        :param list as_dict: if False (default), a list of JobInfo objects is
+             returned. If True, a dictionary is returned, having as key the
+             job_id and as value the JobInfo object.
+        """
+        if not self._features.get('can_query_job_history', False):
+            raise NotImplementedError("The job history is not supported by "
+                                      "this scheduler")
+
+        retval, stdout, stderr = self.transport.exec_command_wait(
+            self._get_job_history_command(jobs=jobs, user=user, since=since))
+
+        joblist = self._parse_job_history_output(retval, stdout, stderr)
+        if as_dict:
+            jobdict = {j.job_id: j for j in joblist}
+            if None in jobdict:
+                raise SchedulerError("Found at least one job without jobid")
+            return jobdict
+        else:
+            return joblist
+
     @property
     def transport(self):
         """
@@ -407,6 +579,102 @@ stderr:
             self._get_submit_command(escape_for_bash(submit_script)))
         return self._parse_submit_output(retval, stdout, stderr)
 
+    def _get_array_directive(self, num_tasks):
+        """
+        Return the line of the submit script header that makes the job an
+        array of ``num_tasks`` tasks, with indices from 1 to ``num_tasks``.
+
+        To be implemented by the plugins that support job arrays.
+        """
+        raise NotImplementedError
+
+    def _get_array_submit_script_header(self, job_tmpl, num_tasks):
+        """
+        Return the submit script header of a job array of ``num_tasks``
+        tasks, using the parameters from the job_tmpl (the resources are
+        those of each task).
+        """
+        return "\n".join([self._get_submit_script_header(job_tmpl),
+                          self._get_array_directive(num_tasks)])
+
+    def get_array_submit_script(self, job_tmpl, task_scripts):
+        """
+        Return the submit script of a job array whose tasks run, each in its
+        own directory, the submit scripts of different calculations
+        (their scheduler directives are ignored, the ones of job_tmpl are
+        used for all tasks).
+
+        :param job_tmpl: a JobTemplate with the parameters of the array
+            header; the resources and the walltime are those of each task
+        :param task_scripts: a list with a (working directory, submit script,
+            stdout file, stderr file) tuple for each task; the submit script
+            and the files are relative to the working directory, stdout file
+            can be None (no redirection) and stderr file can be None (joined
+            to stdout)
+        :return: the submit script as a string
+        """
+        from aiida.common.exceptions import InternalError
+
+        if not isinstance(job_tmpl, JobTemplate):
+            raise InternalError("job_tmpl should be of type JobTemplate")
+        if not self._features.get('can_submit_job_arrays', False):
+            raise NotImplementedError("Job arrays are not supported by this "
+                                      "scheduler")
+
+        script_lines = ["#!/bin/bash", ""]
+        script_lines.append(self._get_array_submit_script_header(
+            job_tmpl, len(task_scripts)))
+        script_lines.append("")
+
+        script_lines.append('case "${}" in'.format(
+            self._array_task_index_variable))
+        for index, (working_directory, submit_script, stdout_name,
+                    stderr_name) in enumerate(task_scripts, start=1):
+            redirections = ""
+            if stdout_name:
+                redirections = " > {}".format(escape_for_bash(stdout_name))
+                if stderr_name:
+                    redirections += " 2> {}".format(escape_for_bash(stderr_name))
+                else:
+                    redirections += " 2>&1"
+            script_lines.append("    {}) cd {} && bash {}{} ;;".format(
+                index, escape_for_bash(working_directory),
+                escape_for_bash(submit_script), redirections))
+        script_lines.append("esac")
+        script_lines.append("")
+
+        return "\n".join(script_lines)
+
+    def _get_array_jobid(self, jobid):
+        """
+        Return the id of a job array, as found in the job list, from the job
+        id returned by the submission of its script.
+        """
+        return jobid
+
+    def _get_array_task_jobid(self, array_jobid, index):
+        """
+        Return the job id of the task with the given index (starting from 1)
+        of a job array.
+
+        To be implemented by the plugins that support job arrays.
+        """
+        raise NotImplementedError
+
+    def submit_array_from_script(self, working_directory, submit_script,
+                                 num_tasks):
+        """
+        Goes in the working directory and submits the submit_script of a
+        job array (see :py:meth:`get_array_submit_script`).
+
+        :return: a tuple with the job id of the array, and the list of the
+            job ids of its ``num_tasks`` tasks
+        """
+        array_jobid = self._get_array_jobid(
+            self.submit_from_script(working_directory, submit_script))
+        return array_jobid, [self._get_array_task_jobid(array_jobid, index)
+                             for index in range(1, num_tasks + 1)]
+
     def kill(self, jobid):
         """
         Kill a remote job, and try to parse the output message of the scheduler
@@ -423,6 +691,34 @@ stderr:
             self._get_kill_command(jobid))
         return self._parse_kill_output(retval, stdout, stderr)
 
+    def kill_jobs(self, jobids):
+        """
+        Kill several remote jobs, with a single remote command for up to
+        _max_jobs_per_command jobs, and try to parse the output of the
+        scheduler to check which jobs it accepted to kill.
+
+        :param jobids: a list of job ids
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise
+        """
+        results = {}
+        jobids = [str(jobid) for jobid in jobids]
+        for start in range(0, len(jobids), self._max_jobs_per_command):
+            chunk = jobids[start:start + self._max_jobs_per_command]
+            command = self._get_kill_jobs_command(chunk)
+            if command is None:
+                outputs = self.transport.exec_command_batch(
+                    [self._get_kill_command(jobid) for jobid in chunk])
+                results.update(
+                    (jobid, self._parse_kill_output(*output))
+                    for jobid, output in zip(chunk, outputs))
+            else:
+                retval, stdout, stderr = self.transport.exec_command_wait(
+                    command)
+                results.update(self._parse_kill_jobs_output(chunk, retval,
+                                                            stdout, stderr))
+        return results
+
     def _get_kill_command(self, jobid):
         """
         Return the command to kill the job with specified jobid.
@@ -431,6 +727,61 @@ stderr:
         """
         raise NotImplementedError
 
+    def _get_kill_jobs_command(self, jobids):
+        """
+        Return the command to kill several jobs, or None if the plugin has
+        no such command.
+
+        By default, the commands of _get_kill_command are run with a single
+        batch of the transport (see ``Transport.exec_command_batch``); the
+        plugins whose kill command accepts several job ids should override
+        this method and _parse_kill_jobs_output.
+
+        :param jobids: a list of job ids
+        """
+        return None
+
+    def _parse_kill_jobs_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of the command returned by _get_kill_jobs_command.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise
+        """
+        raise NotImplementedError
+
+    def _parse_multiple_kill_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of a kill command of the scheduler that was given
+        several job ids (e.g. ``scancel 1 2 3``), for the plugins overriding
+        _get_kill_jobs_command.
+
+        The jobs mentioned in the lines of stderr are considered as not
+        killed; if the command failed without mentioning any job, none of
+        them is considered as killed.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise
+        """
+        import re
+
+        failed = set(
+            jobid for jobid in jobids
+            if re.search(r'(?<![\w.-]){}(?![\w-])'.format(re.escape(jobid)),
+                         stderr))
+        if retval != 0 and not failed:
+            failed = set(jobids)
+
+        if failed:
+            self.logger.error("Error in _parse_kill_jobs_output for jobs {}: "
+                              "retval={}; stdout={}; stderr={}".format(
+                ", ".join(sorted(failed)), retval, stdout, stderr))
+        elif stderr.strip():
+            self.logger.warning("in _parse_kill_jobs_output: there was some "
+                                "text in stderr: {}".format(stderr))
+
+        return dict((jobid, jobid not in failed) for jobid in jobids)
+
     def _parse_kill_output(self, retval, stdout, stderr):
         """
         Parse the output of the kill command.
@@ -504,6 +504,28 @@ class JobInfo(DefaultFieldsAttributeDict):
         'finish_time': 'date',
     }
 
+    # The fields that change at each query of a running job: when only
+    # these fields change, the job is not considered changed (see
+    # get_changed_fields)
+    _volatile_fields = ('wallclock_time_seconds', 'cpu_time', 'raw_data')
+
+    def get_changed_fields(self, other):
+        """
+        Return the names of the fields whose value is different in another
+        JobInfo, ignoring the volatile fields (the times used by the job and
+        the raw data). Unset fields are considered as None.
+
+        :param other: a JobInfo, or None (in which case all the fields set
+            to a value other than None are changed)
+        :return: a sorted list of field names
+        """
+        if other is None:
+            other = {}
+        return sorted(
+            key for key in set(self).union(other)
+            if key not in self._volatile_fields and
+            self.get(key) != other.get(key))
+
     def _serialize_date(self, v):
         import datetime
         import pytz
@@ -565,13 +587,18 @@ class JobInfo(DefaultFieldsAttributeDict):
         return deserializer_method(value)
 
     def serialize(self):
+        """
+        Return the JobInfo as a compact JSON string; the default fields set
+        to None are omitted.
+        """
         import json
 
         ser_data = {k: self.serialize_field(
             v, self._special_serializers.get(k, None))
-                    for k, v in self.iteritems()}
+                    for k, v in self.iteritems()
+                    if v is not None or k not in self._default_fields}
 
-        return json.dumps(ser_data)
+        return json.dumps(ser_data, separators=(',', ':'), sort_keys=True)
 
 
     def load_from_serialized(self, data):
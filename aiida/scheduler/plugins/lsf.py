@@ -171,10 +171,13 @@ class LsfScheduler(aiida.scheduler.Scheduler):
     # Query only by list of jobs and not by user
     _features = {
         'can_query_by_user': False,
+        'can_submit_job_arrays': True,
         }
     
     # The class to be used for the job resource.
     _job_resource_class = LsfJobResource
+
+    _array_task_index_variable = 'LSB_JOBINDEX'
     
 
             # Unavailable field: substate
@@ -515,6 +518,8 @@ fi
             in the qstat output; missing jobs (for whatever reason) simply
             will not appear here.
         """
+        import re
+
         num_fields = len(self._joblist_fields)
 
         if retval != 0:
@@ -525,20 +530,20 @@ fi
                                  "stdout={}\nstderr={}".format(
                 retval, stdout, stderr))            
 
-        # will contain raw data parsed from output: only lines with the
-        # separator, and already split in fields
-        # I put num_fields, because in this way
+        # Only the lines with the separator are parsed, one at a time
+        # (without building the whole list of raw data first).
+        # I split in num_fields, because in this way
         # if the symbol _field_separator appears in the title (that is
         # the last field), I don't split the title.
         # This assumes that _field_separator never
         # appears in any previous field.
-        jobdata_raw = [l.split(_field_separator, num_fields)
-                       for l in stdout.splitlines()
-                       if _field_separator in l]
 
         # Create dictionary and parse specific fields
         job_list = []
-        for job in jobdata_raw:
+        for line in stdout.splitlines():
+            if _field_separator not in line:
+                continue
+            job = line.split(_field_separator, num_fields)
 
             # Each job should have all fields.
             if len(job) != num_fields:
@@ -651,6 +656,14 @@ fi
 
             this_job.title = job_name
 
+            # The elements of job arrays are listed with the id of the array,
+            # and with the index appended to the job name: I use the same
+            # 'id[index]' format used to query them
+            array_index = re.match(r'^.*\[(\d+)\]$', job_name.strip())
+            if array_index:
+                this_job.job_id = self._get_array_task_jobid(
+                    this_job.job_id, array_index.group(1))
+
             # Everything goes here anyway for debugging purposes
             this_job.raw_data = job
 
@@ -708,7 +721,7 @@ fi
         Parse a time string and returns a datetime object.
         Example format: 'Feb  2 07:39' or 'Feb  2 07:39 L'
         """
-        import time, datetime
+        import datetime
 
         if string == '-':
             return None
@@ -716,7 +729,17 @@ fi
         # The year is not specified. I have to add it, and I set it to the 
         # current year. This is actually not correct, if we are close 
         # new year... we should ask the scheduler also the year.
-        actual_string = '{} {}'.format(datetime.datetime.now().year, string)
+        return self._parse_time_string_of_year(
+            string, fmt, datetime.datetime.now().year)
+
+    @aiida.scheduler.cached_conversion
+    def _parse_time_string_of_year(self, string, fmt, year):
+        """
+        Parse a time string of the given year (see _parse_time_string).
+        """
+        import datetime
+
+        actual_string = '{} {}'.format(year, string)
         actual_fmt = '%Y {}'.format(fmt)
 
         try:
@@ -732,6 +755,25 @@ fi
 
         return thetime
 
+    def _get_array_submit_script_header(self, job_tmpl, num_tasks):
+        """
+        Return the submit script header of a job array: in LSF, the array
+        is defined by appending the range of indices to the job name.
+        """
+        lines = []
+        has_job_name = False
+        for line in self._get_submit_script_header(job_tmpl).split('\n'):
+            if line.startswith('#BSUB -J '):
+                line = '{}[1-{}]"'.format(line.rstrip('"'), num_tasks)
+                has_job_name = True
+            lines.append(line)
+        if not has_job_name:
+            lines.append('#BSUB -J "aiida[1-{}]"'.format(num_tasks))
+        return "\n".join(lines)
+
+    def _get_array_task_jobid(self, array_jobid, index):
+        return "{}[{}]".format(array_jobid, index)
+
     def _get_kill_command(self, jobid):
         """
         Return the command to kill the job with specified jobid.
@@ -740,6 +782,24 @@ fi
         self.logger.info("killing job {}".format(jobid))
         return submit_command
 
+    def _get_kill_jobs_command(self, jobids):
+        """
+        Return the command to kill several jobs with a single bkill call.
+        """
+        self.logger.info("killing jobs {}".format(", ".join(jobids)))
+
+        return 'bkill {}'.format(' '.join(jobids))
+
+    def _parse_kill_jobs_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of the kill command for several jobs.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise.
+        """
+        return self._parse_multiple_kill_output(jobids, retval, stdout,
+                                                stderr)
+
     def _parse_kill_output(self, retval, stdout, stderr):
         """
         Parse the output of the kill command.
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Plugin for a mock scheduler, to load test the daemon without a cluster.
+
+It is meant to be used with the ``local`` transport. The submitted scripts
+are run at once in the background, but each job is reported as queued
+for a simulated queue delay, and then as running for (at least) a
+simulated running time. A fraction of the submissions and of the jobs can
+be made to fail, and the job list can be padded with jobs that AiiDA does
+not know, to simulate very large queues.
+
+Each job is recorded in a file ``job.<jobid>`` of a state folder, with one
+line for each event (``submit``, ``pid``, ``exit``, ``fail`` or
+``killed``); the job list is made from the content of these files, and
+the states are computed from the times when it is parsed. The files of the
+finished jobs are deleted after ``retention`` seconds.
+
+The simulation is set with environment variables of the process using the
+scheduler (i.e., of the daemon):
+
+* ``AIIDA_MOCK_SCHEDULER_FOLDER``: the state folder (default:
+  ``aiida_mock_scheduler`` in the temporary folder)
+* ``AIIDA_MOCK_SCHEDULER_QUEUE_DELAY``: the seconds each job is queued
+  (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_RUN_TIME``: the seconds each job runs (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_JITTER``: the relative spread of the queue delays
+  and running times, which are drawn uniformly in ``[t * (1 - jitter),
+  t * (1 + jitter)]`` (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_FAILURE_RATE``: the fraction of the jobs that
+  fail without running their script (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_SUBMIT_FAILURE_RATE``: the fraction of the
+  submissions that are refused (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_EXTRA_JOBS``: the number of jobs not submitted by
+  AiiDA added to the job list (default: 0)
+* ``AIIDA_MOCK_SCHEDULER_RETENTION``: the seconds the finished jobs are kept
+  (default: 3600)
+* ``AIIDA_MOCK_SCHEDULER_SEED``: the seed of the random draws (default:
+  none)
+"""
+from __future__ import division
+import os
+import random
+import re
+import tempfile
+import time
+
+import aiida.scheduler
+from aiida.common.utils import escape_for_bash
+from aiida.scheduler import SchedulerError
+from aiida.scheduler.datastructures import (
+    JobInfo, job_states, NodeNumberJobResource)
+
+# The simulation parameters, with their types and default values
+_config_defaults = {
+    'folder': (str, os.path.join(tempfile.gettempdir(),
+                                 'aiida_mock_scheduler')),
+    'queue_delay': (float, 0.),
+    'run_time': (float, 0.),
+    'jitter': (float, 0.),
+    'failure_rate': (float, 0.),
+    'submit_failure_rate': (float, 0.),
+    'extra_jobs': (int, 0),
+    'retention': (int, 3600),
+    'seed': (int, None),
+}
+
+_environment_prefix = 'AIIDA_MOCK_SCHEDULER_'
+
+# Print one line for each job file, with the job id (the suffix of the file
+# name) and the lines of the file, separated by '|'
+_awk_joblist = ('FNR == 1 { if (job) print job; n = split(FILENAME, p, "."); '
+                'job = p[n] } { job = job "|" $0 } END { if (job) print job }')
+
+# The jobs added to the job list (half queued, half running, for ever)
+_awk_extra_jobs = ('BEGIN { for (i = 0; i < num; i++) print "extra" i '
+                   '"|submit 0 " (i % 2) * 1e10 " 1e10 " user }')
+
+
+def get_config():
+    """
+    Return the simulation parameters, as set by the environment variables
+    (see the module docstring).
+
+    :raise ValueError: if an environment variable has an invalid value
+    """
+    config = {}
+    for key, (value_type, default) in _config_defaults.iteritems():
+        variable = _environment_prefix + key.upper()
+        value = os.environ.get(variable, '').strip()
+        if not value:
+            config[key] = default
+            continue
+        try:
+            config[key] = value_type(value)
+        except ValueError:
+            raise ValueError("Invalid value '{}' for the environment variable "
+                             "{}".format(value, variable))
+    return config
+
+
+class MockJobResource(NodeNumberJobResource):
+    pass
+
+
+class MockScheduler(aiida.scheduler.Scheduler):
+    """
+    Mock scheduler for load tests, with simulated queue delays, running
+    times and failures (to be used with the local transport).
+    """
+    _logger = aiida.scheduler.Scheduler._logger.getChild('mock')
+
+    # All the jobs of the state folder are listed, so the query by user
+    # returns the jobs of all users
+    _features = {
+        'can_query_by_user': True,
+    }
+
+    # The class to be used for the job resource.
+    _job_resource_class = MockJobResource
+
+    def __init__(self):
+        super(MockScheduler, self).__init__()
+        self._config = get_config()
+        self._random = random.Random(self._config['seed'])
+
+    def _draw_time(self, mean):
+        """
+        Return a simulated time around the given mean (see the jitter in
+        the module docstring).
+        """
+        jitter = self._config['jitter']
+        if not mean or not jitter:
+            return mean
+        return max(0., self._random.uniform(mean * (1. - jitter),
+                                            mean * (1. + jitter)))
+
+    def _get_joblist_command(self, jobs=None, user=None):
+        """
+        The command to list the jobs of the state folder, after having
+        deleted the old finished ones.
+
+        The user is ignored: all the jobs of the state folder are listed.
+        """
+        folder = escape_for_bash(self._config['folder'])
+
+        if jobs:
+            if isinstance(jobs, basestring):
+                jobs = [jobs]
+            try:
+                names = ' -o '.join('-name {}'.format(
+                    escape_for_bash('job.{}'.format(j))) for j in jobs)
+            except TypeError:
+                raise TypeError("If provided, the 'jobs' variable must be a "
+                                "string or a list of strings")
+            names = '\\( {} \\)'.format(names)
+        else:
+            names = "-name 'job.*'"
+
+        commands = [
+            'mkdir -p {}'.format(folder),
+            "find {} -name 'job.*' -mmin +{} -exec grep -l "
+            "-e '^exit' -e '^fail' -e '^killed' {{}} + | xargs rm -f".format(
+                folder, max(1, self._config['retention'] // 60)),
+            "find {} {} -exec awk '{}' {{}} +".format(folder, names,
+                                                     _awk_joblist),
+        ]
+        if self._config['extra_jobs'] and not jobs:
+            commands.append(
+                "awk -v num={} -v user=\"${{USER:-unknown}}\" '{}'".format(
+                    self._config['extra_jobs'], _awk_extra_jobs))
+
+        return '; '.join(commands)
+
+    def _get_detailed_jobinfo_command(self, jobid):
+        """
+        Return the command to print the file of a job.
+        """
+        return 'cat {}'.format(escape_for_bash(
+            os.path.join(self._config['folder'], 'job.{}'.format(jobid))))
+
+    def _get_submit_script_header(self, job_tmpl):
+        """
+        Return the submit script header, using the parameters from the
+        job_tmpl.
+
+        Args:
+           job_tmpl: an JobTemplate instance with relevant parameters set.
+        """
+        lines = []
+        empty_line = ""
+
+        # The output of the job is redirected as a scheduler would do
+        if job_tmpl.sched_output_path:
+            lines.append("exec > {}".format(job_tmpl.sched_output_path))
+        if job_tmpl.sched_join_files:
+            lines.append("exec 2>&1")
+        elif job_tmpl.sched_error_path:
+            lines.append("exec 2> {}".format(job_tmpl.sched_error_path))
+
+        if job_tmpl.custom_scheduler_commands:
+            lines.append(job_tmpl.custom_scheduler_commands)
+
+        if job_tmpl.job_environment:
+            lines.append(empty_line)
+            lines.append("# ENVIRONMENT VARIABLES BEGIN ###")
+            if not isinstance(job_tmpl.job_environment, dict):
+                raise ValueError("If you provide job_environment, it must be "
+                                 "a dictionary")
+            for k, v in job_tmpl.job_environment.iteritems():
+                lines.append("export {}={}".format(
+                    k.strip(),
+                    escape_for_bash(v)))
+            lines.append("# ENVIRONMENT VARIABLES  END  ###")
+            lines.append(empty_line)
+
+        lines.append(empty_line)
+
+        return "\n".join(lines)
+
+    def _get_submit_command(self, submit_script):
+        """
+        Return the string to execute to submit a given script.
+
+        The queue delay, the running time and the failures are drawn here,
+        and written in the file of the job with the submission time (the
+        local clock is used, with a better resolution than the one of
+        ``date``).
+
+        Args:
+            submit_script: the path of the submit script relative to the working
+                directory.
+                IMPORTANT: submit_script should be already escaped.
+        """
+        if self._random.random() < self._config['submit_failure_rate']:
+            self.logger.info("simulating the failure of the submission of "
+                             "{}".format(submit_script))
+            return 'echo "Simulated submission failure" >&2; exit 1'
+
+        folder = escape_for_bash(self._config['folder'])
+        commands = [
+            'mkdir -p {0} && jobfile=$(mktemp {0}/job.XXXXXXXXXX) '
+            '|| exit 1'.format(folder),
+            'echo "submit {!r} {!r} {!r} ${{USER:-unknown}}" '
+            '> "$jobfile"'.format(
+                time.time(), self._draw_time(self._config['queue_delay']),
+                self._draw_time(self._config['run_time'])),
+        ]
+        if self._random.random() < self._config['failure_rate']:
+            commands.append('echo "fail $(date +%s)" >> "$jobfile"')
+        else:
+            commands.extend([
+                '( bash -e {} > /dev/null 2>&1; echo "exit $? $(date +%s)" '
+                '>> "$jobfile" ) < /dev/null > /dev/null 2>&1 &'.format(
+                    submit_script),
+                'echo "pid $!" >> "$jobfile"',
+            ])
+        commands.append('echo "${jobfile##*.}"')
+        submit_command = '\n'.join(commands)
+
+        self.logger.info("submitting with: " + submit_command)
+
+        return submit_command
+
+    def _parse_job_line(self, line, now):
+        """
+        Return the JobInfo of a line of the job list, as printed by the
+        command of _get_joblist_command.
+
+        :param now: the current POSIX timestamp
+        """
+        from datetime import datetime
+
+        fields = line.split('|')
+        this_job = JobInfo()
+        this_job.job_id = fields[0]
+
+        events = {}
+        for field in fields[1:]:
+            values = field.split()
+            if values:
+                events[values[0]] = values[1:]
+
+        try:
+            submit_time, queue_delay, run_time = [
+                float(v) for v in events['submit'][:3]]
+            this_job.job_owner = events['submit'][3]
+        except (KeyError, IndexError, ValueError):
+            self.logger.warning("Invalid record for job id {}: "
+                                "'{}'".format(this_job.job_id, line))
+            this_job.job_state = job_states.UNDETERMINED
+            return this_job
+
+        start_time = submit_time + queue_delay
+        this_job.submission_time = datetime.fromtimestamp(submit_time)
+
+        if 'killed' in events:
+            this_job.job_state = job_states.DONE
+            this_job.annotation = "Killed"
+            return this_job
+
+        if now < start_time:
+            this_job.job_state = job_states.QUEUED
+            return this_job
+
+        this_job.dispatch_time = datetime.fromtimestamp(start_time)
+        if 'fail' in events:
+            end_time = start_time
+            this_job.exit_status = 1
+            this_job.annotation = "Simulated failure"
+        elif 'exit' in events:
+            try:
+                this_job.exit_status = int(events['exit'][0])
+                end_time = max(float(events['exit'][1]),
+                               start_time + run_time)
+            except (IndexError, ValueError):
+                self.logger.warning("Invalid exit record for job id {}: "
+                                    "'{}'".format(this_job.job_id, line))
+                end_time = start_time + run_time
+        else:
+            # The script is still running
+            end_time = None
+
+        if end_time is None or now < end_time:
+            this_job.job_state = job_states.RUNNING
+            this_job.wallclock_time_seconds = int(now - start_time)
+        else:
+            this_job.job_state = job_states.DONE
+            this_job.wallclock_time_seconds = int(end_time - start_time)
+            this_job.finish_time = datetime.fromtimestamp(end_time)
+
+        return this_job
+
+    def _parse_joblist_output(self, retval, stdout, stderr):
+        """
+        Parse the queue output string, as returned by executing the
+        command returned by _get_joblist_command command.
+
+        Return a list of JobInfo objects, one of each job,
+        each relevant parameters implemented.
+        """
+        if stderr.strip():
+            self.logger.warning("Warning in _parse_joblist_output, non-empty "
+                                "stderr='{}'".format(stderr.strip()))
+        if retval != 0:
+            raise SchedulerError("Error during the listing of the jobs of "
+                                 "the mock scheduler, retval={}\n"
+                                 "stdout={}\nstderr={}".format(
+                retval, stdout, stderr))
+
+        now = time.time()
+        return [self._parse_job_line(line, now)
+                for line in stdout.splitlines() if line.strip()]
+
+    def _parse_submit_output(self, retval, stdout, stderr):
+        """
+        Parse the output of the submit command, as returned by executing the
+        command returned by _get_submit_command command.
+
+        Return a string with the JobID.
+        """
+        if retval != 0:
+            self.logger.error("Error in _parse_submit_output: retval={}; "
+                              "stdout={}; stderr={}".format(retval, stdout,
+                                                            stderr))
+            raise SchedulerError("Error during submission, retval={}\n"
+                                 "stdout={}\nstderr={}".format(
+                retval, stdout, stderr))
+
+        if stderr.strip():
+            self.logger.warning("in _parse_submit_output for {}: "
+                                "there was some text in stderr: {}".format(
+                str(self.transport), stderr))
+
+        jobid = stdout.strip()
+        if not re.match(r'^\w+$', jobid):
+            raise SchedulerError("Unable to get the job id: retval={}; "
+                                 "stdout={}; stderr={}".format(retval, stdout,
+                                                               stderr))
+        return jobid
+
+    def _get_kill_command(self, jobid):
+        """
+        Return the command to kill the job with specified jobid: its script
+        is stopped if still running, and the job is marked as killed.
+        """
+        jobfile = escape_for_bash(
+            os.path.join(self._config['folder'], 'job.{}'.format(jobid)))
+        kill_command = (
+            'test -f {0} || {{ echo "Unknown job {1}" >&2; exit 1; }}; '
+            'pid=$(awk \'$1 == "pid" {{ print $2 }}\' {0}); '
+            'test -n "$pid" && kill $pid 2> /dev/null; '
+            'echo "killed $(date +%s)" >> {0}'.format(jobfile, jobid))
+
+        self.logger.info("killing job {}".format(jobid))
+
+        return kill_command
+
+    def _parse_kill_output(self, retval, stdout, stderr):
+        """
+        Parse the output of the kill command.
+
+        :return: True if everything seems ok, False otherwise.
+        """
+        if retval != 0:
+            self.logger.error("Error in _parse_kill_output: retval={}; "
+                              "stdout={}; stderr={}".format(retval, stdout,
+                                                            stderr))
+            return False
+
+        if stderr.strip():
+            self.logger.warning("in _parse_kill_output for {}: "
+                                "there was some text in stderr: {}".format(
+                str(self.transport), stderr))
+
+        return True
@@ -118,6 +118,9 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
     # Query only by list of jobs and not by user
     _features = {
         'can_query_by_user': False,
+        # The array directive and the index variable are defined by the
+        # subclasses
+        'can_submit_job_arrays': True,
     }
 
     # The class to be used for the job resource.
@@ -147,12 +150,12 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
         """
         The command to report full information on existing jobs.
 
-        TODO: in the case of job arrays, decide what to do (i.e., if we want
-              to pass the -t options to list each subjob).
+        The -t option lists each subjob of job arrays, with job ids in the
+        format 'arrayid[index].server'.
         """
         from aiida.common.exceptions import FeatureNotAvailable
 
-        command = ['qstat', '-f']
+        command = ['qstat', '-f', '-t']
 
         if jobs and user:
             raise FeatureNotAvailable("Cannot query by user and job(s) in PBS")
@@ -342,6 +345,59 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
 
         return submit_command
 
+    @staticmethod
+    def _iter_job_stanzas(stdout):
+        """
+        Split the output of qstat -f in the stanzas of the jobs, yielding
+        each job as soon as its stanza is complete, as a dictionary with
+        keys 'id', 'lines' (the attribute lines, with their continuation
+        lines appended) and 'warning_lines_idx' (the indices of the lines
+        that had continuation lines that do not start either with tab or
+        space).
+        """
+        job = None
+        # Get raw data and split in lines
+        for line_num, l in enumerate(stdout.split('\n'), start=1):
+            # Each new job stanza starts with the string 'Job Id:'
+            if l.startswith('Job Id:'):
+                if job is not None:
+                    yield job
+                job = {'id': l.split(':', 1)[1].strip(),
+                       'lines': [], 'warning_lines_idx': []}
+            else:
+                if l.strip():
+                    # This is a non-empty line, therefore it is an attribute
+                    # of the last job found
+                    if job is None:
+                        # No job found yet! (This means that I found a
+                        # non-empty line, before finding the first 'Job Id:'
+                        # string: it is an error. However this may happen
+                        # only before the first job.
+                        raise SchedulerParsingError("I did not find the header for the first job")
+                    else:
+                        if l.startswith(' '):
+                            # If it starts with a space, it is a new field
+                            job['lines'].append(l)
+                        elif l.startswith('\t'):
+                            # If a line starts with a TAB,
+                            # I append to the previous string
+                            # stripping the TAB
+                            if not job['lines']:
+                                raise SchedulerParsingError(
+                                    "Line {} is the first line of the job, but it "
+                                    "starts with a TAB! ({})".format(line_num, l))
+                            job['lines'][-1] += l[1:]
+                        else:
+                            ## For some reasons, the output of 'comment' and
+                            ## 'Variable_List', for instance, can have
+                            ## newlines if they are included... # I do a
+                            ## workaround
+                            job['lines'][-1] += "\n{}".format(l)
+                            job['warning_lines_idx'].append(
+                                len(job['lines']) - 1)
+        if job is not None:
+            yield job
+
     def _parse_joblist_output(self, retval, stdout, stderr):
         """
         Parse the queue output string, as returned by executing the
@@ -380,62 +436,21 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
                 raise SchedulerError(
                     "Error during qstat parsing (_parse_joblist_output function)")
 
-        jobdata_raw = []  # will contain raw data parsed from qstat output
-        # Get raw data and split in lines
-        for line_num, l in enumerate(stdout.split('\n'), start=1):
-            # Each new job stanza starts with the string 'Job Id:': I
-            # create a new item in the jobdata_raw list
-            if l.startswith('Job Id:'):
-                jobdata_raw.append(
-                    {'id': l.split(':', 1)[1].strip(),
-                     'lines': [], 'warning_lines_idx': []})
-                # warning_lines_idx: lines that do not start either with
-                # tab or space
-            else:
-                if l.strip():
-                    # This is a non-empty line, therefore it is an attribute
-                    # of the last job found
-                    if not jobdata_raw:
-                        # The list is still empty! (This means that I found a
-                        # non-empty line, before finding the first 'Job Id:'
-                        # string: it is an error. However this may happen
-                        # only before the first job.
-                        raise SchedulerParsingError("I did not find the header for the first job")
-                        #self.logger.warning("I found some text before the "
-                        #"first job: {}".format(l))
-                    else:
-                        if l.startswith(' '):
-                            # If it starts with a space, it is a new field
-                            jobdata_raw[-1]['lines'].append(l)
-                        elif l.startswith('\t'):
-                            # If a line starts with a TAB,
-                            # I append to the previous string
-                            # stripping the TAB
-                            if not jobdata_raw[-1]['lines']:
-                                raise SchedulerParsingError(
-                                    "Line {} is the first line of the job, but it "
-                                    "starts with a TAB! ({})".format(line_num, l))
-                            jobdata_raw[-1]['lines'][-1] += l[1:]
-                        else:
-                            #raise SchedulerParsingError(
-                            #    "Wrong starting character at line {}! ({})"
-                            #    "".format(line_num, l))
-                            ## For some reasons, the output of 'comment' and
-                            ## 'Variable_List', for instance, can have
-                            ## newlines if they are included... # I do a
-                            ## workaround
-                            jobdata_raw[-1]['lines'][-1] += "\n{}".format(l)
-                            jobdata_raw[-1]['warning_lines_idx'].append(
-                                len(jobdata_raw[-1]['lines']) - 1)
-
         # Create dictionary and parse specific fields
         job_list = []
-        for job in jobdata_raw:
+        for job in self._iter_job_stanzas(stdout):
             this_job = JobInfo()
             this_job.job_id = job['id']
 
-            lines_without_equals_sign = [i for i in job['lines']
-                                         if '=' not in i]
+            # Each line is split only once
+            raw_data = {}
+            lines_without_equals_sign = []
+            for i in job['lines']:
+                key, equals_sign, value = i.partition('=')
+                if equals_sign:
+                    raw_data[key.strip().lower()] = value.lstrip()
+                else:
+                    lines_without_equals_sign.append(i)
 
             # There are lines without equals sign: this is bad
             if lines_without_equals_sign:
@@ -445,10 +460,6 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
                 raise (SchedulerParsingError("There are lines without equals "
                                              "sign."))
 
-            raw_data = {i.split('=', 1)[0].strip().lower():
-                            i.split('=', 1)[1].lstrip()
-                        for i in job['lines'] if '=' in i}
-
             ## I ignore the errors for the time being - this seems to be
             ## a problem if there are \n in the content of some variables?
             ## I consider this a workaround...
@@ -674,6 +685,7 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
 
         return job_list
 
+    @aiida.scheduler.cached_conversion
     def _convert_time(self, string):
         """
         Convert a string in the format HH:MM:SS to a number of seconds.
@@ -713,6 +725,7 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
 
         return hours * 3600 + mins * 60 + secs
 
+    @aiida.scheduler.cached_conversion
     def _parse_time_string(self, string, fmt='%a %b %d %H:%M:%S %Y'):
         """
         Parse a time string in the format returned from qstat -f and
@@ -755,6 +768,14 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
 
         return stdout.strip()
 
+    def _get_array_task_jobid(self, array_jobid, index):
+        # The id of an array is e.g. '123[].server', and the ones of its
+        # subjobs '123[1].server'
+        if '[]' in array_jobid:
+            return array_jobid.replace('[]', '[{}]'.format(index), 1)
+        jobnum, sep, server = array_jobid.partition('.')
+        return "{}[{}]{}{}".format(jobnum, index, sep, server)
+
     def _get_kill_command(self, jobid):
         """
         Return the command to kill the job with specified jobid.
@@ -765,6 +786,24 @@ class PbsBaseClass(aiida.scheduler.Scheduler):
 
         return submit_command
 
+    def _get_kill_jobs_command(self, jobids):
+        """
+        Return the command to kill several jobs with a single qdel call.
+        """
+        self.logger.info("killing jobs {}".format(", ".join(jobids)))
+
+        return 'qdel {}'.format(' '.join(jobids))
+
+    def _parse_kill_jobs_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of the kill command for several jobs.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise.
+        """
+        return self._parse_multiple_kill_output(jobids, retval, stdout,
+                                                stderr)
+
     def _parse_kill_output(self, retval, stdout, stderr):
         """
         Parse the output of the kill command.
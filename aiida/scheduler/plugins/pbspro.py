@@ -13,6 +13,7 @@ This has been tested on PBSPro v. 12.
 """
 from __future__ import division
 import aiida.scheduler
+from aiida.scheduler.datastructures import job_states
 from .pbsbaseclasses import PbsBaseClass
 
 # This maps PbsPro status letters to our own status list
@@ -42,6 +43,9 @@ class PbsproScheduler(PbsBaseClass):
     """
     _logger = aiida.scheduler.Scheduler._logger.getChild('pbspro')
 
+    # The finished jobs are kept in the job history of the server
+    _features = dict(PbsBaseClass._features, can_query_job_history=True)
+
     ## I don't need to change this from the base class
     #_job_resource_class = PbsJobResource
 
@@ -49,6 +53,11 @@ class PbsproScheduler(PbsBaseClass):
     ## for the time being, but I can redefine it if needed.
     #_map_status = _map_status_pbs_common
 
+    _array_task_index_variable = 'PBS_ARRAY_INDEX'
+
+    def _get_array_directive(self, num_tasks):
+        return "#PBS -J 1-{}".format(num_tasks)
+
     def _get_resource_lines(self, num_machines, num_mpiprocs_per_machine,
                             num_cores_per_machine, max_memory_kb, max_wallclock_seconds):
         """
@@ -97,3 +106,56 @@ class PbsproScheduler(PbsBaseClass):
 
         return_lines.append("#PBS -l {}".format(select_string))
         return return_lines
+
+    def _get_job_history_command(self, jobs=None, user=None, since=None):
+        """
+        The command to report full information on the jobs, including the
+        finished ones kept in the job history of the server (qstat -x).
+
+        qstat cannot select the jobs by time, therefore since is ignored.
+        """
+        return self._get_joblist_command(jobs=jobs, user=user).replace(
+            'qstat -f', 'qstat -x -f', 1)
+
+    def _parse_job_history_output(self, retval, stdout, stderr):
+        """
+        Parse the output of qstat -x -f as the job list, setting also the
+        exit status, the terminating signal and the finish time of the
+        finished jobs.
+        """
+        job_list = self._parse_joblist_output(retval, stdout, stderr)
+        for this_job in job_list:
+            if this_job.job_state != job_states.DONE:
+                continue
+
+            # Exit_status is the exit status of the job script; it is
+            # 256 plus the signal number if the job was killed by a
+            # signal, and negative if the job could not be run by PBS
+            try:
+                exit_status = int(this_job.raw_data['exit_status'])
+            except KeyError:
+                self.logger.debug("No 'exit_status' field for job id "
+                                  "{}".format(this_job.job_id))
+            except ValueError:
+                self.logger.warning("'exit_status' is not an integer "
+                                    "({}) for job id {}!".format(
+                    this_job.raw_data['exit_status'], this_job.job_id))
+            else:
+                if exit_status > 256:
+                    this_job.terminating_signal = exit_status - 256
+                else:
+                    this_job.exit_status = exit_status
+
+            # obittime is set by the recent versions of PBSPro only;
+            # otherwise mtime is the time of the last change of state
+            for field in ('obittime', 'mtime'):
+                if field in this_job.raw_data:
+                    try:
+                        this_job.finish_time = self._parse_time_string(
+                            this_job.raw_data[field])
+                    except ValueError:
+                        self.logger.warning("Error parsing '{}' for job id "
+                                            "{}".format(field, this_job.job_id))
+                    break
+
+        return job_list
@@ -16,7 +16,6 @@ Email: marco(DOT)dorigo(AT)rub(DOT)de
 """
 from __future__ import division
 import aiida.scheduler
-import xml.parsers.expat
 from aiida.common.utils import escape_for_bash
 from aiida.scheduler import SchedulerError, SchedulerParsingError
 from aiida.scheduler.datastructures import (
@@ -103,10 +102,13 @@ class SgeScheduler(aiida.scheduler.Scheduler):
     # user, but not by job id
     _features = {
         'can_query_by_user': True,
+        'can_submit_job_arrays': True,
         }
     
     # The class to be used for the job resource.
     _job_resource_class = SgeJobResource
+
+    _array_task_index_variable = 'SGE_TASK_ID'
     
     def _get_joblist_command(self,jobs=None,user=None):
         """
@@ -307,8 +309,15 @@ class SgeScheduler(aiida.scheduler.Scheduler):
         return submit_command
 
     def _parse_joblist_output(self, retval, stdout, stderr):
-        import xml.dom.minidom
-        
+        """
+        Parse the xml output of qstat. The document is parsed incrementally
+        with ElementTree: each job_list element is converted to JobInfo
+        objects, and then discarded, as soon as it has been read.
+        """
+        import re
+        from StringIO import StringIO
+        from xml.etree import cElementTree as ElementTree
+
         if retval != 0:
             self.logger.error("Error in _parse_joblist_output: retval={}; "
                 "stdout={}; stderr={}".format(retval, stdout, stderr))
@@ -319,161 +328,206 @@ class SgeScheduler(aiida.scheduler.Scheduler):
             self.logger.warning("in _parse_joblist_output for {}: "
                 "there was some text in stderr: {}".format(
                     str(self.transport),stderr))
-           
-        if stdout:
-            try:
-                xmldata = xml.dom.minidom.parseString(stdout)
-            except xml.parsers.expat.ExpatError:
-                self.logger.error("in sge._parse_joblist_output: "
-                "xml parsing of stdout failed:"
-                "{}".format(stdout))
-                raise SchedulerParsingError("Error during joblist retrieval,"
-                                            "xml parsing of stdout failed")
-        else:
+
+        if not stdout:
             self.logger.error("Error in sge._parse_joblist_output: retval={}; "
                 "stdout={}; stderr={}".format(retval, stdout, stderr))
             raise SchedulerError("Error during joblist retrieval,"
                                  "no stdout produced")
-        
+        if isinstance(stdout, unicode):
+            stdout = stdout.encode('utf-8')
+
+        # The text of each job_list element, stored as raw data; they are
+        # in the same order as the elements
+        raw_jobs = (m.group(0) for m in re.finditer(
+            r'<job_list\b.*?</job_list>', stdout, re.DOTALL))
+
+        joblist = []
+        # The root element is the last one to end
+        element = None
         try:
-            first_child = xmldata.firstChild
-            second_childs = first_child.childNodes
-            tag_names_sec = [elem.tagName for elem in second_childs \
-                             if elem.nodeType == 1]
-            if not 'queue_info' in tag_names_sec:
-                self.logger.error("Error in sge._parse_joblist_output: "
-                                  "no queue_info: {}".\
-                                  format(stdout))
-                raise SchedulerError
-            if not 'job_info' in tag_names_sec:
+            for _, element in ElementTree.iterparse(StringIO(stdout)):
+                if element.tag == 'job_list':
+                    joblist.extend(self._parse_job_element(
+                        element, next(raw_jobs, None), stdout))
+                    # The job has been parsed: I free its memory
+                    element.clear()
+        except ElementTree.ParseError:
+            self.logger.error("in sge._parse_joblist_output: "
+            "xml parsing of stdout failed:"
+            "{}".format(stdout))
+            raise SchedulerParsingError("Error during joblist retrieval,"
+                                        "xml parsing of stdout failed")
+
+        tag_names_sec = set(child.tag for child in element)
+        for tag_name in ('queue_info', 'job_info'):
+            if tag_name not in tag_names_sec:
                 self.logger.error("Error in sge._parse_joblist_output: "
-                                  "no job_info: {}".\
-                                  format(stdout))
+                                  "no {}: {}".format(tag_name, stdout))
+                raise SchedulerError("Error during xml processing, of stdout:"
+                                     "There is no 'job_info' or no 'queue_info'"
+                                     "element or there are no jobs!")
+
+        #self.logger.debug("joblist final: {}".format(joblist))
+        return joblist
+
+    @staticmethod
+    def _get_element_text(element, tag):
+        """
+        Return the stripped text of the first child of an xml element with
+        the given tag.
+
+        :raise IndexError: if there is no such sub-element, or if it is empty
+        """
+        # The fields of the jobs are children of the job_list elements
+        sub_element = element.find(tag)
+        if sub_element is None:
+            raise IndexError("No '{}' element".format(tag))
+        if sub_element.text is None:
+            raise IndexError("Empty '{}' element".format(tag))
+        return str(sub_element.text).strip()
+
+    def _parse_job_element(self, job, raw_data, stdout):
+        """
+        Parse a job_list element of the xml output of qstat.
+
+        :param job: the job_list element
+        :param raw_data: the text of the element in stdout, or None
+        :param stdout: the whole output, for the error messages
+
+        :return: a list of JobInfo objects: one for the job, or one for
+            each task if the job is a job array
+        """
+        from xml.etree import cElementTree as ElementTree
+
+        this_job = JobInfo()
+
+        #In case the user needs more information the xml-data for
+        #each job is stored:
+        if raw_data is None:
+            job.tail = None
+            raw_data = ElementTree.tostring(job)
+        this_job.raw_data = raw_data
+
+        try:
+            this_job.job_id = self._get_element_text(job, 'JB_job_number')
+            if not this_job.job_id:
                 raise SchedulerError
         except SchedulerError:
-            self.logger.error("Error in sge._parse_joblist_output: stdout={}"\
-                              .format(stdout))
-            raise SchedulerError("Error during xml processing, of stdout:"
-                                 "There is no 'job_info' or no 'queue_info'"
-                                 "element or there are no jobs!")
-        #If something weird happens while firstChild, pop, etc:
-        except Exception: 
-            self.logger.error("Error in sge._parse_joblist_output: stdout={}"\
+            self.logger.error("Error in sge._parse_joblist_output:"
+                              "no job id is given, stdout={}"\
                               .format(stdout))
-            raise SchedulerError("Error during xml processing, of stdout")
-            
-        jobs = [i for i in first_child.getElementsByTagName('job_list')]
-        #jobs = [i for i in jobinfo.getElementsByTagName('job_list')]
-        #print [i[0].childNodes[0].data for i in job_numbers if i]
-        joblist = []
-        for job in jobs:
-            this_job = JobInfo()
-            
-            #In case the user needs more information the xml-data for 
-            #each job is stored:
-            this_job.raw_data = job.toxml()
-            
-            try:
-                job_element = job.getElementsByTagName('JB_job_number').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                this_job.job_id = str(element_child.data).strip()
-                if not this_job.job_id:
-                    raise SchedulerError
-            except SchedulerError:
-                self.logger.error("Error in sge._parse_joblist_output:"
-                                  "no job id is given, stdout={}"\
-                                  .format(stdout))
-                raise SchedulerError("Error in sge._parse_joblist_output:"
-                "no job id is given")
-            except IndexError:
-                self.logger.error("No 'job_number' given for job index {} in "
-                                  "job list, stdout={}".format(jobs.index(job)\
-                                  ,stdout))
-                raise IndexError("Error in sge._parse_joblist_output:"
-                "no job id is given")
-            
+            raise SchedulerError("Error in sge._parse_joblist_output:"
+            "no job id is given")
+        except IndexError:
+            self.logger.error("No 'job_number' given for job in "
+                              "job list, stdout={}".format(stdout))
+            raise IndexError("Error in sge._parse_joblist_output:"
+            "no job id is given")
+
+        try:
+            job_state_string = self._get_element_text(job, 'state')
             try:
-                job_element = job.getElementsByTagName('state').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                job_state_string = str(element_child.data).strip()
-                try:
-                    this_job.job_state = _map_status_sge[job_state_string]
-                except KeyError:
-                    self.logger.warning("Unrecognized job_state '{}' for job "
-                                        "id {}".format(job_state_string,
-                                                       this_job.job_id))
-                    this_job.job_state = job_states.UNDETERMINED
-            except IndexError:
-                self.logger.warning("No 'job_state' field for job id {} in" 
-                                  "stdout={}".format(this_job.job_id,stdout))
+                this_job.job_state = _map_status_sge[job_state_string]
+            except KeyError:
+                self.logger.warning("Unrecognized job_state '{}' for job "
+                                    "id {}".format(job_state_string,
+                                                   this_job.job_id))
                 this_job.job_state = job_states.UNDETERMINED
-            
-            try:
-                job_element = job.getElementsByTagName('JB_owner').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                this_job.job_owner = str(element_child.data).strip()
-            except IndexError:
-                self.logger.warning("No 'job_owner' field for job "
-                                  "id {}".format(this_job.job_id))
-            
-            try:
-                job_element = job.getElementsByTagName('JB_name').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                this_job.title = str(element_child.data).strip()
-            except IndexError:
-                self.logger.warning("No 'title' field for job "
-                                  "id {}".format(this_job.job_id))
-             
+        except IndexError:
+            self.logger.warning("No 'job_state' field for job id {} in"
+                              "stdout={}".format(this_job.job_id,stdout))
+            this_job.job_state = job_states.UNDETERMINED
+
+        try:
+            this_job.job_owner = self._get_element_text(job, 'JB_owner')
+        except IndexError:
+            self.logger.warning("No 'job_owner' field for job "
+                              "id {}".format(this_job.job_id))
+
+        try:
+            this_job.title = self._get_element_text(job, 'JB_name')
+        except IndexError:
+            self.logger.warning("No 'title' field for job "
+                              "id {}".format(this_job.job_id))
+
+        try:
+            this_job.queue_name = self._get_element_text(job, 'queue_name')
+        except IndexError:
+            if this_job.job_state == job_states.RUNNING:
+                self.logger.warning("No 'queue_name' field for job "
+                                    "id {}".format(this_job.job_id))
+
+        try:
+            time_string = self._get_element_text(job, 'JB_submission_time')
             try:
-                job_element = job.getElementsByTagName('queue_name').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                this_job.queue_name = str(element_child.data).strip()
-            except IndexError:
-                if this_job.job_state == job_states.RUNNING:
-                    self.logger.warning("No 'queue_name' field for job "
-                                        "id {}".format(this_job.job_id))
-            
+                this_job.submission_time = self._parse_time_string(
+                   time_string)
+            except ValueError:
+                self.logger.warning("Error parsing 'JB_submission_time' "
+                    "for job id {} ('{}')".format(this_job.job_id,
+                                                  time_string))
+        except IndexError:
             try:
-                job_element = job.getElementsByTagName('JB_submission_time').pop(0)
-                element_child = job_element.childNodes.pop(0)
-                time_string = str(element_child.data).strip()
+                time_string = self._get_element_text(job, 'JAT_start_time')
                 try:
-                    this_job.submission_time = self._parse_time_string(
-                       time_string)
+                    this_job.dispatch_time = self._parse_time_string(
+                                                        time_string)
                 except ValueError:
-                    self.logger.warning("Error parsing 'JB_submission_time' "
-                        "for job id {} ('{}')".format(this_job.job_id,
-                                                      time_string)) 
+                    self.logger.warning("Error parsing 'JAT_start_time'"
+                    "for job id {} ('{}')".format(this_job.job_id,
+                                                  time_string))
             except IndexError:
-                try:
-                    job_element = job.getElementsByTagName('JAT_start_time').pop(0)
-                    element_child = job_element.childNodes.pop(0)
-                    time_string = str(element_child.data).strip()
-                    try:
-                        this_job.dispatch_time = self._parse_time_string(
-                                                            time_string)
-                    except ValueError:
-                        self.logger.warning("Error parsing 'JAT_start_time'"
-                        "for job id {} ('{}')".format(this_job.job_id,
-                                                      time_string))
-                except IndexError:
-                    self.logger.warning("No 'JB_submission_time' and no "
-                                        "'JAT_start_time' field for job "
-                                        "id {}".format(this_job.job_id))
-                
-            #There is also cpu_usage, mem_usage, io_usage information available:
-            if this_job.job_state == job_states.RUNNING:
-                try:
-                    job_element = job.getElementsByTagName('slots').pop(0)
-                    element_child = job_element.childNodes.pop(0)
-                    this_job.num_mpiprocs = str(element_child.data).strip()
-                except IndexError:
-                    self.logger.warning("No 'slots' field for job "
-                                  "id {}".format(this_job.job_id))
-                
-            joblist.append(this_job)
-        #self.logger.debug("joblist final: {}".format(joblist))
-        return joblist
+                self.logger.warning("No 'JB_submission_time' and no "
+                                    "'JAT_start_time' field for job "
+                                    "id {}".format(this_job.job_id))
+
+        #There is also cpu_usage, mem_usage, io_usage information available:
+        if this_job.job_state == job_states.RUNNING:
+            try:
+                this_job.num_mpiprocs = self._get_element_text(job, 'slots')
+            except IndexError:
+                self.logger.warning("No 'slots' field for job "
+                              "id {}".format(this_job.job_id))
+
+        # The tasks of job arrays are listed with the id of the array
+        # and the indices of the tasks (a range if they are pending):
+        # each task is listed as a separate job
+        try:
+            task_indices = self._parse_array_task_indices(
+                self._get_element_text(job, 'tasks'))
+        except (IndexError, ValueError):
+            task_indices = []
+
+        if task_indices:
+            job_tasks = []
+            for index in task_indices:
+                task_job = this_job.copy()
+                task_job.job_id = self._get_array_task_jobid(
+                    this_job.job_id, index)
+                job_tasks.append(task_job)
+            return job_tasks
+        return [this_job]
+
+    @staticmethod
+    def _parse_array_task_indices(tasks_string):
+        """
+        Parse the task indices of a job array, in the format of the 'tasks'
+        element of qstat (e.g. '3', '1-10:1' or '1,4-8:2'), into a list of
+        integers.
+
+        :raise ValueError: if the string cannot be parsed
+        """
+        indices = []
+        for part in tasks_string.split(','):
+            if '-' in part:
+                first_last, _, step = part.partition(':')
+                first, last = first_last.split('-')
+                indices.extend(range(int(first), int(last) + 1,
+                                     int(step) if step else 1))
+            else:
+                indices.append(int(part))
+        return indices
 
     def _parse_submit_output(self, retval, stdout, stderr):
         """
@@ -500,6 +554,7 @@ class SgeScheduler(aiida.scheduler.Scheduler):
         
         return stdout.strip()
 
+    @aiida.scheduler.cached_conversion
     def _parse_time_string(self,string,fmt='%Y-%m-%dT%H:%M:%S'):
         """
         Parse a time string in the format returned from qstat -xml -ext and
@@ -520,6 +575,16 @@ class SgeScheduler(aiida.scheduler.Scheduler):
         # http://stackoverflow.com/questions/1697815
         return datetime.datetime.fromtimestamp(time.mktime(time_struct))
 
+    def _get_array_directive(self, num_tasks):
+        return "#$ -t 1-{}".format(num_tasks)
+
+    def _get_array_jobid(self, jobid):
+        # With -terse, qsub prints e.g. '123.1-10:1' for job arrays
+        return jobid.split('.')[0]
+
+    def _get_array_task_jobid(self, array_jobid, index):
+        return "{}.{}".format(array_jobid, index)
+
     def _get_kill_command(self, jobid):
         """
         Return the command to kill the job with specified jobid.
@@ -530,6 +595,24 @@ class SgeScheduler(aiida.scheduler.Scheduler):
 
         return submit_command
 
+    def _get_kill_jobs_command(self, jobids):
+        """
+        Return the command to kill several jobs with a single qdel call.
+        """
+        self.logger.info("killing jobs {}".format(", ".join(jobids)))
+
+        return 'qdel {}'.format(' '.join(jobids))
+
+    def _parse_kill_jobs_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of the kill command for several jobs.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise.
+        """
+        return self._parse_multiple_kill_output(jobids, retval, stdout,
+                                                stderr)
+
     def _parse_kill_output(self, retval, stdout, stderr):
         """
         Parse the output of the kill command.
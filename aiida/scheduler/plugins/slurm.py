@@ -58,6 +58,28 @@ _map_status_slurm = {
     'TO': job_states.DONE,
     }
 
+# This maps the full SLURM state names, as given by sacct, to our own
+# status list
+_map_status_sacct = {
+    'BOOT_FAIL': job_states.DONE,
+    'CANCELLED': job_states.DONE,
+    'COMPLETED': job_states.DONE,
+    'CONFIGURING': job_states.QUEUED,
+    'COMPLETING': job_states.RUNNING,
+    'DEADLINE': job_states.DONE,
+    'FAILED': job_states.DONE,
+    'NODE_FAIL': job_states.DONE,
+    'OUT_OF_MEMORY': job_states.DONE,
+    'PENDING': job_states.QUEUED,
+    'PREEMPTED': job_states.DONE,
+    'REQUEUED': job_states.QUEUED,
+    'RESIZING': job_states.RUNNING,
+    'REVOKED': job_states.DONE,
+    'RUNNING': job_states.RUNNING,
+    'SUSPENDED': job_states.SUSPENDED,
+    'TIMEOUT': job_states.DONE,
+    }
+
 # From the manual,
 # possible lines are:
 # salloc: Granted job allocation 65537
@@ -157,11 +179,25 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
     # Query only by list of jobs and not by user
     _features = {
         'can_query_by_user': False,
+        'can_submit_job_arrays': True,
+        'can_query_job_history': True,
         }
     
     # The class to be used for the job resource.
     _job_resource_class = SlurmJobResource
 
+    _array_task_index_variable = 'SLURM_ARRAY_TASK_ID'
+
+    # The fields of the output of sacct for the detailed jobinfo
+    _detailed_jobinfo_format = (
+        "AllocCPUS,Account,AssocID,AveCPU,AvePages,AveRSS,AveVMSize,Cluster,"
+        "Comment,CPUTime,CPUTimeRAW,DerivedExitCode,Elapsed,Eligible,End,"
+        "ExitCode,GID,Group,JobID,JobName,MaxRSS,MaxRSSNode,MaxRSSTask,"
+        "MaxVMSize,MaxVMSizeNode,MaxVMSizeTask,MinCPU,MinCPUNode,MinCPUTask,"
+        "NCPUS,NNodes,NodeList,NTasks,Priority,Partition,QOSRAW,ReqCPUS,"
+        "Reserved,ResvCPU,ResvCPURAW,Start,State,Submit,Suspended,SystemCPU,"
+        "Timelimit,TotalCPU,UID,User,UserCPU")
+
     # Fields to query or to parse
     # Unavailable fields: substate, cputime
     fields = [
@@ -183,6 +219,25 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
                                 # 14.03.7 and later  
       ]
 
+    # Fields to query with sacct for the job history; the job name is the
+    # last one, since it may contain the separator
+    history_fields = [
+      ("JobID", 'job_id'),
+      ("State", 'state'), # full state name, possibly followed by details
+                          # (e.g. 'CANCELLED by 1234')
+      ("ExitCode", 'exit_code'), # exit code and signal, as 'code:signal'
+      ("User", 'username'),
+      ("NNodes", 'number_nodes'),
+      ("AllocCPUS", 'number_cpus'),
+      ("Partition", 'partition'),
+      ("ElapsedRaw", 'elapsed'), # elapsed time in seconds
+      ("TotalCPU", 'cpu_time'), # in [DD-[HH:]]MM:SS.mmm format
+      ("Submit", 'submission_time'),
+      ("Start", 'dispatch_time'),
+      ("End", 'finish_time'),
+      ("JobName", 'job_name'),
+      ]
+
     def _get_joblist_command(self, jobs=None, user=None):
         """
         The command to report full information on existing jobs.
@@ -195,7 +250,10 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
         
         # I add the environment variable SLURM_TIME_FORMAT in front to be
         # sure to get the times in 'standard' format
+        # With --array, the tasks of job arrays are listed one per line,
+        # with job ids in the format 'arrayid_index', also when pending
         command = ["SLURM_TIME_FORMAT='standard'", "squeue", "--noheader",
+                   "--array",
                    "-o '{}'".format(_field_separator.join(
                        _[0] for _ in self.fields))]
 
@@ -221,6 +279,48 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
         self.logger.debug("squeue command: {}".format(comm))
         return comm
 
+    def _get_job_history_command(self, jobs=None, user=None, since=None):
+        """
+        The command to get the jobs from the accounting (sacct), one line
+        per job allocation (job steps are not listed), with the fields of
+        history_fields separated by a pipe.
+
+        The start of the time window is given relative to the current
+        time of the cluster, so that it does not depend on its time zone.
+        """
+        import math
+        import time
+
+        if since is None:
+            starttime = '1970-01-01T00:00:00'
+        else:
+            starttime = 'now-{}seconds'.format(
+                max(int(math.ceil(time.time() - since)), 0))
+
+        command = ["SLURM_TIME_FORMAT='standard'", "sacct", "--noheader",
+                   "--allocations", "--parsable2",
+                   "--starttime={}".format(starttime),
+                   "--format={}".format(','.join(
+                       _[0] for _ in self.history_fields))]
+
+        if user:
+            command.append('--user={}'.format(user))
+
+        if jobs:
+            if isinstance(jobs, basestring):
+                joblist = [jobs]
+            else:
+                if not isinstance(jobs, (tuple, list)):
+                    raise TypeError(
+                        "If provided, the 'jobs' variable must be a string or "
+                        "a list of strings")
+                joblist = jobs
+            command.append('--jobs={}'.format(','.join(joblist)))
+
+        comm = ' '.join(command)
+        self.logger.debug("sacct command: {}".format(comm))
+        return comm
+
     def _get_detailed_jobinfo_command(self,jobid):
         """
         Return the command to run to get the detailed information on a job,
@@ -230,7 +330,38 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
         --parsable split the fields with a pipe (|), adding a pipe also at 
         the end.
         """
-        return "sacct --format=AllocCPUS,Account,AssocID,AveCPU,AvePages,AveRSS,AveVMSize,Cluster,Comment,CPUTime,CPUTimeRAW,DerivedExitCode,Elapsed,Eligible,End,ExitCode,GID,Group,JobID,JobName,MaxRSS,MaxRSSNode,MaxRSSTask,MaxVMSize,MaxVMSizeNode,MaxVMSizeTask,MinCPU,MinCPUNode,MinCPUTask,NCPUS,NNodes,NodeList,NTasks,Priority,Partition,QOSRAW,ReqCPUS,Reserved,ResvCPU,ResvCPURAW,Start,State,Submit,Suspended,SystemCPU,Timelimit,TotalCPU,UID,User,UserCPU --parsable --jobs={}".format(jobid)
+        return "sacct --format={} --parsable --jobs={}".format(
+            self._detailed_jobinfo_format, jobid)
+
+    def _get_detailed_jobinfos_command(self, jobids):
+        """
+        Return the command to get the detailed information on several jobs
+        with a single sacct call.
+        """
+        return self._get_detailed_jobinfo_command(','.join(jobids))
+
+    def _parse_detailed_jobinfos_output(self, jobids, retval, stdout, stderr):
+        """
+        Split the output of sacct among the jobs: each job gets the header
+        line, and the lines of the job and of its steps.
+        """
+        jobid_index = self._detailed_jobinfo_format.split(',').index('JobID')
+        lines = stdout.splitlines(True)
+        header = lines[0] if lines else ''
+
+        job_lines = dict((jobid, []) for jobid in jobids)
+        for line in lines[1:]:
+            fields = line.split('|')
+            if len(fields) <= jobid_index:
+                continue
+            # The steps of job 123 are 123.batch, 123.0, ...
+            jobid = fields[jobid_index].split('.')[0]
+            if jobid in job_lines:
+                job_lines[jobid].append(line)
+
+        return dict(
+            (jobid, (retval, header + ''.join(job_lines[jobid]), stderr))
+            for jobid in jobids)
 
     def _get_submit_script_header(self, job_tmpl):
         """
@@ -456,6 +587,12 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
             "Error during submission, could not retrieve the jobID from "
             "sbatch output; see log for more info.")
 
+    def _get_array_directive(self, num_tasks):
+        return "#SBATCH --array=1-{}".format(num_tasks)
+
+    def _get_array_task_jobid(self, array_jobid, index):
+        return "{}_{}".format(array_jobid, index)
+
     def _parse_joblist_output(self, retval, stdout, stderr):
         """
         Parse the queue output string, as returned by executing the
@@ -493,22 +630,23 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
                 raise SchedulerError(
                     "Error during squeue parsing (_parse_joblist_output function)")
 
-        # will contain raw data parsed from output: only lines with the
-        # separator, and already split in fields
-        # I put num_fields, because in this way
+        # Only the lines with the separator are parsed, one at a time
+        # (without building the whole list of raw data first).
+        # I split in num_fields, because in this way
         # if the symbol _field_separator appears in the title (that is
         # the last field), I don't split the title.
         # This assumes that _field_separator never
         # appears in any previous field.
-        jobdata_raw = [l.split(_field_separator,num_fields)
-                       for l in stdout.splitlines()
-                       if _field_separator in l]
+        field_names = [_[1] for _ in self.fields]
 
         # Create dictionary and parse specific fields
         job_list = []
-        for job in jobdata_raw:
+        for line in stdout.splitlines():
+            if _field_separator not in line:
+                continue
+            job = line.split(_field_separator, num_fields)
 
-            thisjob_dict = {k[1]: v for k, v in zip(self.fields, job)}
+            thisjob_dict = dict(zip(field_names, job))
 
             this_job = JobInfo()
             try:
@@ -562,7 +700,7 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
                 # Also print a warning
                 self.logger.warning("Wrong line length in squeue output!"
                                     "Skipping optional fields. Line: '{}'"
-                                    "".format(jobdata_raw))
+                                    "".format(job))
                 # I append this job before continuing
                 job_list.append(this_job)
                 continue
@@ -652,6 +790,112 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
 
         return job_list
 
+    def _parse_job_history_output(self, retval, stdout, stderr):
+        """
+        Parse the output of the sacct command returned by
+        _get_job_history_command: one line per job, with the fields of
+        history_fields separated by a pipe.
+
+        For the finished jobs, the exit status, the terminating signal,
+        the wallclock and cpu times and the finish time are set.
+        """
+        num_fields = len(self.history_fields)
+
+        if retval != 0:
+            self.logger.warning("Error in _parse_job_history_output: "
+                                "retval={}; stdout={}; stderr={}".format(
+                retval, stdout, stderr))
+            raise SchedulerError("Error during sacct parsing "
+                                 "(_parse_job_history_output function)")
+        if stderr.strip():
+            self.logger.warning("Warning in _parse_job_history_output, "
+                                "non-empty stderr='{}'".format(stderr.strip()))
+
+        job_list = []
+        for line in stdout.splitlines():
+            job = line.split('|', num_fields - 1)
+            if len(job) != num_fields:
+                if line.strip():
+                    self.logger.error("Wrong line length in sacct output! "
+                                      "'{}'".format(line))
+                continue
+            thisjob_dict = {k[1]: v for k, v in zip(self.history_fields, job)}
+
+            this_job = JobInfo()
+            this_job.job_id = thisjob_dict['job_id']
+            state = thisjob_dict['state'].strip()
+            this_job.job_substate = state.split(' ')[0] if state else state
+            try:
+                this_job.job_state = _map_status_sacct[this_job.job_substate]
+            except KeyError:
+                self.logger.warning("Unrecognized job_state '{}' for job "
+                                    "id {}".format(state, this_job.job_id))
+                this_job.job_state = job_states.UNDETERMINED
+            this_job.annotation = state
+
+            this_job.job_owner = thisjob_dict['username']
+            this_job.queue_name = thisjob_dict['partition']
+            this_job.title = thisjob_dict['job_name']
+
+            try:
+                this_job.num_machines = int(thisjob_dict['number_nodes'])
+            except ValueError:
+                pass
+            try:
+                this_job.num_mpiprocs = int(thisjob_dict['number_cpus'])
+            except ValueError:
+                pass
+
+            try:
+                this_job.submission_time = self._parse_time_string(
+                    thisjob_dict['submission_time'])
+            except ValueError:
+                # 'Unknown', for instance
+                pass
+            try:
+                this_job.dispatch_time = self._parse_time_string(
+                    thisjob_dict['dispatch_time'])
+            except ValueError:
+                # The job may not have been started yet
+                pass
+
+            if this_job.job_state == job_states.DONE:
+                try:
+                    exit_status, signal = thisjob_dict['exit_code'].split(':')
+                    this_job.exit_status = int(exit_status)
+                    this_job.terminating_signal = int(signal)
+                except ValueError:
+                    self.logger.warning("Error parsing the exit code '{}' "
+                                        "for job id {}".format(
+                        thisjob_dict['exit_code'], this_job.job_id))
+                try:
+                    this_job.wallclock_time_seconds = int(
+                        thisjob_dict['elapsed'])
+                except ValueError:
+                    self.logger.warning("Error parsing the elapsed time "
+                                        "for job id {}".format(this_job.job_id))
+                try:
+                    # I drop the milliseconds
+                    this_job.cpu_time = self._convert_time(
+                        thisjob_dict['cpu_time'].split('.')[0])
+                except ValueError:
+                    self.logger.warning("Error parsing the cpu time "
+                                        "for job id {}".format(this_job.job_id))
+                try:
+                    this_job.finish_time = self._parse_time_string(
+                        thisjob_dict['finish_time'])
+                except ValueError:
+                    self.logger.warning("Error parsing the finish time "
+                                        "for job id {}".format(this_job.job_id))
+
+            # Everything goes here anyway for debugging purposes
+            this_job.raw_data = job
+
+            job_list.append(this_job)
+
+        return job_list
+
+    @aiida.scheduler.cached_conversion
     def _convert_time(self,string):
         """
         Convert a string in the format DD-HH:MM:SS to a number of seconds.
@@ -676,6 +920,7 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
         return days * 86400 + hours * 3600 + mins * 60 + secs
 
 
+    @aiida.scheduler.cached_conversion
     def _parse_time_string(self,string,fmt='%Y-%m-%dT%H:%M:%S'):
         """
         Parse a time string in the format returned from qstat -f and
@@ -705,6 +950,24 @@ class SlurmScheduler(aiida.scheduler.Scheduler):
 
         return submit_command
 
+    def _get_kill_jobs_command(self, jobids):
+        """
+        Return the command to kill several jobs with a single scancel call.
+        """
+        self.logger.info("killing jobs {}".format(", ".join(jobids)))
+
+        return 'scancel {}'.format(' '.join(jobids))
+
+    def _parse_kill_jobs_output(self, jobids, retval, stdout, stderr):
+        """
+        Parse the output of the kill command for several jobs.
+
+        :return: a dictionary with the job ids as keys, and as values True
+            if everything seems ok for the job, False otherwise.
+        """
+        return self._parse_multiple_kill_output(jobids, retval, stdout,
+                                                stderr)
+
 
     def _parse_kill_output(self, retval, stdout, stderr):
         """
@@ -209,5 +209,38 @@ class TestParserBkill(unittest.TestCase):
         self.assertTrue( s._parse_kill_output(retval, stdout, stderr) )
 
 
+class TestJobArrays(unittest.TestCase):
+
+    def test_parse_array_elements(self):
+        """
+        The elements of job arrays are listed with the id of the array and
+        the index in the job name.
+        """
+        s = LsfScheduler()
+        stdout = ("764213240|RUN|-|b681e480bd|inewton|1|-|b681e480bd|test|"
+                  "Feb  2 00:46|Feb  2 00:45|-|Feb  2 00:44|aiida-1033269[1]\n"
+                  "764213240|PEND|-|-|inewton|-|-|-|test|-|-|-|"
+                  "Feb  2 00:44|aiida-1033269[2]")
+
+        job_list = s._parse_joblist_output(0, stdout, '')
+
+        self.assertEquals([j.job_id for j in job_list],
+                          ['764213240[1]', '764213240[2]'])
+        self.assertEquals(job_list[1].job_state, job_states.QUEUED)
+
+    def test_array_submit_script_header(self):
+        from aiida.scheduler.datastructures import JobTemplate
+
+        s = LsfScheduler()
+
+        job_tmpl = JobTemplate()
+        job_tmpl.job_name = 'aiida-array-12'
+        job_tmpl.job_resource = s.create_job_resource(tot_num_mpiprocs=2)
+
+        header = s._get_array_submit_script_header(job_tmpl, 3)
+        self.assertTrue( '#BSUB -J "aiida-array-12[1-3]"' in header )
+
+
+
 if __name__ == '__main__':        
     unittest.main()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from aiida.scheduler import SchedulerError
+from aiida.scheduler.datastructures import job_states, JobTemplate
+from aiida.scheduler.plugins.mock import MockScheduler
+from aiida.transport.plugins.local import LocalTransport
+
+# Lines of the job list at time 1000
+joblist_output = """a1|submit 990 20 5 aiida|pid 123
+a2|submit 970 20 5 aiida|pid 124
+a3|submit 900 20 5 aiida|pid 125|exit 0 921
+a4|submit 900 20 5 aiida|pid 126|exit 2 921
+a5|submit 990 0 5 aiida|fail 990
+a6|submit 990 20 5 aiida|pid 127|killed 995
+a7|submit 997 0 5 aiida|pid 128|exit 0 998
+a8|corrupted
+"""
+
+
+class MockSchedulerTestCase(unittest.TestCase):
+    """
+    Base class setting the environment of the mock scheduler, with a
+    temporary state folder.
+    """
+    config = {}
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.environ = dict(
+            ('AIIDA_MOCK_SCHEDULER_' + k.upper(), str(v))
+            for k, v in dict(self.config,
+                             folder=os.path.join(self.folder,
+                                                 'state')).iteritems())
+        self.original_environ = dict((k, os.environ.get(k))
+                                     for k in self.environ)
+        os.environ.update(self.environ)
+        self.scheduler = MockScheduler()
+
+    def tearDown(self):
+        for k, v in self.original_environ.iteritems():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+        shutil.rmtree(self.folder)
+
+
+class TestParserGetJobList(MockSchedulerTestCase):
+    """
+    Test the computation of the states of the jobs from their records.
+    """
+
+    def test_parse_joblist_output(self):
+        now = 1000.
+        jobs = dict((line.split('|')[0],
+                     self.scheduler._parse_job_line(line, now))
+                    for line in joblist_output.splitlines())
+
+        self.assertEquals(jobs['a1'].job_state, job_states.QUEUED)
+        self.assertEquals(jobs['a1'].job_owner, 'aiida')
+        self.assertEquals(jobs['a2'].job_state, job_states.RUNNING)
+        self.assertEquals(jobs['a2'].wallclock_time_seconds, 10)
+        self.assertEquals(jobs['a3'].job_state, job_states.DONE)
+        self.assertEquals(jobs['a3'].exit_status, 0)
+        self.assertEquals(jobs['a3'].wallclock_time_seconds, 5)
+        self.assertEquals(jobs['a4'].exit_status, 2)
+        self.assertEquals(jobs['a5'].job_state, job_states.DONE)
+        self.assertEquals(jobs['a5'].exit_status, 1)
+        self.assertEquals(jobs['a6'].job_state, job_states.DONE)
+        self.assertEquals(jobs['a6'].annotation, "Killed")
+        # The script has finished, but not the simulated running time
+        self.assertEquals(jobs['a7'].job_state, job_states.RUNNING)
+        self.assertEquals(jobs['a8'].job_state, job_states.UNDETERMINED)
+
+    def test_parse_errors(self):
+        with self.assertRaises(SchedulerError):
+            self.scheduler._parse_joblist_output(1, '', 'find: error')
+        with self.assertRaises(SchedulerError):
+            self.scheduler._parse_submit_output(1, '', 'Simulated failure')
+
+
+class TestSubmission(MockSchedulerTestCase):
+    """
+    Test the submission of scripts through the local transport.
+    """
+    config = {'run_time': 1, 'extra_jobs': 10}
+
+    def get_jobs(self, transport, jobs=None):
+        self.scheduler.set_transport(transport)
+        return self.scheduler.getJobs(jobs=jobs, as_dict=True)
+
+    def test_submit(self):
+        job_tmpl = JobTemplate()
+        job_tmpl.sched_output_path = '_scheduler-stdout.txt'
+        job_tmpl.sched_error_path = '_scheduler-stderr.txt'
+        with open(os.path.join(self.folder, 'script.sh'), 'w') as f:
+            f.write(self.scheduler._get_submit_script_header(job_tmpl))
+            f.write("echo done > output.txt\n")
+
+        with LocalTransport() as t:
+            self.scheduler.set_transport(t)
+            jobid = self.scheduler.submit_from_script(self.folder,
+                                                      'script.sh')
+            jobs = self.get_jobs(t)
+            self.assertEquals(len(jobs), 11)
+            self.assertEquals(jobs[jobid].job_state, job_states.RUNNING)
+
+            for _ in range(50):
+                time.sleep(0.1)
+                job = self.get_jobs(t, jobs=[jobid])[jobid]
+                if job.job_state == job_states.DONE:
+                    break
+            self.assertEquals(job.job_state, job_states.DONE)
+            self.assertEquals(job.exit_status, 0)
+            self.assertGreaterEqual(job.wallclock_time_seconds, 1)
+
+            with open(os.path.join(self.folder, 'output.txt')) as f:
+                self.assertEquals(f.read().strip(), 'done')
+            with open(os.path.join(self.folder,
+                                   '_scheduler-stdout.txt')) as f:
+                self.assertEquals(f.read(), '')
+
+            self.assertIn('submit', self.scheduler.get_detailed_jobinfo(jobid))
+
+    def test_kill(self):
+        with open(os.path.join(self.folder, 'script.sh'), 'w') as f:
+            f.write("sleep 5\n")
+
+        with LocalTransport() as t:
+            self.scheduler.set_transport(t)
+            jobid = self.scheduler.submit_from_script(self.folder,
+                                                      'script.sh')
+            self.assertTrue(self.scheduler.kill(jobid))
+            job = self.get_jobs(t, jobs=[jobid])[jobid]
+            self.assertEquals(job.job_state, job_states.DONE)
+            self.assertFalse(self.scheduler.kill('nonexisting'))
+
+    def test_batch_operations(self):
+        with open(os.path.join(self.folder, 'script.sh'), 'w') as f:
+            f.write("sleep 5\n")
+
+        with LocalTransport() as t:
+            self.scheduler.set_transport(t)
+            jobids = [self.scheduler.submit_from_script(self.folder,
+                                                        'script.sh')
+                      for _ in range(3)]
+
+            jobinfos = self.scheduler.get_detailed_jobinfos(
+                jobids + ['nonexisting'])
+            for jobid in jobids:
+                self.assertIn('Return Code: 0', jobinfos[jobid])
+                self.assertIn('submit', jobinfos[jobid])
+                self.assertIn('job.{}'.format(jobid), jobinfos[jobid])
+            self.assertIn('Return Code: 1', jobinfos['nonexisting'])
+
+            self.assertEquals(
+                self.scheduler.kill_jobs(jobids + ['nonexisting']),
+                dict([(jobid, True) for jobid in jobids] +
+                     [('nonexisting', False)]))
+            jobs = self.get_jobs(t, jobs=jobids)
+            for jobid in jobids:
+                self.assertEquals(jobs[jobid].annotation, "Killed")
+
+
+class TestFailures(MockSchedulerTestCase):
+    """
+    Test the simulated failures.
+    """
+    config = {'failure_rate': 1}
+
+    def test_failure(self):
+        with open(os.path.join(self.folder, 'script.sh'), 'w') as f:
+            f.write("echo done > output.txt\n")
+
+        with LocalTransport() as t:
+            self.scheduler.set_transport(t)
+            jobid = self.scheduler.submit_from_script(self.folder,
+                                                      'script.sh')
+            job = self.scheduler.getJobs(as_dict=True)[jobid]
+            self.assertEquals(job.job_state, job_states.DONE)
+            self.assertEquals(job.exit_status, 1)
+            self.assertFalse(os.path.exists(os.path.join(self.folder,
+                                                         'output.txt')))
+
+    def test_submit_failure(self):
+        os.environ['AIIDA_MOCK_SCHEDULER_SUBMIT_FAILURE_RATE'] = '1'
+        try:
+            scheduler = MockScheduler()
+        finally:
+            del os.environ['AIIDA_MOCK_SCHEDULER_SUBMIT_FAILURE_RATE']
+
+        with LocalTransport() as t:
+            scheduler.set_transport(t)
+            with self.assertRaises(SchedulerError):
+                scheduler.submit_from_script(self.folder, 'script.sh')
+
+    def test_invalid_config(self):
+        os.environ['AIIDA_MOCK_SCHEDULER_QUEUE_DELAY'] = 'soon'
+        try:
+            with self.assertRaises(ValueError):
+                MockScheduler()
+        finally:
+            del os.environ['AIIDA_MOCK_SCHEDULER_QUEUE_DELAY']
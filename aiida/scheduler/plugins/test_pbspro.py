@@ -1061,3 +1061,84 @@ class TestSubmitScript(unittest.TestCase):
                 num_cores_per_mpiproc=23
             )
 
+
+class TestJobArrays(unittest.TestCase):
+    def test_array_submit_script_header(self):
+        from aiida.scheduler.datastructures import JobTemplate
+
+        s = PbsproScheduler()
+
+        job_tmpl = JobTemplate()
+        job_tmpl.job_resource = s.create_job_resource(num_machines=1, num_mpiprocs_per_machine=1)
+        job_tmpl.max_wallclock_seconds = 3600
+
+        header = s._get_array_submit_script_header(job_tmpl, 5)
+        self.assertTrue( '#PBS -J 1-5' in header )
+        self.assertTrue( '#PBS -l walltime=01:00:00' in header )
+
+    def test_array_task_jobid(self):
+        s = PbsproScheduler()
+        self.assertEquals(s._get_array_task_jobid('123[].mycluster', 2),
+                          '123[2].mycluster')
+        self.assertEquals(s._get_array_task_jobid('123.mycluster', 2),
+                          '123[2].mycluster')
+
+
+text_qstat_x_f_to_test = """Job Id: 68351.mycluster
+    Job_Name = pw
+    Job_Owner = user1@mycluster
+    resources_used.cput = 01:02:03
+    resources_used.walltime = 00:31:00
+    job_state = F
+    queue = workq
+    ctime = Mon Apr 22 13:13:53 2013
+    mtime = Mon Apr 22 13:45:10 2013
+    Exit_status = 0
+
+Job Id: 68352.mycluster
+    Job_Name = pw
+    Job_Owner = user1@mycluster
+    job_state = F
+    queue = workq
+    ctime = Mon Apr 22 13:13:53 2013
+    mtime = Mon Apr 22 13:20:00 2013
+    obittime = Mon Apr 22 13:19:58 2013
+    Exit_status = 271
+
+Job Id: 68353.mycluster
+    Job_Name = pw
+    Job_Owner = user1@mycluster
+    job_state = R
+    queue = workq
+    ctime = Mon Apr 22 13:13:53 2013
+"""
+
+
+class TestJobHistory(unittest.TestCase):
+    def test_job_history_command(self):
+        s = PbsproScheduler()
+        self.assertEquals(s._get_job_history_command(jobs=['68351.mycluster']),
+                          "qstat -x -f -t '68351.mycluster'")
+
+    def test_parse_job_history_output(self):
+        import datetime
+
+        s = PbsproScheduler()
+        jobs = s._parse_job_history_output(0, text_qstat_x_f_to_test, '')
+        job_dict = {j.job_id: j for j in jobs}
+
+        job = job_dict['68351.mycluster']
+        self.assertEquals(job.job_state, job_states.DONE)
+        self.assertEquals(job.exit_status, 0)
+        self.assertEquals(job.cpu_time, 3723)
+        self.assertEquals(job.wallclock_time_seconds, 1860)
+        self.assertEquals(job.finish_time,
+                          datetime.datetime(2013, 4, 22, 13, 45, 10))
+
+        job = job_dict['68352.mycluster']
+        self.assertIsNone(job.exit_status)
+        self.assertEquals(job.terminating_signal, 15)
+        self.assertEquals(job.finish_time,
+                          datetime.datetime(2013, 4, 22, 13, 19, 58))
+
+        self.assertIsNone(job_dict['68353.mycluster'].exit_status)
@@ -361,3 +361,21 @@ class TestCommand(unittest.TestCase):
         
         
         
+
+
+class TestJobArrays(unittest.TestCase):
+    def test_parse_array_task_indices(self):
+        self.assertEquals(SgeScheduler._parse_array_task_indices('3'), [3])
+        self.assertEquals(SgeScheduler._parse_array_task_indices('1-4:1'),
+                          [1, 2, 3, 4])
+        self.assertEquals(SgeScheduler._parse_array_task_indices('1,4-8:2'),
+                          [1, 4, 6, 8])
+        with self.assertRaises(ValueError):
+            SgeScheduler._parse_array_task_indices('a-b')
+
+    def test_array_task_jobid(self):
+        sge = SgeScheduler()
+        array_jobid = sge._get_array_jobid('1212299.1-4:1')
+        self.assertEquals(array_jobid, '1212299')
+        self.assertEquals(sge._get_array_task_jobid(array_jobid, 2),
+                          '1212299.2')
@@ -335,5 +335,142 @@ class TestSubmitScript(unittest.TestCase):
 
 
 
+class TestJobArrays(unittest.TestCase):
+    def test_array_submit_script(self):
+        """
+        Test the creation of the submission script of a job array.
+        """
+        from aiida.scheduler.datastructures import JobTemplate
+
+        s = SlurmScheduler()
+
+        job_tmpl = JobTemplate()
+        job_tmpl.job_resource = s.create_job_resource(num_machines=1, num_mpiprocs_per_machine=1)
+        job_tmpl.max_wallclock_seconds = 3600
+
+        submit_script_text = s.get_array_submit_script(job_tmpl, [
+            ('/scratch/aa/bb', '_aiidasubmit.sh', '_scheduler-stdout.txt',
+             '_scheduler-stderr.txt'),
+            ('/scratch/cc/dd', '_aiidasubmit.sh', '_scheduler-stdout.txt',
+             None),
+        ])
+
+        self.assertTrue( submit_script_text.startswith('#!/bin/bash') )
+        self.assertTrue( '#SBATCH --array=1-2' in submit_script_text )
+        self.assertTrue( '#SBATCH --time=01:00:00' in submit_script_text )
+        self.assertTrue( 'case "$SLURM_ARRAY_TASK_ID" in' in submit_script_text )
+        self.assertTrue( "    1) cd '/scratch/aa/bb' && bash '_aiidasubmit.sh'"
+                         " > '_scheduler-stdout.txt'"
+                         " 2> '_scheduler-stderr.txt' ;;" in submit_script_text )
+        self.assertTrue( "    2) cd '/scratch/cc/dd' && bash '_aiidasubmit.sh'"
+                         " > '_scheduler-stdout.txt' 2>&1 ;;" in submit_script_text )
+
+    def test_array_task_jobid(self):
+        s = SlurmScheduler()
+        self.assertEquals(s._get_array_task_jobid('863553', 3), '863553_3')
+
+
+text_sacct_to_test = """863553|RUNNING|0:0|user5|1|32|normal|1800|00:00:00|2013-05-23T10:42:11|2013-05-23T11:44:11|Unknown|bash
+863554|COMPLETED|0:0|user5|2|64|normal|3600|1-02:03:04|2013-05-23T10:42:11|2013-05-23T11:44:11|2013-05-23T12:44:11|pw|x
+863555|CANCELLED by 1234|0:15|user5|1|32|normal|61|01:02.345|2013-05-23T10:42:11|2013-05-23T11:44:11|2013-05-23T11:45:12|pw
+863556|PENDING|0:0|user5|1|32|normal|0|00:00:00|2013-05-23T10:42:11|Unknown|Unknown|pw
+863557|OUT_OF_MEMORY|1:0|user5|1|32|normal|120|00:01:50|2013-05-23T10:42:11|2013-05-23T11:44:11|2013-05-23T11:46:11|pw
+"""
+
+
+class TestJobHistory(unittest.TestCase):
+    def test_job_history_command(self):
+        s = SlurmScheduler()
+
+        command = s._get_job_history_command(jobs=['863553', '863554'])
+        self.assertTrue('sacct' in command)
+        self.assertTrue('--jobs=863553,863554' in command)
+        self.assertTrue('--starttime=1970-01-01T00:00:00' in command)
+        self.assertTrue('JobID,State,ExitCode' in command)
+
+        import time
+        command = s._get_job_history_command(jobs=['863553'],
+                                             since=time.time() - 600)
+        self.assertTrue(
+            '--starttime=now-600seconds' in command or
+            '--starttime=now-601seconds' in command)
+
+    def test_parse_job_history_output(self):
+        s = SlurmScheduler()
+
+        jobs = s._parse_job_history_output(0, text_sacct_to_test, '')
+        job_dict = {j.job_id: j for j in jobs}
+        self.assertEquals(len(job_dict), 5)
+
+        self.assertEquals(job_dict['863553'].job_state, job_states.RUNNING)
+        self.assertIsNone(job_dict['863553'].exit_status)
+        self.assertEquals(job_dict['863556'].job_state, job_states.QUEUED)
+
+        job = job_dict['863554']
+        self.assertEquals(job.job_state, job_states.DONE)
+        self.assertEquals(job.job_substate, 'COMPLETED')
+        self.assertEquals(job.exit_status, 0)
+        self.assertEquals(job.terminating_signal, 0)
+        self.assertEquals(job.wallclock_time_seconds, 3600)
+        self.assertEquals(job.cpu_time, 93784)
+        self.assertEquals(job.num_machines, 2)
+        self.assertEquals(job.finish_time,
+                          datetime.datetime(2013, 5, 23, 12, 44, 11))
+        # The separator in the job name is not split
+        self.assertEquals(job.title, 'pw|x')
+
+        job = job_dict['863555']
+        self.assertEquals(job.job_state, job_states.DONE)
+        self.assertEquals(job.job_substate, 'CANCELLED')
+        self.assertEquals(job.annotation, 'CANCELLED by 1234')
+        self.assertEquals(job.terminating_signal, 15)
+        self.assertEquals(job.cpu_time, 62)
+
+        self.assertEquals(job_dict['863557'].job_state, job_states.DONE)
+        self.assertEquals(job_dict['863557'].exit_status, 1)
+
+
+class TestBatchOperations(unittest.TestCase):
+    def test_kill_jobs(self):
+        scheduler = SlurmScheduler()
+
+        self.assertEquals(scheduler._get_kill_jobs_command(['12', '123']),
+                          'scancel 12 123')
+
+        result = scheduler._parse_kill_jobs_output(['12', '123'], 0, '', '')
+        self.assertEquals(result, {'12': True, '123': True})
+
+        stderr = ("scancel: error: Kill job error on job id 123: "
+                  "Invalid job id specified\n")
+        result = scheduler._parse_kill_jobs_output(['12', '123'], 1, '',
+                                                   stderr)
+        self.assertEquals(result, {'12': True, '123': False})
+
+        result = scheduler._parse_kill_jobs_output(['12', '123'], 1, '',
+                                                   'Unable to contact slurm')
+        self.assertEquals(result, {'12': False, '123': False})
+
+    def test_detailed_jobinfos(self):
+        scheduler = SlurmScheduler()
+
+        command = scheduler._get_detailed_jobinfos_command(['12', '123'])
+        self.assertIn('--jobs=12,123', command)
+
+        fields = scheduler._detailed_jobinfo_format.split(',')
+        header = '|'.join(fields) + '|\n'
+
+        def line(jobid):
+            return '|'.join(jobid if f == 'JobID' else ''
+                            for f in fields) + '|\n'
+
+        stdout = header + line('12') + line('12.batch') + line('123')
+        outputs = scheduler._parse_detailed_jobinfos_output(
+            ['12', '123', '1234'], 0, stdout, '')
+        self.assertEquals(outputs['12'],
+                          (0, header + line('12') + line('12.batch'), ''))
+        self.assertEquals(outputs['123'], (0, header + line('123'), ''))
+        self.assertEquals(outputs['1234'], (0, header, ''))
+
+
 if __name__ == '__main__':        
     unittest.main()
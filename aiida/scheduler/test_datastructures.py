@@ -72,4 +72,50 @@ class TestNodeNumberJobResource(unittest.TestCase):
         with self.assertRaises(ValueError):
             _ = NodeNumberJobResource(num_mpiprocs_per_machine=8, tot_num_mpiprocs=15)
         
-        
\ No newline at end of file
+        
+
+class TestJobInfo(unittest.TestCase):
+    def test_serialize(self):
+        import datetime
+        from aiida.scheduler.datastructures import JobInfo, job_states
+
+        jobinfo = JobInfo()
+        jobinfo.job_id = '12'
+        jobinfo.job_state = job_states.RUNNING
+        jobinfo.title = None
+        jobinfo.submission_time = datetime.datetime(2017, 5, 2, 10, 30)
+        jobinfo.detailedJobinfo = None
+
+        serialized = jobinfo.serialize()
+        # The default fields set to None are not stored
+        self.assertNotIn('title', serialized)
+        self.assertNotIn(' ', serialized)
+
+        loaded = JobInfo()
+        loaded.load_from_serialized(serialized)
+        self.assertEquals(loaded.job_id, '12')
+        self.assertEquals(loaded.job_state, job_states.RUNNING)
+        self.assertIsNone(loaded.title)
+        self.assertEquals(loaded.submission_time, jobinfo.submission_time)
+        self.assertIn('detailedJobinfo', loaded)
+        self.assertEquals(jobinfo.get_changed_fields(loaded), [])
+
+    def test_changed_fields(self):
+        from aiida.scheduler.datastructures import JobInfo, job_states
+
+        jobinfo = JobInfo()
+        jobinfo.job_id = '12'
+        jobinfo.job_state = job_states.QUEUED
+        self.assertEquals(jobinfo.get_changed_fields(None),
+                          ['job_id', 'job_state'])
+
+        new_jobinfo = jobinfo.copy()
+        new_jobinfo.wallclock_time_seconds = 10
+        new_jobinfo.raw_data = ['12', 'PD']
+        # Only volatile fields changed
+        self.assertEquals(new_jobinfo.get_changed_fields(jobinfo), [])
+
+        new_jobinfo.job_state = job_states.RUNNING
+        new_jobinfo.annotation = 'None'
+        self.assertEquals(new_jobinfo.get_changed_fields(jobinfo),
+                          ['annotation', 'job_state'])
@@ -12,6 +12,9 @@ from aiida.common.exceptions import InternalError
 from aiida.common.extendeddicts import FixedFieldsAttributeDict
 
 import os, re, fnmatch, sys  # for glob commands
+import functools
+import threading
+import time
 
 
 magic_check = re.compile('[*?[]')
@@ -71,15 +74,89 @@ def copy_from_remote_to_remote(transportsource,transportdestination,
                                                remotesource,remotedestination,
                                                **kwargs)
 
+# The transports running an operation in each thread, so that only the
+# outermost operations are traced
+_tracing_local = threading.local()
+
+
+def _traced(operation, method):
+    """
+    Wrap a method of a transport, so that its calls are recorded by the
+    :py:data:`aiida.transport.tracing.transport_tracer`.
+    """
+    @functools.wraps(method)
+    def traced_method(self, *args, **kwargs):
+        from aiida.transport.tracing import transport_tracer
+
+        running = _tracing_local.__dict__.setdefault('running', set())
+        if id(self) in running:
+            # Called by another operation of the same transport
+            return method(self, *args, **kwargs)
+
+        running.add(id(self))
+        # Filled by _add_traced_bytes, also from the threads of the transfer
+        self._traced_bytes = traced_bytes = []
+        result = None
+        error = True
+        start = time.time()
+        try:
+            result = method(self, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            running.discard(id(self))
+            self._traced_bytes = None
+            transport_tracer.record(self, operation, time.time() - start,
+                                    args, kwargs, result, error,
+                                    transferred=sum(traced_bytes))
+
+    return traced_method
+
+
+class _TracedTransportType(type):
+    """
+    Metaclass of the transports, wrapping the methods listed in
+    ``_traced_operations`` of each transport class with :py:func:`_traced`.
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        cls = super(_TracedTransportType, mcs).__new__(mcs, name, bases, attrs)
+        for operation in getattr(cls, '_traced_operations', ()):
+            method = attrs.get(operation, None)
+            if callable(method):
+                setattr(cls, operation, _traced(operation, method))
+        return cls
+
+
 class Transport(object):
     """
     Abstract class for a generic transport (ssh, local, ...)
     Contains the set of minimal methods
     """
+    __metaclass__ = _TracedTransportType
+
     # To be defined in the subclass
     # See the ssh or local plugin to see the format
     _valid_auth_params = None
 
+    # The operations recorded by the transport tracer (see
+    # aiida.transport.tracing)
+    _traced_operations = (
+        'open', 'close', 'chdir', 'normalize', 'chmod', 'chown',
+        'copy', 'copyfile', 'copytree', 'copy_from_remote_to_remote',
+        'get', 'getfile', 'gettree', 'put', 'putfile', 'puttree',
+        'put_archive',
+        'get_attribute', 'isdir', 'isfile', 'listdir',
+        'makedirs', 'mkdir', 'remove', 'rename', 'rmdir', 'rmtree',
+        'symlink', 'whoami', 'path_exists', 'glob',
+        'exec_command_wait', 'exec_command_batch',
+    )
+
+    # The exceptions that may leave an open transport unusable, e.g. a
+    # connection lost in the middle of an operation: the transport pool
+    # closes a transport that raised one of them (see aiida.transport.pool)
+    _connection_errors = (EnvironmentError, EOFError)
+
     def __init__(self, *args, **kwargs):
         """
         __init__ method of the Transport base class.
@@ -88,6 +165,11 @@ class Transport(object):
             self.__class__.__name__)
 
         self._logger_extra = None
+        # The pk of the computer, set by the AuthInfo that created the
+        # transport (see aiida.transport.tracing)
+        self._computer_pk = None
+        # The bytes moved by the traced operation running, if any
+        self._traced_bytes = None
 
     def __enter__(self):
         """
@@ -115,6 +197,22 @@ class Transport(object):
         """
         raise NotImplementedError
 
+    def is_alive(self):
+        """
+        Return True if the transport is open and its connection (if any) is
+        still usable, e.g. before reusing a transport that was kept open.
+        The default implementation does not check anything.
+        """
+        return True
+
+    def set_keepalive(self, interval):
+        """
+        Send keep-alive packets every ``interval`` seconds on an open
+        connection, so that it is not dropped while idle (0 to disable).
+        Transports without a network connection just ignore this.
+        """
+        pass
+
     def __repr__(self):
         return '<{}: {}>'.format(self.__class__.__name__, str(self))
 
@@ -136,6 +234,21 @@ class Transport(object):
         """
         self._logger_extra = logger_extra
 
+    def _add_traced_bytes(self, num_bytes):
+        """
+        Report the bytes moved by a transfer to the transport tracer (see
+        aiida.transport.tracing). The transfer methods call it with the
+        sizes they already know, so that the tracer does not need to look
+        at the transferred files again.
+
+        :param num_bytes: the number of bytes transferred
+        """
+        traced_bytes = getattr(self, '_traced_bytes', None)
+        if traced_bytes is not None:
+            # list.append is atomic: this can be called by the threads of
+            # a parallel transfer
+            traced_bytes.append(num_bytes)
+
     @classmethod
     def get_short_doc(self):
         """
@@ -355,6 +468,50 @@ class Transport(object):
         """
         raise NotImplementedError
 
+    def exec_command_batch(self, commands, stop_on_error=False):
+        """
+        Execute several commands and return their results. Each command
+        is executed as exec_command_wait would do, i.e. from the cwd and
+        independently of the others (e.g. a cd in a command does not
+        affect the following ones), without standard input.
+
+        Transports for which each command has a cost (e.g. a round-trip
+        to a remote computer) execute all the commands at once; this
+        default implementation executes them one by one.
+
+        :param commands: a list of commands, given as strings
+        :param stop_on_error: if True, the commands following the first
+            one that fails (non-zero retcode) are not executed
+        :return: a list with a tuple (retcode, stdout, stderr) for each
+            executed command, in the same order; if stop_on_error is True,
+            it can be shorter than the list of commands.
+        """
+        results = []
+        for command in commands:
+            retval, stdout, stderr = self.exec_command_wait(command)
+            results.append((retval, stdout, stderr))
+            if stop_on_error and retval != 0:
+                break
+        return results
+
+    def _start_command(self, command, stdin=None, combine_stderr=False):
+        """
+        Start the command on the shell, from the cwd as exec_command_wait
+        does, but without waiting for it to finish; this is used by the
+        asynchronous transports (see :py:mod:`aiida.transport.asynchronous`)
+        to follow many commands at the same time.
+
+        :param str command: execute the command given as a string
+        :param stdin: (optional) a string or a file-like object with the
+            standard input of the command
+        :param combine_stderr: if True, combine the standard error with the
+            standard output
+        :return: a :py:class:`aiida.transport.asynchronous.RunningCommand`
+        :raise NotImplementedError: if the transport cannot start a command
+            without waiting for it
+        """
+        raise NotImplementedError
+
 
     def get(self, remotepath, localpath, *args, **kwargs):
         """
@@ -543,6 +700,24 @@ class Transport(object):
         raise NotImplementedError
 
 
+    def put_archive(self, upload_list):
+        """
+        Put several local files and folders in the current directory at
+        once, streaming them as a single tar archive that is unpacked by a
+        remote ``tar`` command: this replaces one transfer per file with a
+        single stream.
+
+        :param upload_list: a list of (local absolute path, remote relative
+            path) tuples; they are unpacked in the given order, so that
+            later entries overwrite earlier ones, as with separate ``put``
+            calls
+        :return: True if the files were transferred, False if the remote
+            command failed (e.g. ``tar`` is not available); in this case
+            the files should be transferred one by one.
+        """
+        raise NotImplementedError
+
+
     def remove(self, path):
         """
         Remove the file at the given path. This only works on files;
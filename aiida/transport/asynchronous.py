@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Asynchronous versions of the transport methods, so that a single process can
+have many remote operations in flight at the same time (e.g. on many
+computers), without a thread for each of them.
+
+The methods of an :py:class:`AsyncTransport` return a
+:py:class:`concurrent.futures.Future`. The remote commands of all the
+asynchronous transports are started and then followed by a single thread
+(the :py:data:`transport_loop`), that waits for the output of all of them at
+once. The other operations of a transport (file transfers, listings, ...) are
+run by a thread of that transport, in the order in which they are requested,
+since a transport can only do one of them at a time.
+
+For instance::
+
+    futures = [AsyncTransport(t).exec_command_wait_async('qstat')
+               for t in open_transports]
+    concurrent.futures.wait(futures)
+
+The :py:class:`SyncTransportAdapter` gives back the usual (blocking)
+:py:class:`aiida.transport.Transport` interface on top of an asynchronous
+transport.
+"""
+import errno
+import functools
+import os
+import select
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import aiida.common
+from aiida.transport import Transport
+
+looplogger = aiida.common.aiidalogger.getChild('transport').getChild('loop')
+
+
+class RunningCommand(object):
+    """
+    A remote command started by
+    :py:meth:`aiida.transport.Transport._start_command`, whose output is
+    collected by the :py:class:`TransportLoop`.
+    """
+
+    def filenos(self):
+        """
+        Return the list of file descriptors that become readable when new
+        output is available, or when the command ends.
+        """
+        raise NotImplementedError
+
+    def read_available(self):
+        """
+        Read the output that is available, without blocking.
+        """
+        raise NotImplementedError
+
+    def is_finished(self):
+        """
+        Return True if the command ended and all its output was read.
+        """
+        raise NotImplementedError
+
+    def get_result(self):
+        """
+        Return a tuple with the return value, the standard output and the
+        standard error of the finished command, as exec_command_wait does.
+        """
+        raise NotImplementedError
+
+    def kill(self):
+        """
+        Stop following the command, and terminate it if possible.
+        """
+        raise NotImplementedError
+
+
+class TransportLoop(object):
+    """
+    Follow the running commands of all the asynchronous transports in a
+    single thread, and set the result of their futures when they end.
+    """
+
+    def __init__(self, poll_interval=1.):
+        """
+        :param poll_interval: the maximum time (in seconds) between two
+            checks of the running commands, also if no output arrived
+        """
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._commands = []
+        self._wakeup = None
+
+    def add_command(self, command, future):
+        """
+        Follow a running command, and set the result of the future (see
+        :py:meth:`RunningCommand.get_result`) when it ends.
+
+        :param command: a :py:class:`RunningCommand`
+        :param future: a :py:class:`concurrent.futures.Future`
+        """
+        with self._lock:
+            self._start()
+            self._commands.append((command, future))
+            wakeup = self._wakeup
+        os.write(wakeup[1], 'x')
+
+    def num_commands(self):
+        """
+        Return the number of the running commands that are followed.
+        """
+        with self._lock:
+            return len(self._commands)
+
+    def _start(self):
+        """
+        Start the thread of the loop in the current process, if not running
+        yet (threads do not survive a fork: each process has its own). To be
+        called with the lock acquired.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._commands = []
+        self._wakeup = os.pipe()
+        thread = threading.Thread(target=self._run, args=(self._wakeup[0],),
+                                  name='transport-loop')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, wakeup_fd):
+        while True:
+            with self._lock:
+                commands = list(self._commands)
+
+            filenos = [wakeup_fd]
+            for command, _ in commands:
+                filenos.extend(command.filenos())
+            try:
+                readable, _, _ = select.select(filenos, [], [],
+                                               self._poll_interval)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    looplogger.error("Error while waiting for the running "
+                                     "commands: {}".format(e))
+                continue
+            if wakeup_fd in readable:
+                os.read(wakeup_fd, 4096)
+
+            finished = []
+            for command, future in commands:
+                try:
+                    command.read_available()
+                    if not command.is_finished():
+                        continue
+                    result = command.get_result()
+                except Exception as e:
+                    command.kill()
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finished.append(command)
+
+            if finished:
+                with self._lock:
+                    self._commands = [(command, future) for command, future
+                                      in self._commands
+                                      if command not in finished]
+
+
+class AsyncTransport(object):
+    """
+    Asynchronous version of a transport: each method listed in
+    ``_async_methods`` is also available with the suffix ``_async`` and the
+    same parameters (e.g. ``listdir_async(path)``), and returns a
+    :py:class:`concurrent.futures.Future` of its result.
+
+    The remote commands (``exec_command_wait_async``) are followed by the
+    :py:data:`transport_loop`, if the transport can start them without
+    waiting for them (see
+    :py:meth:`aiida.transport.Transport._start_command`); in this case, the
+    thread of the transport is only used to start them.
+    """
+    _async_methods = (
+        'open', 'close', 'chdir', 'getcwd', 'normalize', 'chmod', 'chown',
+        'copy', 'copyfile', 'copytree', 'copy_from_remote_to_remote',
+        'get', 'getfile', 'gettree', 'put', 'putfile', 'puttree',
+        'get_attribute', 'get_mode', 'isdir', 'isfile', 'listdir',
+        'makedirs', 'mkdir', 'remove', 'rename', 'rmdir', 'rmtree',
+        'symlink', 'whoami', 'path_exists', 'glob', 'exec_command_batch',
+    )
+
+    def __init__(self, transport, loop=None):
+        """
+        :param transport: the (blocking) transport to use
+        :param loop: the :py:class:`TransportLoop` following the running
+            commands; if None, use the :py:data:`transport_loop`
+        """
+        self._transport = transport
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def transport(self):
+        """
+        The underlying (blocking) transport.
+        """
+        return self._transport
+
+    def __getattr__(self, name):
+        suffix = '_async'
+        if name.endswith(suffix) and name[:-len(suffix)] in self._async_methods:
+            method = getattr(self._transport, name[:-len(suffix)])
+            return functools.partial(self._executor.submit, method)
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            self.__class__.__name__, name))
+
+    def __enter__(self):
+        self.open_async().result()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            self.close_async().result()
+        finally:
+            self.shutdown()
+
+    def __str__(self):
+        return "async {}".format(self._transport)
+
+    def exec_command_wait_async(self, command, stdin=None,
+                                combine_stderr=False):
+        """
+        Execute a command and return a future of the tuple (return value,
+        standard output, standard error), as exec_command_wait does.
+
+        :param command: the command to execute
+        :param stdin: (optional) a string or a file-like object with the
+            standard input of the command
+        :param combine_stderr: if True, combine the standard error with the
+            standard output
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        loop = self._loop if self._loop is not None else transport_loop
+
+        def start():
+            try:
+                try:
+                    running = self._transport._start_command(
+                        command, stdin=stdin, combine_stderr=combine_stderr)
+                except NotImplementedError:
+                    # The transport cannot start a command without waiting
+                    # for it: wait for it in the thread of the transport
+                    kwargs = {'stdin': stdin}
+                    if combine_stderr:
+                        kwargs['combine_stderr'] = True
+                    future.set_result(
+                        self._transport.exec_command_wait(command, **kwargs))
+                else:
+                    loop.add_command(running, future)
+            except Exception as e:
+                future.set_exception(e)
+
+        self._executor.submit(start)
+        return future
+
+    def shutdown(self):
+        """
+        Stop the thread of the transport, after the requested operations
+        are done (the running commands are still followed by the loop).
+        """
+        self._executor.shutdown(wait=False)
+
+
+class SyncTransportAdapter(Transport):
+    """
+    The usual (blocking) transport interface on top of an asynchronous
+    transport, i.e. any object with the ``*_async`` methods of
+    :py:class:`AsyncTransport`: each method waits for the result of the
+    corresponding asynchronous method.
+    """
+
+    # The operations are traced by the underlying transport
+    _traced_operations = ()
+
+    def __init__(self, async_transport):
+        super(SyncTransportAdapter, self).__init__()
+        self._async_transport = async_transport
+
+    @property
+    def async_transport(self):
+        """
+        The underlying asynchronous transport.
+        """
+        return self._async_transport
+
+    def __str__(self):
+        return "sync {}".format(self._async_transport)
+
+    def open(self):
+        self._async_transport.open_async().result()
+        return self
+
+    def exec_command_wait(self, command, stdin=None, combine_stderr=False):
+        return self._async_transport.exec_command_wait_async(
+            command, stdin=stdin, combine_stderr=combine_stderr).result()
+
+
+def _get_sync_method(name):
+    """
+    Return a method of the :py:class:`SyncTransportAdapter` waiting for the
+    result of the asynchronous method with the given name.
+    """
+    def method(self, *args, **kwargs):
+        return getattr(self._async_transport, name + '_async')(
+            *args, **kwargs).result()
+
+    method.__name__ = name
+    method.__doc__ = getattr(Transport, name).__doc__
+    return method
+
+
+for _name in AsyncTransport._async_methods:
+    if _name not in SyncTransportAdapter.__dict__:
+        setattr(SyncTransportAdapter, _name, _get_sync_method(_name))
+
+# The loop following the running commands of the asynchronous transports of
+# this process
+transport_loop = TransportLoop()
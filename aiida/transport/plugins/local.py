@@ -16,22 +16,194 @@
 ### in the exact same way as paramiko does already.
 
 import os, shutil, subprocess
+import select
+import sys
 import aiida.transport
 from aiida.transport import FileAttribute
+from aiida.transport.asynchronous import RunningCommand
 import StringIO
 import glob
 from aiida.common import aiidalogger
 
 
+# Request of the Linux ioctl that clones the data blocks of a file into
+# another one (a reflink, e.g. on btrfs or XFS)
+_FICLONE = 0x40049409
+# Maximum number of bytes that Linux transfers with a single sendfile call
+_SENDFILE_MAX_BYTES = 0x7ffff000
+_libc_sendfile = None
+
+
+def _sendfile(out_fd, in_fd, count):
+    """
+    Call the sendfile function of the C library, from the current position
+    of in_fd.
+
+    :return: the number of bytes copied; -1 on errors (errno is set)
+    """
+    global _libc_sendfile
+    import ctypes
+    import ctypes.util
+
+    if _libc_sendfile is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _libc_sendfile = libc.sendfile
+        _libc_sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                                   ctypes.c_void_p, ctypes.c_size_t]
+        _libc_sendfile.restype = ctypes.c_ssize_t
+    return _libc_sendfile(out_fd, in_fd, None, count)
+
+
+def _copy_file_in_kernel(source, destination):
+    """
+    Copy the content of a file without reading it in user space: as a
+    reflink if the filesystem supports it (the data is then shared until
+    one of the files is modified), otherwise with sendfile. Linux only.
+
+    :return: True if the file was copied, False if neither is supported
+        (the destination may then have been truncated)
+    """
+    import ctypes
+    import errno
+    import fcntl
+
+    with open(source, 'rb') as source_file:
+        with open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), _FICLONE,
+                            source_file.fileno())
+                return True
+            except (IOError, OSError):
+                pass
+
+            size = os.fstat(source_file.fileno()).st_size
+            copied = 0
+            while copied < size:
+                sent = _sendfile(destination_file.fileno(),
+                                 source_file.fileno(),
+                                 min(size - copied, _SENDFILE_MAX_BYTES))
+                if sent < 0:
+                    error = ctypes.get_errno()
+                    if copied == 0 and error in (errno.EINVAL, errno.ENOSYS):
+                        return False
+                    raise OSError(error, os.strerror(error))
+                if sent == 0:
+                    # The source file was truncated meanwhile
+                    break
+                copied += sent
+    return True
+
+
+def _copy_file(source, destination, hardlink=False):
+    """
+    Copy the content of a file as shutil.copyfile does, but without copying
+    the data byte by byte when possible (see _copy_file_in_kernel).
+
+    :param hardlink: if True, the destination is first replaced by a hard
+        link to the source (if they are on the same filesystem): the two
+        paths are then the same file, and a change of one changes the other.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        if os.path.abspath(source) != os.path.abspath(destination):
+            # Already a hard link to the source
+            return
+        # Never truncate the source: shutil raises the usual error
+        shutil.copyfile(source, destination)
+
+    if hardlink:
+        if os.path.isfile(destination) or os.path.islink(destination):
+            # Never write into the file, it could be linked to another one
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+
+    if sys.platform.startswith('linux'):
+        try:
+            if _copy_file_in_kernel(source, destination):
+                return
+        except (IOError, OSError):
+            # e.g. the destination is a folder: shutil raises the same
+            # errors as usual
+            pass
+
+    shutil.copyfile(source, destination)
+
+
+def _copy_tree(source, destination, symlinks=False, hardlink=False):
+    """
+    Copy a folder recursively as shutil.copytree does, but copying the
+    files with _copy_file.
+
+    :return: the total size of the files copied
+    """
+    names = os.listdir(source)
+    os.makedirs(destination)
+    errors = []
+    copied = 0
+    for name in names:
+        source_name = os.path.join(source, name)
+        destination_name = os.path.join(destination, name)
+        try:
+            if symlinks and os.path.islink(source_name):
+                os.symlink(os.readlink(source_name), destination_name)
+            elif os.path.isdir(source_name):
+                copied += _copy_tree(source_name, destination_name, symlinks,
+                                     hardlink)
+            else:
+                _copy_file(source_name, destination_name, hardlink)
+                shutil.copystat(source_name, destination_name)
+                copied += os.path.getsize(destination_name)
+        except shutil.Error as e:
+            errors.extend(e.args[0])
+        except EnvironmentError as e:
+            errors.append((source_name, destination_name, str(e)))
+    try:
+        shutil.copystat(source, destination)
+    except OSError as e:
+        errors.append((source, destination, str(e)))
+    if errors:
+        raise shutil.Error(errors)
+    return copied
+
 
 class LocalTransport(aiida.transport.Transport):
     """
     Support copy and command execution on the same host on which AiiDA is running via direct file copy and execution commands.
     """
-    # There are no valid parameters for the local transport
-    _valid_auth_params = []
+    # Valid parameters for the local transport (see the ssh transport)
+    _valid_auth_params = ['hardlink_files']
+
+    @classmethod
+    def _convert_hardlink_files_fromstring(cls, string):
+        """
+        Convert the hardlink_files parameter from string.
+        """
+        from aiida.common.exceptions import ValidationError
+        from aiida.transport.plugins.ssh import convert_to_bool
+
+        try:
+            return convert_to_bool(string)
+        except ValueError:
+            raise ValidationError("hardlink_files must be a boolean")
+
+    @classmethod
+    def _get_hardlink_files_suggestion_string(cls, computer):
+        """
+        Return a suggestion for the specific field.
+        """
+        return "False"
 
     def __init__(self, **kwargs):
+        """
+        :param hardlink_files: (optional, default = False): if True, the
+            files are copied (by put, get and copy) as hard links when
+            possible, instead of as new files. A calculation that modifies
+            its input files in place would then modify the files of the
+            repository too.
+        """
         super(LocalTransport, self).__init__()
 
         # _internal_dir will emulate the concept of working directory
@@ -41,6 +213,7 @@ class LocalTransport(aiida.transport.Transport):
         self._internal_dir = None
         # Just to avoid errors
         self._machine = kwargs.pop('machine', None)
+        self._hardlink_files = kwargs.pop('hardlink_files', False)
         if self._machine and self._machine != 'localhost':
             # TODO: check if we want a different logic
             self.logger.debug('machine was passed, but it is not localhost')
@@ -76,6 +249,12 @@ class LocalTransport(aiida.transport.Transport):
                                    "it is already closed")
         self._is_open = False
 
+    def is_alive(self):
+        """
+        Return True if the transport is open.
+        """
+        return self._is_open
+
     def __str__(self):
         """
         Return a description as a string.
@@ -320,7 +499,8 @@ class LocalTransport(aiida.transport.Transport):
         if os.path.exists(the_destination) and not overwrite:
             raise OSError('Destination already exists: not overwriting it')
 
-        shutil.copyfile(source, the_destination)
+        _copy_file(source, the_destination, self._hardlink_files)
+        self._add_traced_bytes(os.path.getsize(source))
 
     def puttree(self, source, destination, dereference=True, overwrite=True):
         """
@@ -361,7 +541,55 @@ class LocalTransport(aiida.transport.Transport):
 
         the_destination = os.path.join(self.curdir, destination)
 
-        shutil.copytree(source, the_destination, symlinks=not(dereference))
+        self._add_traced_bytes(_copy_tree(
+            source, the_destination, symlinks=not(dereference),
+            hardlink=self._hardlink_files))
+
+    def put_archive(self, upload_list):
+        """
+        Put several local files and folders in the current directory,
+        streaming them as a single tar archive to a ``tar`` command
+        (see :py:meth:`aiida.transport.Transport.put_archive`).
+        """
+        import tarfile
+
+        stdin, stdout, stderr, proc = self._exec_command_internal('tar -xf -')
+        write_error = None
+        sent = 0
+        try:
+            archive = tarfile.open(fileobj=stdin, mode='w|', dereference=True)
+            try:
+                for source, destination in upload_list:
+                    archive.add(source, arcname=destination)
+                sent = sum(member.size for member in archive.members)
+            finally:
+                archive.close()
+        except IOError as e:
+            # Typically the command failed and closed its input (broken
+            # pipe): in this case, the error is reported below
+            write_error = e
+        except Exception:
+            proc.kill()
+            raise
+        finally:
+            try:
+                stdin.close()
+            except IOError:
+                pass
+        stdout.read()
+        stderr_text = stderr.read()
+        retval = proc.wait()
+        if retval == 0 and write_error is not None:
+            raise IOError("Error while streaming to {}: {}".format(
+                self.getcwd(), write_error))
+        if retval != 0:
+            self.logger.warning("Unable to unpack the tar stream in {} "
+                                "(retval={}, stderr={}), transferring each "
+                                "file separately".format(
+                self.getcwd(), retval, stderr_text.strip()))
+            return False
+        self._add_traced_bytes(sent)
+        return True
 
     def rmtree(self, path):
         """
@@ -477,7 +705,8 @@ class LocalTransport(aiida.transport.Transport):
         if os.path.exists(destination) and not overwrite:
             raise OSError('Destination already exists: not overwriting it')
 
-        shutil.copyfile(the_source, destination)
+        _copy_file(the_source, destination, self._hardlink_files)
+        self._add_traced_bytes(os.path.getsize(the_source))
 
     def gettree(self, source, destination, dereference=True, overwrite=True):
         """
@@ -513,7 +742,9 @@ class LocalTransport(aiida.transport.Transport):
             destination = os.path.join(destination, os.path.split(source)[1])
 
         the_source = os.path.join(self.curdir, source)
-        shutil.copytree(the_source, destination, symlinks=not(dereference))
+        self._add_traced_bytes(_copy_tree(
+            the_source, destination, symlinks=not(dereference),
+            hardlink=self._hardlink_files))
 
     def copy(self, source, destination, dereference=False):
         """
@@ -563,7 +794,7 @@ class LocalTransport(aiida.transport.Transport):
                 the_s = os.path.join(self.curdir, s)
                 if self.isfile(s):
                     # With shutil, use the full path (the_s)
-                    shutil.copy(the_s, the_destination)
+                    self._copy_with_mode(the_s, the_destination)
                 else:
                     # With self.copytree, the (possible) relative path is OK
                     self.copytree(s, destination, dereference)
@@ -573,7 +804,7 @@ class LocalTransport(aiida.transport.Transport):
             the_source = os.path.join(self.curdir, source)
             if self.isfile(source):
                 # With shutil, use the full path (the_source)
-                shutil.copy(the_source, the_destination)
+                self._copy_with_mode(the_source, the_destination)
             else:
                 # With self.copytree, the (possible) relative path is OK
                 self.copytree(source, destination, dereference)
@@ -600,7 +831,7 @@ class LocalTransport(aiida.transport.Transport):
         if not os.path.exists(the_source):
             raise OSError("Source not found")
 
-        shutil.copyfile(the_source, the_destination)
+        _copy_file(the_source, the_destination, self._hardlink_files)
 
     def copytree(self, source, destination, dereference=False):
         """
@@ -630,7 +861,18 @@ class LocalTransport(aiida.transport.Transport):
             the_destination = os.path.join(the_destination,
                                            os.path.split(source)[1])
 
-        shutil.copytree(the_source, the_destination, symlinks=not(dereference))
+        _copy_tree(the_source, the_destination, symlinks=not(dereference),
+                   hardlink=self._hardlink_files)
+
+    def _copy_with_mode(self, source, destination):
+        """
+        Copy a file with its permissions, as shutil.copy does (also into
+        a destination folder), but with _copy_file.
+        """
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        _copy_file(source, destination, self._hardlink_files)
+        shutil.copymode(source, destination)
 
     def get_attribute(self, path):
         """
@@ -719,6 +961,45 @@ class LocalTransport(aiida.transport.Transport):
                                 cwd=self.getcwd())
         return proc.stdin, proc.stdout, proc.stderr, proc
 
+    def _start_command(self, command, stdin=None, combine_stderr=False):
+        """
+        Start the specified command without waiting for it to finish (see
+        :py:meth:`aiida.transport.Transport._start_command`).
+
+        :param command: the command to execute
+        :param stdin: (optional,default=None) can be a string or a
+                   file-like object.
+        :param combine_stderr: (optional, default=False) if True, combine
+                   stdout and stderr on the same buffer (i.e., stdout).
+
+        :return: a RunningCommand
+        """
+        import tempfile
+
+        # The standard input is passed through a file, so that the command
+        # cannot block while writing to it
+        stdin_file = tempfile.TemporaryFile()
+        try:
+            if stdin is not None:
+                if isinstance(stdin, basestring):
+                    stdin_file.write(stdin)
+                else:
+                    try:
+                        shutil.copyfileobj(stdin, stdin_file)
+                    except AttributeError:
+                        raise ValueError("stdin can only be either a string "
+                                         "of a file-like object!")
+                stdin_file.seek(0)
+
+            proc = subprocess.Popen(
+                command, shell=True, stdin=stdin_file, stdout=subprocess.PIPE,
+                stderr=(subprocess.STDOUT if combine_stderr
+                        else subprocess.PIPE),
+                cwd=self.getcwd())
+        finally:
+            stdin_file.close()
+        return LocalRunningCommand(proc)
+
     def exec_command_wait(self, command, stdin=None):
         """
         Executes the specified command and waits for it to finish.
@@ -828,3 +1109,53 @@ class LocalTransport(aiida.transport.Transport):
         Check if path exists
         """
         return os.path.exists(os.path.join(self.curdir, path))
+
+
+class LocalRunningCommand(RunningCommand):
+    """
+    A command started by the local transport, whose output is read from the
+    pipes of the process.
+    """
+
+    def __init__(self, proc):
+        self._proc = proc
+        self._stdout_fd = proc.stdout.fileno()
+        self._stderr_fd = (proc.stderr.fileno() if proc.stderr is not None
+                           else None)
+        self._output = {self._stdout_fd: [], self._stderr_fd: []}
+        self._open_fds = set(fd for fd in self._output if fd is not None)
+
+    def filenos(self):
+        return list(self._open_fds)
+
+    def read_available(self):
+        readable, _, _ = select.select(list(self._open_fds), [], [], 0)
+        for fd in readable:
+            data = os.read(fd, 65536)
+            if data:
+                self._output[fd].append(data)
+            else:
+                # End of file
+                self._open_fds.discard(fd)
+
+    def is_finished(self):
+        return not self._open_fds and self._proc.poll() is not None
+
+    def get_result(self):
+        self._close_pipes()
+        return (self._proc.returncode, "".join(self._output[self._stdout_fd]),
+                "".join(self._output[self._stderr_fd]))
+
+    def kill(self):
+        try:
+            self._proc.kill()
+        except OSError:
+            # The process already ended
+            pass
+        self._close_pipes()
+
+    def _close_pipes(self):
+        for pipe in [self._proc.stdout, self._proc.stderr]:
+            if pipe is not None:
+                pipe.close()
+        self._open_fds.clear()
@@ -12,10 +12,13 @@ import StringIO
 import paramiko
 import os
 import glob
+import shutil
+import socket
 
 import aiida.transport
 from aiida.common.utils import escape_for_bash
 from aiida.transport import FileAttribute
+from aiida.transport.asynchronous import RunningCommand
 from aiida.common import aiidalogger
 
 
@@ -40,6 +43,26 @@ def convert_to_bool(string):
     else:
         raise ValueError("Invalid boolean value provided")
 
+def _is_safe_tar_member(member):
+    """
+    Return True if the member of a tar archive is a regular file, a folder
+    or a link that is extracted inside the destination folder (i.e., it
+    has a relative path without '..', and links point inside the archive).
+    """
+    def is_inside(path):
+        path = os.path.normpath(path)
+        return not (os.path.isabs(path) or path == os.pardir or
+                    path.startswith(os.pardir + os.sep))
+
+    if not is_inside(member.name):
+        return False
+    if member.issym():
+        return is_inside(os.path.join(os.path.dirname(member.name),
+                                      member.linkname))
+    if member.islnk():
+        return is_inside(member.linkname)
+    return member.isfile() or member.isdir()
+
 class SshTransport(aiida.transport.Transport):
     """
     Support connection, command execution and data transfer to remote computers via SSH+SFTP.
@@ -67,7 +90,32 @@ class SshTransport(aiida.transport.Transport):
     _valid_auth_params = _valid_connect_params + [
         'load_system_host_keys',
         'key_policy',
+        'tree_transfer',
+        'compression_threshold',
         ]
+
+    # socket.error is an EnvironmentError
+    _connection_errors = aiida.transport.Transport._connection_errors + (
+        paramiko.SSHException,)
+
+    # Ways of transferring folders with gettree and puttree:
+    # 'sftp' transfers the files one by one on the SFTP channel,
+    # 'parallel' on several SFTP channels of the same connection at once,
+    # 'tar' as a single tar stream through a remote command
+    _valid_tree_transfer_modes = ['sftp', 'parallel', 'tar']
+    # Number of SFTP channels used by the 'parallel' tree transfer
+    _tree_transfer_channels = 4
+    # Maximum number of folders created with a single remote mkdir command
+    _mkdir_batch_size = 200
+    # Files larger than this (in bytes) are transferred by getfile and
+    # putfile in chunks, resuming after a dropped connection, and are
+    # verified with a remote checksum
+    _resumable_transfer_threshold = 64 * 1024 * 1024
+    _transfer_chunk_size = 1024 * 1024
+    # Number of times a dropped resumable transfer is resumed
+    _transfer_max_retries = 3
+    # Suffix of the partially transferred files, kept to resume them later
+    _partial_transfer_suffix = '.aiidapart'
     
     @classmethod
     def _convert_username_fromstring(cls, string):
@@ -302,6 +350,48 @@ class SshTransport(aiida.transport.Transport):
         """
         return "RejectPolicy"
     
+    @classmethod
+    def _convert_tree_transfer_fromstring(cls, string):
+        """
+        Convert the tree transfer mode from string.
+        """
+        from aiida.common.exceptions import ValidationError
+
+        if string not in cls._valid_tree_transfer_modes:
+            raise ValidationError("tree_transfer must be one of: {}".format(
+                ", ".join(cls._valid_tree_transfer_modes)))
+        return string
+
+    @classmethod
+    def _get_tree_transfer_suggestion_string(cls, computer):
+        """
+        Return a suggestion for the specific field.
+        """
+        return "parallel"
+
+    @classmethod
+    def _convert_compression_threshold_fromstring(cls, string):
+        """
+        Convert the compression threshold from string.
+        """
+        from aiida.common.exceptions import ValidationError
+
+        try:
+            threshold = int(string)
+        except ValueError:
+            raise ValidationError("compression_threshold must be an integer")
+        if threshold < 0:
+            raise ValidationError("compression_threshold must not be "
+                                  "negative")
+        return threshold
+
+    @classmethod
+    def _get_compression_threshold_suggestion_string(cls, computer):
+        """
+        Return a suggestion for the specific field.
+        """
+        return str(1024 * 1024)
+
     @classmethod
     def _convert_gss_auth_fromstring(cls, string):
         """
@@ -389,6 +479,14 @@ class SshTransport(aiida.transport.Transport):
                 load the system host keys
         :param key_policy: (optional, default = paramiko.RejectPolicy()): the
                 policy to use for unknown keys
+        :param tree_transfer: (optional, default = 'sftp'): how folders are
+                transferred by gettree and puttree: 'sftp' (one file at a
+                time), 'parallel' (on several SFTP channels at once) or
+                'tar' (as a single tar stream)
+        :param compression_threshold: (optional, default = None): files at
+                least this large (in bytes) are compressed with gzip on the
+                remote computer by getfile, and decompressed locally; if
+                None, files are never compressed
         Other parameters valid for the ssh connect function (see the 
         self._valid_connect_params list) are passed to the connect
         function (as port, username, password, ...); taken from the
@@ -419,6 +517,19 @@ class SshTransport(aiida.transport.Transport):
             raise ValueError("Unknown value of the key policy, allowed values "
                              "are: RejectPolicy, WarningPolicy, AutoAddPolicy")
 
+        self._tree_transfer = kwargs.pop('tree_transfer', 'sftp')
+        if self._tree_transfer not in self._valid_tree_transfer_modes:
+            raise ValueError("Unknown value of the tree transfer mode, allowed "
+                             "values are: {}".format(
+                ", ".join(self._valid_tree_transfer_modes)))
+
+        self._compression_threshold = kwargs.pop('compression_threshold', None)
+        if (self._compression_threshold is not None and
+                (not isinstance(self._compression_threshold, (int, long)) or
+                 self._compression_threshold < 0)):
+            raise ValueError("The compression threshold must be a "
+                             "non-negative integer (or None)")
+
         self._connect_args = {}
         for k in self._valid_connect_params:
             try:
@@ -445,8 +556,8 @@ class SshTransport(aiida.transport.Transport):
         
         if self._is_open:
             raise InvalidOperation("Cannot open the transport twice")
-        # Open a SSHClient
-        connection_arguments = self._connect_args
+        # Open a SSHClient (copying the arguments, so that it can be reopened)
+        connection_arguments = dict(self._connect_args)
         proxystring = connection_arguments.pop('proxy_command', None)
         if proxystring is not None:
             proxy = paramiko.ProxyCommand(proxystring)
@@ -489,6 +600,30 @@ class SshTransport(aiida.transport.Transport):
         self._client.close()
         self._is_open = False
 
+    def is_alive(self):
+        """
+        Return True if the transport is open and the underlying SSH
+        connection is still active.
+        """
+        if not self._is_open:
+            return False
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def set_keepalive(self, interval):
+        """
+        Send a keep-alive packet every ``interval`` seconds when the
+        connection is idle (0 to disable).
+
+        :raise InvalidOperation: if the channel is not open
+        """
+        from aiida.common.exceptions import InvalidOperation
+
+        if not self._is_open:
+            raise InvalidOperation("Cannot set the keep-alive interval: "
+                                   "the transport is not open")
+        self._client.get_transport().set_keepalive(interval)
+
     @property
     def sshclient(self):
         if not self._is_open:
@@ -811,7 +946,8 @@ class SshTransport(aiida.transport.Transport):
 
     def putfile(self,localpath,remotepath,callback=None,dereference=True,overwrite=True):
         """
-        Put a file from local to remote.
+        Put a file from local to remote. Large files are transferred in
+        chunks, can be resumed and are verified (see _put_resumable).
 
         :param localpath: an (absolute) local path
         :param remotepath: a remote path
@@ -833,8 +969,14 @@ class SshTransport(aiida.transport.Transport):
 
         if self.isfile(remotepath) and not overwrite:
             raise OSError('Destination already exists: not overwriting it')
-        
-        return self.sftp.put(localpath,remotepath,callback=callback)
+
+        local_size = os.path.getsize(localpath)
+        if local_size >= self._resumable_transfer_threshold:
+            result = self._put_resumable(localpath,remotepath,callback=callback)
+        else:
+            result = self.sftp.put(localpath,remotepath,callback=callback)
+        self._add_traced_bytes(local_size)
+        return result
 
 
     def puttree(self,localpath,remotepath,callback=None,dereference=True,overwrite=True): # by default overwrite
@@ -881,7 +1023,18 @@ class SshTransport(aiida.transport.Transport):
         else: # remotepath exists already: copy the folder inside of it!
             remotepath = os.path.join(remotepath,os.path.split(localpath)[1])
             self.mkdir(remotepath) # create a nested folder
-        
+
+        if self._tree_transfer == 'tar':
+            if self._puttree_tar(localpath, remotepath):
+                return
+            # The remote folder was created above: the files that were
+            # unpacked before the failure are removed
+            self.rmtree(remotepath)
+            self.mkdir(remotepath)
+        elif self._tree_transfer == 'parallel':
+            self._puttree_parallel(localpath, remotepath)
+            return
+
         # TODO, NOTE: we are not using 'onerror' because we checked above that
         # the folder exists, but it would be better to use it
         for this_source in os.walk(localpath):
@@ -903,6 +1056,107 @@ class SshTransport(aiida.transport.Transport):
                 this_remote_file = os.path.join(remotepath,this_basename,this_file)
                 self.putfile(this_local_file,this_remote_file)
 
+    def _puttree_parallel(self, localpath, remotepath):
+        """
+        Put the content of a local folder into an existing remote folder,
+        creating all the remote folders with a few remote commands and
+        transferring the files on several SFTP channels at once.
+        """
+        folders = []
+        transfers = []
+        for this_folder, _, this_files in os.walk(localpath):
+            this_basename = os.path.relpath(path=this_folder, start=localpath)
+            if this_basename != os.curdir:
+                folders.append(os.path.join(remotepath, this_basename))
+            for this_file in this_files:
+                transfers.append(
+                    (os.path.join(this_folder, this_file),
+                     os.path.normpath(os.path.join(remotepath, this_basename,
+                                                   this_file))))
+
+        for start in range(0, len(folders), self._mkdir_batch_size):
+            batch = folders[start:start + self._mkdir_batch_size]
+            retval, stdout, stderr = self.exec_command_wait(
+                "mkdir -p -- {}".format(
+                    " ".join(escape_for_bash(folder) for folder in batch)))
+            if retval != 0:
+                raise IOError("Error while creating the remote folders "
+                              "(retval={}): {}".format(retval, stderr.strip()))
+
+        self._transfer_files_parallel(transfers, upload=True)
+
+    def _puttree_tar(self, localpath, remotepath):
+        """
+        Put the content of a local folder into an existing remote folder,
+        streaming it as a tar archive to a remote ``tar`` command.
+
+        :return: True if the folder was transferred, False if the remote
+            command failed (e.g. ``tar`` is not available); in this case
+            the files should be transferred in another way.
+        """
+        return self._put_tar_stream(
+            [(os.path.join(localpath, entry), entry)
+             for entry in sorted(os.listdir(localpath))], remotepath)
+
+    def put_archive(self, upload_list):
+        """
+        Put several local files and folders in the current directory,
+        streaming them as a single tar archive to a remote ``tar`` command
+        (see :py:meth:`aiida.transport.Transport.put_archive`).
+        """
+        return self._put_tar_stream(upload_list, '.')
+
+    def _put_tar_stream(self, entries, remotepath):
+        """
+        Stream local files and folders as a tar archive to a remote ``tar``
+        command unpacking it in an existing remote folder.
+
+        :param entries: a list of (local path, name in the archive) tuples
+        :param remotepath: the remote folder
+        :return: True if the entries were transferred, False if the remote
+            command failed
+        """
+        import tarfile
+
+        stdin, stdout, stderr, channel = self._exec_command_internal(
+            "tar -xf - -C {}".format(escape_for_bash(remotepath)))
+        write_error = None
+        sent = 0
+        try:
+            archive = tarfile.open(fileobj=stdin, mode='w|', dereference=True)
+            try:
+                for localpath, arcname in entries:
+                    archive.add(localpath, arcname=arcname)
+                sent = sum(member.size for member in archive.members)
+            finally:
+                archive.close()
+            stdin.flush()
+            stdin.channel.shutdown_write()
+        except (IOError, EOFError) as e:
+            # Typically the remote command failed and closed the channel
+            # (socket.error is a subclass of IOError): in this case, the
+            # error is reported below
+            write_error = e
+            try:
+                stdin.channel.shutdown_write()
+            except (IOError, EOFError):
+                pass
+        except Exception:
+            channel.close()
+            raise
+        retval, stderr_text = self._wait_tar_command(stdout, stderr, channel)
+        if retval == 0 and write_error is not None:
+            raise IOError("Error while streaming to {}: {}".format(
+                remotepath, write_error))
+        if retval != 0:
+            self.logger.warning("Unable to unpack the tar stream in {} "
+                                "(retval={}, stderr={}), transferring each "
+                                "file separately".format(
+                remotepath, retval, stderr_text.strip()))
+            return False
+        self._add_traced_bytes(sent)
+        return True
+
 
     def get(self,remotepath,localpath,callback=None,dereference=True,overwrite=True,
             ignore_nonexisting=False):
@@ -975,7 +1229,10 @@ class SshTransport(aiida.transport.Transport):
 
     def getfile(self,remotepath,localpath,callback=None,dereference=True,overwrite=True):
         """
-        Get a file from remote to local.
+        Get a file from remote to local. Files larger than the compression
+        threshold are compressed remotely (see _getfile_compressed); large
+        files are transferred in chunks, can be resumed and are verified
+        (see _get_resumable).
 
         :param remotepath: a remote path
         :param  localpath: an (absolute) local path
@@ -995,18 +1252,251 @@ class SshTransport(aiida.transport.Transport):
 
         if not dereference:
             raise NotImplementedError
+
+        remote_size = self.sftp.stat(remotepath).st_size
+        if (self._compression_threshold is not None and
+                remote_size >= self._compression_threshold and
+                self._getfile_compressed(remotepath,localpath,remote_size,
+                                         callback=callback)):
+            self._add_traced_bytes(remote_size)
+            return
+
+        if remote_size >= self._resumable_transfer_threshold:
+            result = self._get_resumable(remotepath,localpath,callback=callback)
+            self._add_traced_bytes(remote_size)
+            return result
             
         # Workaround for bug #724 in paramiko -- remove localpath on IOError
         try:
-            return self.sftp.get(remotepath,localpath,callback)
+            result = self.sftp.get(remotepath,localpath,callback)
         except IOError as e:
             try:
                 os.remove(localpath)
             except OSError:
                 pass
             raise e
-        
-        
+        self._add_traced_bytes(remote_size)
+        return result
+        
+        
+    def _getfile_compressed(self,remotepath,localpath,remote_size,
+                            callback=None):
+        """
+        Get a file streaming it from a remote ``gzip`` command (with the
+        fastest compression, as the aim is to transfer less data), and
+        decompressing it locally.
+
+        :param remote_size: the size of the remote file, used to verify the
+            transfer and for the callback
+        :param callback: called with the bytes written so far and the total
+            bytes, as for paramiko
+        :return: True if the file was transferred, False if the remote
+            command failed (e.g. ``gzip`` is not available); in this case
+            the file should be transferred in another way.
+        :raise IOError: if the compressed stream is invalid, or the
+            decompressed file does not have the size of the remote one
+        """
+        import zlib
+
+        stdin, stdout, stderr, channel = self._exec_command_internal(
+            "gzip -1 -c -- {}".format(escape_for_bash(remotepath)))
+        stdin.channel.shutdown_write()
+        # 16 + MAX_WBITS: a gzip stream, whose checksum is verified by zlib
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        read_error = None
+        written = 0
+        try:
+            with open(localpath, 'wb') as local_file:
+                while True:
+                    data = stdout.read(self._transfer_chunk_size)
+                    if not data:
+                        break
+                    data = decompressor.decompress(data)
+                    local_file.write(data)
+                    written += len(data)
+                    if callback is not None and data:
+                        callback(written, remote_size)
+                data = decompressor.flush()
+                local_file.write(data)
+                written += len(data)
+        except zlib.error as e:
+            # Typically the remote command failed before sending a valid
+            # stream: in this case, the error is reported below
+            read_error = e
+        except Exception:
+            channel.close()
+            if os.path.exists(localpath):
+                os.remove(localpath)
+            raise
+        retval, stderr_text = self._wait_tar_command(stdout, stderr, channel)
+        if retval != 0:
+            os.remove(localpath)
+            self.logger.warning("Unable to compress {} remotely (retval={}, "
+                                "stderr={}), transferring it "
+                                "uncompressed".format(
+                remotepath, retval, stderr_text.strip()))
+            return False
+        if read_error is not None or written != remote_size:
+            os.remove(localpath)
+            raise IOError("Invalid compressed stream of {}: {}".format(
+                remotepath, read_error or "got {} bytes instead of {}".format(
+                    written, remote_size)))
+        return True
+
+    def _get_resumable(self,remotepath,localpath,callback=None):
+        """
+        Get a file in chunks, first into a partial file next to localpath.
+        If the connection drops, the transport is reopened and the transfer
+        resumes from the end of the partial file, also if getfile is called
+        again later. The file is verified with a remote checksum before
+        being moved to localpath.
+
+        :param remotepath: a remote path
+        :param localpath: an (absolute) local path
+        :param callback: called with the bytes transferred so far and the
+            total bytes, as for paramiko
+
+        :raise IOError: if the checksums of the two files differ (the
+            partial file is then removed)
+        """
+        partial_path = localpath + self._partial_transfer_suffix
+        remote_size = self.sftp.stat(remotepath).st_size
+
+        for attempt in range(self._transfer_max_retries + 1):
+            offset = 0
+            if os.path.isfile(partial_path):
+                offset = os.path.getsize(partial_path)
+                if offset > remote_size:
+                    os.remove(partial_path)
+                    offset = 0
+            try:
+                with self.sftp.open(remotepath, 'rb') as remote_file:
+                    remote_file.seek(offset)
+                    remote_file.prefetch(remote_size)
+                    with open(partial_path, 'ab') as local_file:
+                        while offset < remote_size:
+                            data = remote_file.read(self._transfer_chunk_size)
+                            if not data:
+                                break
+                            local_file.write(data)
+                            offset += len(data)
+                            if callback is not None:
+                                callback(offset, remote_size)
+                break
+            except (socket.error, EOFError, paramiko.SSHException) as e:
+                if attempt == self._transfer_max_retries:
+                    raise
+                self.logger.warning("Connection lost while getting {} ({}), "
+                                    "resuming from byte {}".format(
+                    remotepath, e, offset))
+                self._reopen()
+
+        if not self._check_transferred_file(remotepath, partial_path):
+            # The next transfer starts from zero
+            os.remove(partial_path)
+            raise IOError("Checksum mismatch after getting {} to {}".format(
+                remotepath, localpath))
+        os.rename(partial_path, localpath)
+
+    def _put_resumable(self,localpath,remotepath,callback=None):
+        """
+        Put a file in chunks, first into a partial file next to remotepath.
+        If the connection drops, the transport is reopened and the transfer
+        resumes from the end of the partial file, also if putfile is called
+        again later. The file is verified with a remote checksum before
+        being moved to remotepath.
+
+        :param localpath: an (absolute) local path
+        :param remotepath: a remote path
+        :param callback: called with the bytes transferred so far and the
+            total bytes, as for paramiko
+
+        :raise IOError: if the checksums of the two files differ (the
+            partial file is then removed)
+        """
+        partial_path = remotepath + self._partial_transfer_suffix
+        local_size = os.path.getsize(localpath)
+
+        for attempt in range(self._transfer_max_retries + 1):
+            try:
+                offset = self.sftp.stat(partial_path).st_size
+            except IOError:
+                offset = 0
+            if offset > local_size:
+                offset = 0
+            try:
+                with open(localpath, 'rb') as local_file, \
+                        self.sftp.open(partial_path,
+                                       'r+b' if offset else 'wb') as remote_file:
+                    remote_file.set_pipelined(True)
+                    local_file.seek(offset)
+                    remote_file.seek(offset)
+                    while offset < local_size:
+                        data = local_file.read(self._transfer_chunk_size)
+                        if not data:
+                            break
+                        remote_file.write(data)
+                        offset += len(data)
+                        if callback is not None:
+                            callback(offset, local_size)
+                break
+            except (socket.error, EOFError, paramiko.SSHException) as e:
+                if attempt == self._transfer_max_retries:
+                    raise
+                self.logger.warning("Connection lost while putting {} ({}), "
+                                    "resuming from byte {}".format(
+                    remotepath, e, offset))
+                self._reopen()
+
+        if not self._check_transferred_file(partial_path, localpath):
+            # The next transfer starts from zero
+            self.sftp.remove(partial_path)
+            raise IOError("Checksum mismatch after putting {} to {}".format(
+                localpath, remotepath))
+        retval, stdout, stderr = self.exec_command_wait("mv -f {} {}".format(
+            escape_for_bash(partial_path), escape_for_bash(remotepath)))
+        if retval != 0:
+            raise IOError("Unable to move {} to {}: {}".format(
+                partial_path, remotepath, stderr.strip()))
+
+    def _check_transferred_file(self,remotepath,localpath):
+        """
+        Compare the md5 checksum of a remote and a local file, computed
+        remotely with md5sum (or md5 -q).
+
+        :return: False if the checksums differ, True otherwise; if neither
+            command is available remotely, the check is skipped with a
+            warning and True is returned.
+        """
+        from aiida.common.utils import md5_file
+
+        retval, stdout, stderr = self.exec_command_wait(
+            "md5sum {0} 2>/dev/null || md5 -q {0}".format(
+                escape_for_bash(remotepath)))
+        if retval != 0 or not stdout.split():
+            self.logger.warning("Unable to compute the checksum of {} "
+                                "remotely, the transfer is not "
+                                "verified".format(remotepath))
+            return True
+
+        # md5sum prefixes the checksum with a backslash for some file names
+        remote_md5 = stdout.split()[0].lstrip('\\')
+        return remote_md5 == md5_file(localpath)
+
+    def _reopen(self):
+        """
+        Close (ignoring errors, as the connection may be lost) and reopen
+        the transport, keeping the current directory.
+        """
+        cwd = self.getcwd()
+        try:
+            self.close()
+        except Exception:
+            self._client.close()
+            self._is_open = False
+        self.open()
+        self.chdir(cwd)
+
     def gettree(self,remotepath,localpath,callback=None,dereference=True,overwrite=True):
         """
         Get a folder recursively from remote to local.
@@ -1048,7 +1538,26 @@ class SshTransport(aiida.transport.Transport):
         else: # localpath exists already: copy the folder inside of it!
             localpath = os.path.join(localpath,os.path.split(remotepath)[1])
             os.mkdir(localpath) # create a nested folder
-        
+
+        if self._tree_transfer == 'tar':
+            if self._gettree_tar(remotepath, localpath):
+                return
+            # The local folder was created above: the files that were
+            # extracted before the failure (e.g. if a file changed while
+            # tar was reading it) are removed
+            shutil.rmtree(localpath)
+            os.mkdir(localpath)
+        elif self._tree_transfer == 'parallel':
+            if self._gettree_parallel(remotepath, localpath):
+                return
+
+        self._gettree_sftp(remotepath, localpath)
+
+    def _gettree_sftp(self, remotepath, localpath):
+        """
+        Get the content of a remote folder into an existing local folder,
+        one file at a time.
+        """
         item_list = self.listdir(remotepath)
         dest = str(localpath)
 
@@ -1056,10 +1565,271 @@ class SshTransport(aiida.transport.Transport):
             item = str(item)
 
             if self.isdir( os.path.join(remotepath,item) ):
-                self.gettree( os.path.join(remotepath,item) , os.path.join(dest,item) )
+                os.mkdir( os.path.join(dest,item) )
+                self._gettree_sftp( os.path.join(remotepath,item) , os.path.join(dest,item) )
             else:
                 self.getfile( os.path.join(remotepath,item) , os.path.join(dest,item) )
 
+    def _gettree_parallel(self, remotepath, localpath):
+        """
+        Get the content of a remote folder into an existing local folder,
+        listing the whole remote tree with a single ``find`` command and
+        transferring the files on several SFTP channels at once.
+
+        :return: True if the folder was transferred, False if the remote
+            tree could not be listed; in this case the files should be
+            transferred in another way.
+        """
+        # The folders (always including '.') and then the other files,
+        # separated by an empty name (names are never empty, and the NUL
+        # character cannot be in a name)
+        retval, stdout, stderr = self.exec_command_wait(
+            "cd {} && find -L . -type d -print0 && printf '\\000' && "
+            "find -L . ! -type d -print0".format(escape_for_bash(remotepath)))
+        if retval != 0:
+            self.logger.warning("Unable to list the remote folder {} "
+                                "(retval={}, stderr={}), transferring each "
+                                "file separately".format(
+                remotepath, retval, stderr.strip()))
+            return False
+
+        folders, _, files = stdout.partition('\0\0')
+        folders = [path for path in folders.split('\0') if path]
+        files = [path for path in files.split('\0') if path]
+
+        for folder in folders:
+            folder = os.path.normpath(folder)
+            if folder != os.curdir:
+                os.makedirs(os.path.join(localpath, folder))
+        self._transfer_files_parallel(
+            [(os.path.normpath(os.path.join(remotepath, path)),
+              os.path.normpath(os.path.join(localpath, path)))
+             for path in files],
+            upload=False)
+        return True
+
+    def _gettree_tar(self, remotepath, localpath):
+        """
+        Get the content of a remote folder into an existing local folder,
+        streaming it as a tar archive from a remote ``tar`` command.
+
+        :return: True if the folder was transferred, False if the remote
+            command failed (e.g. ``tar`` is not available); in this case
+            the files should be transferred in another way.
+        """
+        import tarfile
+
+        stdin, stdout, stderr, channel = self._exec_command_internal(
+            "tar -chf - -C {} .".format(escape_for_bash(remotepath)))
+        stdin.channel.shutdown_write()
+        read_error = None
+        received = 0
+        try:
+            archive = tarfile.open(fileobj=stdout, mode='r|')
+            try:
+                for member in archive:
+                    if not _is_safe_tar_member(member):
+                        raise IOError("Refusing to extract the member {} of "
+                                      "the tar stream of {}".format(
+                            member.name, remotepath))
+                    if os.path.normpath(member.name) != os.curdir:
+                        archive.extract(member, localpath)
+                        received += member.size
+            finally:
+                archive.close()
+        except tarfile.TarError as e:
+            # Typically the remote command failed before sending a valid
+            # archive: in this case, the error is reported below
+            read_error = e
+        except Exception:
+            channel.close()
+            raise
+        retval, stderr_text = self._wait_tar_command(stdout, stderr, channel)
+        if retval == 0 and read_error is not None:
+            raise IOError("Invalid tar stream of {}: {}".format(
+                remotepath, read_error))
+        if retval != 0:
+            self.logger.warning("Unable to create the tar stream of {} "
+                                "(retval={}, stderr={}), transferring each "
+                                "file separately".format(
+                remotepath, retval, stderr_text.strip()))
+            return False
+        self._add_traced_bytes(received)
+        return True
+
+    @staticmethod
+    def _wait_tar_command(stdout, stderr, channel):
+        """
+        Wait for a remote command started by the tar (or compressed)
+        transfers to finish.
+
+        :return: a tuple with the return value and the standard error
+        """
+        # Consume what remains of the output, so that the command can exit
+        stdout.read()
+        retval = channel.recv_exit_status()
+        return retval, stderr.read()
+
+    def _transfer_files_parallel(self, transfers, upload):
+        """
+        Transfer files on several SFTP channels of the same SSH connection
+        at once (see ``_tree_transfer_channels``).
+
+        :param transfers: a list of (source, destination) tuples; the
+            remote paths are relative to the current directory
+        :param upload: True to put local files on the remote computer,
+            False to get remote files
+        :raise IOError: the first error that occurred in a transfer (the
+            other transfers are stopped)
+        """
+        import threading
+        import Queue
+
+        if not transfers:
+            return
+
+        pending = Queue.Queue()
+        for transfer in transfers:
+            pending.put(transfer)
+        errors = []
+
+        def worker(sftp):
+            while not errors:
+                try:
+                    source, destination = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    if upload:
+                        attributes = sftp.put(source, destination)
+                        self._add_traced_bytes(attributes.st_size)
+                    else:
+                        sftp.get(source, destination)
+                        self._add_traced_bytes(os.path.getsize(destination))
+                except Exception as e:
+                    if not upload:
+                        # As in getfile, do not leave partial files around
+                        try:
+                            os.remove(destination)
+                        except OSError:
+                            pass
+                    errors.append(e)
+
+        # The SFTP channel of the transport is one of the channels
+        sftp_channels = [self.sftp]
+        extra_channels = []
+        try:
+            num_channels = min(self._tree_transfer_channels, len(transfers))
+            for _ in range(num_channels - 1):
+                try:
+                    sftp = self.sshclient.open_sftp()
+                except Exception as e:
+                    # e.g. the server limits the sessions on a connection
+                    self.logger.debug("Unable to open a further SFTP "
+                                      "channel, using {}: {}".format(
+                        len(sftp_channels), e))
+                    break
+                extra_channels.append(sftp)
+                sftp.chdir(self.getcwd())
+                sftp_channels.append(sftp)
+
+            threads = [threading.Thread(target=worker, args=(sftp,))
+                       for sftp in sftp_channels]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for sftp in extra_channels:
+                sftp.close()
+
+        if errors:
+            raise errors[0]
+
+    def copy_from_remote_to_remote(self, transportdestination,
+                                   remotesource, remotedestination, **kwargs):
+        """
+        Copy files or folders from a remote computer to another remote
+        computer (see
+        :py:meth:`aiida.transport.Transport.copy_from_remote_to_remote`).
+
+        Folders are transferred with gettree and puttree, and therefore with
+        the tree transfer mode of each transport; if both transports use the
+        'tar' mode, a folder is instead streamed directly from a remote
+        ``tar`` command to the other one, without storing it locally.
+        """
+        if (self._tree_transfer == 'tar' and
+                isinstance(transportdestination, SshTransport) and
+                transportdestination._tree_transfer == 'tar' and
+                set(kwargs).issubset(['callback', 'dereference', 'overwrite',
+                                      'ignore_nonexisting']) and
+                kwargs.get('dereference', True) and
+                not self.has_magic(remotesource) and
+                self.isdir(remotesource)):
+            self._copytree_tar_stream(transportdestination, remotesource,
+                                      remotedestination,
+                                      overwrite=kwargs.get('overwrite', True))
+            return
+
+        return super(SshTransport, self).copy_from_remote_to_remote(
+            transportdestination, remotesource, remotedestination, **kwargs)
+
+    def _copytree_tar_stream(self, transportdestination, remotesource,
+                             remotedestination, overwrite=True):
+        """
+        Copy a folder to another computer, piping a remote ``tar`` command
+        creating the archive into a remote ``tar`` command extracting it.
+        The destination is the same as the one of a gettree into a local
+        folder followed by a puttree.
+
+        :raise IOError: if one of the two remote commands fails
+        :raise OSError: if unintentionally overwriting
+        """
+        chunk_size = 1024 * 1024
+
+        if transportdestination.path_exists(remotedestination) and not overwrite:
+            raise OSError("Can't overwrite existing files")
+        if transportdestination.isfile(remotedestination):
+            raise OSError("Cannot copy a directory into a file")
+        if not transportdestination.isdir(remotedestination):
+            transportdestination.mkdir(remotedestination)
+        else:
+            remotedestination = os.path.join(
+                remotedestination,
+                os.path.basename(os.path.normpath(remotesource)))
+            transportdestination.mkdir(remotedestination)
+
+        src_stdin, src_stdout, src_stderr, src_channel = (
+            self._exec_command_internal("tar -chf - -C {} .".format(
+                escape_for_bash(remotesource))))
+        src_stdin.channel.shutdown_write()
+        dst_stdin, dst_stdout, dst_stderr, dst_channel = (
+            transportdestination._exec_command_internal(
+                "tar -xf - -C {}".format(escape_for_bash(remotedestination))))
+        try:
+            while True:
+                data = src_stdout.read(chunk_size)
+                if not data:
+                    break
+                dst_stdin.write(data)
+            dst_stdin.flush()
+            dst_stdin.channel.shutdown_write()
+        except Exception:
+            src_channel.close()
+            dst_channel.close()
+            raise
+
+        src_retval, src_stderr_text = self._wait_tar_command(
+            src_stdout, src_stderr, src_channel)
+        dst_retval, dst_stderr_text = self._wait_tar_command(
+            dst_stdout, dst_stderr, dst_channel)
+        if src_retval != 0 or dst_retval != 0:
+            raise IOError("Error while streaming {} to {} on {} (retval={}, "
+                          "{}; stderr={}, {})".format(
+                remotesource, remotedestination, transportdestination,
+                src_retval, dst_retval, src_stderr_text.strip(),
+                dst_stderr_text.strip()))
+
 
     def get_attribute(self,path):
         """
@@ -1156,8 +1926,9 @@ class SshTransport(aiida.transport.Transport):
                     raise OSError("Can't copy more than one file in the same "
                                   "destination file")
             
-            for s in to_copy_list:
-                self._exec_cp(cp_exe,cp_flags,s,remotedestination)
+            # All the copies are done with a single round-trip
+            self._exec_cp_batch(cp_exe,cp_flags,
+                                [(s,remotedestination) for s in to_copy_list])
 
         else:
             self._exec_cp(cp_exe,cp_flags,remotesource,remotedestination)
@@ -1165,25 +1936,34 @@ class SshTransport(aiida.transport.Transport):
 
     def _exec_cp(self,cp_exe,cp_flags,src,dst):
         # to simplify writing the above copy function
-        command = '{} {} {} {}'.format(cp_exe,cp_flags,escape_for_bash(src),
-                                       escape_for_bash(dst))
+        self._exec_cp_batch(cp_exe,cp_flags,[(src,dst)])
+
+    def _exec_cp_batch(self,cp_exe,cp_flags,copy_list):
+        """
+        Execute a cp command for each (src, dst) tuple of copy_list, with a
+        single remote shell, stopping at the first one that fails.
+        """
+        commands = ['{} {} {} {}'.format(cp_exe,cp_flags,escape_for_bash(src),
+                                         escape_for_bash(dst))
+                    for src, dst in copy_list]
+
+        results = self.exec_command_batch(commands, stop_on_error=True)
 
-        retval,stdout,stderr = self.exec_command_wait(command)
-        
         # TODO : check and fix below
-            
-        if retval == 0:
-            if stderr.strip():
-                self.logger.warning("There was nonempty stderr in the cp "
-                                        "command: {}".format(stderr))
-        else:
-            self.logger.error("Problem executing cp. Exit code: {}, stdout: '{}', "
-                              "stderr: '{}', command: '{}'"
-                              .format(retval, stdout, stderr,command))
-            raise IOError("Error while executing cp. Exit code: {}, "
-                          "stdout: '{}', stderr: '{}', "
-                          "command: '{}'".format(retval, stdout, stderr,
-                                                 command) )
+
+        for command, (retval,stdout,stderr) in zip(commands, results):
+            if retval == 0:
+                if stderr.strip():
+                    self.logger.warning("There was nonempty stderr in the cp "
+                                            "command: {}".format(stderr))
+            else:
+                self.logger.error("Problem executing cp. Exit code: {}, stdout: '{}', "
+                                  "stderr: '{}', command: '{}'"
+                                  .format(retval, stdout, stderr,command))
+                raise IOError("Error while executing cp. Exit code: {}, "
+                              "stdout: '{}', stderr: '{}', "
+                              "command: '{}'".format(retval, stdout, stderr,
+                                                     command) )
 
                 
     def _local_listdir(self,path,pattern=None):
@@ -1323,6 +2103,43 @@ class SshTransport(aiida.transport.Transport):
 
         return stdin, stdout, stderr, channel
 
+    def _start_command(self, command, stdin=None, combine_stderr=False):
+        """
+        Start the specified command without waiting for it to finish (see
+        :py:meth:`aiida.transport.Transport._start_command`).
+
+        :param command: the command to execute
+        :param stdin: (optional,default=None) can be a string or a
+                   file-like object.
+        :param combine_stderr: (optional, default=False) see docstring of
+                   self._exec_command_internal()
+
+        :return: a RunningCommand
+        """
+        ssh_stdin, stdout, stderr, channel = self._exec_command_internal(
+            command, combine_stderr)
+
+        try:
+            if stdin is not None:
+                if isinstance(stdin, basestring):
+                    filelike_stdin = StringIO.StringIO(stdin)
+                else:
+                    filelike_stdin = stdin
+
+                try:
+                    for l in filelike_stdin.readlines():
+                        ssh_stdin.write(l)
+                except AttributeError:
+                    raise ValueError("stdin can only be either a string of a "
+                                     "file-like object!")
+
+            ssh_stdin.flush()
+            ssh_stdin.channel.shutdown_write()
+        except Exception:
+            channel.close()
+            raise
+        return SshRunningCommand(channel)
+
     def exec_command_wait(self,command,stdin=None,combine_stderr=False,
                           bufsize=-1):
         """
@@ -1370,6 +2187,70 @@ class SshTransport(aiida.transport.Transport):
 
         return retval, output_text, stderr_text
 
+    def exec_command_batch(self, commands, stop_on_error=False):
+        """
+        Execute several commands with a single remote shell, i.e. with a
+        single round-trip, and return their results (see
+        :py:meth:`aiida.transport.Transport.exec_command_batch`).
+
+        The commands are sent as a shell script on the standard input. Each
+        command is run in a subshell, and its output is followed by a
+        line with a random marker (and, on the standard output, the return
+        value), used to split the output of the shell.
+
+        :param commands: a list of commands, given as strings
+        :param stop_on_error: if True, the commands following the first
+            one that fails (non-zero retcode) are not executed
+
+        :return: a list with a tuple (retcode, stdout, stderr) for each
+            executed command, in the same order.
+        :raise IOError: if the remote shell did not execute all the commands
+        """
+        import uuid
+
+        commands = list(commands)
+        if not commands:
+            return []
+
+        marker = 'AIIDA-BATCH-{}'.format(uuid.uuid4().hex)
+        script_lines = ['{']
+        for command in commands:
+            # Newlines around the command, in case it ends with a comment
+            script_lines.extend([
+                '(', command, ') < /dev/null',
+                'AIIDA_RETVAL=$?',
+                "printf '\\n%s %d\\n' {} \"$AIIDA_RETVAL\"".format(marker),
+                "printf '\\n%s\\n' {} >&2".format(marker)])
+            if stop_on_error:
+                script_lines.append('[ "$AIIDA_RETVAL" -eq 0 ] || exit 0')
+        script_lines.append('}')
+
+        # The script is sent on the standard input rather than on the command
+        # line, whose length is limited; the shell reads all of it before
+        # running the commands, so that their output cannot fill the
+        # channel while the script is still being sent
+        retval, stdout, stderr = self.exec_command_wait(
+            "sh -c 'eval \"$(cat)\"'", stdin='\n'.join(script_lines) + '\n')
+
+        # The output of the first command, then for each command its return
+        # value followed by the output of the next command
+        pieces = stdout.split('\n{} '.format(marker))
+        outputs = [pieces[0]]
+        retvals = []
+        for piece in pieces[1:]:
+            retval_string, _, output = piece.partition('\n')
+            retvals.append(int(retval_string))
+            outputs.append(output)
+        errors = stderr.split('\n{}\n'.format(marker))
+
+        stopped = stop_on_error and retvals and retvals[-1] != 0
+        if retval != 0 or (len(retvals) != len(commands) and not stopped):
+            raise IOError("The remote shell executed only {} of the {} "
+                          "commands of the batch (retval={}, stderr={})".format(
+                len(retvals), len(commands), retval, errors[-1].strip()))
+
+        return zip(retvals, outputs, errors)
+
     def gotocomputer_command(self, remotedir):
         """
         Specific gotocomputer string to connect to a given remote computer via
@@ -1444,3 +2325,41 @@ class SshTransport(aiida.transport.Transport):
         else:
             return True
     
+
+
+class SshRunningCommand(RunningCommand):
+    """
+    A command started by the ssh transport, whose output is read from its
+    SSH channel.
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self._stdout = []
+        self._stderr = []
+
+    def filenos(self):
+        # paramiko makes the channel readable (through a pipe) when new
+        # output is received, or when the channel is closed
+        return [self._channel.fileno()]
+
+    def read_available(self):
+        while self._channel.recv_ready():
+            self._stdout.append(self._channel.recv(65536))
+        while self._channel.recv_stderr_ready():
+            self._stderr.append(self._channel.recv_stderr(65536))
+
+    def is_finished(self):
+        # The output is received before the end of file
+        return (self._channel.exit_status_ready() and
+                (self._channel.eof_received or self._channel.closed) and
+                not self._channel.recv_ready() and
+                not self._channel.recv_stderr_ready())
+
+    def get_result(self):
+        retval = self._channel.recv_exit_status()
+        self._channel.close()
+        return retval, "".join(self._stdout), "".join(self._stderr)
+
+    def kill(self):
+        self._channel.close()
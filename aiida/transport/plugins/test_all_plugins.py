@@ -741,6 +741,39 @@ class TestPutGetTree(unittest.TestCase):
             t.chdir('..')
             t.rmdir(directory)
 
+    @run_for_all_plugins
+    def test_put_archive(self, custom_transport):
+        import os
+        import shutil
+        import tempfile
+
+        local_dir = tempfile.mkdtemp()
+        remote_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(local_dir, 'folder'))
+            for name, content in [('a', 'a'), ('b', 'b'),
+                                  (os.path.join('folder', 'c'), 'c')]:
+                with open(os.path.join(local_dir, name), 'w') as f:
+                    f.write(content)
+            upload_list = [(os.path.join(local_dir, source), destination)
+                           for source, destination in [
+                               ('a', 'a'), ('folder', 'sub'),
+                               ('a', os.path.join('sub', 'd', 'a')),
+                               # Later entries overwrite earlier ones
+                               ('b', 'a')]]
+
+            with custom_transport as t:
+                t.chdir(remote_dir)
+                self.assertTrue(t.put_archive(upload_list))
+
+            for name, content in [('a', 'b'), (os.path.join('sub', 'c'), 'c'),
+                                  (os.path.join('sub', 'd', 'a'), 'a')]:
+                with open(os.path.join(remote_dir, name)) as f:
+                    self.assertEquals(f.read(), content)
+        finally:
+            shutil.rmtree(local_dir)
+            shutil.rmtree(remote_dir)
+
     @run_for_all_plugins
     def test_put_and_get_overwrite(self, custom_transport):
         import os, shutil
@@ -1298,3 +1331,42 @@ class TestExecuteCommandWait(unittest.TestCase):
 
 
 
+
+class TestExecuteCommandBatch(unittest.TestCase):
+    """
+    Test the execution of several commands at once.
+    """
+
+    @run_for_all_plugins
+    def test_exec_batch(self, custom_transport):
+        with custom_transport as t:
+            t.chdir(t.normalize('/tmp'))
+            results = t.exec_command_batch(
+                ['pwd', 'printf "no newline"', 'echo error >&2; exit 3',
+                 'cd /', 'pwd'])
+            self.assertEquals(len(results), 5)
+            self.assertEquals(results[0], (0, t.getcwd() + '\n', ''))
+            self.assertEquals(results[1], (0, 'no newline', ''))
+            self.assertEquals(results[2], (3, '', 'error\n'))
+            # Each command is executed from the cwd of the transport
+            self.assertEquals(results[4], (0, t.getcwd() + '\n', ''))
+
+    @run_for_all_plugins
+    def test_exec_batch_stop_on_error(self, custom_transport):
+        with custom_transport as t:
+            results = t.exec_command_batch(
+                ['echo 1', 'false', 'echo 2'], stop_on_error=True)
+            self.assertEquals(len(results), 2)
+            self.assertEquals(results[0], (0, '1\n', ''))
+            self.assertEquals(results[1][0], 1)
+
+            self.assertEquals(t.exec_command_batch([]), [])
+
+    @run_for_all_plugins
+    def test_exec_batch_long(self, custom_transport):
+        # Longer than the maximum length of a command line
+        commands = ['echo {} # {}'.format(i, 'x' * 200) for i in range(1000)]
+        with custom_transport as t:
+            results = t.exec_command_batch(commands)
+            self.assertEquals(len(results), 1000)
+            self.assertEquals(results[-1], (0, '999\n', ''))
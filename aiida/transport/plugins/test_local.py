@@ -50,5 +50,42 @@ class TestBasicConnection(unittest.TestCase):
             pass
 
 
+
+class TestFileCopies(unittest.TestCase):
+    """
+    Test the copies of files, with and without hard links.
+    """
+
+    def _check_copies(self, hardlink_files):
+        import os
+        import shutil
+        import tempfile
+
+        folder = tempfile.mkdtemp()
+        try:
+            source = os.path.join(folder, 'source')
+            with open(source, 'w') as f:
+                f.write('content')
+            with LocalTransport(hardlink_files=hardlink_files) as t:
+                t.chdir(folder)
+                t.putfile(source, 'put')
+                t.getfile('put', os.path.join(folder, 'get'))
+                t.copy('get', 'copy')
+                # Copying again over a hard link keeps the source
+                t.putfile(source, 'put')
+
+            for name in ['put', 'get', 'copy']:
+                with open(os.path.join(folder, name)) as f:
+                    self.assertEquals(f.read(), 'content')
+            return os.stat(source).st_nlink
+        finally:
+            shutil.rmtree(folder)
+
+    def test_copies(self):
+        self.assertEquals(self._check_copies(hardlink_files=False), 1)
+
+    def test_hardlinks(self):
+        self.assertEquals(self._check_copies(hardlink_files=True), 4)
+
 if __name__ == '__main__':
     unittest.main()
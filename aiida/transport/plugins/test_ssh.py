@@ -12,10 +12,14 @@ Test ssh plugin on localhost
 """
 import unittest
 import logging
+import os
+import shutil
+import tarfile
+import tempfile
 
 import aiida.transport
 import paramiko
-from aiida.transport.plugins.ssh import SshTransport
+from aiida.transport.plugins.ssh import SshTransport, _is_safe_tar_member
 
 # This will be used by test_all_plugins
 
@@ -43,6 +47,14 @@ class TestBasicConnection(unittest.TestCase):
     def test_invalid_param(self):
         with self.assertRaises(ValueError):
             SshTransport(machine='localhost', invalid_param=True)
+
+    def test_invalid_tree_transfer(self):
+        with self.assertRaises(ValueError):
+            SshTransport(machine='localhost', tree_transfer='invalid')
+
+    def test_invalid_compression_threshold(self):
+        with self.assertRaises(ValueError):
+            SshTransport(machine='localhost', compression_threshold=-1)
                              
 
     def test_auto_add_policy(self):
@@ -64,5 +76,207 @@ class TestBasicConnection(unittest.TestCase):
         logging.disable(logging.NOTSET)
 
 
+class TestTarMembers(unittest.TestCase):
+    """
+    Test the check of the members of the tar streams of gettree.
+    """
+
+    def _get_member(self, name, type=tarfile.REGTYPE, linkname=''):
+        member = tarfile.TarInfo(name)
+        member.type = type
+        member.linkname = linkname
+        return member
+
+    def test_safe_members(self):
+        self.assertTrue(_is_safe_tar_member(self._get_member('./a/b')))
+        self.assertTrue(_is_safe_tar_member(
+            self._get_member('a/b', type=tarfile.DIRTYPE)))
+        self.assertTrue(_is_safe_tar_member(
+            self._get_member('a/b', type=tarfile.SYMTYPE, linkname='../c')))
+        self.assertTrue(_is_safe_tar_member(
+            self._get_member('a/b', type=tarfile.LNKTYPE, linkname='./c')))
+
+    def test_unsafe_members(self):
+        self.assertFalse(_is_safe_tar_member(self._get_member('/etc/passwd')))
+        self.assertFalse(_is_safe_tar_member(self._get_member('a/../../b')))
+        self.assertFalse(_is_safe_tar_member(
+            self._get_member('a', type=tarfile.SYMTYPE, linkname='../b')))
+        self.assertFalse(_is_safe_tar_member(
+            self._get_member('a', type=tarfile.SYMTYPE, linkname='/etc')))
+        self.assertFalse(_is_safe_tar_member(
+            self._get_member('a', type=tarfile.LNKTYPE, linkname='../b')))
+        self.assertFalse(_is_safe_tar_member(
+            self._get_member('a', type=tarfile.CHRTYPE)))
+
+
+class TestTreeTransfer(unittest.TestCase):
+    """
+    Test the tree transfer modes on localhost.
+    """
+
+    def _get_transport(self, tree_transfer):
+        return SshTransport(machine='localhost', timeout=30,
+                            load_system_host_keys=True,
+                            key_policy='AutoAddPolicy',
+                            tree_transfer=tree_transfer)
+
+    def _create_tree(self, path):
+        for folder in ['a', os.path.join('a', 'b'), 'empty']:
+            os.mkdir(os.path.join(path, folder))
+        for filename in ['f', os.path.join('a', 'f'),
+                         os.path.join('a', 'b', 'f')]:
+            with open(os.path.join(path, filename), 'w') as f:
+                f.write(filename)
+
+    def _get_tree(self, path):
+        tree = {}
+        for this_folder, folders, files in os.walk(path):
+            this_basename = os.path.relpath(this_folder, path)
+            tree[this_basename] = sorted(folders)
+            for filename in files:
+                with open(os.path.join(this_folder, filename)) as f:
+                    tree[os.path.join(this_basename, filename)] = f.read()
+        return tree
+
+    def _check_mode(self, tree_transfer):
+        base = tempfile.mkdtemp()
+        try:
+            source = os.path.join(base, 'source')
+            os.mkdir(source)
+            self._create_tree(source)
+            with self._get_transport(tree_transfer) as t:
+                t.puttree(source, os.path.join(base, 'put'))
+                t.gettree(os.path.join(base, 'put'), os.path.join(base, 'get'))
+                # The destination exists: a nested folder is created
+                t.gettree(os.path.join(base, 'put'), os.path.join(base, 'get'))
+                with self._get_transport(tree_transfer) as t2:
+                    t.copy_from_remote_to_remote(
+                        t2, os.path.join(base, 'get'),
+                        os.path.join(base, 'copy'))
+
+            expected = self._get_tree(source)
+            self.assertEquals(self._get_tree(os.path.join(base, 'put')),
+                              expected)
+            self.assertEquals(self._get_tree(os.path.join(base, 'get', 'put')),
+                              expected)
+            self.assertEquals(
+                self._get_tree(os.path.join(base, 'copy', 'put')), expected)
+        finally:
+            shutil.rmtree(base)
+
+    def test_sftp(self):
+        self._check_mode('sftp')
+
+    def test_parallel(self):
+        self._check_mode('parallel')
+
+    def test_tar(self):
+        self._check_mode('tar')
+
+    def test_tar_fallback(self):
+        base = tempfile.mkdtemp()
+
+        def partial_transfer(source, destination):
+            # The tar command fails after a part of the tree was unpacked
+            os.mkdir(os.path.join(destination, 'a'))
+            with open(os.path.join(destination, 'f'), 'w') as f:
+                f.write('partial')
+            return False
+
+        try:
+            source = os.path.join(base, 'source')
+            os.mkdir(source)
+            self._create_tree(source)
+            with self._get_transport('tar') as t:
+                t._puttree_tar = partial_transfer
+                t._gettree_tar = partial_transfer
+                t.puttree(source, os.path.join(base, 'put'))
+                t.gettree(os.path.join(base, 'put'), os.path.join(base, 'get'))
+
+            expected = self._get_tree(source)
+            self.assertEquals(self._get_tree(os.path.join(base, 'put')),
+                              expected)
+            self.assertEquals(self._get_tree(os.path.join(base, 'get')),
+                              expected)
+        finally:
+            shutil.rmtree(base)
+
+
+
+class TestResumableTransfer(unittest.TestCase):
+    """
+    Test the chunked transfers of large files on localhost.
+    """
+
+    def test_resume_and_checksum(self):
+        content = ''.join(str(i) for i in range(1000))
+        base = tempfile.mkdtemp()
+        try:
+            source = os.path.join(base, 'source')
+            with open(source, 'w') as f:
+                f.write(content)
+
+            with SshTransport(machine='localhost', timeout=30,
+                              load_system_host_keys=True,
+                              key_policy='AutoAddPolicy') as t:
+                t._resumable_transfer_threshold = 1
+                t._transfer_chunk_size = 100
+
+                # A partial file left by a previous transfer is resumed
+                put = os.path.join(base, 'put')
+                with open(put + t._partial_transfer_suffix, 'w') as f:
+                    f.write(content[:250])
+                progress = []
+                t.putfile(source, put,
+                          callback=lambda done, total: progress.append(done))
+                self.assertEquals(progress[0], 350)
+                self.assertEquals(progress[-1], len(content))
+
+                # A corrupted partial file is detected and removed
+                get = os.path.join(base, 'get')
+                with open(get + t._partial_transfer_suffix, 'w') as f:
+                    f.write('x' * 250)
+                with self.assertRaises(IOError):
+                    t.getfile(put, get)
+                self.assertFalse(
+                    os.path.exists(get + t._partial_transfer_suffix))
+                t.getfile(put, get)
+
+            for path in [put, get]:
+                with open(path) as f:
+                    self.assertEquals(f.read(), content)
+            self.assertEquals(sorted(os.listdir(base)),
+                              ['get', 'put', 'source'])
+        finally:
+            shutil.rmtree(base)
+
+
+class TestCompressedTransfer(unittest.TestCase):
+    """
+    Test the files retrieved compressed on localhost.
+    """
+
+    def test_getfile_compressed(self):
+        content = '\n'.join('line {}'.format(i) for i in range(10000))
+        base = tempfile.mkdtemp()
+        try:
+            source = os.path.join(base, 'source')
+            with open(source, 'w') as f:
+                f.write(content)
+
+            progress = []
+            with SshTransport(machine='localhost', timeout=30,
+                              load_system_host_keys=True,
+                              key_policy='AutoAddPolicy',
+                              compression_threshold=0) as t:
+                t.getfile(source, os.path.join(base, 'get'),
+                          callback=lambda done, total: progress.append(done))
+
+            with open(os.path.join(base, 'get')) as f:
+                self.assertEquals(f.read(), content)
+            self.assertEquals(progress[-1], len(content))
+        finally:
+            shutil.rmtree(base)
+
 if __name__ == '__main__': 
     unittest.main()
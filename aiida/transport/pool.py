@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+A pool of open transports, so that the connections to the computers (and
+e.g. the SSH handshake and authentication) are reused across the daemon
+tasks instead of being opened again every time.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import aiida.common
+
+poollogger = aiida.common.aiidalogger.getChild('transport').getChild('pool')
+
+
+class TransportPool(object):
+    """
+    Keep transports open between uses, one pool of idle transports for each
+    authinfo.
+
+    Idle transports are kept alive with keep-alive packets, checked (and
+    reopened if needed) before being reused, and closed after
+    ``idle_timeout`` seconds without use. The number of transports open at
+    the same time to each computer, for all users together, is limited by
+    ``computer.get_max_transport_sessions()``: when the limit is reached,
+    idle transports of other users are closed, or the request waits for a
+    transport to be released.
+
+    Transports are obtained with :py:meth:`request_transport`::
+
+        with transport_pool.request_transport(authinfo) as t:
+            t.chdir(...)
+
+    The pool is thread-safe, but it is not shared between processes.
+    """
+
+    def __init__(self, keepalive_interval=None, idle_timeout=None):
+        """
+        :param keepalive_interval: interval (in seconds) between keep-alive
+            packets; if None, use the ``daemon.transport_keepalive_interval``
+            property
+        :param idle_timeout: time (in seconds) after which idle transports
+            are closed; if None, use the ``daemon.transport_idle_timeout``
+            property
+        """
+        self._keepalive_interval = keepalive_interval
+        self._idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        # key -> list of (transport, initial directory, release time)
+        self._idle = {}
+        # id(transport) -> (key, transport, initial directory), for the
+        # transports in use
+        self._in_use = {}
+        # computer pk -> number of open transports (idle or in use)
+        self._open_count = {}
+
+    @property
+    def keepalive_interval(self):
+        if self._keepalive_interval is None:
+            from aiida.common.setup import get_property
+            return get_property("daemon.transport_keepalive_interval")
+        return self._keepalive_interval
+
+    @property
+    def idle_timeout(self):
+        if self._idle_timeout is None:
+            from aiida.common.setup import get_property
+            return get_property("daemon.transport_idle_timeout")
+        return self._idle_timeout
+
+    @staticmethod
+    def _get_key(authinfo):
+        """
+        Return the key identifying the transports of the given authinfo.
+        It includes the transport configuration, so that transports opened
+        before a change of the configuration are not reused.
+        """
+        from aiida.orm.computer import Computer
+
+        computer = Computer(dbcomputer=authinfo.dbcomputer)
+        params = json.dumps([computer.get_transport_params(),
+                             authinfo.get_auth_params()], sort_keys=True)
+        return (computer.pk, authinfo.aiidauser_id,
+                computer.get_transport_type(), computer.get_hostname(),
+                params)
+
+    @staticmethod
+    def _get_max_sessions(authinfo):
+        """
+        Return the maximum number of transports open at the same time to the
+        computer of the given authinfo, or None if there is no limit.
+        """
+        from aiida.orm.computer import Computer
+
+        return Computer(
+            dbcomputer=authinfo.dbcomputer).get_max_transport_sessions()
+
+    def _close(self, transport):
+        try:
+            transport.close()
+        except Exception as e:
+            poollogger.debug("Error closing transport {}: {}".format(
+                transport, e))
+
+    def _pop_expired(self, now):
+        """
+        Remove from the pool the transports idle for too long, and return
+        them. To be called with the condition acquired.
+        """
+        expired = []
+        idle_timeout = self.idle_timeout
+        for key, idle in self._idle.items():
+            keep = []
+            for item in idle:
+                if now - item[2] > idle_timeout:
+                    expired.append(item[0])
+                    self._open_count[key[0]] -= 1
+                else:
+                    keep.append(item)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    def _pop_idle_of_computer(self, computer_pk):
+        """
+        Remove from the pool the least recently used idle transport of the
+        given computer (of any user), and return it; return None if there
+        is none. To be called with the condition acquired.
+        """
+        candidates = [(idle[0][2], key) for key, idle in self._idle.iteritems()
+                      if key[0] == computer_pk]
+        if not candidates:
+            return None
+        _, key = min(candidates)
+        transport = self._idle[key].pop(0)[0]
+        if not self._idle[key]:
+            del self._idle[key]
+        self._open_count[computer_pk] -= 1
+        return transport
+
+    def get_transport(self, authinfo, block=True):
+        """
+        Return an open transport for the given authinfo, reusing an idle one
+        if possible. It has to be given back with
+        :py:meth:`release_transport`; prefer :py:meth:`request_transport`.
+
+        :param authinfo: the DbAuthInfo of the user and the computer
+        :param block: if False and the limit of sessions of the computer is
+            reached, return None instead of waiting
+        :return: an open transport, with the current directory set to the
+            directory where it was opened, or None
+        """
+        key = self._get_key(authinfo)
+        computer_pk = key[0]
+        max_sessions = self._get_max_sessions(authinfo)
+
+        while True:
+            to_close = []
+            reused = None
+            must_open = False
+            with self._condition:
+                while True:
+                    to_close.extend(self._pop_expired(time.time()))
+                    if self._idle.get(key):
+                        reused = self._idle[key].pop()
+                        if not self._idle[key]:
+                            del self._idle[key]
+                        break
+                    open_count = self._open_count.get(computer_pk, 0)
+                    if max_sessions is None or open_count < max_sessions:
+                        self._open_count[computer_pk] = open_count + 1
+                        must_open = True
+                        break
+                    # Make room by closing an idle transport of another user
+                    evicted = self._pop_idle_of_computer(computer_pk)
+                    if evicted is not None:
+                        to_close.append(evicted)
+                        continue
+                    if not block:
+                        break
+                    self._condition.wait()
+
+            for transport in to_close:
+                self._close(transport)
+
+            if reused is not None:
+                transport, initial_dir, _ = reused
+                try:
+                    if not transport.is_alive():
+                        raise IOError("connection lost")
+                    # This also checks that the connection still works
+                    transport.chdir(initial_dir)
+                except Exception as e:
+                    poollogger.info("Reopening transport {}, the connection "
+                                    "was lost: {}".format(transport, e))
+                    self._close(transport)
+                    with self._condition:
+                        self._open_count[computer_pk] -= 1
+                        self._condition.notify_all()
+                    continue
+                break
+            elif must_open:
+                from aiida.daemon.metrics import daemon_metrics
+
+                try:
+                    with daemon_metrics.timer('transport'):
+                        transport = authinfo.get_transport()
+                        transport.open()
+                    initial_dir = transport.getcwd()
+                    if self.keepalive_interval:
+                        transport.set_keepalive(self.keepalive_interval)
+                except Exception:
+                    with self._condition:
+                        self._open_count[computer_pk] -= 1
+                        self._condition.notify_all()
+                    raise
+                break
+            else:
+                return None
+
+        with self._condition:
+            self._in_use[id(transport)] = (key, transport, initial_dir)
+        return transport
+
+    def release_transport(self, transport, discard=False):
+        """
+        Give back a transport obtained with :py:meth:`get_transport`.
+
+        :param transport: the transport
+        :param discard: if True, close the transport instead of keeping it
+            open for later use (e.g. after an error that may have left it in
+            an inconsistent state)
+        """
+        with self._condition:
+            key, _, initial_dir = self._in_use.pop(id(transport))
+            if discard or not transport.is_alive():
+                self._open_count[key[0]] -= 1
+            else:
+                transport._set_logger_extra(None)
+                self._idle.setdefault(key, []).append(
+                    (transport, initial_dir, time.time()))
+                transport = None
+            self._condition.notify_all()
+
+        if transport is not None:
+            self._close(transport)
+
+    @contextmanager
+    def request_transport(self, authinfo):
+        """
+        Context manager returning an open transport for the given authinfo,
+        that is given back to the pool at the end. It is closed instead if
+        its connection was lost, or if the block raised a transport error
+        (see :py:func:`is_connection_error`), after which the transport
+        may be in an inconsistent state.
+        """
+        transport = self.get_transport(authinfo)
+        discard = False
+        try:
+            yield transport
+        except Exception as e:
+            discard = is_connection_error(transport, e)
+            if discard:
+                poollogger.info("Closing transport {} after the error: "
+                                "{}".format(transport, e))
+            raise
+        finally:
+            self.release_transport(transport, discard=discard)
+
+    def close_expired(self):
+        """
+        Close the transports that have been idle for more than
+        ``idle_timeout`` seconds.
+        """
+        with self._condition:
+            to_close = self._pop_expired(time.time())
+            self._condition.notify_all()
+
+        for transport in to_close:
+            self._close(transport)
+
+    def close_idle(self):
+        """
+        Close all the idle transports.
+        """
+        with self._condition:
+            to_close = []
+            for key, idle in self._idle.iteritems():
+                to_close.extend(item[0] for item in idle)
+                self._open_count[key[0]] -= len(idle)
+            self._idle = {}
+            self._condition.notify_all()
+
+        for transport in to_close:
+            self._close(transport)
+
+
+def is_connection_error(transport, exception):
+    """
+    Return True if an exception raised while using a transport may have
+    left it unusable, so that it should not be reused (see
+    ``Transport._connection_errors``).
+    """
+    return isinstance(exception, getattr(transport, '_connection_errors', ()))
+
+
+# The pool used by the daemon
+transport_pool = TransportPool()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from concurrent.futures import wait
+
+from aiida.transport.asynchronous import (AsyncTransport,
+                                          SyncTransportAdapter, TransportLoop)
+from aiida.transport.plugins.local import LocalTransport
+
+
+class BlockingLocalTransport(LocalTransport):
+    """
+    A local transport that cannot start commands without waiting for them.
+    """
+
+    def _start_command(self, command, stdin=None, combine_stderr=False):
+        raise NotImplementedError
+
+
+class TestAsyncTransport(unittest.TestCase):
+    """
+    Test the asynchronous transports on the local transport.
+    """
+
+    def setUp(self):
+        self.loop = TransportLoop(poll_interval=0.1)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_concurrent_commands(self):
+        """
+        The commands run at the same time, without a thread each.
+        """
+        with AsyncTransport(LocalTransport(), loop=self.loop) as t:
+            start = time.time()
+            futures = [t.exec_command_wait_async('sleep 1; echo {}'.format(i))
+                       for i in range(50)]
+            wait(futures, timeout=30)
+            self.assertLess(time.time() - start, 10)
+            self.assertEquals([f.result() for f in futures],
+                              [(0, '{}\n'.format(i), '') for i in range(50)])
+        self.assertEquals(self.loop.num_commands(), 0)
+
+    def test_command_output(self):
+        with AsyncTransport(LocalTransport(), loop=self.loop) as t:
+            t.chdir_async(self.folder).result()
+            self.assertEquals(
+                t.exec_command_wait_async('pwd').result(),
+                (0, os.path.realpath(self.folder) + '\n', ''))
+            self.assertEquals(
+                t.exec_command_wait_async('cat; echo err >&2; exit 3',
+                                          stdin='in\n').result(),
+                (3, 'in\n', 'err\n'))
+            self.assertEquals(
+                t.exec_command_wait_async('echo err >&2',
+                                          combine_stderr=True).result(),
+                (0, 'err\n', ''))
+            # A large output, read in several chunks
+            retval, stdout, _ = t.exec_command_wait_async(
+                'head -c 1000000 /dev/zero').result()
+            self.assertEquals(len(stdout), 1000000)
+
+    def test_operations(self):
+        with AsyncTransport(LocalTransport(), loop=self.loop) as t:
+            t.chdir_async(self.folder).result()
+            futures = [t.mkdir_async('dir{}'.format(i)) for i in range(5)]
+            wait(futures)
+            self.assertEquals(sorted(t.listdir_async('.').result()),
+                              ['dir{}'.format(i) for i in range(5)])
+            with self.assertRaises(OSError):
+                t.mkdir_async('dir0').result()
+            with self.assertRaises(AttributeError):
+                t.invalid_async
+
+    def test_blocking_transport(self):
+        """
+        The commands of a transport that cannot start them are run by the
+        thread of the transport.
+        """
+        with AsyncTransport(BlockingLocalTransport(), loop=self.loop) as t:
+            self.assertEquals(t.exec_command_wait_async('echo 1').result(),
+                              (0, '1\n', ''))
+        self.assertEquals(self.loop.num_commands(), 0)
+
+    def test_sync_adapter(self):
+        async_transport = AsyncTransport(LocalTransport(), loop=self.loop)
+        with SyncTransportAdapter(async_transport) as t:
+            t.chdir(self.folder)
+            self.assertEquals(t.getcwd(), self.folder)
+            t.mkdir('dir')
+            self.assertTrue(t.isdir('dir'))
+            self.assertEquals(t.exec_command_wait('ls'), (0, 'dir\n', ''))
+        async_transport.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
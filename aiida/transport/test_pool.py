@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+import unittest
+
+from aiida.transport.plugins.local import LocalTransport
+from aiida.transport.pool import TransportPool
+
+
+class FakeAuthInfo(object):
+    """
+    Stand-in for a DbAuthInfo, giving local transports.
+    """
+
+    def __init__(self, computer_pk, user_pk):
+        self.computer_pk = computer_pk
+        self.user_pk = user_pk
+        self.num_opened = 0
+
+    def get_transport(self):
+        self.num_opened += 1
+        return LocalTransport()
+
+
+class LocalTransportPool(TransportPool):
+    """
+    A pool that does not need the database.
+    """
+
+    def __init__(self, max_sessions=None, **kwargs):
+        super(LocalTransportPool, self).__init__(
+            keepalive_interval=0, **kwargs)
+        self.max_sessions = max_sessions
+
+    @staticmethod
+    def _get_key(authinfo):
+        return (authinfo.computer_pk, authinfo.user_pk)
+
+    def _get_max_sessions(self, authinfo):
+        return self.max_sessions
+
+
+class TestTransportPool(unittest.TestCase):
+    """
+    Test the reuse of transports, and the limit of sessions per computer.
+    """
+
+    def test_reuse(self):
+        pool = LocalTransportPool(idle_timeout=3600)
+        authinfo = FakeAuthInfo(1, 1)
+
+        with pool.request_transport(authinfo) as t:
+            initial_dir = t.getcwd()
+            t.chdir('/')
+        with pool.request_transport(authinfo) as t2:
+            self.assertIs(t2, t)
+            self.assertEquals(t2.getcwd(), initial_dir)
+        self.assertEquals(authinfo.num_opened, 1)
+
+        # A closed transport is replaced by a new one
+        t.close()
+        with pool.request_transport(authinfo) as t3:
+            self.assertIsNot(t3, t)
+            self.assertTrue(t3.is_alive())
+        self.assertEquals(authinfo.num_opened, 2)
+
+        pool.close_idle()
+        self.assertFalse(t3.is_alive())
+
+    def test_discard_after_error(self):
+        pool = LocalTransportPool(idle_timeout=3600)
+        authinfo = FakeAuthInfo(1, 1)
+
+        # An error unrelated to the transport: it is reused
+        with self.assertRaises(ValueError):
+            with pool.request_transport(authinfo) as t:
+                raise ValueError("invalid input")
+        self.assertTrue(t.is_alive())
+
+        # A transport error: it is closed, even if it looks alive
+        with self.assertRaises(IOError):
+            with pool.request_transport(authinfo) as t2:
+                self.assertIs(t2, t)
+                raise IOError("connection reset")
+        self.assertFalse(t.is_alive())
+
+        with pool.request_transport(authinfo) as t3:
+            self.assertIsNot(t3, t)
+        self.assertEquals(authinfo.num_opened, 2)
+        pool.close_idle()
+
+    def test_idle_timeout(self):
+        pool = LocalTransportPool(idle_timeout=0)
+        authinfo = FakeAuthInfo(1, 1)
+
+        with pool.request_transport(authinfo) as t:
+            pass
+        pool.close_expired()
+        self.assertFalse(t.is_alive())
+
+    def test_max_sessions(self):
+        pool = LocalTransportPool(max_sessions=1, idle_timeout=3600)
+        authinfo = FakeAuthInfo(1, 1)
+        other_user = FakeAuthInfo(1, 2)
+        other_computer = FakeAuthInfo(2, 1)
+
+        t = pool.get_transport(authinfo)
+        self.assertIsNone(pool.get_transport(authinfo, block=False))
+        self.assertIsNone(pool.get_transport(other_user, block=False))
+        t_other = pool.get_transport(other_computer, block=False)
+        self.assertIsNotNone(t_other)
+        pool.release_transport(t_other)
+
+        # The idle transport of another user is closed to make room
+        pool.release_transport(t)
+        t2 = pool.get_transport(other_user, block=False)
+        self.assertIsNotNone(t2)
+        self.assertFalse(t.is_alive())
+        pool.release_transport(t2, discard=True)
+        self.assertFalse(t2.is_alive())
+        pool.close_idle()
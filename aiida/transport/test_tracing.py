@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+import os
+import shutil
+import tempfile
+import unittest
+
+from aiida.transport.plugins.local import LocalTransport
+from aiida.transport.tracing import TransportTracer, LATENCY_BUCKETS
+import aiida.transport.tracing
+
+
+class TestTransportTracer(unittest.TestCase):
+    """
+    Test the recording of the operations of the transports.
+    """
+
+    def setUp(self):
+        self.tracer = TransportTracer()
+        self.original_tracer = aiida.transport.tracing.transport_tracer
+        aiida.transport.tracing.transport_tracer = self.tracer
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        aiida.transport.tracing.transport_tracer = self.original_tracer
+        shutil.rmtree(self.folder)
+
+    def test_operations(self):
+        source = os.path.join(self.folder, 'source')
+        with open(source, 'w') as f:
+            f.write('x' * 100)
+
+        with LocalTransport() as t:
+            t._computer_pk = 7
+            t._set_logger_extra({'objpk': 42})
+            t.chdir(self.folder)
+            t.putfile(source, 'put')
+            # get calls getfile: only the outermost operation is recorded
+            t.get('put', os.path.join(self.folder, 'get'))
+            t.exec_command_wait('echo hello')
+            with self.assertRaises(IOError):
+                t.getfile('nonexisting', os.path.join(self.folder, 'none'))
+
+        # The transport was opened before its computer was set
+        self.assertEquals(sorted(self.tracer.get_histograms(None)), ['open'])
+        histograms = self.tracer.get_histograms(7)
+        self.assertEquals(
+            sorted(histograms),
+            ['chdir', 'close', 'exec_command_wait echo', 'get', 'getfile',
+             'putfile'])
+        self.assertEquals(histograms['putfile']['bytes'], 100)
+        self.assertEquals(histograms['get']['bytes'], 100)
+        self.assertEquals(histograms['exec_command_wait echo']['bytes'], 6)
+        self.assertEquals(histograms['getfile']['errors'], 1)
+        self.assertEquals(len(histograms['get']['buckets']),
+                          len(LATENCY_BUCKETS) + 1)
+        self.assertEquals(sum(histograms['get']['buckets']), 1)
+
+        recent = self.tracer.get_recent(computer_pk=7, calc_pk=42)
+        self.assertEquals([trace['operation'] for trace in recent],
+                          ['chdir', 'putfile', 'get', 'exec_command_wait echo',
+                           'getfile', 'close'])
+
+    def test_tree_bytes(self):
+        source = os.path.join(self.folder, 'source')
+        os.mkdir(source)
+        os.mkdir(os.path.join(source, 'sub'))
+        for name, size in [('a', 10), (os.path.join('sub', 'b'), 20)]:
+            with open(os.path.join(source, name), 'w') as f:
+                f.write('x' * size)
+
+        with LocalTransport() as t:
+            t.chdir(self.folder)
+            t.puttree(source, 'put')
+            t.gettree('put', os.path.join(self.folder, 'get'))
+
+        histograms = self.tracer.get_histograms(None)
+        self.assertEquals(histograms['puttree']['bytes'], 30)
+        self.assertEquals(histograms['gettree']['bytes'], 30)
+
+    def test_store(self):
+        import mock
+
+        stored = {'7': {'putfile': dict(
+            self._histogram(), count=1, bytes=10)}}
+
+        def update_global_setting(key, update, description=None):
+            calls.append(key)
+            stored.update(update(stored))
+
+        calls = []
+        source = os.path.join(self.folder, 'source')
+        with open(source, 'w') as f:
+            f.write('x' * 100)
+        with LocalTransport() as t:
+            t._computer_pk = 7
+            t.putfile(source, os.path.join(self.folder, 'put'))
+        with LocalTransport() as t:
+            t._computer_pk = 8
+            t.chdir(self.folder)
+
+        with mock.patch('aiida.backends.utils.update_global_setting',
+                        update_global_setting):
+            self.tracer.store()
+            # Nothing left to store
+            self.tracer.store()
+
+        # A single update for all the computers
+        self.assertEquals(calls, ['transport|latency'])
+        self.assertEquals(sorted(stored), ['7', '8'])
+        self.assertEquals(stored['7']['putfile']['count'], 2)
+        self.assertEquals(stored['7']['putfile']['bytes'], 110)
+        self.assertEquals(stored['8']['chdir']['count'], 1)
+        self.assertEquals(self.tracer.get_histograms(7), {})
+
+    @staticmethod
+    def _histogram():
+        return {'count': 0, 'errors': 0, 'seconds': 0., 'bytes': 0,
+                'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
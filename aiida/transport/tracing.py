@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Tracing of the operations of the transports.
+
+Each operation of a transport (``listdir``, ``get``, ``put``,
+``exec_command_wait``, ...) is recorded by the :py:data:`transport_tracer`
+of the process, with its duration, the bytes it moved and the calculation
+it served (taken from the logger extras of the transport). The most recent
+operations are kept in memory, and a latency histogram is accumulated for
+each operation on each computer (identified by its pk, so that computers
+sharing a hostname are told apart). The bytes of the transfers are those
+reported by the transports (see ``Transport._add_traced_bytes``).
+
+The remote commands are recorded with the name of their executable (e.g.
+``exec_command_wait squeue``), so that the time spent in the scheduler can
+be told apart from the time spent in the transfers.
+
+The daemon stores the histograms in the DbSetting table with its metrics
+(see :py:mod:`aiida.daemon.metrics`), in a single setting for all the
+computers, so that they are shared by all daemon processes and shown by
+``verdi computer latency``. The operations of transports not created by an
+AuthInfo (e.g. in the tests) are only kept in memory.
+"""
+import os
+import threading
+from collections import deque
+
+from aiida.common import aiidalogger
+
+tracinglogger = aiidalogger.getChild('transporttracing')
+
+# The upper bounds (in seconds) of the buckets of the latency histograms;
+# a last bucket holds the slower operations
+LATENCY_BUCKETS = (0.001, 0.01, 0.1, 1., 10., 60.)
+
+_SETTING_KEY = 'transport|latency'
+_SETTING_DESCRIPTION = ("Latency histograms of the transport operations, by "
+                        "computer pk")
+
+
+def _get_argument(args, kwargs, index, names):
+    """
+    Return a positional argument, or the keyword argument with one of the
+    given names (the transport plugins do not name them consistently).
+    """
+    if len(args) > index:
+        return args[index]
+    for name in names:
+        if name in kwargs:
+            return kwargs[name]
+    return None
+
+
+def _get_operation_bytes(operation, args, kwargs, result, transferred):
+    """
+    Return the bytes moved by an operation: the bytes reported by the
+    transport for the transfers, the input and output for the commands.
+    """
+    if operation == 'exec_command_wait':
+        stdin = _get_argument(args, kwargs, 1, ('stdin',))
+        num_bytes = len(stdin) if isinstance(stdin, basestring) else 0
+        if result is not None:
+            num_bytes += len(result[1]) + len(result[2])
+        return num_bytes
+    if operation == 'exec_command_batch' and result is not None:
+        return sum(len(stdout) + len(stderr) for _, stdout, stderr in result)
+    return transferred
+
+
+def _get_operation_name(operation, args, kwargs):
+    """
+    Return the name under which an operation is recorded: the name of the
+    method, followed for commands by the name of their executable.
+    """
+    if operation == 'exec_command_wait':
+        command = _get_argument(args, kwargs, 0, ('command',))
+        if isinstance(command, basestring) and command.split():
+            return "{} {}".format(operation,
+                                  os.path.basename(command.split()[0]))
+    return operation
+
+
+def _new_histogram():
+    return {
+        'count': 0,
+        'errors': 0,
+        'seconds': 0.,
+        'bytes': 0,
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def _merge_histogram(histogram, other):
+    """
+    Add the counts of the histogram ``other`` to ``histogram``.
+    """
+    for key in ('count', 'errors', 'seconds', 'bytes'):
+        histogram[key] += other[key]
+    histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'],
+                                                  other['buckets'])]
+
+
+class TransportTracer(object):
+    """
+    Record the operations of the transports of the current process (see
+    the module docstring).
+    """
+
+    def __init__(self, max_recent=1000):
+        """
+        :param max_recent: the number of most recent operations kept in
+            memory
+        """
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max_recent)
+        # The histograms not stored yet, with (computer pk, operation) keys
+        self._histograms = {}
+
+    def record(self, transport, operation, duration, args=(), kwargs=None,
+               result=None, error=False, transferred=0):
+        """
+        Record an operation of a transport. It never raises: tracing must
+        not break the transports.
+
+        :param transport: the transport
+        :param operation: the name of the method
+        :param duration: the duration of the operation, in seconds
+        :param args: the positional arguments of the method
+        :param kwargs: the keyword arguments of the method
+        :param result: the value returned by the method
+        :param error: True if the method raised an exception
+        :param transferred: the bytes transferred, as reported by the
+            transport
+        """
+        import time
+        from bisect import bisect_left
+
+        try:
+            kwargs = kwargs or {}
+            computer_pk = getattr(transport, '_computer_pk', None)
+            hostname = getattr(transport, '_machine', None) or 'localhost'
+            name = _get_operation_name(operation, args, kwargs)
+            num_bytes = 0
+            if not error:
+                num_bytes = _get_operation_bytes(operation, args, kwargs,
+                                                 result, transferred)
+            logger_extra = getattr(transport, '_logger_extra', None) or {}
+
+            with self._lock:
+                self._recent.append({
+                    'time': time.time(),
+                    'computer_pk': computer_pk,
+                    'hostname': hostname,
+                    'operation': name,
+                    'duration': duration,
+                    'bytes': num_bytes,
+                    'calc_pk': logger_extra.get('objpk', None),
+                    'error': error,
+                })
+                histogram = self._histograms.setdefault((computer_pk, name),
+                                                        _new_histogram())
+                histogram['count'] += 1
+                histogram['errors'] += int(error)
+                histogram['seconds'] += duration
+                histogram['bytes'] += num_bytes
+                histogram['buckets'][bisect_left(LATENCY_BUCKETS,
+                                                 duration)] += 1
+        except Exception as e:
+            tracinglogger.debug("Unable to trace the operation {} of {}: "
+                                "{}".format(operation, transport, e))
+
+    def get_recent(self, computer_pk=None, calc_pk=None):
+        """
+        Return the most recent operations, oldest first.
+
+        :param computer_pk: if given, only the operations on this computer
+        :param calc_pk: if given, only the operations serving this
+            calculation
+        :return: a list of dictionaries with keys 'time', 'computer_pk',
+            'hostname', 'operation', 'duration', 'bytes', 'calc_pk' and
+            'error'
+        """
+        with self._lock:
+            recent = list(self._recent)
+        return [trace for trace in recent
+                if (computer_pk is None or
+                    trace['computer_pk'] == computer_pk) and
+                (calc_pk is None or trace['calc_pk'] == calc_pk)]
+
+    def get_histograms(self, computer_pk):
+        """
+        Return the latency histograms recorded by this process for a
+        computer, and not stored yet (see :py:meth:`store`).
+
+        :param computer_pk: the pk of the computer (None for the
+            transports not created by an AuthInfo)
+        :return: a dictionary with the operations as keys, and histograms
+            as values (see :py:func:`get_latency_histograms`)
+        """
+        with self._lock:
+            return dict((name, dict(histogram, buckets=list(
+                histogram['buckets'])))
+                        for (this_pk, name), histogram
+                        in self._histograms.iteritems()
+                        if this_pk == computer_pk)
+
+    def store(self):
+        """
+        Add the histograms recorded by this process to those stored in the
+        database, and reset them. All the computers are stored with a
+        single update of the setting.
+        """
+        from aiida.backends.utils import update_global_setting
+
+        with self._lock:
+            histograms = self._histograms
+            self._histograms = {}
+
+        # The keys of the setting are strings
+        by_computer = {}
+        for (computer_pk, name), histogram in histograms.iteritems():
+            if computer_pk is not None:
+                by_computer.setdefault(str(computer_pk), {})[name] = histogram
+        if not by_computer:
+            return
+
+        def update(stored):
+            # The other processes store their histograms concurrently
+            stored = stored or {}
+            for computer_key, new_histograms in by_computer.iteritems():
+                computer_histograms = stored.setdefault(computer_key, {})
+                for name, histogram in new_histograms.iteritems():
+                    _merge_histogram(computer_histograms.setdefault(
+                        name, _new_histogram()), histogram)
+            return stored
+
+        update_global_setting(_SETTING_KEY, update,
+                              description=_SETTING_DESCRIPTION)
+
+
+def get_latency_histograms(computer_pk):
+    """
+    Return the latency histograms stored for a computer.
+
+    :param computer_pk: the pk of the computer
+    :return: a dictionary with the operations as keys, and as values the
+        histograms, i.e. dictionaries with keys 'count', 'errors',
+        'seconds' (the total duration), 'bytes' and 'buckets' (the number
+        of operations in each bucket of :py:data:`LATENCY_BUCKETS`, plus
+        the slower ones)
+    """
+    from aiida.backends.utils import get_global_setting
+
+    try:
+        return get_global_setting(_SETTING_KEY).get(str(computer_pk), {})
+    except KeyError:
+        return {}
+
+
+def reset_latency_histograms(computer_pk):
+    """
+    Delete the latency histograms stored for a computer.
+    """
+    from aiida.backends.utils import update_global_setting
+
+    def update(stored):
+        stored = stored or {}
+        stored.pop(str(computer_pk), None)
+        return stored
+
+    update_global_setting(_SETTING_KEY, update,
+                          description=_SETTING_DESCRIPTION)
+
+
+# The tracer of the transports of this process
+transport_tracer = TransportTracer()
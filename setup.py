@@ -96,6 +96,7 @@ if __name__ == '__main__':
                 'slurm = aiida.scheduler.plugins.slurm:SlurmScheduler',
                 'pbspro = aiida.scheduler.plugins.pbspro:PbsproScheduler',
                 'torque = aiida.scheduler.plugins.torque:TorqueScheduler',
+                'mock = aiida.scheduler.plugins.mock:MockScheduler',
             ],
             'aiida.transports': [
                 'ssh = aiida.transport.plugins.ssh:SshTransport',
@@ -22,6 +22,8 @@ install_requires = [
     'six==1.10',
     'future',
     'singledispatch >= 3.4.0.0',
+    # Backport of concurrent.futures, used by the asynchronous transports
+    'futures',
     # We need for the time being to stay with an old version
     # of celery, including the versions of the AMQP libraries below,
     # because the support for a SQLA broker has been dropped in later
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Benchmark of the daemon: push calculations through submit, update, retrieve
+and parse, and report the time spent in each daemon task.
+
+The calculations (``simpleplugins.templatereplacer`` running ``/bin/cat``)
+are created on the given computer, which should use the ``mock`` scheduler
+and the ``local`` transport (see :py:mod:`aiida.scheduler.plugins.mock`),
+with a low minimum job poll interval. The daemon tasks are then run in this
+process, one after the other, until all calculations are finished; the
+daemon must be stopped during the benchmark.
+
+Usage: benchmark_daemon.py [options] COMPUTER (see --help)
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+from aiida.backends.utils import load_dbenv, is_dbenv_loaded
+
+if not is_dbenv_loaded():
+    load_dbenv()
+
+from aiida.common.datastructures import calc_states
+from aiida.daemon.execmanager import (
+    submit_jobs, update_jobs, retrieve_jobs, parse_jobs)
+from aiida.daemon.metrics import daemon_metrics, get_task_metrics, CATEGORIES
+from aiida.orm import Code, Computer, JobCalculation
+from aiida.orm.calculation.job.simpleplugins.templatereplacer import (
+    TemplatereplacerCalculation)
+from aiida.orm.data.parameter import ParameterData
+from aiida.orm.querybuilder import QueryBuilder
+
+# The daemon tasks, in the order in which they are run
+TASKS = (
+    ('submitter', submit_jobs),
+    ('updater', update_jobs),
+    ('retriever', retrieve_jobs),
+    ('parser', parse_jobs),
+)
+
+FINAL_STATES = (
+    calc_states.FINISHED,
+    calc_states.FAILED,
+    calc_states.SUBMISSIONFAILED,
+    calc_states.RETRIEVALFAILED,
+    calc_states.PARSINGFAILED,
+)
+
+# The options setting the environment of the mock scheduler
+MOCK_OPTIONS = ('queue_delay', 'run_time', 'jitter', 'failure_rate',
+                'submit_failure_rate', 'extra_jobs', 'seed')
+
+
+def create_calculations(computer, num_calcs):
+    """
+    Create and submit num_calcs calculations on the given computer.
+
+    :return: the list of their pks
+    """
+    code = Code(remote_computer_exec=(computer, '/bin/cat'))
+    code.label = 'benchmark-cat'
+    code.set_input_plugin_name('simpleplugins.templatereplacer')
+    code.store()
+
+    # The input nodes are shared by all calculations
+    template = ParameterData(dict={
+        'input_file_template': '{value}\n',
+        'input_file_name': 'aiida.in',
+        'output_file_name': 'aiida.out',
+        'input_through_stdin': True,
+    }).store()
+    parameters = ParameterData(dict={'value': 'benchmark'}).store()
+
+    pks = []
+    for _ in range(num_calcs):
+        calc = TemplatereplacerCalculation(computer=computer, withmpi=False)
+        calc.set_resources({"num_machines": 1,
+                            "num_mpiprocs_per_machine": 1})
+        calc.use_code(code)
+        calc.use_template(template)
+        calc.use_parameters(parameters)
+        calc.store_all()
+        calc.submit()
+        pks.append(calc.pk)
+    return pks
+
+
+def count_states(pks):
+    """
+    Return a Counter of the states of the calculations with the given pks.
+    """
+    qb = QueryBuilder()
+    qb.append(JobCalculation, filters={'id': {'in': pks}},
+              project=['attributes.state'])
+    return Counter(state for state, in qb.iterall())
+
+
+def get_metrics_difference(before, after):
+    """
+    Return the metrics of the daemon tasks accumulated between two results
+    of get_task_metrics, with keys 'cycles', 'duration', 'processed' and
+    'times'.
+    """
+    difference = {}
+    for task_name, metrics in after.iteritems():
+        old = before.get(task_name, {})
+        old_times = old.get('total_times', {})
+        difference[task_name] = {
+            'cycles': metrics['cycles'] - old.get('cycles', 0),
+            'duration': (metrics['total_duration'] -
+                         old.get('total_duration', 0.)),
+            'processed': (metrics['total_processed'] -
+                          old.get('total_processed', 0)),
+            'times': dict(
+                (category, seconds - old_times.get(category, 0.))
+                for category, seconds in
+                metrics.get('total_times', {}).iteritems()),
+        }
+    return difference
+
+
+def print_report(num_calcs, wall_time, states, metrics):
+    print
+    print "{} calculations in {:.1f} s ({:.2f} calculations/s)".format(
+        num_calcs, wall_time, num_calcs / wall_time)
+    print "Final states: {}".format(", ".join(
+        "{} {}".format(count, state)
+        for state, count in sorted(states.iteritems())))
+    print
+    print "{:10s} {:>7s} {:>10s} {:>9s} {}".format(
+        "task", "cycles", "seconds", "processed",
+        " ".join("{:>9s}".format(c) for c in CATEGORIES))
+    for task_name, _ in TASKS:
+        task_metrics = metrics.get(task_name)
+        if task_metrics is None:
+            continue
+        print "{:10s} {:7d} {:10.2f} {:9d} {}".format(
+            task_name, task_metrics['cycles'], task_metrics['duration'],
+            task_metrics['processed'],
+            " ".join("{:9.2f}".format(task_metrics['times'].get(c, 0.))
+                     for c in CATEGORIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the daemon tasks with the mock scheduler.")
+    parser.add_argument('computer', help="the name of the computer")
+    parser.add_argument('-n', '--num-calcs', type=int, default=1000,
+                        help="the number of calculations (default: 1000)")
+    parser.add_argument('-t', '--timeout', type=float, default=3600.,
+                        help="stop after this number of seconds (default: "
+                             "3600)")
+    parser.add_argument('-s', '--sleep', type=float, default=1.,
+                        help="the seconds between two rounds of the daemon "
+                             "tasks (default: 1)")
+    for option in MOCK_OPTIONS:
+        parser.add_argument(
+            '--{}'.format(option.replace('_', '-')), dest=option,
+            help="set the AIIDA_MOCK_SCHEDULER_{} environment "
+                 "variable".format(option.upper()))
+    args = parser.parse_args()
+
+    for option in MOCK_OPTIONS:
+        if getattr(args, option) is not None:
+            os.environ['AIIDA_MOCK_SCHEDULER_{}'.format(option.upper())] = \
+                getattr(args, option)
+
+    computer = Computer.get(args.computer)
+    if (computer.get_scheduler_type() != 'mock' or
+            computer.get_transport_type() != 'local'):
+        print >> sys.stderr, ("Warning: computer {} does not use the mock "
+                              "scheduler with the local transport".format(
+            computer.name))
+    print "Minimum job poll interval of {}: {} s".format(
+        computer.name, computer.get_minimum_job_poll_interval())
+
+    start = time.time()
+    pks = create_calculations(computer, args.num_calcs)
+    print "Created and submitted {} calculations in {:.1f} s".format(
+        len(pks), time.time() - start)
+
+    metrics_before = get_task_metrics()
+    start = time.time()
+    while True:
+        for task_name, function in TASKS:
+            with daemon_metrics.cycle(task_name):
+                function()
+        states = count_states(pks)
+        elapsed = time.time() - start
+        print "{:8.1f} s: {}".format(elapsed, ", ".join(
+            "{} {}".format(count, state)
+            for state, count in sorted(states.iteritems())))
+        if all(state in FINAL_STATES for state in states):
+            break
+        if elapsed > args.timeout:
+            print >> sys.stderr, "Timeout, not all calculations finished"
+            break
+        time.sleep(args.sleep)
+
+    print_report(len(pks), time.time() - start, states,
+                 get_metrics_difference(metrics_before, get_task_metrics()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+###########################################################################
+# Copyright (c), The AiiDA team. All rights reserved.                     #
+# This file is part of the AiiDA code.                                    #
+#                                                                         #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida_core #
+# For further information on the license, see the LICENSE.txt file        #
+# For further information please visit http://www.aiida.net               #
+###########################################################################
+"""
+Benchmark of the parsers of the job lists of the scheduler plugins.
+
+The outputs recorded in the tests of the plugins are replicated (with new
+job ids) up to the requested number of jobs, and parsed a few times.
+
+Usage: benchmark_scheduler_parsers.py [NUM_JOBS [REPEATS]]
+"""
+import logging
+import re
+import sys
+import timeit
+
+
+def _replicate_lines(text, num_jobs, separator):
+    """
+    Replicate the lines of a job list with one job per line, starting with
+    the job id.
+    """
+    lines = [l for l in text.splitlines() if separator in l]
+    return '\n'.join(
+        '{}{}{}'.format(i, separator,
+                        lines[i % len(lines)].split(separator, 1)[1])
+        for i in range(num_jobs))
+
+
+def _replicate_pbs(text, num_jobs):
+    """
+    Replicate the stanzas of the output of qstat -f.
+    """
+    stanzas = ['Job Id: {}'.format(s) for s in text.split('Job Id: ')[1:]]
+    return ''.join(
+        re.sub(r'^Job Id: [^\n]*', 'Job Id: {}.mycluster'.format(i),
+               stanzas[i % len(stanzas)]).rstrip('\n') + '\n\n'
+        for i in range(num_jobs))
+
+
+def _replicate_sge(text, num_jobs):
+    """
+    Replicate the job_list elements of the XML output of qstat, keeping
+    them in the job_info element.
+    """
+    jobs = re.findall(r'<job_list.*?</job_list>', text, re.DOTALL)
+    replicated = '\n'.join(
+        re.sub(r'<JB_job_number>\d+</JB_job_number>',
+               '<JB_job_number>{}</JB_job_number>'.format(i),
+               jobs[i % len(jobs)])
+        for i in range(num_jobs))
+    return ("<?xml version='1.0'?>\n<job_info>\n<queue_info>\n</queue_info>\n"
+            "<job_info>\n{}\n</job_info>\n</job_info>".format(replicated))
+
+
+def get_benchmarks(num_jobs):
+    """
+    Return a list of (name, scheduler, stdout) tuples, with the recorded
+    outputs replicated to num_jobs jobs.
+    """
+    from aiida.scheduler.plugins import (test_slurm, test_pbspro,
+                                         test_torque, test_sge, test_lsf)
+    from aiida.scheduler.plugins.slurm import SlurmScheduler
+    from aiida.scheduler.plugins.pbspro import PbsproScheduler
+    from aiida.scheduler.plugins.torque import TorqueScheduler
+    from aiida.scheduler.plugins.sge import SgeScheduler
+    from aiida.scheduler.plugins.lsf import LsfScheduler
+
+    return [
+        ('slurm', SlurmScheduler(),
+         _replicate_lines(test_slurm.text_squeue_to_test, num_jobs, '^^^')),
+        ('pbspro', PbsproScheduler(),
+         _replicate_pbs(test_pbspro.text_qstat_f_to_test, num_jobs)),
+        ('torque', TorqueScheduler(),
+         _replicate_pbs(test_torque.text_qstat_f_to_test, num_jobs)),
+        ('sge', SgeScheduler(),
+         _replicate_sge(test_sge.text_qstat_ext_urg_xml_test, num_jobs)),
+        ('lsf', LsfScheduler(),
+         _replicate_lines(test_lsf.bjobs_stdout_to_test, num_jobs, '|')),
+    ]
+
+
+def main(num_jobs=50000, repeats=3):
+    # The recorded outputs have a few fields that the parsers complain about
+    logging.disable(logging.WARNING)
+
+    print "Parsing job lists of {} jobs (best of {} runs)".format(num_jobs,
+                                                                  repeats)
+    for name, scheduler, stdout in get_benchmarks(num_jobs):
+        jobs = scheduler._parse_joblist_output(0, stdout, '')
+        if len(jobs) != num_jobs:
+            raise AssertionError("{}: {} jobs parsed instead of {}".format(
+                name, len(jobs), num_jobs))
+        seconds = min(timeit.repeat(
+            lambda: scheduler._parse_joblist_output(0, stdout, ''),
+            number=1, repeat=repeats))
+        print "{:8s} {:8.3f} s  {:8.1f} us/job".format(
+            name, seconds, seconds / num_jobs * 1e6)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])